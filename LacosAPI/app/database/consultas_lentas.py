@@ -0,0 +1,184 @@
+import psycopg2
+import psycopg2.extensions
+import os
+import re
+import random
+import threading
+import time
+from collections import deque
+from datetime import datetime, timezone
+from typing import Dict, Any, List
+
+# Registo opcional de consultas lentas (desligado por omissão)
+SLOW_QUERY_LOG = os.getenv("SLOW_QUERY_LOG", "0").lower() in ("1", "true", "sim", "yes")
+SLOW_QUERY_THRESHOLD_MS = float(os.getenv("SLOW_QUERY_THRESHOLD_MS", "200"))
+SLOW_QUERY_EXPLAIN_SAMPLE_RATE = float(os.getenv("SLOW_QUERY_EXPLAIN_SAMPLE_RATE", "0.1"))
+SLOW_QUERY_BUFFER_SIZE = int(os.getenv("SLOW_QUERY_BUFFER_SIZE", "500"))
+
+# Buffer circular: as entradas mais antigas são descartadas automaticamente
+_REGISTOS: deque = deque(maxlen=SLOW_QUERY_BUFFER_SIZE)
+_LOCK = threading.Lock()
+
+_RE_STRING = re.compile(r"'(?:[^']|'')*'")
+_RE_NUMERO = re.compile(r"\b\d+(?:\.\d+)?\b")
+_RE_PARAM = re.compile(r"%\(\w+\)s|%s")
+_RE_LISTA = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+_RE_ESPACOS = re.compile(r"\s+")
+
+
+def normalizar_sql(sql) -> str:
+    """
+    Reduz uma instrução SQL à sua forma canónica (literais e parâmetros viram '?'),
+    para que execuções da mesma consulta com valores diferentes fiquem agrupadas.
+    """
+    if isinstance(sql, bytes):
+        sql = sql.decode("utf-8", errors="replace")
+    sql = str(sql)
+    sql = _RE_STRING.sub("?", sql)
+    sql = _RE_PARAM.sub("?", sql)
+    sql = _RE_NUMERO.sub("?", sql)
+    sql = _RE_LISTA.sub("(?)", sql)
+    return _RE_ESPACOS.sub(" ", sql).strip()
+
+
+def _formato_parametros(params):
+    """Guarda apenas os tipos dos parâmetros (nunca os valores, que podem conter dados pessoais)."""
+    if params is None:
+        return None
+    if isinstance(params, dict):
+        return {k: type(v).__name__ for k, v in params.items()}
+    try:
+        return [type(v).__name__ for v in params]
+    except TypeError:
+        return type(params).__name__
+
+
+def _capturar_plano(dsn: str, sql_completo: str):
+    """
+    Executa EXPLAIN (ANALYZE, BUFFERS) numa ligação separada, em transação só de leitura
+    que é sempre revertida, para não interferir com a transação do pedido original.
+    """
+    conn = psycopg2.connect(dsn)
+    conn.set_client_encoding('UTF8')
+    try:
+        conn.set_session(readonly=True)
+        cursor = conn.cursor()
+        try:
+            cursor.execute("EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) " + sql_completo)
+            row = cursor.fetchone()
+            return row[0] if row else None
+        finally:
+            cursor.close()
+            conn.rollback()
+    finally:
+        conn.close()
+
+
+def registar_consulta(sql, params, duracao_ms: float, plano=None):
+    entrada = {
+        "sql": sql.decode("utf-8", errors="replace") if isinstance(sql, bytes) else str(sql),
+        "sql_normalizado": normalizar_sql(sql),
+        "formato_parametros": _formato_parametros(params),
+        "duracao_ms": round(duracao_ms, 3),
+        "plano": plano,
+        "registado_em": datetime.now(timezone.utc).isoformat(),
+    }
+    with _LOCK:
+        _REGISTOS.append(entrada)
+
+
+class _CursorCronometrado:
+    """Mixin que mede cada execute() e regista as consultas acima do limiar."""
+
+    def execute(self, query, vars=None):
+        inicio = time.perf_counter()
+        try:
+            return super().execute(query, vars)
+        finally:
+            duracao_ms = (time.perf_counter() - inicio) * 1000
+            if duracao_ms >= SLOW_QUERY_THRESHOLD_MS:
+                self._registar_lenta(query, vars, duracao_ms)
+
+    def _registar_lenta(self, query, vars, duracao_ms: float):
+        plano = None
+        try:
+            texto = normalizar_sql(query).lower()
+            if (texto.startswith("select") or texto.startswith("with")) and random.random() < SLOW_QUERY_EXPLAIN_SAMPLE_RATE:
+                sql_completo = self.mogrify(query, vars).decode("utf-8")
+                plano = _capturar_plano(self.connection.dsn_original, sql_completo)
+        except Exception as e:
+            plano = {"erro": str(e)}
+        try:
+            registar_consulta(query, vars, duracao_ms, plano)
+        except Exception as e:
+            print(f"Aviso: Falha ao registar consulta lenta: {e}")
+
+
+_CLASSES_CRONOMETRADAS: Dict[type, type] = {}
+
+
+def _cursor_cronometrado(factory):
+    classe = _CLASSES_CRONOMETRADAS.get(factory)
+    if classe is None:
+        classe = type(f"Cronometrado{factory.__name__}", (_CursorCronometrado, factory), {})
+        _CLASSES_CRONOMETRADAS[factory] = classe
+    return classe
+
+
+class ConexaoMonitorizada(psycopg2.extensions.connection):
+    """
+    Ligação que envolve qualquer cursor_factory pedido (RealDictCursor, cursores nomeados, ...)
+    num cursor cronometrado, sem exigir alterações nas rotas.
+    """
+
+    # DSN completo (conn.dsn oculta a palavra-passe), necessário para abrir a ligação do EXPLAIN
+    dsn_original = None
+
+    def cursor(self, *args, **kwargs):
+        factory = kwargs.get("cursor_factory") or self.cursor_factory or psycopg2.extensions.cursor
+        kwargs["cursor_factory"] = _cursor_cronometrado(factory)
+        return super().cursor(*args, **kwargs)
+
+
+def listar_consultas_agrupadas() -> List[Dict[str, Any]]:
+    """
+    Agrupa as entradas do buffer por instrução normalizada, ordenadas pelo tempo total.
+    Cada grupo traz o plano da amostra mais recente que tenha EXPLAIN.
+    """
+    with _LOCK:
+        entradas = list(_REGISTOS)
+
+    grupos: Dict[str, Dict[str, Any]] = {}
+    for e in entradas:
+        g = grupos.get(e["sql_normalizado"])
+        if g is None:
+            g = grupos[e["sql_normalizado"]] = {
+                "sql_normalizado": e["sql_normalizado"],
+                "execucoes": 0,
+                "duracao_total_ms": 0.0,
+                "duracao_max_ms": 0.0,
+                "formato_parametros": e["formato_parametros"],
+                "ultimo_registo": None,
+                "exemplo_sql": None,
+                "plano": None,
+            }
+        g["execucoes"] += 1
+        g["duracao_total_ms"] += e["duracao_ms"]
+        g["duracao_max_ms"] = max(g["duracao_max_ms"], e["duracao_ms"])
+        g["ultimo_registo"] = e["registado_em"]
+        g["exemplo_sql"] = e["sql"]
+        if e["plano"] is not None:
+            g["plano"] = e["plano"]
+
+    resultado = []
+    for g in grupos.values():
+        g["duracao_total_ms"] = round(g["duracao_total_ms"], 3)
+        g["duracao_media_ms"] = round(g["duracao_total_ms"] / g["execucoes"], 3)
+        resultado.append(g)
+    resultado.sort(key=lambda g: g["duracao_total_ms"], reverse=True)
+    return resultado
+
+
+def limpar_consultas():
+    with _LOCK:
+        _REGISTOS.clear()
@@ -0,0 +1,155 @@
+import psycopg2
+import psycopg2.extensions
+import hashlib
+import itertools
+import os
+import threading
+import time
+from contextvars import ContextVar
+from typing import Any, Dict, List, Optional
+
+# Réplicas de leitura opcionais (lista separada por vírgulas); vazio = tudo no primário
+REPLICA_DATABASE_URLS = [d.strip() for d in os.getenv("REPLICA_DATABASE_URLS", "").split(",") if d.strip()]
+# Atraso máximo (segundos) aceite antes de desviar as leituras para o primário
+REPLICA_MAX_LAG_S = float(os.getenv("REPLICA_MAX_LAG_S", "5"))
+# Intervalo entre verificações de saúde de cada réplica
+REPLICA_HEALTH_INTERVAL_S = float(os.getenv("REPLICA_HEALTH_INTERVAL_S", "10"))
+# Depois de uma escrita, as leituras do mesmo cliente ficam no primário durante esta janela
+REPLICA_STICKY_S = float(os.getenv("REPLICA_STICKY_S", "5"))
+REPLICA_CONNECT_TIMEOUT_S = int(os.getenv("REPLICA_CONNECT_TIMEOUT_S", "2"))
+
+# Identificador do cliente do pedido em curso (definido pelo middleware em main.py)
+_cliente_pedido: ContextVar[Optional[str]] = ContextVar("cliente_pedido", default=None)
+_ultimas_escritas: Dict[str, float] = {}
+_LOCK = threading.Lock()
+
+
+class _EstadoReplica:
+    def __init__(self, dsn: str):
+        self.dsn = dsn
+        self.saudavel = True
+        self.atraso_s: Optional[float] = None
+        self.erro: Optional[str] = None
+        self.verificada_em = 0.0
+        self.a_verificar = False
+
+    def disponivel(self) -> bool:
+        return self.saudavel and (self.atraso_s is None or self.atraso_s <= REPLICA_MAX_LAG_S)
+
+
+_REPLICAS: List[_EstadoReplica] = [_EstadoReplica(dsn) for dsn in REPLICA_DATABASE_URLS]
+_rotacao = itertools.count()
+
+
+def identificar_cliente(authorization: Optional[str], endereco: Optional[str]) -> Optional[str]:
+    """Chave do cliente para a janela pós-escrita: hash do token (nunca o token em claro) ou o IP."""
+    if authorization:
+        return hashlib.sha256(authorization.encode()).hexdigest()[:32]
+    return endereco
+
+
+def definir_cliente_pedido(chave: Optional[str]):
+    return _cliente_pedido.set(chave)
+
+
+def registar_escrita(chave: Optional[str]):
+    if not chave or not _REPLICAS:
+        return
+    agora = time.monotonic()
+    with _LOCK:
+        _ultimas_escritas[chave] = agora
+        # Limpeza ocasional das janelas já expiradas
+        if len(_ultimas_escritas) > 10000:
+            for k, t in list(_ultimas_escritas.items()):
+                if agora - t > REPLICA_STICKY_S:
+                    _ultimas_escritas.pop(k, None)
+
+
+def _escreveu_recentemente() -> bool:
+    chave = _cliente_pedido.get()
+    if not chave:
+        return False
+    t = _ultimas_escritas.get(chave)
+    return t is not None and time.monotonic() - t <= REPLICA_STICKY_S
+
+
+def _verificar(replica: _EstadoReplica):
+    """Liga à réplica e mede o atraso de replicação. 0 quando já aplicou tudo o que recebeu."""
+    try:
+        conn = psycopg2.connect(replica.dsn, connect_timeout=REPLICA_CONNECT_TIMEOUT_S)
+        try:
+            cursor = conn.cursor()
+            cursor.execute("""
+                SELECT pg_is_in_recovery(),
+                       CASE
+                           WHEN NOT pg_is_in_recovery() THEN 0
+                           WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+                           ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+                       END
+            """)
+            _, atraso = cursor.fetchone()
+            replica.atraso_s = float(atraso)
+            replica.saudavel = True
+            replica.erro = None
+        finally:
+            conn.close()
+    except Exception as e:
+        replica.saudavel = False
+        replica.erro = str(e)
+    finally:
+        replica.verificada_em = time.monotonic()
+        replica.a_verificar = False
+
+
+def _atualizar_se_necessario(replica: _EstadoReplica):
+    # Só um pedido de cada vez verifica a réplica; os restantes usam o último estado conhecido
+    if time.monotonic() - replica.verificada_em < REPLICA_HEALTH_INTERVAL_S:
+        return
+    with _LOCK:
+        if replica.a_verificar:
+            return
+        replica.a_verificar = True
+    _verificar(replica)
+
+
+def escolher_replica() -> Optional[_EstadoReplica]:
+    """Próxima réplica disponível em round-robin, ou None se as leituras devem ir ao primário."""
+    if not _REPLICAS or _escreveu_recentemente():
+        return None
+    inicio = next(_rotacao)
+    for i in range(len(_REPLICAS)):
+        replica = _REPLICAS[(inicio + i) % len(_REPLICAS)]
+        _atualizar_se_necessario(replica)
+        if replica.disponivel():
+            return replica
+    return None
+
+
+def marcar_indisponivel(replica: _EstadoReplica, erro: Exception):
+    replica.saudavel = False
+    replica.erro = str(erro)
+    replica.verificada_em = time.monotonic()
+
+
+def _destino(dsn: str) -> str:
+    # O DSN pode ter a senha; expõe-se só host:porta/base
+    try:
+        partes = psycopg2.extensions.parse_dsn(dsn)
+    except Exception:
+        return "?"
+    return f"{partes.get('host', 'localhost')}:{partes.get('port', '5432')}/{partes.get('dbname', '')}"
+
+
+def estado_replicas() -> List[Dict[str, Any]]:
+    agora = time.monotonic()
+    return [
+        {
+            "destino": _destino(r.dsn),
+            "saudavel": r.saudavel,
+            "atraso_s": r.atraso_s,
+            "disponivel": r.disponivel(),
+            "erro": r.erro,
+            "verificada_ha_s": round(agora - r.verificada_em, 1) if r.verificada_em else None,
+        }
+        for r in _REPLICAS
+    ]
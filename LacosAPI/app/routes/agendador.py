@@ -0,0 +1,53 @@
+from fastapi import APIRouter, HTTPException, Depends, BackgroundTasks, Query
+from typing import Optional
+from app.database.database import get_db_connection
+from app.utils.auth import get_current_administrador
+from app.utils.agendador import SCHEDULER_ENABLED, SCHEDULER_UTC_OFFSET_H, TRABALHOS, agendador, executar_trabalho
+import psycopg2.extras
+
+router = APIRouter()
+
+
+@router.get("/trabalhos")
+def listar_trabalhos(funcionario_atual: dict = Depends(get_current_administrador)):
+    return {
+        "ativo": SCHEDULER_ENABLED,
+        "diferenca_utc_horas": SCHEDULER_UTC_OFFSET_H,
+        "trabalhos": agendador.estado(),
+    }
+
+
+@router.post("/trabalhos/{nome}/executar", status_code=202)
+def executar_agora(nome: str, background_tasks: BackgroundTasks, funcionario_atual: dict = Depends(get_current_administrador)):
+    """
+    Corre o trabalho em segundo plano, fora do ciclo do agendador. Se outro processo o estiver
+    a correr nesse momento, a execução é ignorada (ver /execucoes).
+    """
+    if nome not in TRABALHOS:
+        raise HTTPException(status_code=404, detail=f"Trabalho desconhecido. Use um de: {', '.join(TRABALHOS)}")
+    background_tasks.add_task(executar_trabalho, nome)
+    return {"mensagem": f"Execução de '{nome}' iniciada em segundo plano"}
+
+
+@router.get("/execucoes")
+def listar_execucoes(
+    trabalho: Optional[str] = None,
+    limite: int = Query(50, ge=1, le=500),
+    funcionario_atual: dict = Depends(get_current_administrador)
+):
+    """Histórico das execuções (início, fim, linhas afetadas e erro), das mais recentes para as mais antigas."""
+    conn = get_db_connection()
+    cursor = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
+    
+    try:
+        if trabalho:
+            cursor.execute(
+                "SELECT * FROM execucoes_agendadas WHERE trabalho = %s ORDER BY inicio DESC LIMIT %s",
+                (trabalho, limite)
+            )
+        else:
+            cursor.execute("SELECT * FROM execucoes_agendadas ORDER BY inicio DESC LIMIT %s", (limite,))
+        return cursor.fetchall()
+    finally:
+        cursor.close()
+        conn.close()
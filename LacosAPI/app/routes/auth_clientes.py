@@ -5,7 +5,7 @@ from app.schemas.autenticacao_cliente import (
     AutenticacaoCliente, AutenticacaoClienteCriar, AutenticacaoClienteAtualizar,
     LoginClienteRequest, LoginClienteResponse
 )
-from app.database.database import get_db_connection
+from app.database.database import get_db_connection, get_db_connection_leitura
 from app.utils.auth import get_current_funcionario
 import psycopg2.extras
 import bcrypt
@@ -162,7 +162,7 @@ def login_cliente(login_data: LoginClienteRequest):
 @router.get("/listar", response_model=List[AutenticacaoCliente])
 def listar_autenticacoes_clientes(pular: int = 0, limite: int = 100, funcionario_atual: dict = Depends(get_current_funcionario)):
     """List all client authentications (only employees can access)"""
-    conn = get_db_connection()
+    conn = get_db_connection_leitura()
     cursor = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
     
     try:
@@ -1,19 +1,138 @@
-from fastapi import APIRouter, HTTPException, status, Depends
+from fastapi import APIRouter, HTTPException, status, Depends, Query, UploadFile, File
 from typing import List
-from app.schemas.cliente import Cliente
-from app.database.database import get_db_connection
-from app.utils.auth import get_current_funcionario
+from app.schemas.cliente import Cliente, ClientePesquisa
+from app.database.database import get_db_connection, get_db_connection_leitura
+from app.utils.auth import get_current_funcionario, get_current_administrador
+from app.utils.duplicados import DUPLICADOS_LIMIAR, verificar_cliente
+from app.utils.importacao import importar_clientes
+from app.utils.serializacao import responder_lista
+from app.utils.tarefas import submeter_tarefa
 import psycopg2.extras
 from datetime import date
+import re
+import time
+
+# Candidatos lidos por cada índice antes de juntar e ordenar por relevância
+CANDIDATOS_POR_CAMPO = 50
+
+
+def _escapar_like(texto: str) -> str:
+    return texto.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+def _consulta_pesquisa(termo: str):
+    """
+    Monta a pesquisa como uma união de leituras curtas, cada uma servida por um índice
+    (prefixo em btree text_pattern_ops ou trigramas pg_trgm), e devolve (sql, parametros).
+    Pontuação: exata = 1, prefixo = 0.95, restantes pela semelhança de trigramas.
+    """
+    texto = termo.strip().lower()
+    digitos = re.sub(r"[^0-9]", "", texto)
+    documento = re.sub(r"\s+", "", texto).upper()
+    parametros = {
+        "texto": texto,
+        "texto_prefixo": _escapar_like(texto) + "%",
+        "texto_contem": "%" + _escapar_like(texto) + "%",
+        "digitos": digitos,
+        "digitos_prefixo": digitos + "%",
+        "digitos_contem": "%" + digitos + "%",
+        "documento": documento,
+        "documento_prefixo": _escapar_like(documento) + "%",
+        "documento_contem": "%" + _escapar_like(documento) + "%",
+        "candidatos": CANDIDATOS_POR_CAMPO,
+    }
+    # Os índices de trigramas só ajudam a partir de 3 caracteres
+    trigramas = len(texto) >= 3
+    ramos = []
+
+    if not digitos or len(digitos) < len(texto.replace(" ", "")):
+        ramos.append("""
+            (SELECT cliente_id,
+                    CASE WHEN lower(nome) = %(texto)s THEN 1.0 ELSE 0.95 END::real AS pontuacao, 'nome' AS campo
+             FROM clientes WHERE lower(nome) LIKE %(texto_prefixo)s
+             ORDER BY lower(nome) LIMIT %(candidatos)s)
+        """)
+        if trigramas:
+            # Semelhança por palavra: "mari" encontra "Ana Maria Cossa" e tolera erros de escrita
+            ramos.append("""
+                (SELECT cliente_id, (word_similarity(%(texto)s, lower(nome)) * 0.9)::real AS pontuacao, 'nome' AS campo
+                 FROM clientes WHERE %(texto)s <%% lower(nome)
+                 ORDER BY %(texto)s <<-> lower(nome) LIMIT %(candidatos)s)
+            """)
+        if "@" in texto or trigramas:
+            ramos.append("""
+                (SELECT cliente_id,
+                        CASE WHEN lower(email) = %(texto)s THEN 1.0
+                             WHEN lower(email) LIKE %(texto_prefixo)s THEN 0.95 ELSE 0.8 END::real AS pontuacao,
+                        'email' AS campo
+                 FROM clientes WHERE lower(email) LIKE %(texto_contem)s LIMIT %(candidatos)s)
+            """)
+
+    if len(digitos) >= 2:
+        ramos.append("""
+            (SELECT cliente_id,
+                    CASE WHEN telefone = %(digitos)s THEN 1.0 ELSE 0.95 END::real AS pontuacao, 'telefone' AS campo
+             FROM clientes WHERE telefone LIKE %(digitos_prefixo)s
+             ORDER BY telefone LIMIT %(candidatos)s)
+        """)
+        if len(digitos) >= 3:
+            ramos.append("""
+                (SELECT cliente_id, 0.85::real AS pontuacao, 'telefone' AS campo
+                 FROM clientes WHERE telefone LIKE %(digitos_contem)s LIMIT %(candidatos)s)
+            """)
+
+    if any(c.isdigit() for c in documento):
+        ramos.append("""
+            (SELECT d.cliente_id,
+                    CASE WHEN upper(d.numero_documento) = %(documento)s THEN 1.0 ELSE 0.95 END::real AS pontuacao,
+                    'documento' AS campo
+             FROM documentos d
+             WHERE upper(d.numero_documento) LIKE %(documento_prefixo)s AND d.cliente_id IS NOT NULL
+             ORDER BY upper(d.numero_documento) LIMIT %(candidatos)s)
+        """)
+        if len(documento) >= 3:
+            ramos.append("""
+                (SELECT d.cliente_id, 0.85::real AS pontuacao, 'documento' AS campo
+                 FROM documentos d
+                 WHERE upper(d.numero_documento) LIKE %(documento_contem)s AND d.cliente_id IS NOT NULL
+                 LIMIT %(candidatos)s)
+            """)
+
+    sql = f"""
+        WITH candidatos AS ({" UNION ALL ".join(ramos)}),
+        melhores AS (
+            SELECT DISTINCT ON (cliente_id) cliente_id, pontuacao, campo
+            FROM candidatos
+            ORDER BY cliente_id, pontuacao DESC
+        )
+        SELECT c.*, m.pontuacao, m.campo
+        FROM melhores m
+        JOIN clientes c ON c.cliente_id = m.cliente_id
+        ORDER BY m.pontuacao DESC, c.nome, c.cliente_id
+        LIMIT %(limite)s
+    """
+    return sql, parametros
+
 
 router = APIRouter()
 
 @router.post("/criar", response_model=Cliente)
-def criar_cliente(cliente: Cliente, funcionario_atual: dict = Depends(get_current_funcionario)):
+def criar_cliente(
+    cliente: Cliente,
+    verificar_duplicados: bool = Query(False, description="Recusar (409) se houver clientes parecidos; os candidatos vêm no detalhe"),
+    funcionario_atual: dict = Depends(get_current_funcionario)
+):
     conn = get_db_connection()
     cursor = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
     
     try:
+        if verificar_duplicados:
+            candidatos = verificar_cliente(cursor, cliente.nome, cliente.telefone, cliente.email, cliente.data_nascimento)
+            if candidatos:
+                raise HTTPException(
+                    status_code=409,
+                    detail={"mensagem": "Possíveis clientes duplicados encontrados", "candidatos": candidatos},
+                )
         cursor.execute(
             "INSERT INTO clientes (nome, sexo, telefone, email, nacionalidade, data_nascimento) VALUES (%s, %s, %s, %s, %s, %s) RETURNING cliente_id",
             (cliente.nome, cliente.sexo, cliente.telefone, cliente.email, cliente.nacionalidade, cliente.data_nascimento)
@@ -37,19 +156,158 @@ def criar_cliente(cliente: Cliente, funcionario_atual: dict = Depends(get_curren
         cursor.close()
         conn.close()
 
+@router.post("/importar")
+def importar(
+    arquivo: UploadFile = File(..., description="CSV (uma linha por cliente) ou ZIP com o CSV e os ficheiros dos documentos"),
+    tamanho_lote: int = Query(200, ge=1, le=5000, description="Linhas válidas gravadas por transação"),
+    simular: bool = Query(False, description="Só validar, sem gravar"),
+    funcionario_atual: dict = Depends(get_current_funcionario)
+):
+    """Registo em massa de clientes com localização, ocupação e documento; devolve o relatório por linha."""
+    conteudo = arquivo.file.read()
+    if not conteudo:
+        raise HTTPException(status_code=400, detail="Arquivo não pode estar vazio")
+    conn = get_db_connection()
+    try:
+        return importar_clientes(conn, conteudo, arquivo.filename or "", tamanho_lote=tamanho_lote, simular=simular)
+    finally:
+        conn.close()
+
 @router.get("/listar", response_model=List[Cliente])
 def listar_clientes(pular: int = 0, limite: int = 100, funcionario_atual: dict = Depends(get_current_funcionario)):
-    conn = get_db_connection()
+    conn = get_db_connection_leitura()
     cursor = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
     
     try:
         cursor.execute("SELECT * FROM clientes LIMIT %s OFFSET %s", (limite, pular))
         clientes = cursor.fetchall()
-        return [Cliente(**cliente) for cliente in clientes]
+        return responder_lista(clientes, Cliente)
     finally:
         cursor.close()
         conn.close()
 
+@router.get("/pesquisar", response_model=List[ClientePesquisa])
+def pesquisar_clientes(
+    q: str = Query(..., min_length=2, max_length=100, description="Parte do nome, telefone, email ou número de documento"),
+    limite: int = Query(10, ge=1, le=50),
+    funcionario_atual: dict = Depends(get_current_funcionario)
+):
+    """
+    Pesquisa de clientes para o balcão, ordenada por relevância.
+    Usa os índices de prefixo e de trigramas (pg_trgm) definidos em database_setup.sql.
+    """
+    if len(q.strip()) < 2:
+        raise HTTPException(status_code=400, detail="O termo de pesquisa deve ter pelo menos 2 caracteres")
+    sql, parametros = _consulta_pesquisa(q)
+    parametros["limite"] = limite
+
+    conn = get_db_connection_leitura()
+    cursor = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
+    
+    try:
+        cursor.execute(sql, parametros)
+        resultados = cursor.fetchall()
+        return responder_lista(resultados, ClientePesquisa)
+    finally:
+        cursor.close()
+        conn.close()
+
+@router.post("/duplicados/verificar")
+def verificar_duplicados(
+    cliente: Cliente,
+    documentos: List[str] = Query([], description="Números de documentos de identificação do cliente"),
+    funcionario_atual: dict = Depends(get_current_funcionario)
+):
+    """
+    Clientes existentes que podem ser a mesma pessoa (telefone, email, documento, nome e data
+    de nascimento), do mais provável para o menos. Com cliente_id, esse cliente é excluído.
+    """
+    inicio = time.perf_counter()
+    conn = get_db_connection_leitura()
+    cursor = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
+
+    try:
+        candidatos = verificar_cliente(cursor, cliente.nome, cliente.telefone, cliente.email, cliente.data_nascimento,
+                                       documentos, excluir_cliente_id=cliente.cliente_id)
+    finally:
+        cursor.close()
+        conn.close()
+    return {
+        "duplicado_provavel": bool(candidatos),
+        "candidatos": candidatos,
+        "tempo_ms": round((time.perf_counter() - inicio) * 1000, 1),
+    }
+
+@router.get("/duplicados")
+def listar_duplicados(
+    pontuacao_min: float = Query(DUPLICADOS_LIMIAR, ge=0, le=1),
+    pular: int = Query(0, ge=0),
+    limite: int = Query(50, ge=1, le=500, description="Número de grupos"),
+    funcionario_atual: dict = Depends(get_current_funcionario)
+):
+    """
+    Grupos de possíveis duplicados da última análise completa (POST /duplicados/analisar),
+    os de pontuação mais alta primeiro. Cada grupo traz os clientes e os pares que o ligam.
+    """
+    conn = get_db_connection_leitura()
+    cursor = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
+
+    try:
+        cursor.execute("""
+            WITH grupos AS (
+                SELECT grupo, MAX(pontuacao) AS pontuacao_max
+                FROM clientes_duplicados
+                WHERE pontuacao >= %s
+                GROUP BY grupo
+                ORDER BY pontuacao_max DESC, grupo
+                LIMIT %s OFFSET %s
+            )
+            SELECT g.grupo, g.pontuacao_max, d.cliente_id, d.duplicado_de, d.pontuacao, d.motivos, d.detetado_em
+            FROM grupos g
+            JOIN clientes_duplicados d ON d.grupo = g.grupo AND d.pontuacao >= %s
+            ORDER BY g.pontuacao_max DESC, g.grupo, d.pontuacao DESC
+        """, (pontuacao_min, limite, pular, pontuacao_min))
+        pares = cursor.fetchall()
+        ids = sorted({p["cliente_id"] for p in pares} | {p["duplicado_de"] for p in pares})
+        clientes = {}
+        if ids:
+            cursor.execute("""
+                SELECT cliente_id, nome, telefone, email, data_nascimento, data_cadastro
+                FROM clientes WHERE cliente_id = ANY(%s)
+            """, (ids,))
+            clientes = {c["cliente_id"]: c for c in cursor.fetchall()}
+    finally:
+        cursor.close()
+        conn.close()
+
+    grupos = {}
+    for p in pares:
+        grupo = grupos.setdefault(p["grupo"], {
+            "grupo": p["grupo"],
+            "pontuacao_max": round(float(p["pontuacao_max"]), 4),
+            "detetado_em": p["detetado_em"],
+            "clientes": set(),
+            "pares": [],
+        })
+        grupo["clientes"].update((p["cliente_id"], p["duplicado_de"]))
+        grupo["pares"].append({
+            "cliente_id": p["cliente_id"],
+            "duplicado_de": p["duplicado_de"],
+            "pontuacao": round(float(p["pontuacao"]), 4),
+            "motivos": p["motivos"],
+        })
+    for grupo in grupos.values():
+        grupo["clientes"] = [clientes[i] for i in sorted(grupo["clientes"]) if i in clientes]
+    return {"grupos": list(grupos.values())}
+
+@router.post("/duplicados/analisar")
+def analisar_duplicados(
+    limiar: float = Query(DUPLICADOS_LIMIAR, ge=0.3, le=1),
+    funcionario_atual: dict = Depends(get_current_administrador)
+):
+    """Submete a análise completa de duplicados como tarefa em segundo plano (Administrador)."""
+    return submeter_tarefa("duplicados", {"limiar": limiar}, funcionario_atual.get("username"))
+
 @router.get("/obter/{cliente_id}", response_model=Cliente)
 def obter_cliente(cliente_id: int, funcionario_atual: dict = Depends(get_current_funcionario)):
     conn = get_db_connection()
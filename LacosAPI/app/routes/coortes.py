@@ -0,0 +1,124 @@
+from fastapi import APIRouter, HTTPException, Depends, Query
+from typing import List, Optional
+from app.database.database import get_db_connection, get_db_connection_leitura
+from app.utils.auth import get_current_funcionario, get_current_administrador
+from app.utils.coortes import DIMENSOES, atualizar_cubo
+from app.utils.filtros import FiltroSQL
+import psycopg2.extras
+from datetime import date
+
+router = APIRouter()
+
+
+def _to_float(x) -> float:
+    return float(x) if x is not None else 0.0
+
+
+@router.get("/curvas")
+def obter_curvas(
+    mes_inicio: Optional[date] = Query(None, description="Primeiro mês de desembolso (qualquer dia do mês)"),
+    mes_fim: Optional[date] = Query(None, description="Último mês de desembolso (qualquer dia do mês)"),
+    categoria_risco: Optional[str] = None,
+    sexo: Optional[str] = None,
+    dimensoes: List[str] = Query([], description=f"Desagregar por: {', '.join(DIMENSOES)}"),
+    max_meses: int = Query(36, ge=0, le=240, description="Meses em carteira a devolver por coorte"),
+    funcionario_atual: dict = Depends(get_current_funcionario),
+):
+    """
+    Curvas de reembolso por coorte de desembolso, lidas do cubo pré-calculado.
+    Cada ponto (meses em carteira) traz valores acumulados: desembolsado, pago, em aberto
+    e incumprimentos (empréstimos com mais de 90 dias de atraso por pagar).
+    """
+    invalidas = [d for d in dimensoes if d not in DIMENSOES]
+    if invalidas:
+        raise HTTPException(status_code=400, detail=f"Dimensões inválidas: {invalidas}. Use: {list(DIMENSOES)}")
+    # A ordem é fixa (e sem repetições) para o SQL não depender da ordem do pedido
+    dims = [d for d in DIMENSOES if d in dimensoes]
+    colunas = "".join(f", {d}" for d in dims)
+
+    filtro = (FiltroSQL()
+              .minimo("mes_desembolso", mes_inicio.replace(day=1) if mes_inicio else None)
+              .maximo("mes_desembolso", mes_fim.replace(day=1) if mes_fim else None)
+              .igual("categoria_risco", categoria_risco)
+              .igual("sexo", sexo))
+
+    conn = get_db_connection_leitura()
+    cursor = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
+    try:
+        cursor.execute(f"""
+            WITH base AS (
+                SELECT mes_desembolso, meses_em_carteira{colunas},
+                       SUM(emprestimos) AS emprestimos, SUM(valor_desembolsado) AS valor_desembolsado,
+                       SUM(total_devido) AS total_devido, SUM(valor_pago) AS valor_pago,
+                       SUM(incumprimentos) AS incumprimentos, SUM(valor_incumprido) AS valor_incumprido
+                FROM coortes
+                {filtro.where()}
+                GROUP BY mes_desembolso, meses_em_carteira{colunas}
+            ),
+            -- Todos os meses em carteira até hoje, mesmo os sem movimentos, para as curvas serem contínuas
+            celulas AS (
+                SELECT g.*, s.n AS meses_em_carteira
+                FROM (SELECT DISTINCT mes_desembolso{colunas} FROM base) g
+                CROSS JOIN LATERAL generate_series(0, LEAST(%s,
+                    ((EXTRACT(YEAR FROM CURRENT_DATE) - EXTRACT(YEAR FROM g.mes_desembolso)) * 12
+                     + EXTRACT(MONTH FROM CURRENT_DATE) - EXTRACT(MONTH FROM g.mes_desembolso))::int)) AS s(n)
+            )
+            SELECT to_char(mes_desembolso, 'YYYY-MM') AS coorte, meses_em_carteira{colunas},
+                   SUM(COALESCE(b.emprestimos, 0)) OVER w AS emprestimos,
+                   SUM(COALESCE(b.valor_desembolsado, 0)) OVER w AS valor_desembolsado,
+                   SUM(COALESCE(b.total_devido, 0)) OVER w AS total_devido,
+                   SUM(COALESCE(b.valor_pago, 0)) OVER w AS valor_pago,
+                   SUM(COALESCE(b.incumprimentos, 0)) OVER w AS incumprimentos,
+                   SUM(COALESCE(b.valor_incumprido, 0)) OVER w AS valor_incumprido
+            FROM celulas c
+            LEFT JOIN base b USING (mes_desembolso, meses_em_carteira{colunas})
+            WINDOW w AS (PARTITION BY mes_desembolso{colunas} ORDER BY meses_em_carteira)
+            ORDER BY mes_desembolso{colunas}, meses_em_carteira
+        """, filtro.valores + [max_meses])
+        rows = cursor.fetchall()
+        cursor.execute("SELECT atualizado_em FROM coortes_estado WHERE id")
+        estado = cursor.fetchone()
+    finally:
+        cursor.close()
+        conn.close()
+
+    coortes = {}
+    for r in rows:
+        chave = (r["coorte"],) + tuple(r[d] for d in dims)
+        coorte = coortes.get(chave)
+        if coorte is None:
+            coorte = coortes[chave] = {"coorte": r["coorte"], **{d: r[d] for d in dims}, "curva": []}
+        devido = _to_float(r["total_devido"])
+        pago = _to_float(r["valor_pago"])
+        coorte["curva"].append({
+            "meses_em_carteira": r["meses_em_carteira"],
+            "emprestimos": int(r["emprestimos"]),
+            "valor_desembolsado": _to_float(r["valor_desembolsado"]),
+            "valor_pago": pago,
+            "em_aberto": max(devido - pago, 0.0),
+            "taxa_reembolso": round(pago / devido, 4) if devido else None,
+            "incumprimentos": int(r["incumprimentos"]),
+            "valor_incumprido": _to_float(r["valor_incumprido"]),
+            "taxa_incumprimento": round(int(r["incumprimentos"]) / int(r["emprestimos"]), 4) if r["emprestimos"] else None,
+        })
+    return {
+        "dimensoes": dims,
+        "atualizado_em": estado["atualizado_em"].isoformat() if estado and estado["atualizado_em"] else None,
+        "coortes": list(coortes.values()),
+    }
+
+
+@router.post("/atualizar")
+def atualizar_coortes(completo: bool = False, funcionario_atual: dict = Depends(get_current_administrador)):
+    """
+    Soma ao cubo os empréstimos, pagamentos e incumprimentos novos desde a última atualização.
+    completo=true reconstrói-o do zero (necessário depois de correções ou remoções).
+    Para carteiras grandes, prefira a tarefa 'coortes' (/api/tarefas/criar).
+    """
+    conn = get_db_connection()
+    try:
+        return atualizar_cubo(conn, completo=completo)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Erro ao atualizar o cubo de coortes: {str(e)}")
+    finally:
+        conn.close()
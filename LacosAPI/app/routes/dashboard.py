@@ -1,11 +1,16 @@
 
 from fastapi import APIRouter, Depends, HTTPException, Query
-from app.database.database import get_db_connection
-from app.utils.auth import get_current_funcionario
+from app.database.database import get_db_connection_leitura
+from app.utils.auth import get_current_funcionario, get_current_administrador
+from app.utils.garantias import FAIXAS_COBERTURA, filtro_cobertura, sql_cobertura, versao_cobertura
+from app.utils.prestacoes import sql_total_devido
+from app.utils.previsao import prever_fluxo
+from app.utils.snapshots import indicadores
+from app.utils.tarefas import submeter_tarefa
 import psycopg2.extras
-from datetime import datetime, timezone, date
+from datetime import datetime, timezone, date, timedelta
 from decimal import Decimal
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Optional
 import os
 import time
 
@@ -76,7 +81,7 @@ def obter_resumo_dashboard(
         if cached is not None:
             return cached
 
-    conn = get_db_connection()
+    conn = get_db_connection_leitura()
     cursor = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
     try:
         # Totais de clientes
@@ -108,15 +113,17 @@ def obter_resumo_dashboard(
         cursor.execute("""
             SELECT COALESCE(SUM(valor), 0) AS total
             FROM emprestimos
-            WHERE date_trunc('month', data_emprestimo) = date_trunc('month', CURRENT_DATE)
+            WHERE data_emprestimo >= date_trunc('month', CURRENT_DATE)
+              AND data_emprestimo < date_trunc('month', CURRENT_DATE) + INTERVAL '1 month'
         """)
         total_valor_emprestado_mes = _to_float(cursor.fetchone()["total"])
 
-        # Total pago no mês corrente
+        # Total pago no mês corrente (intervalo na coluna de partição: lê só a partição do mês)
         cursor.execute("""
             SELECT COALESCE(SUM(valor_pago), 0) AS total
             FROM pagamentos
-            WHERE date_trunc('month', data_pagamento) = date_trunc('month', CURRENT_DATE)
+            WHERE data_pagamento >= date_trunc('month', CURRENT_DATE)
+              AND data_pagamento < date_trunc('month', CURRENT_DATE) + INTERVAL '1 month'
         """)
         total_pago_mes = _to_float(cursor.fetchone()["total"])
 
@@ -124,15 +131,16 @@ def obter_resumo_dashboard(
         cursor.execute("""
             SELECT COALESCE(SUM(valor), 0) AS total
             FROM penalizacoes
-            WHERE date_trunc('month', data_aplicacao) = date_trunc('month', CURRENT_DATE)
+            WHERE data_aplicacao >= date_trunc('month', CURRENT_DATE)
+              AND data_aplicacao < date_trunc('month', CURRENT_DATE) + INTERVAL '1 month'
         """)
         total_penalizacoes_mes = _to_float(cursor.fetchone()["total"])
 
         recebimentos_mes = _to_float(total_pago_mes + total_penalizacoes_mes)
 
-        # Saldo em aberto (apenas empréstimos Ativos): soma do max(valor*1.20 - total_pago, 0)
-        cursor.execute("""
-            SELECT COALESCE(SUM(GREATEST(e.valor * 1.20 - COALESCE(p.total_pago, 0), 0)), 0) AS saldo
+        # Saldo em aberto (apenas empréstimos Ativos): soma do max(total devido - total_pago, 0)
+        cursor.execute(f"""
+            SELECT COALESCE(SUM(GREATEST({sql_total_devido('e')} - COALESCE(p.total_pago, 0), 0)), 0) AS saldo
             FROM emprestimos e
             LEFT JOIN (
                 SELECT emprestimo_id, SUM(valor_pago) AS total_pago
@@ -158,7 +166,8 @@ def obter_resumo_dashboard(
         cursor.execute("""
             SELECT COUNT(*) AS total
             FROM clientes
-            WHERE date_trunc('month', data_cadastro) = date_trunc('month', CURRENT_DATE)
+            WHERE data_cadastro >= date_trunc('month', CURRENT_DATE)
+              AND data_cadastro < date_trunc('month', CURRENT_DATE) + INTERVAL '1 month'
         """)
         clientes_novos_mes = int(cursor.fetchone()["total"])
 
@@ -170,7 +179,8 @@ def obter_resumo_dashboard(
         cursor.execute("""
             SELECT metodo_pagamento, COALESCE(SUM(valor_pago),0) AS total
             FROM pagamentos
-            WHERE date_trunc('month', data_pagamento) = date_trunc('month', CURRENT_DATE)
+            WHERE data_pagamento >= date_trunc('month', CURRENT_DATE)
+              AND data_pagamento < date_trunc('month', CURRENT_DATE) + INTERVAL '1 month'
             GROUP BY metodo_pagamento
         """)
         dist_rows = cursor.fetchall()
@@ -235,28 +245,39 @@ def obter_trends(
         if cached is not None:
             return cached
 
-    conn = get_db_connection()
+    conn = get_db_connection_leitura()
     cursor = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
     try:
+        # O intervalo repetido em cada agregação limita a leitura às partições da janela
         cursor.execute("""
             WITH series AS (
                 SELECT generate_series(
-                    date_trunc('month', CURRENT_DATE) - (INTERVAL '1 month' * %s) + INTERVAL '1 month',
+                    date_trunc('month', CURRENT_DATE) - (INTERVAL '1 month' * %(months)s) + INTERVAL '1 month',
                     date_trunc('month', CURRENT_DATE),
                     INTERVAL '1 month'
                 ) AS m
             ),
             e AS (
-                SELECT date_trunc('month', data_emprestimo) AS m, SUM(valor) AS total FROM emprestimos GROUP BY 1
+                SELECT date_trunc('month', data_emprestimo) AS m, SUM(valor) AS total FROM emprestimos
+                WHERE data_emprestimo >= date_trunc('month', CURRENT_DATE) - (INTERVAL '1 month' * %(months)s) + INTERVAL '1 month'
+                GROUP BY 1
             ),
             p AS (
-                SELECT date_trunc('month', data_pagamento) AS m, SUM(valor_pago) AS total FROM pagamentos GROUP BY 1
+                SELECT date_trunc('month', data_pagamento) AS m, SUM(valor_pago) AS total FROM pagamentos
+                WHERE data_pagamento >= date_trunc('month', CURRENT_DATE) - (INTERVAL '1 month' * %(months)s) + INTERVAL '1 month'
+                  AND data_pagamento < date_trunc('month', CURRENT_DATE) + INTERVAL '1 month'
+                GROUP BY 1
             ),
             x AS (
-                SELECT date_trunc('month', data_aplicacao) AS m, SUM(valor) AS total FROM penalizacoes GROUP BY 1
+                SELECT date_trunc('month', data_aplicacao) AS m, SUM(valor) AS total FROM penalizacoes
+                WHERE data_aplicacao >= date_trunc('month', CURRENT_DATE) - (INTERVAL '1 month' * %(months)s) + INTERVAL '1 month'
+                  AND data_aplicacao < date_trunc('month', CURRENT_DATE) + INTERVAL '1 month'
+                GROUP BY 1
             ),
             c AS (
-                SELECT date_trunc('month', data_cadastro) AS m, COUNT(*) AS total FROM clientes GROUP BY 1
+                SELECT date_trunc('month', data_cadastro) AS m, COUNT(*) AS total FROM clientes
+                WHERE data_cadastro >= date_trunc('month', CURRENT_DATE) - (INTERVAL '1 month' * %(months)s) + INTERVAL '1 month'
+                GROUP BY 1
             )
             SELECT
                 to_char(s.m, 'YYYY-MM') AS ym,
@@ -270,7 +291,7 @@ def obter_trends(
             LEFT JOIN x ON x.m = s.m
             LEFT JOIN c ON c.m = s.m
             ORDER BY s.m
-        """, (months,))
+        """, {"months": months})
         rows = cursor.fetchall()
         data = [
             {
@@ -295,35 +316,40 @@ def obter_aging(
     funcionario_atual: dict = Depends(get_current_funcionario),
     use_cache: bool = Query(True),
     refresh: bool = Query(False),
+    cobertura_max: Optional[float] = None,
+    faixa_cobertura: Optional[str] = None,
 ):
     """
     Envelhecimento da dívida (saldo em aberto) por faixas de atraso.
     Buckets: 1-30, 31-60, 61-90, 90+ dias.
+    cobertura_max / faixa_cobertura restringem aos empréstimos com essa cobertura por garantias.
     """
-    ckey = _ckey("aging", {})
+    ctes_cobertura, condicao_cobertura, valores_cobertura = filtro_cobertura("e.emprestimo_id", cobertura_max, faixa_cobertura)
+    params = {"cobertura_max": cobertura_max, "faixa_cobertura": faixa_cobertura, "v": versao_cobertura()} if condicao_cobertura else {}
+    ckey = _ckey("aging", params)
     if use_cache and not refresh:
         cached = _cget(ckey)
         if cached is not None:
             return cached
 
-    conn = get_db_connection()
+    conn = get_db_connection_leitura()
     cursor = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
     try:
-        cursor.execute("""
-            WITH pagos AS (
+        cursor.execute(f"""
+            WITH {ctes_cobertura} pagos AS (
               SELECT emprestimo_id, COALESCE(SUM(valor_pago),0) AS total_pago
               FROM pagamentos
               GROUP BY emprestimo_id
             ),
             ativos AS (
-              SELECT e.emprestimo_id, e.valor, e.data_vencimento, COALESCE(p.total_pago,0) AS total_pago
+              SELECT e.emprestimo_id, {sql_total_devido('e')} AS total_devido, e.data_vencimento, COALESCE(p.total_pago,0) AS total_pago
               FROM emprestimos e
               LEFT JOIN pagos p ON p.emprestimo_id = e.emprestimo_id
-              WHERE e.status = 'Ativo'
+              WHERE e.status = 'Ativo'{condicao_cobertura}
             ),
             calc AS (
               SELECT
-                GREATEST(a.valor * 1.20 - a.total_pago, 0) AS saldo,
+                GREATEST(a.total_devido - a.total_pago, 0) AS saldo,
                 (CURRENT_DATE - DATE(a.data_vencimento))::int AS dias
               FROM ativos a
               WHERE DATE(a.data_vencimento) < CURRENT_DATE
@@ -338,7 +364,7 @@ def obter_aging(
               COALESCE(COUNT(CASE WHEN dias BETWEEN 61 AND 90 THEN 1 END),0) AS c61_90,
               COALESCE(COUNT(CASE WHEN dias > 90 THEN 1 END),0) AS c90_plus
             FROM calc
-        """)
+        """, valores_cobertura)
         r = cursor.fetchone() or {}
         data = {
             "buckets": {
@@ -364,6 +390,227 @@ def obter_aging(
         conn.close()
 
 
+@router.get("/previsao-fluxo")
+def obter_previsao_fluxo(
+    dias: int = Query(90, ge=1, le=365, description="Horizonte da previsão em dias"),
+    funcionario_atual: dict = Depends(get_current_funcionario),
+    refresh: bool = Query(False, description="Ignora a cache e recalcula imediatamente"),
+):
+    """
+    Cobranças esperadas por dia nos próximos `dias` dias, a partir do saldo em aberto de cada
+    empréstimo ativo e da distribuição histórica do atraso dos pagamentos face ao vencimento.
+    Fica em cache até à próxima escrita em pagamentos (ou empréstimos).
+    """
+    return prever_fluxo(dias=dias, refresh=refresh)
+
+
+@router.get("/aging/historico")
+def obter_aging_historico(
+    data_inicio: Optional[date] = Query(None, description="Por omissão, 90 dias antes de data_fim"),
+    data_fim: Optional[date] = Query(None, description="Por omissão, a fotografia mais recente"),
+    funcionario_atual: dict = Depends(get_current_funcionario),
+):
+    """
+    Evolução diária das faixas de atraso e do PAR (portfolio at risk), lida das fotografias
+    de fim de dia (carteira_snapshots_resumo).
+    """
+    conn = get_db_connection_leitura()
+    cursor = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
+    try:
+        if data_fim is None:
+            cursor.execute("SELECT MAX(data_snapshot) AS ultima FROM carteira_snapshots_resumo")
+            data_fim = (cursor.fetchone() or {}).get("ultima") or date.today()
+        data_inicio = data_inicio or data_fim - timedelta(days=90)
+        cursor.execute("""
+            SELECT data_snapshot, faixa, emprestimos, saldo
+            FROM carteira_snapshots_resumo
+            WHERE data_snapshot BETWEEN %s AND %s
+            ORDER BY data_snapshot
+        """, (data_inicio, data_fim))
+        dias: Dict[date, Dict[str, Dict[str, float]]] = {}
+        for r in cursor.fetchall():
+            dias.setdefault(r["data_snapshot"], {})[r["faixa"]] = {
+                "saldo": _to_float(r["saldo"]), "emprestimos": int(r["emprestimos"])
+            }
+        return {
+            "data_inicio": data_inicio.isoformat(),
+            "data_fim": data_fim.isoformat(),
+            "series": [{"data": d.isoformat(), **indicadores(faixas)} for d, faixas in dias.items()],
+        }
+    finally:
+        cursor.close()
+        conn.close()
+
+
+@router.get("/aging/em")
+def obter_aging_em(
+    data: date = Query(..., description="Dia da fotografia (fim do dia)"),
+    cliente_id: Optional[int] = None,
+    detalhe: bool = Query(False, description="Incluir os empréstimos, do maior atraso para o menor"),
+    pular: int = 0,
+    limite: int = Query(100, ge=1, le=1000),
+    funcionario_atual: dict = Depends(get_current_funcionario),
+):
+    """
+    A carteira tal como estava no fim de `data`: faixas de atraso, PAR1/30/60/90 e,
+    opcionalmente, os empréstimos. Responde a partir das fotografias diárias.
+    """
+    conn = get_db_connection_leitura()
+    cursor = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
+    try:
+        if cliente_id is None:
+            cursor.execute("""
+                SELECT faixa, emprestimos, saldo FROM carteira_snapshots_resumo WHERE data_snapshot = %s
+            """, (data,))
+        else:
+            cursor.execute("""
+                SELECT faixa, COUNT(*) AS emprestimos, SUM(saldo) AS saldo
+                FROM carteira_snapshots
+                WHERE data_snapshot = %s AND cliente_id = %s
+                GROUP BY faixa
+            """, (data, cliente_id))
+        por_faixa = {r["faixa"]: {"saldo": _to_float(r["saldo"]), "emprestimos": int(r["emprestimos"])} for r in cursor.fetchall()}
+        if not por_faixa:
+            cursor.execute("SELECT 1 FROM carteira_snapshots_resumo WHERE data_snapshot = %s LIMIT 1", (data,))
+            if cursor.fetchone() is None:
+                raise HTTPException(status_code=404, detail="Não há fotografia da carteira para esta data")
+
+        resposta = {"data": data.isoformat(), **indicadores(por_faixa)}
+        if detalhe:
+            cursor.execute("""
+                SELECT emprestimo_id, cliente_id, dias_atraso, faixa, total_devido, saldo
+                FROM carteira_snapshots
+                WHERE data_snapshot = %s AND (%s::bigint IS NULL OR cliente_id = %s)
+                ORDER BY dias_atraso DESC, saldo DESC, emprestimo_id
+                LIMIT %s OFFSET %s
+            """, (data, cliente_id, cliente_id, limite, pular))
+            resposta["emprestimos_detalhe"] = [
+                {**r, "total_devido": _to_float(r["total_devido"]), "saldo": _to_float(r["saldo"])}
+                for r in cursor.fetchall()
+            ]
+        return resposta
+    finally:
+        cursor.close()
+        conn.close()
+
+
+@router.post("/aging/snapshots", status_code=202)
+def gerar_aging_snapshots(
+    data_inicio: Optional[date] = None,
+    data_fim: Optional[date] = None,
+    funcionario_atual: dict = Depends(get_current_administrador),
+):
+    """
+    (Re)gera as fotografias de [data_inicio, data_fim] numa tarefa em segundo plano
+    (por omissão, só ontem). Serve para preencher o histórico de dias passados.
+    """
+    if data_inicio and data_fim and data_inicio > data_fim:
+        raise HTTPException(status_code=400, detail="data_inicio não pode ser posterior a data_fim")
+    parametros = {k: v.isoformat() for k, v in (("data_inicio", data_inicio), ("data_fim", data_fim)) if v}
+    return submeter_tarefa("snapshots", parametros, funcionario_atual.get("username"))
+
+
+@router.get("/cobertura")
+def obter_cobertura(
+    faixa_cobertura: Optional[str] = Query(None, description=f"Uma de: {', '.join(FAIXAS_COBERTURA)}"),
+    cobertura_max: Optional[float] = Query(None, ge=0, description="Só empréstimos com cobertura abaixo deste rácio"),
+    cliente_id: Optional[int] = None,
+    pular: int = Query(0, ge=0),
+    limite: int = Query(100, ge=1, le=1000),
+    funcionario_atual: dict = Depends(get_current_funcionario),
+    use_cache: bool = Query(True),
+    refresh: bool = Query(False),
+):
+    """
+    Cobertura dos empréstimos ativos por garantias: valor penhorado (repartido pelos
+    empréstimos do cliente em proporção ao saldo) face ao saldo em aberto, e testemunhas.
+    Devolve o resumo por faixa de cobertura da carteira e os empréstimos menos cobertos primeiro.
+    Fica em cache até à próxima escrita em penhor ou testemunhas (ou DASHBOARD_CACHE_TTL).
+    """
+    ctes_cobertura, condicao_cobertura, valores_cobertura = filtro_cobertura("emprestimo_id", cobertura_max, faixa_cobertura)
+    ckey = _ckey("cobertura", {"faixa": faixa_cobertura, "max": cobertura_max, "cliente": cliente_id,
+                                "pular": pular, "limite": limite, "v": versao_cobertura()})
+    if use_cache and not refresh:
+        cached = _cget(ckey)
+        if cached is not None:
+            return cached
+
+    filtro_cliente = " AND cliente_id = %s" if cliente_id is not None else ""
+    valores_cliente = [cliente_id] if cliente_id is not None else []
+    conn = get_db_connection_leitura()
+    cursor = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
+    try:
+        cursor.execute(f"""
+            WITH {sql_cobertura()}
+            SELECT faixa_cobertura,
+                   COUNT(*) AS emprestimos,
+                   COUNT(DISTINCT cliente_id) AS clientes,
+                   COALESCE(SUM(saldo), 0) AS saldo,
+                   COALESCE(SUM(valor_penhor_alocado), 0) AS valor_penhor
+            FROM cobertura
+            WHERE TRUE{filtro_cliente}
+            GROUP BY faixa_cobertura
+        """, valores_cliente)
+        por_faixa = {r["faixa_cobertura"]: r for r in cursor.fetchall()}
+        cursor.execute(f"""
+            WITH {ctes_cobertura or sql_cobertura() + ","} selecionados AS (
+                SELECT * FROM cobertura WHERE TRUE{condicao_cobertura}{filtro_cliente}
+            )
+            SELECT s.emprestimo_id, s.cliente_id, c.nome, s.valor, s.data_vencimento, s.saldo,
+                   s.valor_penhor_alocado, s.valor_penhor_cliente, s.itens_penhor, s.testemunhas,
+                   s.cobertura, s.faixa_cobertura, COUNT(*) OVER () AS total
+            FROM selecionados s
+            JOIN clientes c ON c.cliente_id = s.cliente_id
+            ORDER BY COALESCE(s.cobertura, 0), s.saldo DESC, s.emprestimo_id
+            LIMIT %s OFFSET %s
+        """, valores_cobertura + valores_cliente + [limite, pular])
+        rows = cursor.fetchall()
+    finally:
+        cursor.close()
+        conn.close()
+
+    saldo_total = sum(_to_float(r["saldo"]) for r in por_faixa.values())
+    penhor_total = sum(_to_float(r["valor_penhor"]) for r in por_faixa.values())
+    data = {
+        "resumo": {
+            "emprestimos": sum(int(r["emprestimos"]) for r in por_faixa.values()),
+            "saldo_em_aberto": round(saldo_total, 2),
+            "valor_penhor": round(penhor_total, 2),
+            "cobertura": round(penhor_total / saldo_total, 4) if saldo_total else None,
+            "faixas": {
+                f: {
+                    "emprestimos": int(por_faixa[f]["emprestimos"]) if f in por_faixa else 0,
+                    "clientes": int(por_faixa[f]["clientes"]) if f in por_faixa else 0,
+                    "saldo": _to_float(por_faixa[f]["saldo"]) if f in por_faixa else 0.0,
+                    "valor_penhor": _to_float(por_faixa[f]["valor_penhor"]) if f in por_faixa else 0.0,
+                }
+                for f in FAIXAS_COBERTURA
+            },
+        },
+        "total": int(rows[0]["total"]) if rows else 0,
+        "emprestimos": [
+            {
+                "emprestimo_id": r["emprestimo_id"],
+                "cliente_id": r["cliente_id"],
+                "nome": r["nome"],
+                "valor": _to_float(r["valor"]),
+                "data_vencimento": _to_iso(r["data_vencimento"]),
+                "saldo": _to_float(r["saldo"]),
+                "valor_penhor_alocado": round(_to_float(r["valor_penhor_alocado"]), 2),
+                "valor_penhor_cliente": _to_float(r["valor_penhor_cliente"]),
+                "itens_penhor": int(r["itens_penhor"]),
+                "testemunhas": int(r["testemunhas"]),
+                "cobertura": round(_to_float(r["cobertura"]), 4) if r["cobertura"] is not None else None,
+                "faixa_cobertura": r["faixa_cobertura"],
+            }
+            for r in rows
+        ],
+    }
+    if use_cache:
+        _cset(ckey, data)
+    return data
+
+
 @router.get("/top-clientes")
 def obter_top_clientes(
     metric: str = Query("saldo", pattern="^(saldo|atraso|pagos_mes)$", description="Métrica: saldo | atraso | pagos_mes"),
@@ -371,38 +618,45 @@ def obter_top_clientes(
     funcionario_atual: dict = Depends(get_current_funcionario),
     use_cache: bool = Query(True),
     refresh: bool = Query(False),
+    cobertura_max: Optional[float] = None,
+    faixa_cobertura: Optional[str] = None,
 ):
     """
     Top clientes por:
       - saldo: maior saldo em aberto (empréstimos ativos)
       - atraso: maior número de dias de atraso (empréstimos ativos vencidos)
       - pagos_mes: maior total pago no mês corrente
+    Em saldo e atraso, cobertura_max / faixa_cobertura contam só os empréstimos com essa cobertura.
     """
     metric = metric or "saldo"
-    ckey = _ckey("top-clientes", {"metric": metric, "limit": limit})
+    ctes_cobertura, condicao_cobertura, valores_cobertura = filtro_cobertura("e.emprestimo_id", cobertura_max, faixa_cobertura)
+    params = {"metric": metric, "limit": limit}
+    if condicao_cobertura:
+        params.update(cobertura_max=cobertura_max, faixa_cobertura=faixa_cobertura, v=versao_cobertura())
+    ckey = _ckey("top-clientes", params)
     if use_cache and not refresh:
         cached = _cget(ckey)
         if cached is not None:
             return cached
 
-    conn = get_db_connection()
+    conn = get_db_connection_leitura()
     cursor = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
     try:
         if metric == "saldo":
-            cursor.execute("""
-                WITH pagos AS (
+            cursor.execute(f"""
+                WITH {ctes_cobertura} pagos AS (
                   SELECT emprestimo_id, COALESCE(SUM(valor_pago),0) AS total_pago
                   FROM pagamentos
                   GROUP BY emprestimo_id
                 ),
                 ativos AS (
-                  SELECT e.emprestimo_id, e.cliente_id, e.valor, COALESCE(p.total_pago,0) AS total_pago
+                  SELECT e.emprestimo_id, e.cliente_id, {sql_total_devido('e')} AS total_devido, COALESCE(p.total_pago,0) AS total_pago
                   FROM emprestimos e
                   LEFT JOIN pagos p ON p.emprestimo_id = e.emprestimo_id
-                  WHERE e.status = 'Ativo'
+                  WHERE e.status = 'Ativo'{condicao_cobertura}
                 ),
                 by_cliente AS (
-                  SELECT cliente_id, GREATEST(SUM(valor * 1.20 - total_pago), 0) AS saldo_em_aberto
+                  SELECT cliente_id, GREATEST(SUM(total_devido - total_pago), 0) AS saldo_em_aberto
                   FROM ativos
                   GROUP BY cliente_id
                 )
@@ -411,7 +665,7 @@ def obter_top_clientes(
                 JOIN clientes c ON c.cliente_id = b.cliente_id
                 ORDER BY b.saldo_em_aberto DESC
                 LIMIT %s
-            """, (limit,))
+            """, valores_cobertura + [limit])
             rows = cursor.fetchall()
             data = [
                 {
@@ -422,16 +676,17 @@ def obter_top_clientes(
                 } for r in rows
             ]
         elif metric == "atraso":
-            cursor.execute("""
+            cursor.execute(f"""
+                {"WITH " + ctes_cobertura.rstrip().rstrip(",") if ctes_cobertura else ""}
                 SELECT c.cliente_id, c.nome, c.telefone,
                        MAX(GREATEST((CURRENT_DATE - DATE(e.data_vencimento))::int, 0)) AS max_dias_atraso
                 FROM clientes c
                 JOIN emprestimos e ON e.cliente_id = c.cliente_id
-                WHERE e.status = 'Ativo' AND DATE(e.data_vencimento) < CURRENT_DATE
+                WHERE e.status = 'Ativo' AND DATE(e.data_vencimento) < CURRENT_DATE{condicao_cobertura}
                 GROUP BY c.cliente_id, c.nome, c.telefone
                 ORDER BY max_dias_atraso DESC
                 LIMIT %s
-            """, (limit,))
+            """, valores_cobertura + [limit])
             rows = cursor.fetchall()
             data = [
                 {
@@ -446,7 +701,8 @@ def obter_top_clientes(
                 SELECT c.cliente_id, c.nome, c.telefone, COALESCE(SUM(p.valor_pago),0) AS total_pago_mes
                 FROM clientes c
                 JOIN pagamentos p ON p.cliente_id = c.cliente_id
-                WHERE date_trunc('month', p.data_pagamento) = date_trunc('month', CURRENT_DATE)
+                WHERE p.data_pagamento >= date_trunc('month', CURRENT_DATE)
+                  AND p.data_pagamento < date_trunc('month', CURRENT_DATE) + INTERVAL '1 month'
                 GROUP BY c.cliente_id, c.nome, c.telefone
                 ORDER BY total_pago_mes DESC
                 LIMIT %s
@@ -488,7 +744,7 @@ def obter_distribuicoes(
         if cached is not None:
             return cached
 
-    conn = get_db_connection()
+    conn = get_db_connection_leitura()
     cursor = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
     try:
         cursor.execute("SELECT sexo, COUNT(*) AS total FROM clientes GROUP BY sexo")
@@ -563,7 +819,7 @@ def obter_notificacoes_metricas(
         if cached is not None:
             return cached
 
-    conn = get_db_connection()
+    conn = get_db_connection_leitura()
     cursor = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
     try:
         cursor.execute("SELECT status, COUNT(*) AS total FROM notificacoes GROUP BY status")
@@ -598,7 +854,7 @@ def obter_eficiencia_cobranca(
 ):
     """
     Eficiência de cobrança por mês:
-      - due_mes: soma (valor * 1.20) de empréstimos cujo vencimento cai no mês
+      - due_mes: soma do total devido dos empréstimos cujo vencimento cai no mês
       - recebido_mes: pagamentos + penalizações no mês
       - eficiencia_percent = (recebido_mes / due_mes) * 100
     """
@@ -609,29 +865,35 @@ def obter_eficiencia_cobranca(
         if cached is not None:
             return cached
 
-    conn = get_db_connection()
+    conn = get_db_connection_leitura()
     cursor = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
     try:
-        cursor.execute("""
+        cursor.execute(f"""
             WITH series AS (
                 SELECT generate_series(
-                    date_trunc('month', CURRENT_DATE) - (INTERVAL '1 month' * %s) + INTERVAL '1 month',
+                    date_trunc('month', CURRENT_DATE) - (INTERVAL '1 month' * %(months)s) + INTERVAL '1 month',
                     date_trunc('month', CURRENT_DATE),
                     INTERVAL '1 month'
                 ) AS m
             ),
             due AS (
-                SELECT date_trunc('month', data_vencimento) AS m, SUM(valor * 1.20) AS due_mes
+                SELECT date_trunc('month', data_vencimento) AS m, SUM({sql_total_devido()}) AS due_mes
                 FROM emprestimos
                 GROUP BY 1
             ),
             pay AS (
                 SELECT date_trunc('month', data_pagamento) AS m, SUM(valor_pago) AS pagos_mes
-                FROM pagamentos GROUP BY 1
+                FROM pagamentos
+                WHERE data_pagamento >= date_trunc('month', CURRENT_DATE) - (INTERVAL '1 month' * %(months)s) + INTERVAL '1 month'
+                  AND data_pagamento < date_trunc('month', CURRENT_DATE) + INTERVAL '1 month'
+                GROUP BY 1
             ),
             pen AS (
                 SELECT date_trunc('month', data_aplicacao) AS m, SUM(valor) AS penalizacoes_mes
-                FROM penalizacoes GROUP BY 1
+                FROM penalizacoes
+                WHERE data_aplicacao >= date_trunc('month', CURRENT_DATE) - (INTERVAL '1 month' * %(months)s) + INTERVAL '1 month'
+                  AND data_aplicacao < date_trunc('month', CURRENT_DATE) + INTERVAL '1 month'
+                GROUP BY 1
             )
             SELECT to_char(s.m, 'YYYY-MM') AS ym,
                    COALESCE(d.due_mes, 0) AS due_mes,
@@ -642,7 +904,7 @@ def obter_eficiencia_cobranca(
             LEFT JOIN pay p ON p.m = s.m
             LEFT JOIN pen x ON x.m = s.m
             ORDER BY s.m
-        """, (months,))
+        """, {"months": months})
         out = []
         for r in cursor.fetchall():
             due = _to_float(r["due_mes"])
@@ -685,10 +947,10 @@ def obter_clientes_insights(
         if cached is not None:
             return cached
 
-    conn = get_db_connection()
+    conn = get_db_connection_leitura()
     cursor = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
     try:
-        cursor.execute("""
+        cursor.execute(f"""
             WITH emprest AS (
                 SELECT cliente_id,
                        COUNT(*) AS total_emprestimos,
@@ -703,13 +965,13 @@ def obter_clientes_insights(
                 GROUP BY emprestimo_id
             ),
             ativos AS (
-                SELECT e.cliente_id, e.emprestimo_id, e.valor, COALESCE(p.total_pago,0) AS total_pago, e.data_vencimento
+                SELECT e.cliente_id, e.emprestimo_id, {sql_total_devido('e')} AS total_devido, COALESCE(p.total_pago,0) AS total_pago, e.data_vencimento
                 FROM emprestimos e
                 LEFT JOIN pagos p ON p.emprestimo_id = e.emprestimo_id
                 WHERE e.status='Ativo'
             ),
             saldo AS (
-                SELECT cliente_id, GREATEST(SUM(valor*1.20 - total_pago), 0) AS saldo_em_aberto
+                SELECT cliente_id, GREATEST(SUM(total_devido - total_pago), 0) AS saldo_em_aberto
                 FROM ativos
                 GROUP BY cliente_id
             ),
@@ -0,0 +1,46 @@
+from fastapi import APIRouter, Depends
+from app.utils.auth import get_current_administrador
+from app.database.consultas_lentas import (
+    SLOW_QUERY_LOG,
+    SLOW_QUERY_THRESHOLD_MS,
+    SLOW_QUERY_EXPLAIN_SAMPLE_RATE,
+    SLOW_QUERY_BUFFER_SIZE,
+    listar_consultas_agrupadas,
+    limpar_consultas,
+)
+from app.database.replicas import REPLICA_MAX_LAG_S, REPLICA_STICKY_S, estado_replicas
+
+router = APIRouter()
+
+
+@router.get("/consultas-lentas")
+def obter_consultas_lentas(funcionario_atual: dict = Depends(get_current_administrador)):
+    """
+    Consultas acima do limiar (SLOW_QUERY_THRESHOLD_MS), agrupadas por instrução normalizada.
+    Só são recolhidas quando SLOW_QUERY_LOG está ativo.
+    """
+    grupos = listar_consultas_agrupadas()
+    return {
+        "ativo": SLOW_QUERY_LOG,
+        "limiar_ms": SLOW_QUERY_THRESHOLD_MS,
+        "taxa_amostragem_explain": SLOW_QUERY_EXPLAIN_SAMPLE_RATE,
+        "capacidade_buffer": SLOW_QUERY_BUFFER_SIZE,
+        "total_grupos": len(grupos),
+        "consultas": grupos,
+    }
+
+
+@router.delete("/consultas-lentas")
+def limpar_consultas_lentas(funcionario_atual: dict = Depends(get_current_administrador)):
+    limpar_consultas()
+    return {"mensagem": "Registo de consultas lentas limpo"}
+
+
+@router.get("/replicas")
+def obter_estado_replicas(funcionario_atual: dict = Depends(get_current_administrador)):
+    """Estado das réplicas de leitura conforme a última verificação de saúde."""
+    return {
+        "atraso_maximo_s": REPLICA_MAX_LAG_S,
+        "janela_pos_escrita_s": REPLICA_STICKY_S,
+        "replicas": estado_replicas(),
+    }
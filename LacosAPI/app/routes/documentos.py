@@ -2,7 +2,7 @@ from fastapi import APIRouter, HTTPException, status, Depends, UploadFile, File,
 from fastapi.responses import StreamingResponse
 from typing import List
 from app.schemas.documento import Documento, DocumentoCreate, DocumentoResponse, TIPOS_DOCUMENTO_PERMITIDOS
-from app.database.database import get_db_connection
+from app.database.database import get_db_connection, get_db_connection_leitura
 from app.utils.auth import get_current_funcionario
 import psycopg2.extras
 import io
@@ -71,7 +71,7 @@ def criar_documento(
 
 @router.get("/listar", response_model=List[DocumentoResponse])
 def listar_documentos(pular: int = 0, limite: int = 100, funcionario_atual: dict = Depends(get_current_funcionario)):
-    conn = get_db_connection()
+    conn = get_db_connection_leitura()
     cursor = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
     
     try:
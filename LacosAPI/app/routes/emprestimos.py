@@ -1,28 +1,69 @@
-from fastapi import APIRouter, HTTPException, status, Depends
-from typing import List
-from app.schemas.emprestimo import Emprestimo
-from app.database.database import get_db_connection
-from app.utils.auth import get_current_funcionario
+from fastapi import APIRouter, HTTPException, status, Depends, Query, Response
+from typing import List, Optional
+from app.schemas.emprestimo import Emprestimo, Prestacao
+from app.database.database import get_db_connection, get_db_connection_leitura
+from app.utils.auth import get_current_funcionario, get_current_administrador
+from app.utils.prestacoes import gerar_para_emprestimos, gerar_carteira, FATOR_TOTAL_PADRAO
+from app.utils import afordabilidade
+from app.utils.previsao import invalidar_previsao
+from app.utils.serializacao import responder_lista
+from app.utils.filtros import FiltroSQL, ordenacao, contar_total, cabecalhos_total
 from app.utils.notifications import notificar_confirmacao_emprestimo, notificar_admin_emprestimo
 import psycopg2.extras
-from datetime import datetime
+from datetime import datetime, date
+from decimal import Decimal
 
 router = APIRouter()
 
+def _validar_produto(cursor, emprestimo: Emprestimo):
+    if emprestimo.produto_id is None:
+        if emprestimo.data_vencimento is None:
+            raise HTTPException(status_code=400, detail="data_vencimento é obrigatória para empréstimos sem produto")
+        return
+    cursor.execute("SELECT ativo FROM produtos_credito WHERE produto_id = %s", (emprestimo.produto_id,))
+    produto = cursor.fetchone()
+    if produto is None:
+        raise HTTPException(status_code=404, detail="Produto de crédito não encontrado")
+    if not produto['ativo']:
+        raise HTTPException(status_code=400, detail="Produto de crédito inativo")
+
+def _verificar_afordabilidade(cursor, emprestimo: Emprestimo, response: Response):
+    """
+    Corre depois do INSERT, na mesma transação: o novo empréstimo já entra na exposição.
+    Em modo bloquear a exceção impede o commit e o empréstimo não fica gravado.
+    """
+    if afordabilidade.AFORDABILIDADE_MODO == "desligado" or emprestimo.status != "Ativo":
+        return
+    avaliacao = afordabilidade.avaliar(cursor, emprestimo.cliente_id)
+    if not avaliacao["aprovado"] and afordabilidade.AFORDABILIDADE_MODO == "bloquear":
+        raise HTTPException(status_code=400, detail={
+            "mensagem": "Empréstimo recusado na verificação de capacidade de pagamento",
+            "avaliacao": avaliacao,
+        })
+    if avaliacao["taxa_esforco"] is not None:
+        response.headers["X-Afordabilidade-Taxa"] = str(avaliacao["taxa_esforco"])
+    if avaliacao["motivo"]:
+        # Cabeçalhos HTTP só aceitam latin-1
+        response.headers["X-Afordabilidade-Aviso"] = avaliacao["motivo"].encode("latin-1", "replace").decode("latin-1")
+
 @router.post("/criar", response_model=Emprestimo)
-def criar_emprestimo(emprestimo: Emprestimo, funcionario_atual: dict = Depends(get_current_funcionario)):
+def criar_emprestimo(emprestimo: Emprestimo, response: Response, funcionario_atual: dict = Depends(get_current_funcionario)):
     conn = get_db_connection()
     cursor = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
     
     try:
+        _validar_produto(cursor, emprestimo)
+        # Com produto, data_vencimento passa a ser a da última prestação (definida pelo cronograma)
         cursor.execute(
-            "INSERT INTO emprestimos (cliente_id, valor, data_emprestimo, data_vencimento, status) VALUES (%s, %s, %s, %s, %s) RETURNING emprestimo_id",
-            (emprestimo.cliente_id, emprestimo.valor, emprestimo.data_emprestimo, emprestimo.data_vencimento, emprestimo.status)
+            "INSERT INTO emprestimos (cliente_id, valor, data_emprestimo, data_vencimento, status, produto_id) VALUES (%s, %s, %s, %s, %s, %s) RETURNING emprestimo_id",
+            (emprestimo.cliente_id, emprestimo.valor, emprestimo.data_emprestimo, emprestimo.data_vencimento or emprestimo.data_emprestimo, emprestimo.status, emprestimo.produto_id)
         )
         result = cursor.fetchone()
         if result is None:
             raise HTTPException(status_code=500, detail="Falha ao criar empréstimo")
         emprestimo_id = result['emprestimo_id']
+        gerar_para_emprestimos(cursor, [emprestimo_id])
+        _verificar_afordabilidade(cursor, emprestimo, response)
 
         # Obter dados do cliente para notificação admin
         cursor.execute("SELECT nome, telefone FROM clientes WHERE cliente_id = %s", (emprestimo.cliente_id,))
@@ -33,32 +74,60 @@ def criar_emprestimo(emprestimo: Emprestimo, funcionario_atual: dict = Depends(g
             # Gerar notificação administrativa
             notificar_admin_emprestimo(cliente_nome, cliente_telefone, float(emprestimo.valor), emprestimo_id)
 
+        cursor.execute("SELECT * FROM emprestimos WHERE emprestimo_id = %s", (emprestimo_id,))
+        criado = cursor.fetchone()
         conn.commit()
+        invalidar_previsao()
 
         # Gerar notificação automática de confirmação para o cliente e admin
         notificar_confirmacao_emprestimo(emprestimo.cliente_id, float(emprestimo.valor), cliente_nome, cliente_telefone)
 
-        return Emprestimo(
-            emprestimo_id=emprestimo_id,
-            cliente_id=emprestimo.cliente_id,
-            valor=emprestimo.valor,
-            data_emprestimo=emprestimo.data_emprestimo,
-            data_vencimento=emprestimo.data_vencimento,
-            status=emprestimo.status
-        )
+        return Emprestimo(**criado)
     finally:
         cursor.close()
         conn.close()
 
+ORDENACAO_EMPRESTIMOS = {
+    "emprestimo_id": "emprestimo_id",
+    "data_emprestimo": "data_emprestimo",
+    "data_vencimento": "data_vencimento",
+    "valor": "valor",
+    "status": "status",
+}
+
 @router.get("/listar", response_model=List[Emprestimo])
-def listar_emprestimos(pular: int = 0, limite: int = 100, funcionario_atual: dict = Depends(get_current_funcionario)):
-    conn = get_db_connection()
+def listar_emprestimos(
+    pular: int = 0,
+    limite: int = 100,
+    status: Optional[str] = None,
+    cliente_id: Optional[int] = None,
+    data_inicio: Optional[date] = Query(None, description="data_emprestimo a partir de (inclusivo)"),
+    data_fim: Optional[date] = Query(None, description="data_emprestimo até (inclusivo)"),
+    vencimento_inicio: Optional[date] = None,
+    vencimento_fim: Optional[date] = None,
+    valor_min: Optional[Decimal] = None,
+    valor_max: Optional[Decimal] = None,
+    ordenar_por: Optional[str] = Query(None, description=f"Um de: {', '.join(ORDENACAO_EMPRESTIMOS)}"),
+    ordem: str = Query("asc", pattern="^(asc|desc)$"),
+    funcionario_atual: dict = Depends(get_current_funcionario),
+):
+    filtro = (FiltroSQL()
+              .igual("status", status)
+              .igual("cliente_id", cliente_id)
+              .intervalo_datas("data_emprestimo", data_inicio, data_fim)
+              .intervalo_datas("data_vencimento", vencimento_inicio, vencimento_fim)
+              .minimo("valor", valor_min)
+              .maximo("valor", valor_max))
+    order_by = ordenacao(ordenar_por, ordem, ORDENACAO_EMPRESTIMOS, "emprestimo_id", "emprestimo_id")
+
+    conn = get_db_connection_leitura()
     cursor = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
     
     try:
-        cursor.execute("SELECT * FROM emprestimos LIMIT %s OFFSET %s", (limite, pular))
+        cursor.execute(f"SELECT * FROM emprestimos{filtro.where()}{order_by} LIMIT %s OFFSET %s", filtro.valores + [limite, pular])
         emprestimos = cursor.fetchall()
-        return [Emprestimo(**emprestimo) for emprestimo in emprestimos]
+        total, estimado = contar_total(cursor, "emprestimos", filtro)
+        return responder_lista(emprestimos, Emprestimo, cabecalhos_total(total, estimado))
     finally:
         cursor.close()
         conn.close()
@@ -86,15 +155,20 @@ def atualizar_emprestimo(emprestimo_id: int, emprestimo: Emprestimo, funcionario
     cursor = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
     
     try:
+        _validar_produto(cursor, emprestimo)
         cursor.execute(
-            "UPDATE emprestimos SET cliente_id = %s, valor = %s, data_emprestimo = %s, data_vencimento = %s, status = %s WHERE emprestimo_id = %s RETURNING *",
-            (emprestimo.cliente_id, emprestimo.valor, emprestimo.data_emprestimo, emprestimo.data_vencimento, emprestimo.status, emprestimo_id)
+            "UPDATE emprestimos SET cliente_id = %s, valor = %s, data_emprestimo = %s, data_vencimento = COALESCE(%s, data_vencimento), status = %s, produto_id = %s, total_devido = NULL WHERE emprestimo_id = %s RETURNING emprestimo_id",
+            (emprestimo.cliente_id, emprestimo.valor, emprestimo.data_emprestimo, emprestimo.data_vencimento, emprestimo.status, emprestimo.produto_id, emprestimo_id)
         )
+        if cursor.fetchone() is None:
+            raise HTTPException(status_code=404, detail="Empréstimo não encontrado")
+        
+        # Valor, datas ou produto podem ter mudado: o plano de prestações é refeito
+        gerar_para_emprestimos(cursor, [emprestimo_id])
+        cursor.execute("SELECT * FROM emprestimos WHERE emprestimo_id = %s", (emprestimo_id,))
         emprestimo_atualizado = cursor.fetchone()
         conn.commit()
-        
-        if emprestimo_atualizado is None:
-            raise HTTPException(status_code=404, detail="Empréstimo não encontrado")
+        invalidar_previsao()
         
         return Emprestimo(**emprestimo_atualizado)
     finally:
@@ -109,6 +183,7 @@ def remover_emprestimo(emprestimo_id: int, funcionario_atual: dict = Depends(get
     try:
         cursor.execute("DELETE FROM emprestimos WHERE emprestimo_id = %s", (emprestimo_id,))
         conn.commit()
+        invalidar_previsao()
         
         if cursor.rowcount == 0:
             raise HTTPException(status_code=404, detail="Empréstimo não encontrado")
@@ -118,6 +193,29 @@ def remover_emprestimo(emprestimo_id: int, funcionario_atual: dict = Depends(get
         cursor.close()
         conn.close()
 
+@router.get("/afordabilidade/{cliente_id}")
+def simular_afordabilidade(
+    cliente_id: int,
+    valor: Decimal = Query(Decimal(0), ge=0, description="Valor de um novo empréstimo a simular"),
+    meses: int = Query(1, ge=1, description="Meses em que o novo empréstimo seria pago"),
+    funcionario_atual: dict = Depends(get_current_funcionario),
+):
+    """Taxa de esforço atual do cliente e, com valor, a que teria com um novo empréstimo."""
+    # Primário e não réplica: a avaliação pode gravar o rendimento do cliente
+    conn = get_db_connection()
+    cursor = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
+    try:
+        cursor.execute("SELECT 1 FROM clientes WHERE cliente_id = %s", (cliente_id,))
+        if cursor.fetchone() is None:
+            raise HTTPException(status_code=404, detail="Cliente não encontrado")
+        prestacao = valor * FATOR_TOTAL_PADRAO / meses
+        avaliacao = afordabilidade.avaliar(cursor, cliente_id, prestacao_adicional=prestacao)
+        conn.commit()
+        return avaliacao
+    finally:
+        cursor.close()
+        conn.close()
+
 @router.get("/cliente/{cliente_id}", response_model=List[Emprestimo])
 def obter_emprestimos_por_cliente(cliente_id: int, funcionario_atual: dict = Depends(get_current_funcionario)):
     conn = get_db_connection()
@@ -126,7 +224,45 @@ def obter_emprestimos_por_cliente(cliente_id: int, funcionario_atual: dict = Dep
     try:
         cursor.execute("SELECT * FROM emprestimos WHERE cliente_id = %s", (cliente_id,))
         emprestimos = cursor.fetchall()
-        return [Emprestimo(**emprestimo) for emprestimo in emprestimos]
+        return responder_lista(emprestimos, Emprestimo)
     finally:
         cursor.close()
         conn.close()
+
+@router.get("/cronograma/{emprestimo_id}", response_model=List[Prestacao])
+def obter_cronograma(emprestimo_id: int, funcionario_atual: dict = Depends(get_current_funcionario)):
+    """Plano de prestações do empréstimo com o valor já alocado a cada prestação."""
+    conn = get_db_connection()
+    cursor = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
+    
+    try:
+        cursor.execute("""
+            SELECT emprestimo_id, numero, data_vencimento, capital, juro, capital + juro AS valor,
+                   valor_pago, capital + juro - valor_pago AS em_aberto
+            FROM prestacoes
+            WHERE emprestimo_id = %s
+            ORDER BY numero
+        """, (emprestimo_id,))
+        prestacoes = cursor.fetchall()
+        
+        if not prestacoes:
+            cursor.execute("SELECT 1 FROM emprestimos WHERE emprestimo_id = %s", (emprestimo_id,))
+            if cursor.fetchone() is None:
+                raise HTTPException(status_code=404, detail="Empréstimo não encontrado")
+        
+        return responder_lista(prestacoes, Prestacao)
+    finally:
+        cursor.close()
+        conn.close()
+
+@router.post("/cronograma/gerar")
+def gerar_cronogramas_carteira(regenerar: bool = False, funcionario_atual: dict = Depends(get_current_administrador)):
+    """
+    Gera os planos de prestações da carteira existente (por omissão, só dos empréstimos sem plano).
+    Para carteiras grandes prefira a tarefa 'cronogramas' em /api/tarefas.
+    """
+    conn = get_db_connection()
+    try:
+        return gerar_carteira(conn, regenerar=regenerar)
+    finally:
+        conn.close()
@@ -0,0 +1,143 @@
+from fastapi import APIRouter, HTTPException, Depends, Query
+from fastapi.responses import StreamingResponse
+from typing import Optional
+from app.database.database import get_db_connection_leitura
+from app.utils.auth import get_current_funcionario
+from app.utils.serializacao import codificar_json
+import psycopg2.extras
+from datetime import date, datetime, timedelta, timezone
+import csv
+import io
+import os
+
+# Linhas pedidas ao servidor por cada ida à base (cursor nomeado)
+EXPORT_ITERSIZE = int(os.getenv("EXPORT_ITERSIZE", "5000"))
+
+# Tabelas exportáveis: colunas, coluna de data para o intervalo e filtros de igualdade permitidos
+TABELAS_EXPORTAVEIS = {
+    "pagamentos": {
+        "colunas": ["pagamento_id", "emprestimo_id", "cliente_id", "valor_pago", "data_pagamento",
+                    "metodo_pagamento", "referencia_pagamento"],
+        "chave": "pagamento_id",
+        "coluna_data": "data_pagamento",
+        "filtros": {"metodo_pagamento": "metodo_pagamento", "cliente_id": "cliente_id"},
+    },
+    "emprestimos": {
+        "colunas": ["emprestimo_id", "cliente_id", "valor", "data_emprestimo", "data_vencimento", "status"],
+        "chave": "emprestimo_id",
+        "coluna_data": "data_emprestimo",
+        "filtros": {"status": "status", "cliente_id": "cliente_id"},
+    },
+    "penalizacoes": {
+        "colunas": ["penalizacao_id", "emprestimo_id", "cliente_id", "tipo", "dias_atraso", "valor",
+                    "status", "data_aplicacao", "observacoes"],
+        "chave": "penalizacao_id",
+        "coluna_data": "data_aplicacao",
+        "filtros": {"status": "status", "cliente_id": "cliente_id"},
+    },
+}
+
+
+def _csv_valor(valor):
+    if valor is None:
+        return ""
+    if isinstance(valor, datetime):
+        return valor.isoformat()
+    return valor
+
+
+def _gerar_linhas(conn, cursor, colunas, formato):
+    """
+    Gerador que lê o cursor nomeado em blocos de itersize e produz NDJSON ou CSV.
+    A ligação só é fechada quando o cliente termina (ou aborta) a transferência.
+    """
+    try:
+        if formato == "csv":
+            buffer = io.StringIO()
+            escritor = csv.writer(buffer)
+            escritor.writerow(colunas)
+            pendentes = 1
+            for linha in cursor:
+                escritor.writerow([_csv_valor(linha[c]) for c in colunas])
+                pendentes += 1
+                if pendentes >= 1000:
+                    yield buffer.getvalue()
+                    buffer.seek(0)
+                    buffer.truncate(0)
+                    pendentes = 0
+            if pendentes:
+                yield buffer.getvalue()
+        else:
+            bloco = []
+            for linha in cursor:
+                bloco.append(codificar_json(linha))
+                if len(bloco) >= 1000:
+                    yield b"\n".join(bloco) + b"\n"
+                    bloco = []
+            if bloco:
+                yield b"\n".join(bloco) + b"\n"
+    finally:
+        cursor.close()
+        conn.rollback()
+        conn.close()
+
+
+router = APIRouter()
+
+
+@router.get("/{tabela}")
+def exportar_tabela(
+    tabela: str,
+    formato: str = Query("ndjson", pattern="^(ndjson|csv)$"),
+    data_inicio: Optional[date] = Query(None, description="Inclusivo, sobre a coluna de data da tabela"),
+    data_fim: Optional[date] = Query(None, description="Inclusivo"),
+    status: Optional[str] = Query(None, description="Apenas emprestimos e penalizacoes"),
+    metodo_pagamento: Optional[str] = Query(None, description="Apenas pagamentos"),
+    cliente_id: Optional[int] = None,
+    funcionario_atual: dict = Depends(get_current_funcionario),
+):
+    """
+    Exporta pagamentos, emprestimos ou penalizacoes completos em streaming (NDJSON ou CSV).
+    Usa um cursor do lado do servidor, pelo que a memória não cresce com o tamanho da tabela.
+    """
+    config = TABELAS_EXPORTAVEIS.get(tabela)
+    if config is None:
+        raise HTTPException(status_code=404, detail=f"Tabela não exportável. Use uma de: {', '.join(TABELAS_EXPORTAVEIS)}")
+
+    condicoes = []
+    valores = []
+    if data_inicio is not None:
+        condicoes.append(f"{config['coluna_data']} >= %s")
+        valores.append(datetime.combine(data_inicio, datetime.min.time(), tzinfo=timezone.utc))
+    if data_fim is not None:
+        condicoes.append(f"{config['coluna_data']} < %s")
+        valores.append(datetime.combine(data_fim + timedelta(days=1), datetime.min.time(), tzinfo=timezone.utc))
+    for nome, valor in (("status", status), ("metodo_pagamento", metodo_pagamento), ("cliente_id", cliente_id)):
+        if valor is None:
+            continue
+        if nome not in config["filtros"]:
+            raise HTTPException(status_code=400, detail=f"Filtro '{nome}' não disponível para {tabela}")
+        condicoes.append(f"{config['filtros'][nome]} = %s")
+        valores.append(valor)
+
+    consulta = f"SELECT {', '.join(config['colunas'])} FROM {tabela}"
+    if condicoes:
+        consulta += " WHERE " + " AND ".join(condicoes)
+    consulta += f" ORDER BY {config['chave']}"
+
+    conn = get_db_connection_leitura()
+    try:
+        cursor = conn.cursor(name=f"exportacao_{tabela}", cursor_factory=psycopg2.extras.RealDictCursor)
+        cursor.itersize = EXPORT_ITERSIZE
+        cursor.execute(consulta, valores)
+    except Exception as e:
+        conn.close()
+        raise HTTPException(status_code=500, detail=f"Erro ao exportar {tabela}: {str(e)}")
+
+    nome_ficheiro = f"{tabela}_{datetime.now(timezone.utc).strftime('%Y%m%d')}.{formato}"
+    media_type = "text/csv; charset=utf-8" if formato == "csv" else "application/x-ndjson"
+    return StreamingResponse(
+        _gerar_linhas(conn, cursor, config["colunas"], formato),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{nome_ficheiro}"'},
+    )
@@ -1,7 +1,7 @@
 from fastapi import APIRouter, HTTPException, status, Depends
 from typing import List
 from app.schemas.funcionario import Funcionario, FuncionarioCreate, FuncionarioUpdate, FuncionarioResponse
-from app.database.database import get_db_connection
+from app.database.database import get_db_connection, get_db_connection_leitura
 from app.utils.auth import get_current_funcionario, get_password_hash
 import psycopg2.extras
 from datetime import datetime
@@ -49,7 +49,7 @@ def criar_funcionario(funcionario: FuncionarioCreate, funcionario_atual: dict =
 
 @router.get("/listar", response_model=List[FuncionarioResponse])
 def listar_funcionarios(pular: int = 0, limite: int = 100, funcionario_atual: dict = Depends(get_current_funcionario)):
-    conn = get_db_connection()
+    conn = get_db_connection_leitura()
     cursor = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
     
     try:
@@ -1,7 +1,7 @@
 from fastapi import APIRouter, HTTPException, Depends
 from typing import List
 from app.schemas.historico_credito import HistoricoCredito, HistoricoCreditoCriar, HistoricoCreditoAtualizar
-from app.database.database import get_db_connection
+from app.database.database import get_db_connection, get_db_connection_leitura
 from app.utils.auth import get_current_funcionario
 import psycopg2.extras
 from datetime import datetime, timezone
@@ -38,7 +38,7 @@ def criar_historico_credito(historico: HistoricoCreditoCriar, funcionario_atual:
 
 @router.get("/listar", response_model=List[HistoricoCredito])
 def listar_historico_credito(pular: int = 0, limite: int = 100, funcionario_atual: dict = Depends(get_current_funcionario)):
-    conn = get_db_connection()
+    conn = get_db_connection_leitura()
     cursor = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
     
     try:
@@ -134,8 +134,12 @@ def remover_historico_credito(historico_id: int, funcionario_atual: dict = Depen
         cursor.close()
         conn.close()
 
-@router.post("/atualizar-automatico")
-def atualizar_historico_credito_automatico(funcionario_atual: dict = Depends(get_current_funcionario)):
+def executar_atualizacao_historico(progresso=None) -> dict:
+    """
+    Atualiza o histórico de crédito de cada cliente a partir do seu empréstimo mais recente.
+    progresso(processados, total), quando indicado, é chamado a cada iteração e pode
+    interromper a execução lançando uma exceção (nada é gravado nesse caso).
+    """
     conn = get_db_connection()
     cursor = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
     
@@ -149,7 +153,9 @@ def atualizar_historico_credito_automatico(funcionario_atual: dict = Depends(get
         clientes = cursor.fetchall()
         historicos_atualizados = []
         
-        for cliente in clientes:
+        for i, cliente in enumerate(clientes):
+            if progresso:
+                progresso(i, len(clientes))
             cliente_id = cliente['cliente_id']
             
             cursor.execute("""
@@ -230,13 +236,22 @@ def atualizar_historico_credito_automatico(funcionario_atual: dict = Depends(get
             "historicos": historicos_atualizados
         }
         
-    except Exception as e:
+    except Exception:
         conn.rollback()
-        raise HTTPException(status_code=500, detail=f"Erro ao atualizar histórico de crédito: {str(e)}")
+        raise
     finally:
         cursor.close()
         conn.close()
 
+@router.post("/atualizar-automatico")
+def atualizar_historico_credito_automatico(funcionario_atual: dict = Depends(get_current_funcionario)):
+    try:
+        return executar_atualizacao_historico()
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Erro ao atualizar histórico de crédito: {str(e)}")
+
 @router.get("/analise-credito/{cliente_id}")
 def analise_credito_cliente(cliente_id: int, funcionario_atual: dict = Depends(get_current_funcionario)):
     conn = get_db_connection()
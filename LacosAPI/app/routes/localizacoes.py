@@ -1,9 +1,17 @@
-from fastapi import APIRouter, HTTPException, status, Depends
-from typing import List
+from fastapi import APIRouter, HTTPException, status, Depends, Query
+from typing import List, Optional
 from app.schemas.localizacao import Localizacao
-from app.database.database import get_db_connection
+from app.database.database import get_db_connection, get_db_connection_leitura
 from app.utils.auth import get_current_funcionario
+from app.utils.filtros import FiltroSQL
+from app.utils.geo import caixa_do_raio, graus_da_celula, sql_distancia_km, sql_na_caixa
+from app.utils.prestacoes import sql_total_devido
+from app.utils.rotas import distancias_percurso, ordenar_por_grupos, ordenar_visitas, projetar_km
+from app.utils.serializacao import responder_lista
+from datetime import date
+import numpy as np
 import psycopg2.extras
+import time
 
 router = APIRouter()
 
@@ -14,8 +22,8 @@ def criar_localizacao(localizacao: Localizacao, funcionario_atual: dict = Depend
     
     try:
         cursor.execute(
-            "INSERT INTO localizacao (cliente_id, bairro, numero_da_casa, quarteirao, cidade, distrito, provincia) VALUES (%s, %s, %s, %s, %s, %s, %s) RETURNING localizacao_id",
-            (localizacao.cliente_id, localizacao.bairro, localizacao.numero_da_casa, localizacao.quarteirao, localizacao.cidade, localizacao.distrito, localizacao.provincia)
+            "INSERT INTO localizacao (cliente_id, bairro, numero_da_casa, quarteirao, cidade, distrito, provincia, latitude, longitude) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s) RETURNING localizacao_id",
+            (localizacao.cliente_id, localizacao.bairro, localizacao.numero_da_casa, localizacao.quarteirao, localizacao.cidade, localizacao.distrito, localizacao.provincia, localizacao.latitude, localizacao.longitude)
         )
         result = cursor.fetchone()
         if result is None:
@@ -31,7 +39,9 @@ def criar_localizacao(localizacao: Localizacao, funcionario_atual: dict = Depend
             quarteirao=localizacao.quarteirao,
             cidade=localizacao.cidade,
             distrito=localizacao.distrito,
-            provincia=localizacao.provincia
+            provincia=localizacao.provincia,
+            latitude=localizacao.latitude,
+            longitude=localizacao.longitude
         )
     finally:
         cursor.close()
@@ -39,13 +49,13 @@ def criar_localizacao(localizacao: Localizacao, funcionario_atual: dict = Depend
 
 @router.get("/listar", response_model=List[Localizacao])
 def listar_localizacoes(pular: int = 0, limite: int = 100, funcionario_atual: dict = Depends(get_current_funcionario)):
-    conn = get_db_connection()
+    conn = get_db_connection_leitura()
     cursor = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
     
     try:
         cursor.execute("SELECT * FROM localizacao LIMIT %s OFFSET %s", (limite, pular))
         localizacoes = cursor.fetchall()
-        return [Localizacao(**localizacao) for localizacao in localizacoes]
+        return responder_lista(localizacoes, Localizacao)
     finally:
         cursor.close()
         conn.close()
@@ -74,8 +84,8 @@ def atualizar_localizacao(localizacao_id: int, localizacao: Localizacao, funcion
     
     try:
         cursor.execute(
-            "UPDATE localizacao SET cliente_id = %s, bairro = %s, numero_da_casa = %s, quarteirao = %s, cidade = %s, distrito = %s, provincia = %s WHERE localizacao_id = %s RETURNING *",
-            (localizacao.cliente_id, localizacao.bairro, localizacao.numero_da_casa, localizacao.quarteirao, localizacao.cidade, localizacao.distrito, localizacao.provincia, localizacao_id)
+            "UPDATE localizacao SET cliente_id = %s, bairro = %s, numero_da_casa = %s, quarteirao = %s, cidade = %s, distrito = %s, provincia = %s, latitude = %s, longitude = %s WHERE localizacao_id = %s RETURNING *",
+            (localizacao.cliente_id, localizacao.bairro, localizacao.numero_da_casa, localizacao.quarteirao, localizacao.cidade, localizacao.distrito, localizacao.provincia, localizacao.latitude, localizacao.longitude, localizacao_id)
         )
         localizacao_atualizada = cursor.fetchone()
         conn.commit()
@@ -113,7 +123,299 @@ def obter_localizacoes_por_cliente(cliente_id: int, funcionario_atual: dict = De
     try:
         cursor.execute("SELECT * FROM localizacao WHERE cliente_id = %s", (cliente_id,))
         localizacoes = cursor.fetchall()
-        return [Localizacao(**localizacao) for localizacao in localizacoes]
+        return responder_lista(localizacoes, Localizacao)
+    finally:
+        cursor.close()
+        conn.close()
+
+
+@router.get("/rota-cobranca")
+def planear_rota_cobranca(
+    funcionario_id: Optional[int] = Query(None, description="Cobrador (por omissão, o funcionário autenticado)"),
+    data: Optional[date] = Query(None, description="Dia da rota: entram os empréstimos vencidos antes dele (por omissão, hoje)"),
+    agrupar: str = Query("coordenadas", description="'coordenadas' (percurso livre) ou 'bairro' (um bairro de cada vez)"),
+    cidade: Optional[str] = None,
+    distrito: Optional[str] = None,
+    bairros: List[str] = Query([], description="Restringir a estes bairros"),
+    partida_lat: Optional[float] = Query(None, ge=-90, le=90),
+    partida_lon: Optional[float] = Query(None, ge=-180, le=180),
+    limite: int = Query(3000, ge=1, le=10000, description="Máximo de clientes (os de maior saldo em atraso)"),
+    funcionario_atual: dict = Depends(get_current_funcionario),
+):
+    """
+    Ordem de visita aos clientes com empréstimos ativos vencidos e saldo em aberto, a partir
+    da localização mais recente de cada cliente. Clientes sem coordenadas ficam no centroide
+    do seu bairro (aproximada=true); se nenhum cliente do bairro tiver coordenadas, vêm em
+    sem_coordenadas, agrupados por bairro.
+    """
+    if agrupar not in ("coordenadas", "bairro"):
+        raise HTTPException(status_code=400, detail="agrupar deve ser 'coordenadas' ou 'bairro'")
+    if (partida_lat is None) != (partida_lon is None):
+        raise HTTPException(status_code=400, detail="Indique partida_lat e partida_lon em conjunto")
+    data = data or date.today()
+    funcionario_id = funcionario_id or funcionario_atual["funcionario_id"]
+
+    filtro = FiltroSQL().igual("l.cidade", cidade).igual("l.distrito", distrito)
+    if bairros:
+        filtro.condicoes.append("l.bairro = ANY(%s)")
+        filtro.valores.append(bairros)
+
+    conn = get_db_connection_leitura()
+    cursor = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
+    try:
+        cursor.execute("""
+            SELECT funcionario_id, nome_completo FROM funcionarios
+            WHERE funcionario_id = %s AND ativo = true
+        """, (funcionario_id,))
+        cobrador = cursor.fetchone()
+        if cobrador is None:
+            raise HTTPException(status_code=404, detail="Funcionário não encontrado ou inativo")
+
+        cursor.execute(f"""
+            WITH em_atraso AS (
+                SELECT e.cliente_id,
+                       COUNT(*) AS emprestimos,
+                       SUM(GREATEST({sql_total_devido("e")} - COALESCE(p.pago, 0), 0)) AS saldo,
+                       MAX(%s - e.data_vencimento::date) AS dias_atraso
+                FROM emprestimos e
+                LEFT JOIN LATERAL (
+                    SELECT SUM(valor_pago) AS pago FROM pagamentos WHERE emprestimo_id = e.emprestimo_id
+                ) p ON TRUE
+                WHERE e.status = 'Ativo' AND e.data_vencimento::date < %s
+                GROUP BY e.cliente_id
+                HAVING SUM(GREATEST({sql_total_devido("e")} - COALESCE(p.pago, 0), 0)) > 0
+            )
+            SELECT a.cliente_id, c.nome, c.telefone, a.emprestimos, a.saldo, a.dias_atraso,
+                   l.bairro, l.quarteirao, l.numero_da_casa, l.cidade, l.distrito, l.latitude, l.longitude
+            FROM em_atraso a
+            JOIN clientes c ON c.cliente_id = a.cliente_id
+            LEFT JOIN LATERAL (
+                SELECT * FROM localizacao WHERE cliente_id = a.cliente_id
+                ORDER BY localizacao_id DESC LIMIT 1
+            ) l ON TRUE
+            {filtro.where()}
+            ORDER BY a.saldo DESC, a.cliente_id
+            LIMIT %s
+        """, [data, data] + filtro.valores + [limite])
+        clientes = cursor.fetchall()
+    finally:
+        cursor.close()
+        conn.close()
+
+    inicio = time.perf_counter()
+    n = len(clientes)
+    lat = np.array([c["latitude"] if c["latitude"] is not None else np.nan for c in clientes], dtype=np.float64)
+    lon = np.array([c["longitude"] if c["longitude"] is not None else np.nan for c in clientes], dtype=np.float64)
+    bairro = np.array([c["bairro"] or "" for c in clientes], dtype=object)
+    _, grupo = np.unique(bairro, return_inverse=True) if n else (None, np.zeros(0, dtype=np.int64))
+
+    # Sem coordenadas: centroide (em graus) dos clientes do mesmo bairro que as têm
+    com_coordenadas = ~(np.isnan(lat) | np.isnan(lon))
+    aproximada = ~com_coordenadas
+    if n and aproximada.any():
+        grupos = int(grupo.max()) + 1
+        contagem = np.bincount(grupo[com_coordenadas], minlength=grupos)
+        soma_lat = np.bincount(grupo[com_coordenadas], weights=lat[com_coordenadas], minlength=grupos)
+        soma_lon = np.bincount(grupo[com_coordenadas], weights=lon[com_coordenadas], minlength=grupos)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            lat[aproximada] = (soma_lat / contagem)[grupo[aproximada]]
+            lon[aproximada] = (soma_lon / contagem)[grupo[aproximada]]
+    localizaveis = np.flatnonzero(~np.isnan(lat))
+
+    partida = None
+    if localizaveis.size:
+        lat_ref = float(lat[localizaveis].mean())
+        pontos = projetar_km(lat[localizaveis], lon[localizaveis], lat_ref)
+        if partida_lat is not None:
+            partida = projetar_km([partida_lat], [partida_lon], lat_ref)[0]
+        if agrupar == "bairro":
+            ordem = ordenar_por_grupos(pontos, grupo[localizaveis], partida)
+        else:
+            ordem = ordenar_visitas(pontos, partida)
+        distancias = distancias_percurso(pontos, ordem, partida)
+    else:
+        ordem = np.array([], dtype=np.int64)
+        distancias = np.array([])
+    tempo_calculo_ms = (time.perf_counter() - inicio) * 1000
+
+    paragens = []
+    for posicao, (k, distancia) in enumerate(zip(localizaveis[ordem], distancias), start=1):
+        c = clientes[k]
+        paragens.append({
+            "ordem": posicao,
+            "cliente_id": c["cliente_id"],
+            "nome": c["nome"],
+            "telefone": c["telefone"],
+            "bairro": c["bairro"],
+            "quarteirao": c["quarteirao"],
+            "numero_da_casa": c["numero_da_casa"],
+            "latitude": round(float(lat[k]), 6),
+            "longitude": round(float(lon[k]), 6),
+            "aproximada": bool(aproximada[k]),
+            "emprestimos": int(c["emprestimos"]),
+            "saldo_em_atraso": float(c["saldo"]),
+            "dias_atraso": int(c["dias_atraso"]),
+            "distancia_km": round(float(distancia), 3),
+        })
+
+    sem_coordenadas = {}
+    for k in np.flatnonzero(np.isnan(lat)):
+        c = clientes[k]
+        sem_coordenadas.setdefault(c["bairro"] or "Sem bairro", []).append({
+            "cliente_id": c["cliente_id"],
+            "nome": c["nome"],
+            "telefone": c["telefone"],
+            "quarteirao": c["quarteirao"],
+            "numero_da_casa": c["numero_da_casa"],
+            "saldo_em_atraso": float(c["saldo"]),
+            "dias_atraso": int(c["dias_atraso"]),
+        })
+
+    return {
+        "funcionario_id": cobrador["funcionario_id"],
+        "cobrador": cobrador["nome_completo"],
+        "data": data.isoformat(),
+        "agrupar": agrupar,
+        "total_clientes": n,
+        "total_paragens": len(paragens),
+        "saldo_em_atraso": round(sum(float(c["saldo"]) for c in clientes), 2),
+        "distancia_total_km": round(float(distancias.sum()), 3),
+        "tempo_calculo_ms": round(tempo_calculo_ms, 1),
+        "paragens": paragens,
+        "sem_coordenadas": [{"bairro": b, "clientes": v} for b, v in sem_coordenadas.items()],
+    }
+
+
+def _validar_caixa(lat_min: float, lat_max: float, lon_min: float, lon_max: float):
+    if lat_min >= lat_max or lon_min >= lon_max:
+        raise HTTPException(status_code=400, detail="A caixa deve ter lat_min < lat_max e lon_min < lon_max")
+
+
+@router.get("/proximas")
+def localizacoes_proximas(
+    latitude: float = Query(..., ge=-90, le=90),
+    longitude: float = Query(..., ge=-180, le=180),
+    raio_km: float = Query(5.0, gt=0, le=500),
+    limite: int = Query(500, ge=1, le=10000),
+    funcionario_atual: dict = Depends(get_current_funcionario),
+):
+    """
+    Clientes com uma localização a menos de raio_km do ponto (uma agência, um cobrador),
+    do mais próximo para o mais distante. Com várias localizações, conta a mais próxima.
+    """
+    caixa = caixa_do_raio(latitude, longitude, raio_km)
+    conn = get_db_connection_leitura()
+    cursor = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
+    try:
+        cursor.execute(f"""
+            SELECT * FROM (
+                SELECT DISTINCT ON (l.cliente_id)
+                       l.localizacao_id, l.cliente_id, c.nome, c.telefone, l.bairro, l.quarteirao,
+                       l.numero_da_casa, l.cidade, l.distrito, l.provincia, l.latitude, l.longitude,
+                       {sql_distancia_km("l")} AS distancia_km
+                FROM localizacao l
+                JOIN clientes c ON c.cliente_id = l.cliente_id
+                WHERE {sql_na_caixa("l")}
+                ORDER BY l.cliente_id, distancia_km
+            ) p
+            WHERE p.distancia_km <= %s
+            ORDER BY p.distancia_km, p.cliente_id
+            LIMIT %s
+        """, (latitude, latitude, longitude) + caixa + (raio_km, limite))
+        linhas = cursor.fetchall()
+    finally:
+        cursor.close()
+        conn.close()
+    for linha in linhas:
+        linha["distancia_km"] = round(float(linha["distancia_km"]), 3)
+    return {"latitude": latitude, "longitude": longitude, "raio_km": raio_km, "total": len(linhas), "clientes": linhas}
+
+
+@router.get("/area")
+def localizacoes_na_area(
+    lat_min: float = Query(..., ge=-90, le=90),
+    lat_max: float = Query(..., ge=-90, le=90),
+    lon_min: float = Query(..., ge=-180, le=180),
+    lon_max: float = Query(..., ge=-180, le=180),
+    pular: int = Query(0, ge=0),
+    limite: int = Query(1000, ge=1, le=10000),
+    funcionario_atual: dict = Depends(get_current_funcionario),
+):
+    """Localizações dentro da caixa (ex.: a área visível de um mapa)."""
+    _validar_caixa(lat_min, lat_max, lon_min, lon_max)
+    conn = get_db_connection_leitura()
+    cursor = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
+    try:
+        cursor.execute(f"""
+            SELECT * FROM localizacao
+            WHERE {sql_na_caixa()}
+            ORDER BY localizacao_id
+            LIMIT %s OFFSET %s
+        """, (lon_min, lat_min, lon_max, lat_max, limite, pular))
+        localizacoes = cursor.fetchall()
+        return responder_lista(localizacoes, Localizacao)
     finally:
         cursor.close()
-        conn.close()
\ No newline at end of file
+        conn.close()
+
+
+@router.get("/mapa-calor")
+def mapa_calor(
+    lat_min: float = Query(..., ge=-90, le=90),
+    lat_max: float = Query(..., ge=-90, le=90),
+    lon_min: float = Query(..., ge=-180, le=180),
+    lon_max: float = Query(..., ge=-180, le=180),
+    celula_km: float = Query(1.0, ge=0.05, le=100),
+    em_atraso: bool = Query(False, description="Contar só clientes com empréstimos ativos vencidos"),
+    funcionario_atual: dict = Depends(get_current_funcionario),
+):
+    """
+    Densidade de clientes numa grelha de células de celula_km × celula_km dentro da caixa,
+    agregada no PostgreSQL. Só são devolvidas as células com pelo menos um cliente.
+    """
+    _validar_caixa(lat_min, lat_max, lon_min, lon_max)
+    passo_lat, passo_lon = graus_da_celula(celula_km, (lat_min + lat_max) / 2)
+    if ((lat_max - lat_min) / passo_lat) * ((lon_max - lon_min) / passo_lon) > 1_000_000:
+        raise HTTPException(status_code=400, detail="Demasiadas células: aumente celula_km ou reduza a área")
+
+    filtro_atraso = """
+        AND EXISTS (
+            SELECT 1 FROM emprestimos e
+            WHERE e.cliente_id = l.cliente_id AND e.status = 'Ativo' AND e.data_vencimento < CURRENT_DATE
+        )""" if em_atraso else ""
+    conn = get_db_connection_leitura()
+    cursor = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
+    try:
+        cursor.execute(f"""
+            SELECT floor((l.latitude - %s) / %s)::int AS linha,
+                   floor((l.longitude - %s) / %s)::int AS coluna,
+                   COUNT(DISTINCT l.cliente_id) AS clientes,
+                   COUNT(*) AS localizacoes
+            FROM localizacao l
+            WHERE {sql_na_caixa("l")}{filtro_atraso}
+            GROUP BY 1, 2
+            ORDER BY 1, 2
+        """, (lat_min, passo_lat, lon_min, passo_lon, lon_min, lat_min, lon_max, lat_max))
+        celulas = cursor.fetchall()
+    finally:
+        cursor.close()
+        conn.close()
+
+    return {
+        "celula_km": celula_km,
+        "passo_lat": passo_lat,
+        "passo_lon": passo_lon,
+        "total_clientes": sum(c["clientes"] for c in celulas),
+        "maximo": max((c["clientes"] for c in celulas), default=0),
+        "celulas": [
+            {
+                "linha": c["linha"],
+                "coluna": c["coluna"],
+                "latitude": round(lat_min + (c["linha"] + 0.5) * passo_lat, 6),
+                "longitude": round(lon_min + (c["coluna"] + 0.5) * passo_lon, 6),
+                "clientes": c["clientes"],
+                "localizacoes": c["localizacoes"],
+            }
+            for c in celulas
+        ],
+    }
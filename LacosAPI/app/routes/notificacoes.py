@@ -1,11 +1,22 @@
-from fastapi import APIRouter, HTTPException, status, Depends
-from typing import List
-from app.schemas.notificacao import Notificacao, NotificacaoCriar, NotificacaoAtualizar
-from app.database.database import get_db_connection
-from app.utils.auth import get_current_funcionario
+from fastapi import APIRouter, HTTPException, status, Depends, Query, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
+from typing import List, Optional
+from app.schemas.notificacao import (Notificacao, NotificacaoArquivada, NotificacaoCriar, NotificacaoAtualizar,
+                                     NotificacaoAtualizacaoMassa)
+from app.database.database import get_db_connection, get_db_connection_leitura
+from app.utils.auth import get_current_funcionario, get_current_administrador
+from app.utils.arquivo_notificacoes import NOTIFICACOES_ARQUIVO_DIAS
+from app.utils import entregas
+from app.utils.serializacao import responder_lista, codificar_json
+from app.utils.eventos_notificacoes import (SSE_KEEPALIVE_S, SSE_RETOMA_MAX, COLUNAS_NOTIFICACAO, contar_pendentes,
+                                            ja_existentes, ler_desde, ouvinte)
+from app.utils.filtros import FiltroSQL, ordenacao, contar_total, cabecalhos_total
+from app.utils.tarefas import submeter_tarefa
 import psycopg2.extras
-from datetime import datetime, timedelta, timezone
+from datetime import datetime, timedelta, timezone, date
 from decimal import Decimal
+import asyncio
 
 router = APIRouter()
 
@@ -37,15 +48,41 @@ def criar_notificacao(notificacao: NotificacaoCriar, funcionario_atual: dict = D
         cursor.close()
         conn.close()
 
+ORDENACAO_NOTIFICACOES = {
+    "notificacao_id": "notificacao_id",
+    "data_envio": "data_envio",
+    "tipo": "tipo",
+    "status": "status",
+}
+
 @router.get("/listar", response_model=List[Notificacao])
-def listar_notificacoes(pular: int = 0, limite: int = 100, funcionario_atual: dict = Depends(get_current_funcionario)):
-    conn = get_db_connection()
+def listar_notificacoes(
+    pular: int = 0,
+    limite: int = 100,
+    status: Optional[str] = None,
+    tipo: Optional[str] = None,
+    cliente_id: Optional[int] = None,
+    data_inicio: Optional[date] = Query(None, description="data_envio a partir de (inclusivo)"),
+    data_fim: Optional[date] = Query(None, description="data_envio até (inclusivo)"),
+    ordenar_por: Optional[str] = Query(None, description=f"Um de: {', '.join(ORDENACAO_NOTIFICACOES)}"),
+    ordem: str = Query("desc", pattern="^(asc|desc)$"),
+    funcionario_atual: dict = Depends(get_current_funcionario),
+):
+    filtro = (FiltroSQL()
+              .igual("status", status)
+              .igual("tipo", tipo)
+              .igual("cliente_id", cliente_id)
+              .intervalo_datas("data_envio", data_inicio, data_fim))
+    order_by = ordenacao(ordenar_por, ordem, ORDENACAO_NOTIFICACOES, "data_envio", "notificacao_id")
+
+    conn = get_db_connection_leitura()
     cursor = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
     
     try:
-        cursor.execute("SELECT * FROM notificacoes ORDER BY data_envio DESC LIMIT %s OFFSET %s", (limite, pular))
+        cursor.execute(f"SELECT {COLUNAS_NOTIFICACAO} FROM notificacoes{filtro.where()}{order_by} LIMIT %s OFFSET %s", filtro.valores + [limite, pular])
         notificacoes = cursor.fetchall()
-        return [Notificacao(**notificacao) for notificacao in notificacoes]
+        total, estimado = contar_total(cursor, "notificacoes", filtro)
+        return responder_lista(notificacoes, Notificacao, cabecalhos_total(total, estimado))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Erro ao recuperar notificações: {str(e)}")
     finally:
@@ -58,9 +95,9 @@ def listar_notificacoes_por_cliente(cliente_id: int, funcionario_atual: dict = D
     cursor = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
     
     try:
-        cursor.execute("SELECT * FROM notificacoes WHERE cliente_id = %s ORDER BY data_envio DESC", (cliente_id,))
+        cursor.execute(f"SELECT {COLUNAS_NOTIFICACAO} FROM notificacoes WHERE cliente_id = %s ORDER BY data_envio DESC", (cliente_id,))
         notificacoes = cursor.fetchall()
-        return [Notificacao(**notificacao) for notificacao in notificacoes]
+        return responder_lista(notificacoes, Notificacao)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Erro ao recuperar notificações: {str(e)}")
     finally:
@@ -91,6 +128,124 @@ def atualizar_notificacao(notificacao_id: int, notificacao: NotificacaoAtualizar
         cursor.close()
         conn.close()
 
+@router.put("/atualizar-em-massa")
+def atualizar_notificacoes_em_massa(pedido: NotificacaoAtualizacaoMassa, funcionario_atual: dict = Depends(get_current_funcionario)):
+    """Muda o status de todas as notificações da lista de ids e/ou dos filtros num só UPDATE."""
+    filtro = (FiltroSQL()
+              .em("notificacao_id", pedido.notificacao_ids)
+              .igual("tipo", pedido.tipo)
+              .igual("cliente_id", pedido.cliente_id)
+              .igual("status", pedido.status_atual)
+              .intervalo_datas("data_envio", pedido.data_inicio, pedido.data_fim))
+    if not filtro.condicoes:
+        raise HTTPException(status_code=400, detail="Indique notificacao_ids ou pelo menos um filtro")
+    filtro.condicoes.append("status IS DISTINCT FROM %s")
+    filtro.valores.append(pedido.status)
+
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    try:
+        cursor.execute(f"UPDATE notificacoes SET status = %s{filtro.where()}", [pedido.status] + filtro.valores)
+        atualizadas = cursor.rowcount
+        conn.commit()
+        return {"mensagem": f"{atualizadas} notificações marcadas como {pedido.status}", "atualizadas": atualizadas}
+    except Exception as e:
+        conn.rollback()
+        raise HTTPException(status_code=500, detail=f"Erro ao atualizar notificações: {str(e)}")
+    finally:
+        cursor.close()
+        conn.close()
+
+@router.post("/arquivar")
+def arquivar_notificacoes(
+    dias: int = Query(NOTIFICACOES_ARQUIVO_DIAS, ge=0, description="Arquivar as lidas com mais de N dias"),
+    funcionario_atual: dict = Depends(get_current_administrador)
+):
+    """Submete o arquivo das notificações lidas antigas como tarefa em segundo plano (Administrador)."""
+    return submeter_tarefa("arquivo-notificacoes", {"dias": dias}, funcionario_atual.get("username"))
+
+@router.get("/arquivo", response_model=List[NotificacaoArquivada])
+def listar_notificacoes_arquivadas(
+    pular: int = Query(0, ge=0),
+    limite: int = Query(100, ge=1, le=1000),
+    tipo: Optional[str] = None,
+    cliente_id: Optional[int] = None,
+    data_inicio: Optional[date] = Query(None, description="data_envio a partir de (inclusivo)"),
+    data_fim: Optional[date] = Query(None, description="data_envio até (inclusivo)"),
+    funcionario_atual: dict = Depends(get_current_funcionario),
+):
+    filtro = (FiltroSQL()
+              .igual("tipo", tipo)
+              .igual("cliente_id", cliente_id)
+              .intervalo_datas("data_envio", data_inicio, data_fim))
+    conn = get_db_connection_leitura()
+    cursor = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
+    try:
+        cursor.execute(
+            f"SELECT {COLUNAS_NOTIFICACAO}, arquivada_em FROM notificacoes_arquivo{filtro.where()} "
+            "ORDER BY data_envio DESC, notificacao_id DESC LIMIT %s OFFSET %s",
+            filtro.valores + [limite, pular],
+        )
+        return responder_lista(cursor.fetchall(), NotificacaoArquivada)
+    finally:
+        cursor.close()
+        conn.close()
+
+@router.get("/entregas/estado")
+def obter_estado_entregas(funcionario_atual: dict = Depends(get_current_administrador)):
+    """Fila de entrega por SMS: notificações de clientes por estado e as últimas falhadas (Administrador)."""
+    conn = get_db_connection_leitura()
+    cursor = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
+    try:
+        cursor.execute("""
+            SELECT status, COUNT(*) AS quantidade,
+                   COUNT(*) FILTER (WHERE status = 'Pendente' AND tentativas > 0) AS em_nova_tentativa
+            FROM notificacoes
+            WHERE cliente_id IS NOT NULL
+            GROUP BY status
+        """)
+        por_status = cursor.fetchall()
+        cursor.execute("""
+            SELECT notificacao_id, cliente_id, tipo, tentativas, ultimo_erro, gateway, data_envio
+            FROM notificacoes
+            WHERE status = 'Falhada'
+            ORDER BY notificacao_id DESC
+            LIMIT 20
+        """)
+        falhadas = cursor.fetchall()
+    finally:
+        cursor.close()
+        conn.close()
+    return {
+        "gateway": entregas.ENTREGA_GATEWAY,
+        "trabalhadores": entregas.ENTREGA_WORKERS,
+        "por_status": {l["status"]: l["quantidade"] for l in por_status},
+        "em_nova_tentativa": sum(l["em_nova_tentativa"] for l in por_status),
+        "ultimas_falhadas": falhadas,
+    }
+
+@router.post("/entregas/reenviar")
+def reenviar_notificacoes_falhadas(
+    notificacao_ids: Optional[List[int]] = Query(None, description="Por omissão, todas as Falhadas"),
+    funcionario_atual: dict = Depends(get_current_administrador)
+):
+    """Devolve notificações Falhadas à fila de entrega, com as tentativas a zero (Administrador)."""
+    filtro = FiltroSQL().igual("status", "Falhada").em("notificacao_id", notificacao_ids)
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    try:
+        cursor.execute(f"""
+            UPDATE notificacoes
+            SET status = 'Pendente', tentativas = 0, proxima_tentativa = NULL, ultimo_erro = NULL
+            {filtro.where()}
+        """, filtro.valores)
+        reenviadas = cursor.rowcount
+        conn.commit()
+        return {"mensagem": f"{reenviadas} notificações devolvidas à fila de entrega", "reenviadas": reenviadas}
+    finally:
+        cursor.close()
+        conn.close()
+
 @router.delete("/remover/{notificacao_id}")
 def remover_notificacao(notificacao_id: int, funcionario_atual: dict = Depends(get_current_funcionario)):
     conn = get_db_connection()
@@ -111,8 +266,12 @@ def remover_notificacao(notificacao_id: int, funcionario_atual: dict = Depends(g
         cursor.close()
         conn.close()
 
-@router.post("/verificar-pagamentos")
-def verificar_e_criar_notificacoes(funcionario_atual: dict = Depends(get_current_funcionario)):
+def executar_verificacao_pagamentos(progresso=None) -> dict:
+    """
+    Cria lembretes e avisos de atraso (no máximo um por cliente e por dia) para os empréstimos ativos.
+    progresso(processados, total), quando indicado, é chamado a cada iteração e pode
+    interromper a execução lançando uma exceção (nada é gravado nesse caso).
+    """
     conn = get_db_connection()
     cursor = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
     
@@ -131,7 +290,9 @@ def verificar_e_criar_notificacoes(funcionario_atual: dict = Depends(get_current
         emprestimos = cursor.fetchall()
         notificacoes_criadas = []
         
-        for emprestimo in emprestimos:
+        for i, emprestimo in enumerate(emprestimos):
+            if progresso:
+                progresso(i, len(emprestimos))
             emprestimo_id = emprestimo['emprestimo_id']
             cliente_id = emprestimo['cliente_id']
             valor_emprestimo = emprestimo['valor']
@@ -145,7 +306,7 @@ def verificar_e_criar_notificacoes(funcionario_atual: dict = Depends(get_current
                 SELECT COUNT(*) as count FROM notificacoes 
                 WHERE cliente_id = %s 
                 AND tipo IN ('Lembrete de Pagamento', 'Atraso no Pagamento')
-                AND DATE(data_envio) = CURRENT_DATE
+                AND data_envio >= CURRENT_DATE AND data_envio < CURRENT_DATE + 1
             """, (cliente_id,))
             
             notificacao_hoje = cursor.fetchone()['count']
@@ -183,24 +344,107 @@ def verificar_e_criar_notificacoes(funcionario_atual: dict = Depends(get_current
             "notificacoes": notificacoes_criadas
         }
         
-    except Exception as e:
+    except Exception:
         conn.rollback()
-        raise HTTPException(status_code=500, detail=f"Erro ao criar notificações: {str(e)}")
+        raise
     finally:
         cursor.close()
         conn.close()
 
+@router.post("/verificar-pagamentos")
+def verificar_e_criar_notificacoes(funcionario_atual: dict = Depends(get_current_funcionario)):
+    try:
+        return executar_verificacao_pagamentos()
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Erro ao criar notificações: {str(e)}")
+
 @router.get("/pendentes", response_model=List[Notificacao])
-def listar_notificacoes_pendentes(funcionario_atual: dict = Depends(get_current_funcionario)):
+def listar_notificacoes_pendentes(
+    pular: int = Query(0, ge=0),
+    limite: int = Query(100, ge=1, le=1000),
+    funcionario_atual: dict = Depends(get_current_funcionario)
+):
     conn = get_db_connection()
     cursor = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
     
     try:
-        cursor.execute("SELECT * FROM notificacoes WHERE status = 'Pendente' ORDER BY data_envio DESC")
+        cursor.execute(
+            f"SELECT {COLUNAS_NOTIFICACAO} FROM notificacoes WHERE status = 'Pendente' "
+            "ORDER BY data_envio DESC, notificacao_id DESC LIMIT %s OFFSET %s",
+            (limite, pular),
+        )
         notificacoes = cursor.fetchall()
-        return [Notificacao(**notificacao) for notificacao in notificacoes]
+        return responder_lista(notificacoes, Notificacao, cabecalhos_total(contar_pendentes(cursor), False))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Erro ao recuperar notificações: {str(e)}")
     finally:
         cursor.close()
         conn.close()
+
+def _evento_sse(tipo: str, dados: dict, evento_id: Optional[int] = None) -> bytes:
+    cabecalho = f"id: {evento_id}\n" if evento_id is not None else ""
+    return f"{cabecalho}event: {tipo}\n".encode() + b"data: " + codificar_json(dados) + b"\n\n"
+
+def _estado_inicial(ultimo_id: Optional[int]):
+    conn = get_db_connection()
+    cursor = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
+    try:
+        existentes = ja_existentes(cursor)
+        perdidas = ler_desde(cursor, ultimo_id, SSE_RETOMA_MAX) if ultimo_id is not None else []
+        return perdidas, contar_pendentes(cursor), existentes
+    finally:
+        cursor.close()
+        conn.close()
+
+@router.get("/stream")
+async def stream_notificacoes(
+    request: Request,
+    ultimo_id: Optional[int] = Query(None, description="Retomar depois desta notificação (em alternativa ao cabeçalho Last-Event-ID)"),
+    funcionario_atual: dict = Depends(get_current_funcionario),
+):
+    """
+    Server-Sent Events: `notificacao` (id = notificacao_id) por cada notificação nova e
+    `pendentes` quando muda o total de pendentes. Ao voltar a ligar com Last-Event-ID (ou
+    ultimo_id) recebe primeiro as notificações criadas entretanto.
+    """
+    cabecalho = request.headers.get("last-event-id")
+    if cabecalho and cabecalho.isdigit():
+        ultimo_id = int(cabecalho)
+
+    async def eventos():
+        # Subscrever antes de ler o estado inicial: nada escapa entre uma coisa e a outra
+        subscricao = ouvinte.subscrever(asyncio.get_running_loop())
+        try:
+            perdidas, pendentes, (ate_id, ja_enviadas) = await run_in_threadpool(_estado_inicial, ultimo_id)
+            yield b"retry: 3000\n\n"
+            for linha in perdidas:
+                ja_enviadas.add(linha["notificacao_id"])
+                yield _evento_sse("notificacao", linha, linha["notificacao_id"])
+            if len(perdidas) >= SSE_RETOMA_MAX:
+                # Ausência demasiado longa: o cliente deve recarregar a lista por /listar
+                yield _evento_sse("resincronizar", {"ultimo_id": perdidas[-1]["notificacao_id"]})
+            yield _evento_sse("pendentes", {"pendentes": pendentes})
+            while not await request.is_disconnected():
+                try:
+                    tipo, dados = await asyncio.wait_for(subscricao.fila.get(), SSE_KEEPALIVE_S)
+                except asyncio.TimeoutError:
+                    yield b": keep-alive\n\n"
+                    continue
+                if subscricao.excedida:
+                    break
+                if tipo == "notificacao":
+                    if dados["notificacao_id"] <= ate_id or dados["notificacao_id"] in ja_enviadas:
+                        continue
+                    yield _evento_sse(tipo, dados, dados["notificacao_id"])
+                else:
+                    yield _evento_sse(tipo, dados)
+        finally:
+            ouvinte.cancelar(subscricao)
+
+    return StreamingResponse(
+        eventos(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
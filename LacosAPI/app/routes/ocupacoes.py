@@ -1,7 +1,7 @@
 from fastapi import APIRouter, HTTPException, Depends
 from typing import List
 from app.schemas.ocupacao import Ocupacao, OcupacaoCriar, OcupacaoAtualizar
-from app.database.database import get_db_connection
+from app.database.database import get_db_connection, get_db_connection_leitura
 from app.utils.auth import get_current_funcionario
 import psycopg2.extras
 
@@ -43,7 +43,7 @@ def criar_ocupacao(ocupacao: OcupacaoCriar, funcionario_atual: dict = Depends(ge
 
 @router.get("/listar", response_model=List[Ocupacao])
 def listar_ocupacoes(pular: int = 0, limite: int = 100, funcionario_atual: dict = Depends(get_current_funcionario)):
-    conn = get_db_connection()
+    conn = get_db_connection_leitura()
     cursor = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
     
     try:
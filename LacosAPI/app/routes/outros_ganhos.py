@@ -1,7 +1,7 @@
 from fastapi import APIRouter, HTTPException, status, Depends
 from typing import List
 from app.schemas.outros_ganhos import OutrosGanhos
-from app.database.database import get_db_connection
+from app.database.database import get_db_connection, get_db_connection_leitura
 from app.utils.auth import get_current_funcionario
 import psycopg2.extras
 
@@ -35,7 +35,7 @@ def criar_outros_ganhos(outros_ganhos: OutrosGanhos, funcionario_atual: dict = D
 
 @router.get("/listar", response_model=List[OutrosGanhos])
 def listar_outros_ganhos(pular: int = 0, limite: int = 100, funcionario_atual: dict = Depends(get_current_funcionario)):
-    conn = get_db_connection()
+    conn = get_db_connection_leitura()
     cursor = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
     
     try:
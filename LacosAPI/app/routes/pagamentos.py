@@ -1,9 +1,13 @@
-from fastapi import APIRouter, HTTPException, status, Depends
-from typing import List
+from fastapi import APIRouter, HTTPException, status, Depends, Query
+from typing import List, Optional
 from app.schemas.pagamento import Pagamento
 from app.schemas.penalizacao import Penalizacao
-from app.database.database import get_db_connection
+from app.database.database import get_db_connection, get_db_connection_leitura
 from app.utils.auth import get_current_funcionario
+from app.utils.serializacao import responder_lista
+from app.utils.prestacoes import total_devido, alocar_pagamentos
+from app.utils.previsao import invalidar_previsao
+from app.utils.filtros import FiltroSQL, ordenacao, contar_total, cabecalhos_total
 from app.utils.notifications import notificar_pagamento_confirmado, notificar_atraso_pagamento, notificar_admin_pagamento
 import psycopg2.extras
 from datetime import datetime, date, timezone
@@ -18,7 +22,7 @@ def criar_pagamento(pagamento: Pagamento, funcionario_atual: dict = Depends(get_
     
     try:
         # Verificar se o empréstimo existe e se pertence ao cliente especificado
-        cursor.execute("SELECT cliente_id, data_vencimento, valor FROM emprestimos WHERE emprestimo_id = %s", (pagamento.emprestimo_id,))
+        cursor.execute("SELECT cliente_id, data_vencimento, valor, total_devido FROM emprestimos WHERE emprestimo_id = %s", (pagamento.emprestimo_id,))
         emprestimo_result = cursor.fetchone()
         if emprestimo_result is None:
             raise HTTPException(status_code=404, detail="Empréstimo não encontrado")
@@ -36,7 +40,9 @@ def criar_pagamento(pagamento: Pagamento, funcionario_atual: dict = Depends(get_
         if result is None:
             raise HTTPException(status_code=500, detail="Falha ao criar pagamento")
         pagamento_id = result['pagamento_id']
+        alocar_pagamentos(cursor, [pagamento.emprestimo_id])
         conn.commit()
+        invalidar_previsao()
         
         # Verificar penalizações pendentes (usar alias e acesso por chave em RealDictRow)
         cursor.execute(
@@ -59,8 +65,8 @@ def criar_pagamento(pagamento: Pagamento, funcionario_atual: dict = Depends(get_
         result = cursor.fetchone()
         total_pago = float(result['total_pago']) if result and 'total_pago' in result else 0.0
 
-        # Valor total devido inclui 20% do valor do empréstimo (parte do banco)
-        valor_total_devido = float(emprestimo_result['valor']) * 1.20
+        # Valor total devido: o do plano de prestações, ou valor + 20% (parte do banco) sem produto
+        valor_total_devido = float(total_devido(emprestimo_result['valor'], emprestimo_result['total_devido']))
 
         # Valor em aberto após este pagamento
         valor_em_aberto = max(valor_total_devido - (float(total_pago) + float(pagamento.valor_pago)), 0.0)
@@ -124,15 +130,45 @@ def criar_pagamento(pagamento: Pagamento, funcionario_atual: dict = Depends(get_
         cursor.close()
         conn.close()
 
+ORDENACAO_PAGAMENTOS = {
+    "pagamento_id": "pagamento_id",
+    "data_pagamento": "data_pagamento",
+    "valor_pago": "valor_pago",
+    "metodo_pagamento": "metodo_pagamento",
+}
+
 @router.get("/listar", response_model=List[Pagamento])
-def listar_pagamentos(pular: int = 0, limite: int = 100, funcionario_atual: dict = Depends(get_current_funcionario)):
-    conn = get_db_connection()
+def listar_pagamentos(
+    pular: int = 0,
+    limite: int = 100,
+    cliente_id: Optional[int] = None,
+    emprestimo_id: Optional[int] = None,
+    metodo_pagamento: Optional[str] = None,
+    data_inicio: Optional[date] = Query(None, description="data_pagamento a partir de (inclusivo)"),
+    data_fim: Optional[date] = Query(None, description="data_pagamento até (inclusivo)"),
+    valor_min: Optional[Decimal] = None,
+    valor_max: Optional[Decimal] = None,
+    ordenar_por: Optional[str] = Query(None, description=f"Um de: {', '.join(ORDENACAO_PAGAMENTOS)}"),
+    ordem: str = Query("asc", pattern="^(asc|desc)$"),
+    funcionario_atual: dict = Depends(get_current_funcionario),
+):
+    filtro = (FiltroSQL()
+              .igual("cliente_id", cliente_id)
+              .igual("emprestimo_id", emprestimo_id)
+              .igual("metodo_pagamento", metodo_pagamento)
+              .intervalo_datas("data_pagamento", data_inicio, data_fim)
+              .minimo("valor_pago", valor_min)
+              .maximo("valor_pago", valor_max))
+    order_by = ordenacao(ordenar_por, ordem, ORDENACAO_PAGAMENTOS, "pagamento_id", "pagamento_id")
+
+    conn = get_db_connection_leitura()
     cursor = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
     
     try:
-        cursor.execute("SELECT * FROM pagamentos LIMIT %s OFFSET %s", (limite, pular))
+        cursor.execute(f"SELECT * FROM pagamentos{filtro.where()}{order_by} LIMIT %s OFFSET %s", filtro.valores + [limite, pular])
         pagamentos = cursor.fetchall()
-        return [Pagamento(**pagamento) for pagamento in pagamentos]
+        total, estimado = contar_total(cursor, "pagamentos", filtro)
+        return responder_lista(pagamentos, Pagamento, cabecalhos_total(total, estimado))
     finally:
         cursor.close()
         conn.close()
@@ -160,12 +196,17 @@ def atualizar_pagamento(pagamento_id: int, pagamento: Pagamento, funcionario_atu
     cursor = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
     
     try:
+        cursor.execute("SELECT emprestimo_id FROM pagamentos WHERE pagamento_id = %s", (pagamento_id,))
+        anterior = cursor.fetchone()
         cursor.execute(
             "UPDATE pagamentos SET emprestimo_id = %s, cliente_id = %s, valor_pago = %s, data_pagamento = %s, metodo_pagamento = %s, referencia_pagamento = %s WHERE pagamento_id = %s RETURNING *",
             (pagamento.emprestimo_id, pagamento.cliente_id, pagamento.valor_pago, pagamento.data_pagamento, pagamento.metodo_pagamento, pagamento.referencia_pagamento, pagamento_id)
         )
         pagamento_atualizado = cursor.fetchone()
+        if pagamento_atualizado is not None:
+            alocar_pagamentos(cursor, {anterior['emprestimo_id'], pagamento.emprestimo_id} - {None})
         conn.commit()
+        invalidar_previsao()
         
         if pagamento_atualizado is None:
             raise HTTPException(status_code=404, detail="Pagamento não encontrado")
@@ -181,12 +222,15 @@ def remover_pagamento(pagamento_id: int, funcionario_atual: dict = Depends(get_c
     cursor = conn.cursor()
     
     try:
-        cursor.execute("DELETE FROM pagamentos WHERE pagamento_id = %s", (pagamento_id,))
-        conn.commit()
+        cursor.execute("DELETE FROM pagamentos WHERE pagamento_id = %s RETURNING emprestimo_id", (pagamento_id,))
+        removido = cursor.fetchone()
         
-        if cursor.rowcount == 0:
+        if removido is None:
             raise HTTPException(status_code=404, detail="Pagamento não encontrado")
         
+        alocar_pagamentos(cursor, [removido[0]])
+        conn.commit()
+        invalidar_previsao()
         return {"mensagem": "Pagamento removido com sucesso"}
     finally:
         cursor.close()
@@ -200,7 +244,7 @@ def obter_pagamentos_por_emprestimo(emprestimo_id: int, funcionario_atual: dict
     try:
         cursor.execute("SELECT * FROM pagamentos WHERE emprestimo_id = %s", (emprestimo_id,))
         pagamentos = cursor.fetchall()
-        return [Pagamento(**pagamento) for pagamento in pagamentos]
+        return responder_lista(pagamentos, Pagamento)
     finally:
         cursor.close()
         conn.close()
@@ -213,7 +257,7 @@ def obter_pagamentos_por_cliente(cliente_id: int, funcionario_atual: dict = Depe
     try:
         cursor.execute("SELECT * FROM pagamentos WHERE cliente_id = %s", (cliente_id,))
         pagamentos = cursor.fetchall()
-        return [Pagamento(**pagamento) for pagamento in pagamentos]
+        return responder_lista(pagamentos, Pagamento)
     finally:
         cursor.close()
         conn.close()
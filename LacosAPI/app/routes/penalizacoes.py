@@ -1,11 +1,15 @@
-from fastapi import APIRouter, HTTPException, Depends
-from typing import List
-from app.schemas.penalizacao import Penalizacao, PenalizacaoDetalhe
-from app.database.database import get_db_connection
+from fastapi import APIRouter, HTTPException, Depends, Query, Response
+from typing import List, Optional
+from app.schemas.penalizacao import Penalizacao, PenalizacaoDetalhe, PenalizacaoSimulada, SimulacaoPenalizacoes
+from app.database.database import get_db_connection, get_db_connection_leitura
 from app.utils.auth import get_current_funcionario
+from app.utils.filtros import FiltroSQL, ordenacao, contar_total, cabecalhos_total
+from app.utils.prestacoes import total_devido
+from app.utils.penalizacoes import calcular_penalizacao, carregar_carteira, dias_atraso as calcular_dias_atraso, simular
 from app.utils.notifications import notificar_penalizacao_aplicada, notificar_admin_penalizacao
+import numpy as np
 import psycopg2.extras
-from datetime import datetime, timezone
+from datetime import datetime, timezone, date
 from decimal import Decimal
 
 router = APIRouter()
@@ -38,7 +42,7 @@ def criar_penalizacao(emprestimo_id: int, data_referencia: datetime, funcionario
             else:
                 data_ref_aware = data_referencia
             dias_atraso = (data_ref_aware - emprestimo['data_vencimento']).days if data_ref_aware > emprestimo['data_vencimento'] else 0
-        penalizacao_dias_atraso = emprestimo['valor'] * Decimal('0.05') * dias_atraso
+        penalizacao_dias_atraso = calcular_penalizacao(emprestimo['valor'], dias_atraso)
         if dias_atraso <= 0:
             raise HTTPException(status_code=400, detail="Sem atraso, não é aplicada penalização")
         total_penalizacao = penalizacao_dias_atraso
@@ -89,31 +93,66 @@ def criar_penalizacao(emprestimo_id: int, data_referencia: datetime, funcionario
             valor_emprestimo=valor_emprestimo,
             percentagem_aplicada=Decimal(dias_atraso) * Decimal(5),
             total_penalizacoes=penalizacao.valor,
-            total_com_lucro=(Decimal(valor_emprestimo) * Decimal('1.20')) + Decimal(penalizacao.valor)
+            total_com_lucro=total_devido(valor_emprestimo, emprestimo.get('total_devido')) + Decimal(penalizacao.valor)
         )
     finally:
         cursor.close()
         conn.close()
 
+ORDENACAO_PENALIZACOES = {
+    "penalizacao_id": "p.penalizacao_id",
+    "data_aplicacao": "p.data_aplicacao",
+    "valor": "p.valor",
+    "dias_atraso": "p.dias_atraso",
+}
+
 @router.get("/listar", response_model=List[PenalizacaoDetalhe])
-def listar_penalizacoes(pular: int = 0, limite: int = 100, funcionario_atual: dict = Depends(get_current_funcionario)):
-    conn = get_db_connection()
+def listar_penalizacoes(
+    response: Response,
+    pular: int = 0,
+    limite: int = 100,
+    status: Optional[str] = None,
+    tipo: Optional[str] = None,
+    cliente_id: Optional[int] = None,
+    emprestimo_id: Optional[int] = None,
+    data_inicio: Optional[date] = Query(None, description="data_aplicacao a partir de (inclusivo)"),
+    data_fim: Optional[date] = Query(None, description="data_aplicacao até (inclusivo)"),
+    valor_min: Optional[Decimal] = None,
+    valor_max: Optional[Decimal] = None,
+    ordenar_por: Optional[str] = Query(None, description=f"Um de: {', '.join(ORDENACAO_PENALIZACOES)}"),
+    ordem: str = Query("desc", pattern="^(asc|desc)$"),
+    funcionario_atual: dict = Depends(get_current_funcionario),
+):
+    filtro = (FiltroSQL()
+              .igual("p.status", status)
+              .igual("p.tipo", tipo)
+              .igual("p.cliente_id", cliente_id)
+              .igual("p.emprestimo_id", emprestimo_id)
+              .intervalo_datas("p.data_aplicacao", data_inicio, data_fim)
+              .minimo("p.valor", valor_min)
+              .maximo("p.valor", valor_max))
+    order_by = ordenacao(ordenar_por, ordem, ORDENACAO_PENALIZACOES, "data_aplicacao", "p.penalizacao_id")
+
+    conn = get_db_connection_leitura()
     cursor = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
     
     try:
-        cursor.execute("""
-            SELECT p.*, c.nome AS nome_cliente, e.data_emprestimo, e.valor AS valor_emprestimo
+        cursor.execute(f"""
+            SELECT p.*, c.nome AS nome_cliente, e.data_emprestimo, e.valor AS valor_emprestimo, e.total_devido
             FROM penalizacoes p
             JOIN clientes c ON p.cliente_id = c.cliente_id
             JOIN emprestimos e ON p.emprestimo_id = e.emprestimo_id
-            ORDER BY p.data_aplicacao DESC
+            {filtro.where()}
+            {order_by}
             LIMIT %s OFFSET %s
-        """, (limite, pular))
+        """, filtro.valores + [limite, pular])
         rows = cursor.fetchall()
+        total, estimado = contar_total(cursor, "penalizacoes p", filtro)
+        response.headers.update(cabecalhos_total(total, estimado))
         itens = []
         for r in rows:
             percent = (r['dias_atraso'] or 0) * 5
-            total_com_lucro = Decimal(r['valor_emprestimo']) * Decimal('1.20') + Decimal(r['valor'])
+            total_com_lucro = total_devido(r['valor_emprestimo'], r['total_devido']) + Decimal(r['valor'])
             itens.append(PenalizacaoDetalhe(
                 penalizacao_id=r['penalizacao_id'],
                 emprestimo_id=r['emprestimo_id'],
@@ -142,7 +181,7 @@ def obter_penalizacao(penalizacao_id: int, funcionario_atual: dict = Depends(get
     
     try:
         cursor.execute("""
-            SELECT p.*, c.nome AS nome_cliente, e.data_emprestimo, e.valor AS valor_emprestimo
+            SELECT p.*, c.nome AS nome_cliente, e.data_emprestimo, e.valor AS valor_emprestimo, e.total_devido
             FROM penalizacoes p
             JOIN clientes c ON p.cliente_id = c.cliente_id
             JOIN emprestimos e ON p.emprestimo_id = e.emprestimo_id
@@ -154,7 +193,7 @@ def obter_penalizacao(penalizacao_id: int, funcionario_atual: dict = Depends(get
             raise HTTPException(status_code=404, detail="Penalização não encontrada")
         
         percent = (r['dias_atraso'] or 0) * 5
-        total_com_lucro = Decimal(r['valor_emprestimo']) * Decimal('1.20') + Decimal(r['valor'])
+        total_com_lucro = total_devido(r['valor_emprestimo'], r['total_devido']) + Decimal(r['valor'])
         return PenalizacaoDetalhe(
             penalizacao_id=r['penalizacao_id'],
             emprestimo_id=r['emprestimo_id'],
@@ -184,14 +223,14 @@ def resumo_penalizacoes(pular: int = 0, limite: int = 100, funcionario_atual: di
     - percentagem aplicada (dias_atraso × 5)
     - valor do empréstimo
     - total das penalizações (valor_emprestimo × 0.05 × dias_atraso)
-    - total final = total penalizações + (valor_emprestimo × 1.20)
+    - total final = total penalizações + total devido do empréstimo (valor_emprestimo × 1.20 sem produto)
     Além disso, devolve uma mensagem similar ao fluxo de aplicação automática.
     """
-    conn = get_db_connection()
+    conn = get_db_connection_leitura()
     cursor = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
     try:
         cursor.execute("""
-            SELECT p.*, c.nome AS nome_cliente, e.data_emprestimo, e.valor AS valor_emprestimo
+            SELECT p.*, c.nome AS nome_cliente, e.data_emprestimo, e.valor AS valor_emprestimo, e.total_devido
             FROM penalizacoes p
             JOIN clientes c ON p.cliente_id = c.cliente_id
             JOIN emprestimos e ON p.emprestimo_id = e.emprestimo_id
@@ -203,7 +242,7 @@ def resumo_penalizacoes(pular: int = 0, limite: int = 100, funcionario_atual: di
         detalhes = []
         for r in rows:
             percent = (r['dias_atraso'] or 0) * 5
-            total_com_lucro = Decimal(r['valor_emprestimo']) * Decimal('1.20') + Decimal(r['valor'])
+            total_com_lucro = total_devido(r['valor_emprestimo'], r['total_devido']) + Decimal(r['valor'])
             detalhes.append({
                 "penalizacao_id": r['penalizacao_id'],
                 "emprestimo_id": r['emprestimo_id'],
@@ -227,9 +266,70 @@ def resumo_penalizacoes(pular: int = 0, limite: int = 100, funcionario_atual: di
         cursor.close()
         conn.close()
 
+def _centimos(v) -> Decimal:
+    return Decimal(int(v)) / 100
+
+@router.get("/simular", response_model=SimulacaoPenalizacoes)
+def simular_penalizacoes(
+    data_referencia: Optional[date] = Query(None, description="Data em que a aplicação automática correria (por omissão, hoje)"),
+    cliente_id: Optional[int] = None,
+    emprestimo_id: Optional[int] = None,
+    apenas_novas: bool = Query(True, description="Listar só os empréstimos que receberiam uma penalização"),
+    pular: int = Query(0, ge=0),
+    limite: int = Query(100, ge=1, le=1000),
+    funcionario_atual: dict = Depends(get_current_funcionario),
+):
+    """
+    Pré-visualização da aplicação automática de penalizações numa data qualquer, sem gravar nada:
+    totais da carteira ativa e os empréstimos afetados, por ordem decrescente de penalização.
+    """
+    data_referencia = data_referencia or datetime.now(timezone.utc).date()
+    conn = get_db_connection_leitura()
+    cursor = conn.cursor()
+    try:
+        carteira = carregar_carteira(cursor, cliente_id=cliente_id, emprestimo_id=emprestimo_id)
+    finally:
+        cursor.close()
+        conn.close()
+
+    r = simular(carteira, data_referencia)
+    selecao = np.flatnonzero(r["elegivel"]) if apenas_novas else np.arange(len(r["penalizacao"]))
+    # Ordenação estável: maior penalização primeiro, depois por emprestimo_id
+    selecao = selecao[np.argsort(-r["penalizacao"][selecao], kind="stable")][pular:pular + limite]
+    itens = [
+        PenalizacaoSimulada(
+            emprestimo_id=int(carteira["emprestimo_id"][i]),
+            cliente_id=int(carteira["cliente_id"][i]),
+            valor_emprestimo=_centimos(carteira["valor"][i]),
+            data_vencimento=carteira["vencimento"][i].item(),
+            dias_atraso=int(r["dias_atraso"][i]),
+            valor=_centimos(r["penalizacao"][i]),
+            penalizacoes_existentes=_centimos(carteira["penalizacoes"][i]),
+            total_com_penalizacoes=_centimos(r["total_com_penalizacoes"][i]),
+            em_divida=_centimos(r["em_divida"][i]),
+        )
+        for i in selecao
+    ]
+    return SimulacaoPenalizacoes(
+        data_referencia=data_referencia,
+        emprestimos_ativos=len(carteira["emprestimo_id"]),
+        emprestimos_vencidos=int(np.count_nonzero(r["dias_atraso"])),
+        novas_penalizacoes=int(np.count_nonzero(r["elegivel"])),
+        valor_novas_penalizacoes=_centimos(r["penalizacao"].sum()),
+        penalizacoes_existentes=_centimos(carteira["penalizacoes"].sum()),
+        total_devido=_centimos(carteira["total_devido"].sum()),
+        total_com_penalizacoes=_centimos(r["total_com_penalizacoes"].sum()),
+        total_em_divida=_centimos(r["em_divida"].sum()),
+        itens=itens,
+    )
+
  
-@router.post("/aplicar-automatico", response_model=dict)
-def aplicar_penalizacoes_automaticas(funcionario_atual: dict = Depends(get_current_funcionario)):
+def executar_penalizacoes_automaticas(progresso=None) -> dict:
+    """
+    Aplica a penalização de mora aos empréstimos ativos vencidos que ainda não a têm.
+    progresso(processados, total), quando indicado, é chamado a cada empréstimo e pode
+    interromper a execução lançando uma exceção (nada é gravado nesse caso).
+    """
     conn = get_db_connection()
     cursor = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
     
@@ -245,15 +345,14 @@ def aplicar_penalizacoes_automaticas(funcionario_atual: dict = Depends(get_curre
         emprestimos_atrasados = cursor.fetchall()
         detalhes = []
         
-        for emprestimo in emprestimos_atrasados:
-            # Ensure both operands are the same type for subtraction
-            current_date = datetime.now(timezone.utc).date()
-            vencimento_date = emprestimo['data_vencimento'].date() if hasattr(emprestimo['data_vencimento'], 'date') else emprestimo['data_vencimento']
-            dias_atraso = (current_date - vencimento_date).days if current_date > vencimento_date else 0
+        for i, emprestimo in enumerate(emprestimos_atrasados):
+            if progresso:
+                progresso(i, len(emprestimos_atrasados))
+            dias_atraso = calcular_dias_atraso(emprestimo['data_vencimento'], datetime.now(timezone.utc).date())
             if dias_atraso <= 0:
                 continue
 
-            penalizacao_dias_atraso = emprestimo['valor'] * Decimal('0.05') * dias_atraso
+            penalizacao_dias_atraso = calcular_penalizacao(emprestimo['valor'], dias_atraso)
             
             cursor.execute(
                 "INSERT INTO penalizacoes (emprestimo_id, cliente_id, tipo, dias_atraso, valor, status, data_aplicacao) VALUES (%s, %s, %s, %s, %s, %s, %s) RETURNING penalizacao_id",
@@ -274,16 +373,23 @@ def aplicar_penalizacoes_automaticas(funcionario_atual: dict = Depends(get_curre
                 "dias_atraso": dias_atraso,
                 "percentagem_aplicada": str(Decimal(dias_atraso) * Decimal(5)),
                 "total_penalizacoes": str(penalizacao_dias_atraso),
-                "total_com_lucro": str((Decimal(emprestimo['valor']) * Decimal('1.20')) + penalizacao_dias_atraso)
+                "total_com_lucro": str(total_devido(emprestimo['valor'], emprestimo.get('total_devido')) + penalizacao_dias_atraso)
             })
         
         conn.commit()
 
         return {"mensagem": "Penalizações aplicadas com sucesso", "detalhes": detalhes}
+    except Exception:
+        conn.rollback()
+        raise
     finally:
         cursor.close()
         conn.close()
 
+@router.post("/aplicar-automatico", response_model=dict)
+def aplicar_penalizacoes_automaticas(funcionario_atual: dict = Depends(get_current_funcionario)):
+    return executar_penalizacoes_automaticas()
+
 @router.delete("/remover/{penalizacao_id}")
 def remover_penalizacao(penalizacao_id: int, funcionario_atual: dict = Depends(get_current_funcionario)):
     conn = get_db_connection()
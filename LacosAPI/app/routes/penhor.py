@@ -1,8 +1,9 @@
 from fastapi import APIRouter, HTTPException, status, Depends
 from typing import List
 from app.schemas.penhor import Penhor
-from app.database.database import get_db_connection
+from app.database.database import get_db_connection, get_db_connection_leitura
 from app.utils.auth import get_current_funcionario
+from app.utils.garantias import invalidar_cobertura
 import psycopg2.extras
 
 router = APIRouter()
@@ -22,6 +23,7 @@ def criar_penhor(penhor: Penhor, funcionario_atual: dict = Depends(get_current_f
             raise HTTPException(status_code=500, detail="Falha ao criar penhor")
         penhor_id = result['penhor_id']
         conn.commit()
+        invalidar_cobertura()
         
         return Penhor(
             penhor_id=penhor_id,
@@ -36,7 +38,7 @@ def criar_penhor(penhor: Penhor, funcionario_atual: dict = Depends(get_current_f
 
 @router.get("/listar", response_model=List[Penhor])
 def listar_penhor(pular: int = 0, limite: int = 100, funcionario_atual: dict = Depends(get_current_funcionario)):
-    conn = get_db_connection()
+    conn = get_db_connection_leitura()
     cursor = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
     
     try:
@@ -76,6 +78,7 @@ def atualizar_penhor(penhor_id: int, penhor: Penhor, funcionario_atual: dict = D
         )
         penhor_atualizado = cursor.fetchone()
         conn.commit()
+        invalidar_cobertura()
         
         if penhor_atualizado is None:
             raise HTTPException(status_code=404, detail="Penhor não encontrado")
@@ -93,6 +96,7 @@ def remover_penhor(penhor_id: int, funcionario_atual: dict = Depends(get_current
     try:
         cursor.execute("DELETE FROM penhor WHERE penhor_id = %s", (penhor_id,))
         conn.commit()
+        invalidar_cobertura()
         
         if cursor.rowcount == 0:
             raise HTTPException(status_code=404, detail="Penhor não encontrado")
@@ -0,0 +1,83 @@
+from fastapi import APIRouter, HTTPException, Depends
+from typing import List
+from app.schemas.produto_credito import ProdutoCredito
+from app.database.database import get_db_connection
+from app.utils.auth import get_current_funcionario
+import psycopg2.extras
+import psycopg2.errors
+
+router = APIRouter()
+
+@router.post("/criar", response_model=ProdutoCredito)
+def criar_produto(produto: ProdutoCredito, funcionario_atual: dict = Depends(get_current_funcionario)):
+    conn = get_db_connection()
+    cursor = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
+    
+    try:
+        cursor.execute(
+            "INSERT INTO produtos_credito (nome, frequencia, metodo, taxa_juro, numero_prestacoes, ativo) VALUES (%s, %s, %s, %s, %s, %s) RETURNING *",
+            (produto.nome, produto.frequencia, produto.metodo, produto.taxa_juro, produto.numero_prestacoes, produto.ativo)
+        )
+        novo = cursor.fetchone()
+        conn.commit()
+        return ProdutoCredito(**novo)
+    except psycopg2.errors.UniqueViolation:
+        conn.rollback()
+        raise HTTPException(status_code=400, detail="Já existe um produto com este nome")
+    finally:
+        cursor.close()
+        conn.close()
+
+@router.get("/listar", response_model=List[ProdutoCredito])
+def listar_produtos(apenas_ativos: bool = False, funcionario_atual: dict = Depends(get_current_funcionario)):
+    conn = get_db_connection()
+    cursor = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
+    
+    try:
+        if apenas_ativos:
+            cursor.execute("SELECT * FROM produtos_credito WHERE ativo ORDER BY nome")
+        else:
+            cursor.execute("SELECT * FROM produtos_credito ORDER BY nome")
+        return [ProdutoCredito(**p) for p in cursor.fetchall()]
+    finally:
+        cursor.close()
+        conn.close()
+
+@router.get("/obter/{produto_id}", response_model=ProdutoCredito)
+def obter_produto(produto_id: int, funcionario_atual: dict = Depends(get_current_funcionario)):
+    conn = get_db_connection()
+    cursor = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
+    
+    try:
+        cursor.execute("SELECT * FROM produtos_credito WHERE produto_id = %s", (produto_id,))
+        produto = cursor.fetchone()
+        
+        if produto is None:
+            raise HTTPException(status_code=404, detail="Produto não encontrado")
+        
+        return ProdutoCredito(**produto)
+    finally:
+        cursor.close()
+        conn.close()
+
+@router.put("/atualizar/{produto_id}", response_model=ProdutoCredito)
+def atualizar_produto(produto_id: int, produto: ProdutoCredito, funcionario_atual: dict = Depends(get_current_funcionario)):
+    """Alterações só afetam empréstimos novos ou cronogramas regenerados explicitamente."""
+    conn = get_db_connection()
+    cursor = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
+    
+    try:
+        cursor.execute(
+            "UPDATE produtos_credito SET nome = %s, frequencia = %s, metodo = %s, taxa_juro = %s, numero_prestacoes = %s, ativo = %s WHERE produto_id = %s RETURNING *",
+            (produto.nome, produto.frequencia, produto.metodo, produto.taxa_juro, produto.numero_prestacoes, produto.ativo, produto_id)
+        )
+        produto_atualizado = cursor.fetchone()
+        conn.commit()
+        
+        if produto_atualizado is None:
+            raise HTTPException(status_code=404, detail="Produto não encontrado")
+        
+        return ProdutoCredito(**produto_atualizado)
+    finally:
+        cursor.close()
+        conn.close()
@@ -0,0 +1,67 @@
+from fastapi import APIRouter, HTTPException, Depends, Query
+from typing import List, Optional
+from app.schemas.tarefa import Tarefa, TarefaCreate
+from app.database.database import get_db_connection
+from app.utils.auth import get_current_funcionario
+from app.utils.tarefas import submeter_tarefa, cancelar_tarefa
+import psycopg2.extras
+
+router = APIRouter()
+
+@router.post("/criar", response_model=Tarefa, status_code=202)
+def criar_tarefa(tarefa: TarefaCreate, funcionario_atual: dict = Depends(get_current_funcionario)):
+    """
+    Submete uma operação longa para execução em segundo plano e devolve logo o tarefa_id.
+    O estado, o progresso e o resultado consultam-se em /obter/{tarefa_id}.
+    """
+    return submeter_tarefa(tarefa.tipo, tarefa.parametros, funcionario_atual.get("username"))
+
+@router.get("/listar", response_model=List[Tarefa])
+def listar_tarefas(
+    estado: Optional[str] = None,
+    tipo: Optional[str] = None,
+    pular: int = 0,
+    limite: int = Query(50, ge=1, le=500),
+    funcionario_atual: dict = Depends(get_current_funcionario)
+):
+    conn = get_db_connection()
+    cursor = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
+    
+    try:
+        cursor.execute("""
+            SELECT * FROM tarefas
+            WHERE (%s::text IS NULL OR estado = %s) AND (%s::text IS NULL OR tipo = %s)
+            ORDER BY tarefa_id DESC
+            LIMIT %s OFFSET %s
+        """, (estado, estado, tipo, tipo, limite, pular))
+        return cursor.fetchall()
+    finally:
+        cursor.close()
+        conn.close()
+
+@router.get("/obter/{tarefa_id}", response_model=Tarefa)
+def obter_tarefa(tarefa_id: int, funcionario_atual: dict = Depends(get_current_funcionario)):
+    conn = get_db_connection()
+    cursor = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
+    
+    try:
+        cursor.execute("SELECT * FROM tarefas WHERE tarefa_id = %s", (tarefa_id,))
+        tarefa = cursor.fetchone()
+        
+        if tarefa is None:
+            raise HTTPException(status_code=404, detail="Tarefa não encontrada")
+        
+        return tarefa
+    finally:
+        cursor.close()
+        conn.close()
+
+@router.post("/cancelar/{tarefa_id}", response_model=Tarefa)
+def cancelar(tarefa_id: int, funcionario_atual: dict = Depends(get_current_funcionario)):
+    """Cancela uma tarefa pendente, ou pede a uma tarefa em curso que pare (nada do que fez é gravado)."""
+    tarefa = cancelar_tarefa(tarefa_id)
+    if tarefa is None:
+        raise HTTPException(status_code=404, detail="Tarefa não encontrada")
+    if tarefa["estado"] not in ("Cancelada", "Em curso"):
+        raise HTTPException(status_code=409, detail=f"A tarefa já terminou (estado: {tarefa['estado']})")
+    return tarefa
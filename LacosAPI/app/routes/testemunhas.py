@@ -1,8 +1,9 @@
 from fastapi import APIRouter, HTTPException, status, Depends
 from typing import List
 from app.schemas.testemunha import Testemunha
-from app.database.database import get_db_connection
+from app.database.database import get_db_connection, get_db_connection_leitura
 from app.utils.auth import get_current_funcionario
+from app.utils.garantias import invalidar_cobertura
 import psycopg2.extras
 
 router = APIRouter()
@@ -22,6 +23,7 @@ def criar_testemunha(testemunha: Testemunha, funcionario_atual: dict = Depends(g
             raise HTTPException(status_code=500, detail="Falha ao criar testemunha")
         testemunha_id = result['testemunha_id']
         conn.commit()
+        invalidar_cobertura()
         
         return Testemunha(
             testemunha_id=testemunha_id,
@@ -36,7 +38,7 @@ def criar_testemunha(testemunha: Testemunha, funcionario_atual: dict = Depends(g
 
 @router.get("/listar", response_model=List[Testemunha])
 def listar_testemunhas(pular: int = 0, limite: int = 100, funcionario_atual: dict = Depends(get_current_funcionario)):
-    conn = get_db_connection()
+    conn = get_db_connection_leitura()
     cursor = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
     
     try:
@@ -76,6 +78,7 @@ def atualizar_testemunha(testemunha_id: int, testemunha: Testemunha, funcionario
         )
         testemunha_atualizada = cursor.fetchone()
         conn.commit()
+        invalidar_cobertura()
         
         if testemunha_atualizada is None:
             raise HTTPException(status_code=404, detail="Testemunha não encontrada")
@@ -93,6 +96,7 @@ def remover_testemunha(testemunha_id: int, funcionario_atual: dict = Depends(get
     try:
         cursor.execute("DELETE FROM testemunhas WHERE testemunha_id = %s", (testemunha_id,))
         conn.commit()
+        invalidar_cobertura()
         
         if cursor.rowcount == 0:
             raise HTTPException(status_code=404, detail="Testemunha não encontrada")
@@ -22,4 +22,8 @@ class Cliente(BaseModel):
     def nacionalidade_must_be_valid(cls, v):
         if v not in ['Moçambicana', 'Estrangeira']:
             raise ValueError('Nacionalidade inválida')
-        return v
\ No newline at end of file
+        return v
+
+class ClientePesquisa(Cliente):
+    pontuacao: float = Field(..., description="Relevância entre 0 e 1 (1 = correspondência exata)")
+    campo: str = Field(..., description="Campo que originou a correspondência (nome, telefone, email, documento)")
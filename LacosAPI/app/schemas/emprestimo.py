@@ -1,6 +1,6 @@
 from pydantic import BaseModel, Field, validator
 from typing import Optional
-from datetime import datetime
+from datetime import date, datetime
 from decimal import Decimal
 
 class Emprestimo(BaseModel):
@@ -8,11 +8,23 @@ class Emprestimo(BaseModel):
     cliente_id: int
     valor: Decimal = Field(..., max_digits=10, decimal_places=2)
     data_emprestimo: datetime
-    data_vencimento: datetime
+    data_vencimento: Optional[datetime] = Field(None, description="Obrigatório sem produto; com produto é a data da última prestação")
     status: str = Field('Ativo', description="Status do empréstimo (Ativo, Pago, Inadimplente)")
+    produto_id: Optional[int] = None
+    total_devido: Optional[Decimal] = Field(None, description="Calculado pelo plano de prestações (só leitura)")
 
     @validator('status')
     def status_must_be_valid(cls, v):
         if v not in ['Ativo', 'Pago', 'Inadimplente']:
             raise ValueError('Status inválido')
         return v
+
+class Prestacao(BaseModel):
+    emprestimo_id: int
+    numero: int
+    data_vencimento: date
+    capital: Decimal
+    juro: Decimal
+    valor: Decimal
+    valor_pago: Decimal
+    em_aberto: Decimal
@@ -1,4 +1,4 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, validator
 from typing import Optional
 
 class Localizacao(BaseModel):
@@ -9,4 +9,18 @@ class Localizacao(BaseModel):
     quarteirao: Optional[str] = None
     cidade: str
     distrito: str
-    provincia: str
\ No newline at end of file
+    provincia: str
+    latitude: Optional[float] = None
+    longitude: Optional[float] = None
+
+    @validator('latitude')
+    def validar_latitude(cls, v):
+        if v is not None and not -90 <= v <= 90:
+            raise ValueError('Latitude deve estar entre -90 e 90')
+        return v
+
+    @validator('longitude')
+    def validar_longitude(cls, v):
+        if v is not None and not -180 <= v <= 180:
+            raise ValueError('Longitude deve estar entre -180 e 180')
+        return v
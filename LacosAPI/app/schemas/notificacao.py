@@ -1,6 +1,9 @@
-from pydantic import BaseModel, validator
-from typing import Optional
-from datetime import datetime
+from pydantic import BaseModel, Field, validator
+from typing import List, Optional
+from datetime import date, datetime
+
+# Máximo de ids numa atualização em massa por lista
+MAX_IDS_ATUALIZACAO = 10000
 
 class NotificacaoBase(BaseModel):
     cliente_id: Optional[int] = None
@@ -17,7 +20,7 @@ class NotificacaoBase(BaseModel):
 
     @validator('status')
     def validar_status(cls, v):
-        valores_permitidos = ['Enviado', 'Lido', 'Pendente']
+        valores_permitidos = ['Enviado', 'Lido', 'Pendente', 'Falhada']
         if v not in valores_permitidos:
             raise ValueError(f'status deve ser um dos: {valores_permitidos}')
         return v
@@ -30,15 +33,43 @@ class NotificacaoAtualizar(BaseModel):
 
     @validator('status')
     def validar_status(cls, v):
-        valores_permitidos = ['Enviado', 'Lido', 'Pendente']
+        valores_permitidos = ['Enviado', 'Lido', 'Pendente', 'Falhada']
         if v not in valores_permitidos:
             raise ValueError(f'status deve ser um dos: {valores_permitidos}')
         return v
 
+class NotificacaoAtualizacaoMassa(BaseModel):
+    status: str = Field(..., description="Novo status (Enviado, Lido, Pendente, Falhada)")
+    notificacao_ids: Optional[List[int]] = Field(None, description="Lista de ids; pode combinar com os filtros")
+    tipo: Optional[str] = None
+    cliente_id: Optional[int] = None
+    status_atual: Optional[str] = Field(None, description="Só as notificações com este status")
+    data_inicio: Optional[date] = Field(None, description="data_envio a partir de (inclusivo)")
+    data_fim: Optional[date] = Field(None, description="data_envio até (inclusivo)")
+
+    @validator('status', 'status_atual')
+    def validar_status(cls, v):
+        valores_permitidos = ['Enviado', 'Lido', 'Pendente', 'Falhada']
+        if v is not None and v not in valores_permitidos:
+            raise ValueError(f'status deve ser um dos: {valores_permitidos}')
+        return v
+
+    @validator('notificacao_ids')
+    def validar_ids(cls, v):
+        if v is not None and not 0 < len(v) <= MAX_IDS_ATUALIZACAO:
+            raise ValueError(f'notificacao_ids deve ter entre 1 e {MAX_IDS_ATUALIZACAO} ids')
+        return v
+
 class Notificacao(NotificacaoBase):
     notificacao_id: int
     data_envio: datetime
     cliente_id: Optional[int] = None  # Override to make it optional
+    tentativas: int = 0
+    enviada_em: Optional[datetime] = None
+    ultimo_erro: Optional[str] = None
 
     class Config:
         from_attributes = True
+
+class NotificacaoArquivada(Notificacao):
+    arquivada_em: datetime
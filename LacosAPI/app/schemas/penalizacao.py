@@ -1,6 +1,6 @@
 from pydantic import BaseModel, Field, validator
-from typing import Optional
-from datetime import datetime
+from typing import List, Optional
+from datetime import date, datetime
 from decimal import Decimal
 
 class Penalizacao(BaseModel):
@@ -33,4 +33,27 @@ class PenalizacaoDetalhe(Penalizacao):
     valor_emprestimo: Optional[Decimal] = None
     percentagem_aplicada: Optional[Decimal] = None  # Ex.: 75 para 15 dias de atraso
     total_penalizacoes: Optional[Decimal] = None    # Somatório das penalizações calculadas
-    total_com_lucro: Optional[Decimal] = None       # total_penalizacoes + (valor_emprestimo * 1.20)
+    total_com_lucro: Optional[Decimal] = None       # total_penalizacoes + total devido do empréstimo
+
+class PenalizacaoSimulada(BaseModel):
+    emprestimo_id: int
+    cliente_id: int
+    valor_emprestimo: Decimal
+    data_vencimento: date
+    dias_atraso: int
+    valor: Decimal = Field(..., description="Penalização que seria aplicada na data de referência")
+    penalizacoes_existentes: Decimal
+    total_com_penalizacoes: Decimal  # total devido + penalizações existentes + simulada
+    em_divida: Decimal               # total_com_penalizacoes - pagamentos
+
+class SimulacaoPenalizacoes(BaseModel):
+    data_referencia: date
+    emprestimos_ativos: int
+    emprestimos_vencidos: int
+    novas_penalizacoes: int
+    valor_novas_penalizacoes: Decimal
+    penalizacoes_existentes: Decimal
+    total_devido: Decimal
+    total_com_penalizacoes: Decimal
+    total_em_divida: Decimal
+    itens: List[PenalizacaoSimulada] = []
@@ -0,0 +1,24 @@
+from pydantic import BaseModel, Field, validator
+from typing import Optional
+from decimal import Decimal
+
+class ProdutoCredito(BaseModel):
+    produto_id: Optional[int] = None
+    nome: str
+    frequencia: str = Field(..., description="Periodicidade das prestações (Semanal, Quinzenal, Mensal)")
+    metodo: str = Field(..., description="Fixo (juro total = valor × taxa) ou Saldo Decrescente (taxa por período)")
+    taxa_juro: Decimal = Field(..., ge=0, max_digits=8, decimal_places=6)
+    numero_prestacoes: int = Field(..., ge=1, le=520)
+    ativo: bool = True
+
+    @validator('frequencia')
+    def frequencia_must_be_valid(cls, v):
+        if v not in ['Semanal', 'Quinzenal', 'Mensal']:
+            raise ValueError('Frequência inválida')
+        return v
+
+    @validator('metodo')
+    def metodo_must_be_valid(cls, v):
+        if v not in ['Fixo', 'Saldo Decrescente']:
+            raise ValueError('Método inválido')
+        return v
@@ -0,0 +1,33 @@
+from pydantic import BaseModel, Field, validator
+from typing import Any, Dict, Optional
+from datetime import datetime
+from decimal import Decimal
+
+TIPOS_TAREFA = ['penalizacoes', 'lembretes', 'historico-credito', 'dashboard-cache', 'cronogramas', 'coortes', 'snapshots', 'duplicados', 'arquivo-notificacoes', 'particoes']
+
+class TarefaCreate(BaseModel):
+    tipo: str = Field(..., description="Tipo de tarefa (penalizacoes, lembretes, historico-credito, dashboard-cache, cronogramas, coortes, snapshots, duplicados, arquivo-notificacoes, particoes)")
+    parametros: Dict[str, Any] = Field(default_factory=dict)
+
+    @validator('tipo')
+    def tipo_must_be_valid(cls, v):
+        if v not in TIPOS_TAREFA:
+            raise ValueError('Tipo de tarefa inválido')
+        return v
+
+class Tarefa(BaseModel):
+    tarefa_id: int
+    tipo: str
+    parametros: Dict[str, Any] = Field(default_factory=dict)
+    estado: str = Field(..., description="Estado (Pendente, Em curso, Concluida, Erro, Cancelada)")
+    progresso: Decimal = Field(0, description="Percentagem concluída (0-100)")
+    processados: int = 0
+    total: Optional[int] = None
+    resultado: Optional[Dict[str, Any]] = None
+    erro: Optional[str] = None
+    cancelamento_pedido: bool = False
+    tentativas: int = 0
+    criado_por: Optional[str] = None
+    criada_em: datetime
+    iniciada_em: Optional[datetime] = None
+    terminada_em: Optional[datetime] = None
@@ -0,0 +1,110 @@
+"""
+Capacidade de pagamento (affordability): taxa de esforço = prestação mensal de todos os
+empréstimos ativos do cliente / rendimento mensal (renda_minima das ocupações ativas mais
+outros_ganhos, ambos tratados como mensais).
+
+A prestação mensal de um empréstimo é o seu saldo em aberto repartido pelos meses que faltam
+até data_vencimento (no mínimo um, pelo que um empréstimo vencido pesa o saldo inteiro).
+
+O rendimento de cada cliente fica guardado em rendimentos_clientes com a versão dos dados de
+origem em que foi calculado. Gatilhos em ocupacoes e outros_ganhos incrementam a versão do
+cliente em rendimentos_versoes; a avaliação só usa o rendimento guardado se a versão ainda for
+a atual e, caso contrário, recalcula-o e guarda-o com a versão lida no mesmo snapshot. Uma
+escrita confirmada durante o cálculo deixa assim a linha guardada já desatualizada, em vez de
+a esconder. A avaliação é uma única consulta.
+"""
+import os
+from decimal import Decimal
+
+from app.utils.prestacoes import sql_total_devido
+
+# avisar: cria o empréstimo e devolve o resultado nos cabeçalhos X-Afordabilidade-*
+# bloquear: recusa (400) os empréstimos acima do limite; desligado: não avalia
+AFORDABILIDADE_MODO = os.getenv("AFORDABILIDADE_MODO", "avisar").lower()
+# Taxa de esforço máxima (prestações / rendimento mensal)
+AFORDABILIDADE_TAXA_MAX = Decimal(os.getenv("AFORDABILIDADE_TAXA_MAX", "0.40"))
+
+DIAS_POR_MES = Decimal("30.4375")
+
+_SQL_AVALIAR = f"""
+    WITH versao AS (
+        SELECT COALESCE((SELECT versao FROM rendimentos_versoes WHERE cliente_id = %(cliente_id)s), 0) AS v
+    ),
+    em_cache AS (
+        SELECT r.renda_ocupacoes, r.outros_ganhos
+        FROM rendimentos_clientes r, versao
+        WHERE r.cliente_id = %(cliente_id)s AND r.versao = versao.v
+    ),
+    calculado AS (
+        SELECT COALESCE((SELECT SUM(renda_minima) FROM ocupacoes
+                         WHERE cliente_id = %(cliente_id)s AND ativo), 0) AS renda_ocupacoes,
+               COALESCE((SELECT SUM(valor) FROM outros_ganhos
+                         WHERE cliente_id = %(cliente_id)s), 0) AS outros_ganhos
+        WHERE NOT EXISTS (SELECT 1 FROM em_cache)
+    ),
+    guardado AS (
+        INSERT INTO rendimentos_clientes (cliente_id, renda_ocupacoes, outros_ganhos, versao)
+        SELECT %(cliente_id)s, c.renda_ocupacoes, c.outros_ganhos, versao.v FROM calculado c, versao
+        ON CONFLICT (cliente_id) DO UPDATE SET
+            renda_ocupacoes = EXCLUDED.renda_ocupacoes,
+            outros_ganhos = EXCLUDED.outros_ganhos,
+            versao = EXCLUDED.versao,
+            atualizado_em = now()
+        WHERE rendimentos_clientes.versao < EXCLUDED.versao
+    ),
+    rendimento AS (
+        SELECT * FROM em_cache
+        UNION ALL
+        SELECT * FROM calculado
+    ),
+    exposicao AS (
+        SELECT COUNT(*) AS emprestimos,
+               COALESCE(SUM(x.saldo), 0) AS saldo,
+               COALESCE(SUM(x.saldo / GREATEST(CEIL((x.vencimento - CURRENT_DATE) / %(dias_por_mes)s), 1)), 0)
+                   AS prestacao_mensal
+        FROM (
+            SELECT e.data_vencimento::date AS vencimento,
+                   GREATEST({sql_total_devido("e")} - COALESCE(
+                       (SELECT SUM(valor_pago) FROM pagamentos p WHERE p.emprestimo_id = e.emprestimo_id), 0), 0) AS saldo
+            FROM emprestimos e
+            WHERE e.cliente_id = %(cliente_id)s AND e.status = 'Ativo'
+        ) x
+    )
+    SELECT r.renda_ocupacoes, r.outros_ganhos, x.emprestimos, x.saldo, x.prestacao_mensal
+    FROM rendimento r CROSS JOIN exposicao x
+"""
+
+
+def avaliar(cursor, cliente_id: int, prestacao_adicional: Decimal = Decimal(0)) -> dict:
+    """
+    Taxa de esforço do cliente com os empréstimos ativos que já tem (na transação do cursor)
+    mais uma prestação mensal adicional (para simular um empréstimo ainda não criado).
+    Tem de correr no primário: pode gravar o rendimento em rendimentos_clientes.
+    """
+    cursor.execute(_SQL_AVALIAR, {"cliente_id": cliente_id, "dias_por_mes": DIAS_POR_MES})
+    linha = cursor.fetchone()
+    renda_ocupacoes = Decimal(linha["renda_ocupacoes"])
+    outros_ganhos = Decimal(linha["outros_ganhos"])
+    rendimento = renda_ocupacoes + outros_ganhos
+    prestacao = Decimal(linha["prestacao_mensal"]) + prestacao_adicional
+    taxa = (prestacao / rendimento) if rendimento > 0 else None
+
+    if rendimento <= 0:
+        motivo = "Cliente sem rendimento registado (ocupações ativas ou outros ganhos)"
+    elif taxa > AFORDABILIDADE_TAXA_MAX:
+        motivo = f"Taxa de esforço {taxa:.1%} acima do limite de {AFORDABILIDADE_TAXA_MAX:.0%}"
+    else:
+        motivo = None
+    return {
+        "cliente_id": cliente_id,
+        "rendimento_mensal": float(rendimento),
+        "renda_ocupacoes": float(renda_ocupacoes),
+        "outros_ganhos": float(outros_ganhos),
+        "emprestimos_ativos": int(linha["emprestimos"]),
+        "saldo_em_aberto": float(linha["saldo"]),
+        "prestacao_mensal": round(float(prestacao), 2),
+        "taxa_esforco": round(float(taxa), 4) if taxa is not None else None,
+        "taxa_maxima": float(AFORDABILIDADE_TAXA_MAX),
+        "aprovado": motivo is None,
+        "motivo": motivo,
+    }
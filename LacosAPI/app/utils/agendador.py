@@ -0,0 +1,286 @@
+import os
+import socket
+import threading
+import traceback
+from datetime import datetime, timedelta, timezone
+from typing import Callable, Dict, List, Optional, Set
+
+import psycopg2.extras
+from fastapi import HTTPException
+
+from app.database.database import get_db_connection
+
+# Agendador em processo dos trabalhos automáticos (desligado por omissão)
+SCHEDULER_ENABLED = os.getenv("SCHEDULER_ENABLED", "0").lower() in ("1", "true", "sim", "yes")
+# Os horários cron são interpretados nesta diferença para UTC, em horas (Moçambique = 2)
+SCHEDULER_UTC_OFFSET_H = float(os.getenv("SCHEDULER_UTC_OFFSET_H", "2"))
+
+
+class ExpressaoCron:
+    """
+    Expressão cron de 5 campos (minuto hora dia-do-mês mês dia-da-semana).
+    Suporta '*', listas 'a,b', intervalos 'a-b' e passos '*/n' ou 'a-b/n'. Domingo = 0 (ou 7).
+    """
+
+    LIMITES = [(0, 59), (0, 23), (1, 31), (1, 12), (0, 6)]
+
+    def __init__(self, expressao: str):
+        campos = expressao.split()
+        if len(campos) != 5:
+            raise ValueError(f"Expressão cron inválida (são precisos 5 campos): '{expressao}'")
+        self.expressao = expressao
+        self.minutos, self.horas, self.dias, self.meses, self.dias_semana = (
+            self._campo(c, minimo, maximo, i == 4) for i, (c, (minimo, maximo)) in enumerate(zip(campos, self.LIMITES))
+        )
+        # Regra do cron: se dia-do-mês e dia-da-semana estiverem ambos restringidos, basta um coincidir
+        self._dia_livre = campos[2] == "*"
+        self._semana_livre = campos[4] == "*"
+
+    @staticmethod
+    def _campo(texto: str, minimo: int, maximo: int, semana: bool) -> Set[int]:
+        valores = set()
+        for parte in texto.split(","):
+            passo = 1
+            if "/" in parte:
+                parte, passo_txt = parte.split("/", 1)
+                passo = int(passo_txt)
+                if passo <= 0:
+                    raise ValueError(f"Passo inválido em '{texto}'")
+            if parte == "*":
+                inicio, fim = minimo, maximo
+            elif "-" in parte:
+                a, b = parte.split("-", 1)
+                inicio, fim = int(a), int(b)
+            else:
+                inicio = int(parte)
+                fim = maximo if passo > 1 else inicio
+            limite_superior = 7 if semana else maximo
+            if inicio < minimo or fim > limite_superior or inicio > fim:
+                raise ValueError(f"Valor fora do intervalo em '{texto}'")
+            valores.update(0 if semana and v == 7 else v for v in range(inicio, fim + 1, passo))
+        return valores
+
+    def coincide(self, momento: datetime) -> bool:
+        if momento.minute not in self.minutos or momento.hour not in self.horas or momento.month not in self.meses:
+            return False
+        dia_ok = momento.day in self.dias
+        # datetime.weekday(): segunda = 0; no cron domingo = 0
+        semana_ok = (momento.weekday() + 1) % 7 in self.dias_semana
+        if self._dia_livre or self._semana_livre:
+            return dia_ok and semana_ok
+        return dia_ok or semana_ok
+
+    def proxima(self, depois_de: datetime) -> datetime:
+        """Próximo minuto (UTC) estritamente posterior a depois_de que satisfaz a expressão."""
+        fuso = timezone(timedelta(hours=SCHEDULER_UTC_OFFSET_H))
+        momento = depois_de.astimezone(fuso).replace(second=0, microsecond=0) + timedelta(minutes=1)
+        # Um ano de minutos chega para qualquer expressão válida
+        for _ in range(366 * 24 * 60):
+            if self.coincide(momento):
+                return momento.astimezone(timezone.utc)
+            if momento.hour not in self.horas:
+                momento = momento.replace(minute=0) + timedelta(hours=1)
+            else:
+                momento += timedelta(minutes=1)
+        raise ValueError(f"A expressão '{self.expressao}' nunca ocorre")
+
+
+class Trabalho:
+    def __init__(self, nome: str, cron: str, executar: Callable[[], dict], contar: Callable[[dict], int]):
+        self.nome = nome
+        self.cron = ExpressaoCron(cron)
+        self.executar = executar
+        self.contar = contar
+
+
+def _penalizacoes():
+    from app.routes.penalizacoes import executar_penalizacoes_automaticas
+    return executar_penalizacoes_automaticas()
+
+
+def _lembretes():
+    from app.routes.notificacoes import executar_verificacao_pagamentos
+    return executar_verificacao_pagamentos()
+
+
+def _historico_credito():
+    from app.routes.historico_credito import executar_atualizacao_historico
+    return executar_atualizacao_historico()
+
+
+def _coortes():
+    from app.utils.coortes import atualizar_cubo
+    conn = get_db_connection()
+    try:
+        return atualizar_cubo(conn)
+    finally:
+        conn.close()
+
+
+def _snapshots():
+    from app.utils.snapshots import gerar_snapshots
+    # "Ontem" no fuso dos horários cron, que pode não ser o do servidor
+    ontem = datetime.now(timezone(timedelta(hours=SCHEDULER_UTC_OFFSET_H))).date() - timedelta(days=1)
+    conn = get_db_connection()
+    try:
+        return gerar_snapshots(conn, data_fim=ontem)
+    finally:
+        conn.close()
+
+
+def _duplicados():
+    from app.utils.duplicados import analisar_carteira
+    conn = get_db_connection()
+    try:
+        return analisar_carteira(conn)
+    finally:
+        conn.close()
+
+
+def _arquivo_notificacoes():
+    from app.utils.arquivo_notificacoes import arquivar_notificacoes
+    conn = get_db_connection()
+    try:
+        return arquivar_notificacoes(conn)
+    finally:
+        conn.close()
+
+
+def _particoes():
+    from app.utils.particoes import manter_particoes
+    conn = get_db_connection()
+    try:
+        return manter_particoes(conn)
+    finally:
+        conn.close()
+
+
+TRABALHOS: Dict[str, Trabalho] = {
+    t.nome: t for t in [
+        Trabalho("penalizacoes", os.getenv("SCHEDULE_PENALIZACOES", "0 1 * * *"),
+                 _penalizacoes, lambda r: len(r.get("detalhes", []))),
+        Trabalho("lembretes", os.getenv("SCHEDULE_LEMBRETES", "0 8 * * *"),
+                 _lembretes, lambda r: len(r.get("notificacoes", []))),
+        Trabalho("historico-credito", os.getenv("SCHEDULE_HISTORICO_CREDITO", "30 2 * * *"),
+                 _historico_credito, lambda r: len(r.get("historicos", []))),
+        Trabalho("coortes", os.getenv("SCHEDULE_COORTES", "0 3 * * *"),
+                 _coortes, lambda r: r.get("linhas_afetadas", 0)),
+        # Logo depois da meia-noite: fotografa o dia anterior, já completo
+        Trabalho("snapshots", os.getenv("SCHEDULE_SNAPSHOTS", "10 0 * * *"),
+                 _snapshots, lambda r: r.get("linhas_afetadas", 0)),
+        Trabalho("duplicados", os.getenv("SCHEDULE_DUPLICADOS", "0 4 * * 0"),
+                 _duplicados, lambda r: r.get("linhas_afetadas", 0)),
+        Trabalho("arquivo-notificacoes", os.getenv("SCHEDULE_ARQUIVO_NOTIFICACOES", "30 4 * * *"),
+                 _arquivo_notificacoes, lambda r: r.get("linhas_afetadas", 0)),
+        # Partições mensais de pagamentos, notificacoes e penalizacoes com meses de avanço
+        Trabalho("particoes", os.getenv("SCHEDULE_PARTICOES", "20 0 * * *"),
+                 _particoes, lambda r: r.get("linhas_afetadas", 0)),
+    ]
+}
+
+_INSTANCIA = f"{socket.gethostname()}:{os.getpid()}"
+
+
+def executar_trabalho(nome: str, agendado_para: Optional[datetime] = None) -> Optional[dict]:
+    """
+    Corre um trabalho se nenhum outro processo o estiver a correr e se esta ocorrência ainda
+    não foi executada. Devolve o registo da execução, ou None quando foi ignorado.
+
+    O advisory lock (pg_try_advisory_lock) fica numa ligação própria durante toda a execução;
+    a restrição única (trabalho, agendado_para) impede que outro processo repita a mesma
+    ocorrência depois de o lock ser libertado.
+    """
+    trabalho = TRABALHOS[nome]
+    agendado_para = agendado_para or datetime.now(timezone.utc).replace(microsecond=0)
+    conn_lock = get_db_connection()
+    conn_lock.autocommit = True
+    cursor = conn_lock.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
+    try:
+        cursor.execute("SELECT pg_try_advisory_lock(hashtext(%s)) AS obtido", (f"agendador:{nome}",))
+        if not cursor.fetchone()["obtido"]:
+            return None
+        try:
+            cursor.execute("""
+                INSERT INTO execucoes_agendadas (trabalho, agendado_para, inicio, estado, instancia)
+                VALUES (%s, %s, %s, 'Em curso', %s)
+                ON CONFLICT (trabalho, agendado_para) DO NOTHING
+                RETURNING execucao_id
+            """, (nome, agendado_para, datetime.now(timezone.utc), _INSTANCIA))
+            registo = cursor.fetchone()
+            if registo is None:
+                return None
+
+            estado, linhas, erro = "Sucesso", None, None
+            try:
+                resultado = trabalho.executar()
+                linhas = trabalho.contar(resultado or {})
+            except HTTPException as e:
+                estado, erro = "Erro", str(e.detail)
+            except Exception:
+                estado, erro = "Erro", traceback.format_exc(limit=5)
+
+            cursor.execute("""
+                UPDATE execucoes_agendadas
+                SET fim = %s, estado = %s, linhas_afetadas = %s, erro = %s
+                WHERE execucao_id = %s
+                RETURNING *
+            """, (datetime.now(timezone.utc), estado, linhas, erro, registo["execucao_id"]))
+            return cursor.fetchone()
+        finally:
+            cursor.execute("SELECT pg_advisory_unlock(hashtext(%s))", (f"agendador:{nome}",))
+    finally:
+        cursor.close()
+        conn_lock.close()
+
+
+class Agendador:
+    """Thread de fundo que acorda na próxima ocorrência de cada trabalho e o executa."""
+
+    def __init__(self, trabalhos: Dict[str, Trabalho]):
+        self.trabalhos = trabalhos
+        self._parar = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.proximas: Dict[str, datetime] = {}
+
+    def iniciar(self):
+        if self._thread is not None:
+            return
+        agora = datetime.now(timezone.utc)
+        self.proximas = {nome: t.cron.proxima(agora) for nome, t in self.trabalhos.items()}
+        self._thread = threading.Thread(target=self._ciclo, name="agendador", daemon=True)
+        self._thread.start()
+
+    def parar(self):
+        self._parar.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+    def _ciclo(self):
+        while not self._parar.is_set():
+            agora = datetime.now(timezone.utc)
+            devidos = [nome for nome, quando in self.proximas.items() if quando <= agora]
+            for nome in devidos:
+                agendado_para = self.proximas[nome]
+                self.proximas[nome] = self.trabalhos[nome].cron.proxima(agora)
+                try:
+                    executar_trabalho(nome, agendado_para)
+                except Exception as e:
+                    # Sem base de dados não há onde registar; tenta-se de novo na próxima ocorrência
+                    print(f"Erro no agendador ({nome}): {e}")
+            espera = (min(self.proximas.values()) - datetime.now(timezone.utc)).total_seconds()
+            self._parar.wait(max(1.0, min(espera, 60.0)))
+
+    def estado(self) -> List[dict]:
+        agora = datetime.now(timezone.utc)
+        return [
+            {
+                "trabalho": nome,
+                "cron": t.cron.expressao,
+                "proxima_execucao": (self.proximas.get(nome) or t.cron.proxima(agora)).isoformat(),
+            }
+            for nome, t in self.trabalhos.items()
+        ]
+
+
+agendador = Agendador(TRABALHOS)
@@ -0,0 +1,61 @@
+"""
+Arquivo de notificações: as já lidas e mais antigas do que NOTIFICACOES_ARQUIVO_DIAS saem de
+notificacoes (a tabela consultada pelo dashboard e pelas listagens) para notificacoes_arquivo.
+A mudança é feita em lotes, cada um num único DELETE ... RETURNING encadeado com o INSERT e
+com o seu commit, para não reter bloqueios em muitas linhas de uma só vez.
+"""
+import os
+from datetime import datetime, timedelta, timezone
+from typing import Callable, Optional
+
+NOTIFICACOES_ARQUIVO_DIAS = int(os.getenv("NOTIFICACOES_ARQUIVO_DIAS", "90"))
+NOTIFICACOES_ARQUIVO_LOTE = int(os.getenv("NOTIFICACOES_ARQUIVO_LOTE", "5000"))
+
+
+def arquivar_notificacoes(conn, dias: Optional[int] = None,
+                          progresso: Optional[Callable[[int, Optional[int]], None]] = None) -> dict:
+    dias = NOTIFICACOES_ARQUIVO_DIAS if dias is None else dias
+    limite = datetime.now(timezone.utc) - timedelta(days=dias)
+    cursor = conn.cursor()
+    movidas = 0
+    try:
+        cursor.execute("SELECT COUNT(*) FROM notificacoes WHERE status = 'Lido' AND data_envio < %s", (limite,))
+        total = cursor.fetchone()[0]
+        while True:
+            if progresso:
+                progresso(movidas, total)
+            # SKIP LOCKED: linhas a ser atualizadas por outro pedido ficam para a próxima passagem
+            cursor.execute("""
+                WITH movidas AS (
+                    DELETE FROM notificacoes
+                    WHERE notificacao_id IN (
+                        SELECT notificacao_id FROM notificacoes
+                        WHERE status = 'Lido' AND data_envio < %s
+                        LIMIT %s
+                        FOR UPDATE SKIP LOCKED
+                    )
+                    RETURNING notificacao_id, cliente_id, tipo, mensagem, data_envio, status,
+                              tentativas, enviada_em, ultimo_erro, gateway
+                )
+                INSERT INTO notificacoes_arquivo (notificacao_id, cliente_id, tipo, mensagem, data_envio, status,
+                                                  tentativas, enviada_em, ultimo_erro, gateway)
+                SELECT notificacao_id, cliente_id, tipo, mensagem, data_envio, status,
+                       tentativas, enviada_em, ultimo_erro, gateway
+                FROM movidas
+            """, (limite, NOTIFICACOES_ARQUIVO_LOTE))
+            lote = cursor.rowcount
+            conn.commit()
+            movidas += lote
+            if lote < NOTIFICACOES_ARQUIVO_LOTE:
+                break
+        if progresso:
+            progresso(movidas, max(total, movidas))
+        return {
+            "mensagem": f"{movidas} notificações lidas com mais de {dias} dias arquivadas",
+            "linhas_afetadas": movidas,
+        }
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
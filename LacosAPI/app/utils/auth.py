@@ -117,3 +117,11 @@ async def get_current_funcionario(token: str = Depends(oauth2_scheme)):
     finally:
         cursor.close()
         conn.close()
+
+async def get_current_administrador(funcionario_atual: dict = Depends(get_current_funcionario)):
+    if funcionario_atual.get('nivel_acesso') != 'Administrador':
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Acesso reservado a administradores",
+        )
+    return funcionario_atual
@@ -0,0 +1,217 @@
+"""
+Cubo de coortes (vintage): mês de desembolso × meses em carteira × categoria de risco da
+ocupação × sexo do cliente.
+
+Cada célula guarda fluxos aditivos (empréstimos desembolsados, valor pago, entradas em
+incumprimento), pelo que a atualização incremental só soma o que entrou desde a anterior:
+empréstimos e pagamentos com id acima da marca guardada em coortes_estado e os empréstimos
+que atingiram o incumprimento desde a última data processada. Os valores acumulados (curvas
+de reembolso, saldo em aberto) são calculados na consulta, sobre o cubo, que é pequeno.
+
+Os ids são atribuídos no INSERT mas confirmados no commit, por vezes fora de ordem: cada
+atualização relê os últimos _MARGEM_IDS ids abaixo da marca e ignora os que já somou (guardados
+em coortes_estado), tudo sobre um único snapshot (REPEATABLE READ).
+
+Alterações ou remoções de empréstimos/pagamentos já processados não são incrementais, tal
+como uma linha confirmada mais de _MARGEM_IDS ids abaixo da marca: para as refletir
+reconstrói-se o cubo (completo=True).
+"""
+from datetime import date
+from typing import Callable, List, Optional
+
+import psycopg2.errors
+
+from app.utils.prestacoes import sql_total_devido
+
+# Dias de atraso a partir dos quais um empréstimo por pagar conta como incumprimento
+DIAS_INCUMPRIMENTO = 90
+DIMENSOES = ("categoria_risco", "sexo")
+SEM_OCUPACAO = "Sem ocupacao"
+# Ids abaixo da marca relidos em cada atualização (transações confirmadas fora de ordem)
+_MARGEM_IDS = 1000
+
+# Empréstimo -> coorte e dimensões. A ocupação considerada é a ativa mais recente do cliente.
+_EMPRESTIMOS = f"""
+    SELECT e.emprestimo_id,
+           date_trunc('month', e.data_emprestimo)::date AS mes,
+           COALESCE(o.categoria_risco, %(sem_ocupacao)s) AS categoria_risco,
+           c.sexo,
+           e.valor,
+           {sql_total_devido("e")} AS total_devido,
+           e.data_vencimento::date + %(dias_incumprimento)s AS data_incumprimento
+    FROM emprestimos e
+    JOIN clientes c ON c.cliente_id = e.cliente_id
+    LEFT JOIN LATERAL (
+        SELECT categoria_risco
+        FROM ocupacoes
+        WHERE cliente_id = e.cliente_id
+        ORDER BY ativo DESC, ocupacao_id DESC
+        LIMIT 1
+    ) o ON TRUE
+"""
+
+# Meses entre o mês de desembolso e a data indicada (0 = o próprio mês)
+_MESES = "GREATEST((EXTRACT(YEAR FROM {d}) * 12 + EXTRACT(MONTH FROM {d}) - EXTRACT(YEAR FROM m.mes) * 12 - EXTRACT(MONTH FROM m.mes))::int, 0)"
+
+_SOMAR = """
+    INSERT INTO coortes (mes_desembolso, meses_em_carteira, categoria_risco, sexo,
+                         emprestimos, valor_desembolsado, total_devido, valor_pago,
+                         incumprimentos, valor_incumprido)
+    {selecao}
+    ON CONFLICT (mes_desembolso, meses_em_carteira, categoria_risco, sexo) DO UPDATE SET
+        emprestimos = coortes.emprestimos + EXCLUDED.emprestimos,
+        valor_desembolsado = coortes.valor_desembolsado + EXCLUDED.valor_desembolsado,
+        total_devido = coortes.total_devido + EXCLUDED.total_devido,
+        valor_pago = coortes.valor_pago + EXCLUDED.valor_pago,
+        incumprimentos = coortes.incumprimentos + EXCLUDED.incumprimentos,
+        valor_incumprido = coortes.valor_incumprido + EXCLUDED.valor_incumprido
+"""
+
+
+def _somar_desembolsos(cursor, id_min: int, id_max: int, excluir: List[int]) -> int:
+    cursor.execute(_SOMAR.format(selecao=f"""
+        SELECT m.mes, 0, m.categoria_risco, m.sexo,
+               COUNT(*), SUM(m.valor), SUM(m.total_devido), 0, 0, 0
+        FROM ({_EMPRESTIMOS}) m
+        WHERE m.emprestimo_id > %(id_min)s AND m.emprestimo_id <= %(id_max)s
+          AND NOT (m.emprestimo_id = ANY(%(excluir)s::bigint[]))
+        GROUP BY 1, 2, 3, 4
+    """), _parametros(id_min=id_min, id_max=id_max, excluir=excluir))
+    return cursor.rowcount
+
+
+def _somar_pagamentos(cursor, id_min: int, id_max: int, excluir: List[int]) -> int:
+    cursor.execute(_SOMAR.format(selecao=f"""
+        SELECT m.mes, {_MESES.format(d="p.data_pagamento")}, m.categoria_risco, m.sexo,
+               0, 0, 0, SUM(p.valor_pago), 0, 0
+        FROM pagamentos p
+        JOIN ({_EMPRESTIMOS}) m ON m.emprestimo_id = p.emprestimo_id
+        WHERE p.pagamento_id > %(id_min)s AND p.pagamento_id <= %(id_max)s
+          AND NOT (p.pagamento_id = ANY(%(excluir)s::bigint[]))
+        GROUP BY 1, 2, 3, 4
+    """), _parametros(id_min=id_min, id_max=id_max, excluir=excluir))
+    return cursor.rowcount
+
+
+def _somar_incumprimentos(cursor, emprestimo_id_max: int, data_min: Optional[date], data_max: date,
+                          emprestimo_id_min: int = 0, excluir: Optional[List[int]] = None) -> int:
+    """
+    Empréstimos com emprestimo_id em ]emprestimo_id_min, emprestimo_id_max], fora de excluir,
+    cuja data de incumprimento (vencimento + DIAS_INCUMPRIMENTO) cai em ]data_min, data_max] e
+    que nessa data ainda não estavam pagos. Entram no mês em carteira dessa data, pelo valor
+    em falta.
+    """
+    cursor.execute(_SOMAR.format(selecao=f"""
+        SELECT m.mes, {_MESES.format(d="m.data_incumprimento")}, m.categoria_risco, m.sexo,
+               0, 0, 0, 0, COUNT(*), SUM(m.total_devido - COALESCE(pg.pago, 0))
+        FROM ({_EMPRESTIMOS}) m
+        LEFT JOIN LATERAL (
+            SELECT SUM(valor_pago) AS pago
+            FROM pagamentos
+            WHERE emprestimo_id = m.emprestimo_id AND data_pagamento::date <= m.data_incumprimento
+        ) pg ON TRUE
+        WHERE m.emprestimo_id > %(id_min)s AND m.emprestimo_id <= %(id_max)s
+          AND NOT (m.emprestimo_id = ANY(%(excluir)s::bigint[]))
+          AND (%(data_min)s::date IS NULL OR m.data_incumprimento > %(data_min)s::date)
+          AND m.data_incumprimento <= %(data_max)s::date
+          AND COALESCE(pg.pago, 0) < m.total_devido
+        GROUP BY 1, 2, 3, 4
+    """), _parametros(id_min=emprestimo_id_min, id_max=emprestimo_id_max, excluir=excluir or [],
+                      data_min=data_min, data_max=data_max))
+    return cursor.rowcount
+
+
+def _parametros(**valores) -> dict:
+    return {"sem_ocupacao": SEM_OCUPACAO, "dias_incumprimento": DIAS_INCUMPRIMENTO, **valores}
+
+
+def _ids_entre(cursor, tabela: str, coluna: str, id_min: int, id_max: int, excluir: List[int]) -> List[int]:
+    cursor.execute(f"""
+        SELECT COALESCE(array_agg({coluna} ORDER BY {coluna}), '{{}}')
+        FROM {tabela}
+        WHERE {coluna} > %s AND {coluna} <= %s AND NOT ({coluna} = ANY(%s::bigint[]))
+    """, (id_min, id_max, excluir))
+    return list(cursor.fetchone()[0])
+
+
+def atualizar_cubo(conn, completo: bool = False, hoje: Optional[date] = None,
+                   progresso: Optional[Callable[[int, Optional[int]], None]] = None) -> dict:
+    """
+    Atualiza o cubo numa única transação. A linha de coortes_estado é bloqueada (FOR UPDATE),
+    pelo que duas atualizações simultâneas são serializadas e nenhum fluxo é somado duas vezes;
+    a que esperou falha por serialização e é repetida com o estado deixado pela outra.
+    """
+    for tentativa in range(3):
+        try:
+            return _atualizar_cubo(conn, completo, hoje or date.today(), progresso)
+        except psycopg2.errors.SerializationFailure:
+            if tentativa == 2:
+                raise
+
+
+def _atualizar_cubo(conn, completo: bool, hoje: date,
+                    progresso: Optional[Callable[[int, Optional[int]], None]]) -> dict:
+    cursor = conn.cursor()
+    try:
+        # Um só snapshot: o que é somado e os ids guardados como somados têm de coincidir
+        cursor.execute("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ")
+        cursor.execute("INSERT INTO coortes_estado (id) VALUES (TRUE) ON CONFLICT (id) DO NOTHING")
+        cursor.execute("""
+            SELECT ultimo_emprestimo_id, ultimo_pagamento_id, data_incumprimento,
+                   margem_emprestimos, margem_pagamentos
+            FROM coortes_estado WHERE id FOR UPDATE
+        """)
+        emp_anterior, pag_anterior, data_anterior, emp_margem, pag_margem = cursor.fetchone()
+        if completo:
+            # DELETE e não TRUNCATE: as consultas continuam a ver o cubo antigo até ao commit
+            cursor.execute("DELETE FROM coortes")
+            emp_anterior, pag_anterior, data_anterior, emp_margem, pag_margem = 0, 0, None, [], []
+        emp_margem, pag_margem = list(emp_margem), list(pag_margem)
+
+        cursor.execute("SELECT COALESCE(MAX(emprestimo_id), 0) FROM emprestimos")
+        emp_atual = max(cursor.fetchone()[0], emp_anterior)
+        cursor.execute("SELECT COALESCE(MAX(pagamento_id), 0) FROM pagamentos")
+        pag_atual = max(cursor.fetchone()[0], pag_anterior)
+        emp_min = max(emp_anterior - _MARGEM_IDS, 0)
+        pag_min = max(pag_anterior - _MARGEM_IDS, 0)
+        # Empréstimos abaixo da marca anterior confirmados depois dela: somados agora como novos
+        emp_atrasados = _ids_entre(cursor, "emprestimos", "emprestimo_id", emp_min, emp_anterior, emp_margem)
+
+        passos: List[Callable[[], int]] = [
+            lambda: _somar_desembolsos(cursor, emp_min, emp_atual, emp_margem),
+            lambda: _somar_pagamentos(cursor, pag_min, pag_atual, pag_margem),
+            # Empréstimos já conhecidos: só os que entraram em incumprimento desde a última vez
+            lambda: _somar_incumprimentos(cursor, emp_anterior, data_anterior, hoje, excluir=emp_atrasados),
+            # Empréstimos novos: todos os incumprimentos até hoje (podem ter datas antigas)
+            lambda: _somar_incumprimentos(cursor, emp_atual, None, hoje, emprestimo_id_min=emp_min,
+                                          excluir=emp_margem),
+        ]
+        celulas = 0
+        for i, passo in enumerate(passos):
+            if progresso:
+                progresso(i, len(passos))
+            celulas += passo()
+
+        # Ids da nova margem: todos os visíveis já estão somados (antes ou nesta atualização)
+        emp_margem = _ids_entre(cursor, "emprestimos", "emprestimo_id", max(emp_atual - _MARGEM_IDS, 0), emp_atual, [])
+        pag_margem = _ids_entre(cursor, "pagamentos", "pagamento_id", max(pag_atual - _MARGEM_IDS, 0), pag_atual, [])
+        cursor.execute("""
+            UPDATE coortes_estado
+            SET ultimo_emprestimo_id = %s, ultimo_pagamento_id = %s, data_incumprimento = %s,
+                margem_emprestimos = %s::bigint[], margem_pagamentos = %s::bigint[], atualizado_em = now()
+            WHERE id
+        """, (emp_atual, pag_atual, hoje, emp_margem, pag_margem))
+        conn.commit()
+        if progresso:
+            progresso(len(passos), len(passos))
+        return {
+            "mensagem": "Cubo de coortes reconstruído" if completo else "Cubo de coortes atualizado",
+            "linhas_afetadas": celulas,
+            "emprestimos_novos": emp_atual - emp_anterior,
+            "pagamentos_novos": pag_atual - pag_anterior,
+        }
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
@@ -0,0 +1,275 @@
+"""
+Deteção de clientes duplicados.
+
+A passagem completa lê clientes e documentos uma única vez e agrupa-os por chaves de bloqueio
+(telefone normalizado, número de documento de identificação normalizado, data de nascimento
+com o primeiro ou o último nome). Só os pares que partilham um bloco são pontuados, pelo que o
+custo cresce com o tamanho dos blocos e não com o quadrado do número de clientes. Os pares
+acima do limiar são unidos em grupos (union-find) e gravados em clientes_duplicados.
+
+A verificação de um único cliente (clientes/criar) usa as mesmas regras, mas vai buscar os
+candidatos com consultas indexadas em vez de ler a tabela toda.
+"""
+import os
+import re
+import unicodedata
+from datetime import date
+from typing import Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+import psycopg2.extras
+
+# Pontuação mínima (0 a 1) para dois clientes serem considerados o mesmo
+DUPLICADOS_LIMIAR = float(os.getenv("DUPLICADOS_LIMIAR", "0.7"))
+# Blocos maiores do que isto (ex.: um telefone genérico partilhado por centenas) são ignorados
+DUPLICADOS_BLOCO_MAX = int(os.getenv("DUPLICADOS_BLOCO_MAX", "200"))
+ITERSIZE = 5000
+
+# Só estes documentos identificam a pessoa (um contrato ou talão não)
+TIPOS_IDENTIFICACAO = ("BI", "Passaporte", "NUIT", "DIRE", "Carta de Conducao", "Certidao de Nascimento")
+
+PESO_NOME = 0.6
+PESO_NASCIMENTO = 0.25
+PESO_TELEFONE = 0.3
+PESO_EMAIL = 0.15
+PESO_DOCUMENTO = 0.5
+
+# Mesma normalização do telefone em SQL (índice idx_clientes_telefone_normalizado)
+SQL_TELEFONE_NORMALIZADO = "right(regexp_replace(telefone, '[^0-9]', '', 'g'), 9)"
+
+
+def normalizar_nome(nome: Optional[str]) -> str:
+    """Minúsculas, sem acentos nem pontuação, espaços simples: 'João  da Silva.' -> 'joao da silva'."""
+    if not nome:
+        return ""
+    sem_acentos = unicodedata.normalize("NFKD", nome).encode("ascii", "ignore").decode("ascii")
+    return " ".join(re.sub(r"[^a-z ]", " ", sem_acentos.lower()).split())
+
+
+def normalizar_telefone(telefone: Optional[str]) -> str:
+    """Só os últimos 9 dígitos: '+258 84 123 4567' e '841234567' são o mesmo número."""
+    return re.sub(r"[^0-9]", "", telefone or "")[-9:]
+
+
+def normalizar_documento(numero: Optional[str]) -> str:
+    return re.sub(r"[^0-9A-Z]", "", (numero or "").upper())
+
+
+def _trigramas(nome_normalizado: str) -> Set[str]:
+    """Trigramas por palavra, como no pg_trgm (duas margens à esquerda, uma à direita)."""
+    trigramas = set()
+    for palavra in nome_normalizado.split():
+        p = f"  {palavra} "
+        trigramas.update(p[i:i + 3] for i in range(len(p) - 2))
+    return trigramas
+
+
+def semelhanca_nomes(a: Set[str], b: Set[str]) -> float:
+    """Coeficiente de Dice dos trigramas: tolera melhor do que o de Jaccard um erro num nome curto."""
+    if not a or not b:
+        return 0.0
+    return 2 * len(a & b) / (len(a) + len(b))
+
+
+class Registo:
+    """Cliente já normalizado, com o que é preciso para o bloquear e pontuar."""
+
+    __slots__ = ("cliente_id", "nome", "trigramas", "telefone", "email", "data_nascimento", "documentos")
+
+    def __init__(self, cliente_id: Optional[int], nome: str, telefone: Optional[str], email: Optional[str],
+                 data_nascimento: Optional[date], documentos: Iterable[str] = ()):
+        self.cliente_id = cliente_id
+        self.nome = normalizar_nome(nome)
+        self.trigramas = _trigramas(self.nome)
+        self.telefone = normalizar_telefone(telefone)
+        self.email = (email or "").strip().lower()
+        self.data_nascimento = data_nascimento
+        self.documentos = {normalizar_documento(d) for d in documentos if d} - {""}
+
+    def chaves(self) -> List[Tuple]:
+        chaves: List[Tuple] = []
+        if len(self.telefone) >= 6:
+            chaves.append(("telefone", self.telefone))
+        chaves.extend(("documento", d) for d in self.documentos)
+        palavras = self.nome.split()
+        if self.data_nascimento and palavras:
+            chaves.append(("nascimento_nome", self.data_nascimento, palavras[0]))
+            if len(palavras) > 1:
+                chaves.append(("nascimento_apelido", self.data_nascimento, palavras[-1]))
+        return chaves
+
+
+def pontuar(a: Registo, b: Registo) -> Tuple[float, List[str]]:
+    """Pontuação entre 0 e 1 e os motivos que a explicam."""
+    semelhanca = semelhanca_nomes(a.trigramas, b.trigramas)
+    pontuacao = PESO_NOME * semelhanca
+    motivos = [f"nome:{semelhanca:.2f}"]
+    if a.data_nascimento and a.data_nascimento == b.data_nascimento:
+        pontuacao += PESO_NASCIMENTO
+        motivos.append("data_nascimento")
+    if a.telefone and a.telefone == b.telefone:
+        pontuacao += PESO_TELEFONE
+        motivos.append("telefone")
+    if a.email and a.email == b.email:
+        pontuacao += PESO_EMAIL
+        motivos.append("email")
+    if a.documentos & b.documentos:
+        pontuacao += PESO_DOCUMENTO
+        motivos.append("documento")
+    return min(pontuacao, 1.0), motivos
+
+
+def _raiz(pais: Dict[int, int], x: int) -> int:
+    while pais[x] != x:
+        pais[x] = pais[pais[x]]
+        x = pais[x]
+    return x
+
+
+def agrupar_pares(pares: Dict[Tuple[int, int], Tuple[float, List[str]]]) -> Dict[int, int]:
+    """Union-find: cliente_id -> grupo (o menor cliente_id do grupo)."""
+    pais: Dict[int, int] = {}
+    for a, b in pares:
+        pais.setdefault(a, a)
+        pais.setdefault(b, b)
+        ra, rb = _raiz(pais, a), _raiz(pais, b)
+        if ra != rb:
+            pais[max(ra, rb)] = min(ra, rb)
+    return {x: _raiz(pais, x) for x in pais}
+
+
+def encontrar_pares(registos: Dict[int, Registo], limiar: float = DUPLICADOS_LIMIAR) -> Tuple[Dict[Tuple[int, int], Tuple[float, List[str]]], int]:
+    """Pares (menor id, maior id) acima do limiar e o número de blocos ignorados por serem grandes."""
+    blocos: Dict[Tuple, List[int]] = {}
+    for cliente_id, registo in registos.items():
+        for chave in registo.chaves():
+            blocos.setdefault(chave, []).append(cliente_id)
+
+    pares: Dict[Tuple[int, int], Tuple[float, List[str]]] = {}
+    vistos: Set[Tuple[int, int]] = set()
+    ignorados = 0
+    for membros in blocos.values():
+        if len(membros) < 2:
+            continue
+        if len(membros) > DUPLICADOS_BLOCO_MAX:
+            ignorados += 1
+            continue
+        for i in range(len(membros)):
+            for j in range(i + 1, len(membros)):
+                par = (min(membros[i], membros[j]), max(membros[i], membros[j]))
+                if par in vistos:
+                    continue
+                vistos.add(par)
+                pontuacao, motivos = pontuar(registos[par[0]], registos[par[1]])
+                if pontuacao >= limiar:
+                    pares[par] = (pontuacao, motivos)
+    return pares, ignorados
+
+
+def carregar_registos(conn) -> Dict[int, Registo]:
+    """Todos os clientes com os seus documentos de identificação, lidos num cursor nomeado."""
+    cursor = conn.cursor(name="duplicados_clientes")
+    cursor.itersize = ITERSIZE
+    try:
+        cursor.execute("""
+            SELECT c.cliente_id, c.nome, c.telefone, c.email, c.data_nascimento,
+                   COALESCE(d.numeros, '{}')
+            FROM clientes c
+            LEFT JOIN (
+                SELECT cliente_id, array_agg(numero_documento) AS numeros
+                FROM documentos
+                WHERE tipo_documento = ANY(%s) AND cliente_id IS NOT NULL
+                GROUP BY cliente_id
+            ) d ON d.cliente_id = c.cliente_id
+        """, (list(TIPOS_IDENTIFICACAO),))
+        return {linha[0]: Registo(*linha) for linha in cursor}
+    finally:
+        cursor.close()
+
+
+def analisar_carteira(conn, limiar: float = DUPLICADOS_LIMIAR,
+                      progresso: Optional[Callable[[int, Optional[int]], None]] = None) -> dict:
+    """Passagem completa: recalcula e substitui o conteúdo de clientes_duplicados."""
+    if progresso:
+        progresso(0, 3)
+    registos = carregar_registos(conn)
+    if progresso:
+        progresso(1, 3)
+    pares, ignorados = encontrar_pares(registos, limiar)
+    grupos = agrupar_pares(pares)
+    if progresso:
+        progresso(2, 3)
+
+    cursor = conn.cursor()
+    try:
+        cursor.execute("DELETE FROM clientes_duplicados")
+        psycopg2.extras.execute_values(cursor, """
+            INSERT INTO clientes_duplicados (cliente_id, duplicado_de, grupo, pontuacao, motivos)
+            VALUES %s
+        """, [(b, a, grupos[a], round(p, 4), motivos) for (a, b), (p, motivos) in pares.items()], page_size=1000)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+    if progresso:
+        progresso(3, 3)
+    return {
+        "mensagem": f"{len(set(grupos.values()))} grupos de possíveis duplicados encontrados",
+        "linhas_afetadas": len(pares),
+        "clientes_analisados": len(registos),
+        "clientes_em_grupos": len(grupos),
+        "blocos_ignorados": ignorados,
+    }
+
+
+def verificar_cliente(cursor, nome: str, telefone: Optional[str], email: Optional[str],
+                      data_nascimento: Optional[date], documentos: Iterable[str] = (),
+                      excluir_cliente_id: Optional[int] = None, limiar: float = DUPLICADOS_LIMIAR) -> List[dict]:
+    """
+    Candidatos a duplicado de um cliente (novo ou existente), do mais provável para o menos.
+    Cada chave de bloqueio é uma consulta servida por índice, limitada a DUPLICADOS_BLOCO_MAX.
+    """
+    novo = Registo(excluir_cliente_id, nome, telefone, email, data_nascimento, documentos)
+    ramos, valores = [], []
+    if len(novo.telefone) >= 6:
+        ramos.append(f"(SELECT cliente_id FROM clientes WHERE {SQL_TELEFONE_NORMALIZADO} = %s LIMIT %s)")
+        valores += [novo.telefone, DUPLICADOS_BLOCO_MAX]
+    if novo.email:
+        ramos.append("(SELECT cliente_id FROM clientes WHERE lower(email) = %s LIMIT %s)")
+        valores += [novo.email, DUPLICADOS_BLOCO_MAX]
+    if novo.data_nascimento:
+        ramos.append("(SELECT cliente_id FROM clientes WHERE data_nascimento = %s LIMIT %s)")
+        valores += [novo.data_nascimento, DUPLICADOS_BLOCO_MAX]
+    if novo.documentos:
+        ramos.append("""(SELECT cliente_id FROM documentos
+                         WHERE upper(regexp_replace(numero_documento, '[^0-9A-Za-z]', '', 'g')) = ANY(%s)
+                           AND tipo_documento = ANY(%s) AND cliente_id IS NOT NULL LIMIT %s)""")
+        valores += [list(novo.documentos), list(TIPOS_IDENTIFICACAO), DUPLICADOS_BLOCO_MAX]
+    if not ramos:
+        return []
+
+    cursor.execute(f"""
+        SELECT c.cliente_id, c.nome, c.telefone, c.email, c.data_nascimento,
+               COALESCE((SELECT array_agg(numero_documento) FROM documentos d
+                         WHERE d.cliente_id = c.cliente_id AND d.tipo_documento = ANY(%s)), '{{}}') AS documentos
+        FROM clientes c
+        WHERE c.cliente_id IN ({" UNION ".join(ramos)}) AND c.cliente_id IS DISTINCT FROM %s
+    """, [list(TIPOS_IDENTIFICACAO)] + valores + [excluir_cliente_id])
+
+    candidatos = []
+    for linha in cursor.fetchall():
+        linha = dict(linha)
+        pontuacao, motivos = pontuar(novo, Registo(linha["cliente_id"], linha["nome"], linha["telefone"], linha["email"],
+                                                   linha["data_nascimento"], linha["documentos"]))
+        if pontuacao >= limiar:
+            candidatos.append({
+                "cliente_id": linha["cliente_id"],
+                "nome": linha["nome"],
+                "telefone": linha["telefone"],
+                "data_nascimento": linha["data_nascimento"].isoformat() if linha["data_nascimento"] else None,
+                "pontuacao": round(pontuacao, 4),
+                "motivos": motivos,
+            })
+    candidatos.sort(key=lambda c: (-c["pontuacao"], c["cliente_id"]))
+    return candidatos
@@ -0,0 +1,291 @@
+"""
+Entrega das notificações aos clientes por SMS.
+
+Cada thread de entrega reclama um lote de notificações Pendentes de clientes com
+SELECT ... FOR UPDATE SKIP LOCKED e faz logo commit, deixando-lhes uma reserva
+(proxima_tentativa = agora + ENTREGA_RESERVA_S): o envio decorre fora da transação, vários
+processos e threads nunca pegam na mesma linha e uma thread que morra a meio só atrasa o
+seu lote até a reserva expirar. Os resultados do lote são gravados num único UPDATE.
+
+Falhas temporárias voltam a ser tentadas com espera exponencial; ao fim de
+ENTREGA_MAX_TENTATIVAS, ou logo numa falha permanente (número inválido), a notificação fica
+Falhada (dead letter) com o último erro, e pode ser reposta por POST /entregas/reenviar.
+As notificações sem cliente (as de administração) não são entregues.
+"""
+import os
+import random
+import threading
+import time
+from collections import deque
+from typing import Callable, Dict, List, Optional, Tuple
+
+import psycopg2
+import psycopg2.extras
+import requests
+
+from app.database.database import get_db_connection
+
+ENTREGA_WORKERS = int(os.getenv("ENTREGA_WORKERS", "0"))
+ENTREGA_GATEWAY = os.getenv("ENTREGA_GATEWAY", "falso")
+ENTREGA_LOTE = int(os.getenv("ENTREGA_LOTE", "50"))
+ENTREGA_INTERVALO_S = float(os.getenv("ENTREGA_INTERVALO_S", "2"))
+ENTREGA_RESERVA_S = int(os.getenv("ENTREGA_RESERVA_S", "300"))
+ENTREGA_MAX_TENTATIVAS = int(os.getenv("ENTREGA_MAX_TENTATIVAS", "5"))
+ENTREGA_ESPERA_BASE_S = float(os.getenv("ENTREGA_ESPERA_BASE_S", "30"))
+ENTREGA_ESPERA_MAX_S = float(os.getenv("ENTREGA_ESPERA_MAX_S", "3600"))
+# Mensagens por segundo por gateway, em cada processo (0 = sem limite)
+ENTREGA_TAXA_POR_S = float(os.getenv("ENTREGA_TAXA_POR_S", "10"))
+
+ENTREGA_HTTP_URL = os.getenv("ENTREGA_HTTP_URL", "")
+ENTREGA_HTTP_TOKEN = os.getenv("ENTREGA_HTTP_TOKEN", "")
+ENTREGA_HTTP_REMETENTE = os.getenv("ENTREGA_HTTP_REMETENTE", "Lacos")
+ENTREGA_HTTP_TIMEOUT_S = float(os.getenv("ENTREGA_HTTP_TIMEOUT_S", "10"))
+
+
+class ErroEntrega(Exception):
+    """Falha temporária: a mensagem volta a ser tentada mais tarde."""
+
+
+class ErroEntregaPermanente(ErroEntrega):
+    """Falha que não se resolve a tentar de novo (número inválido, mensagem recusada)."""
+
+
+class GatewaySMS:
+    """
+    Interface dos gateways: enviar devolve o identificador da mensagem no fornecedor ou
+    lança ErroEntrega / ErroEntregaPermanente. Tem de poder ser chamado de várias threads.
+    """
+    nome = "base"
+
+    def enviar(self, telefone: str, mensagem: str) -> Optional[str]:
+        raise NotImplementedError
+
+
+class GatewayFalso(GatewaySMS):
+    """
+    Gateway local para desenvolvimento e testes: não envia nada, guarda as últimas mensagens
+    em memória e falha (temporariamente) na fração ENTREGA_FALSO_FALHAS das vezes.
+    """
+    nome = "falso"
+
+    def __init__(self, taxa_falhas: float = float(os.getenv("ENTREGA_FALSO_FALHAS", "0"))):
+        self.taxa_falhas = taxa_falhas
+        self.enviadas: deque = deque(maxlen=1000)
+        self._contador = 0
+        self._lock = threading.Lock()
+
+    def enviar(self, telefone: str, mensagem: str) -> Optional[str]:
+        if not any(c.isdigit() for c in telefone or ""):
+            raise ErroEntregaPermanente(f"Telefone inválido: {telefone!r}")
+        if random.random() < self.taxa_falhas:
+            raise ErroEntrega("Falha simulada")
+        with self._lock:
+            self._contador += 1
+            self.enviadas.append((telefone, mensagem))
+            return f"falso-{self._contador}"
+
+
+class GatewayHTTP(GatewaySMS):
+    """
+    Fornecedor com API HTTP genérica: POST JSON {remetente, destino, mensagem} para
+    ENTREGA_HTTP_URL com o token em Authorization. 4xx é permanente (exceto 408 e 429).
+    """
+    nome = "http"
+
+    def __init__(self):
+        if not ENTREGA_HTTP_URL:
+            raise RuntimeError("ENTREGA_HTTP_URL não configurado")
+        self._sessao = requests.Session()
+        if ENTREGA_HTTP_TOKEN:
+            self._sessao.headers["Authorization"] = f"Bearer {ENTREGA_HTTP_TOKEN}"
+
+    def enviar(self, telefone: str, mensagem: str) -> Optional[str]:
+        try:
+            resposta = self._sessao.post(
+                ENTREGA_HTTP_URL,
+                json={"remetente": ENTREGA_HTTP_REMETENTE, "destino": telefone, "mensagem": mensagem},
+                timeout=ENTREGA_HTTP_TIMEOUT_S,
+            )
+        except requests.RequestException as e:
+            raise ErroEntrega(f"Erro de rede: {e}")
+        if resposta.status_code in (408, 429) or resposta.status_code >= 500:
+            raise ErroEntrega(f"HTTP {resposta.status_code}: {resposta.text[:200]}")
+        if resposta.status_code >= 400:
+            raise ErroEntregaPermanente(f"HTTP {resposta.status_code}: {resposta.text[:200]}")
+        try:
+            return str(resposta.json().get("id") or "") or None
+        except ValueError:
+            return None
+
+
+# Gateways disponíveis por nome (ENTREGA_GATEWAY); outros podem ser acrescentados com registar_gateway
+GATEWAYS: Dict[str, Callable[[], GatewaySMS]] = {
+    "falso": GatewayFalso,
+    "http": GatewayHTTP,
+}
+
+
+def registar_gateway(nome: str, fabrica: Callable[[], GatewaySMS]):
+    GATEWAYS[nome] = fabrica
+
+
+class LimiteTaxa:
+    """Balde de fichas partilhado pelas threads de um processo."""
+
+    def __init__(self, por_segundo: float):
+        self.por_segundo = por_segundo
+        self._fichas = max(por_segundo, 1.0)
+        self._ultimo = time.monotonic()
+        self._lock = threading.Lock()
+
+    def aguardar(self, parar: threading.Event):
+        if self.por_segundo <= 0:
+            return
+        while not parar.is_set():
+            with self._lock:
+                agora = time.monotonic()
+                self._fichas = min(max(self.por_segundo, 1.0), self._fichas + (agora - self._ultimo) * self.por_segundo)
+                self._ultimo = agora
+                if self._fichas >= 1:
+                    self._fichas -= 1
+                    return
+                falta = (1 - self._fichas) / self.por_segundo
+            parar.wait(falta)
+
+
+def espera_tentativa(tentativas: int) -> float:
+    """Espera exponencial com variação aleatória (full jitter) antes da tentativa seguinte."""
+    teto = min(ENTREGA_ESPERA_MAX_S, ENTREGA_ESPERA_BASE_S * 2 ** max(tentativas - 1, 0))
+    return random.uniform(teto / 2, teto)
+
+
+def reclamar_lote(cursor, limite: int) -> List[dict]:
+    cursor.execute("""
+        UPDATE notificacoes n
+        SET tentativas = n.tentativas + 1,
+            proxima_tentativa = now() + make_interval(secs => %(reserva)s)
+        FROM (
+            SELECT notificacao_id
+            FROM notificacoes
+            WHERE status = 'Pendente' AND cliente_id IS NOT NULL
+              AND (proxima_tentativa IS NULL OR proxima_tentativa <= now())
+            ORDER BY notificacao_id
+            LIMIT %(limite)s
+            FOR UPDATE SKIP LOCKED
+        ) r, clientes c
+        WHERE n.notificacao_id = r.notificacao_id AND c.cliente_id = n.cliente_id
+        RETURNING n.notificacao_id, n.mensagem, n.tentativas, c.telefone
+    """, {"reserva": ENTREGA_RESERVA_S, "limite": limite})
+    return cursor.fetchall()
+
+
+def gravar_resultados(cursor, resultados: List[Tuple[int, int, str, Optional[float], Optional[str]]], gateway: str):
+    """
+    resultados: (notificacao_id, tentativa devolvida por reclamar_lote, novo status, segundos até
+    nova tentativa, erro). Só grava se a tentativa ainda for a mesma: se a reserva expirou e a
+    notificação foi reclamada de novo, o resultado é do outro trabalhador.
+    """
+    if not resultados:
+        return
+    psycopg2.extras.execute_values(cursor, """
+        UPDATE notificacoes n
+        SET status = v.status,
+            proxima_tentativa = CASE WHEN v.espera IS NULL THEN NULL
+                                     ELSE now() + make_interval(secs => v.espera) END,
+            ultimo_erro = v.erro,
+            gateway = v.gateway,
+            enviada_em = CASE WHEN v.status = 'Enviado' THEN now() ELSE n.enviada_em END
+        FROM (VALUES %s) AS v(notificacao_id, tentativas, status, espera, erro, gateway)
+        WHERE n.notificacao_id = v.notificacao_id AND n.status = 'Pendente' AND n.tentativas = v.tentativas
+    """, [(i, t, s, e, erro, gateway) for i, t, s, e, erro in resultados],
+        template="(%s::bigint, %s::int, %s::text, %s::double precision, %s::text, %s::text)", page_size=len(resultados))
+
+
+def entregar_lote(conn, gateway: GatewaySMS, limite_taxa: LimiteTaxa, parar: threading.Event,
+                  limite: int = ENTREGA_LOTE) -> int:
+    """Reclama, envia e grava um lote; devolve quantas notificações reclamou."""
+    cursor = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
+    try:
+        lote = reclamar_lote(cursor, limite)
+        conn.commit()
+        resultados = []
+        for n in lote:
+            if parar.is_set():
+                # As restantes ficam com a reserva e voltam a ser reclamadas quando expirar
+                break
+            limite_taxa.aguardar(parar)
+            try:
+                gateway.enviar(n["telefone"], n["mensagem"])
+                resultados.append((n["notificacao_id"], n["tentativas"], "Enviado", None, None))
+            except ErroEntregaPermanente as e:
+                resultados.append((n["notificacao_id"], n["tentativas"], "Falhada", None, str(e)[:500]))
+            except Exception as e:
+                if n["tentativas"] >= ENTREGA_MAX_TENTATIVAS:
+                    resultados.append((n["notificacao_id"], n["tentativas"], "Falhada", None, str(e)[:500]))
+                else:
+                    resultados.append((n["notificacao_id"], n["tentativas"], "Pendente",
+                                       espera_tentativa(n["tentativas"]), str(e)[:500]))
+        gravar_resultados(cursor, resultados, gateway.nome)
+        conn.commit()
+        return len(lote)
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+
+
+class TrabalhadorEntregas:
+    """ENTREGA_WORKERS threads por processo; com 0 (omissão) a entrega fica desligada."""
+
+    def __init__(self, trabalhadores: int):
+        self.trabalhadores = trabalhadores
+        self._parar = threading.Event()
+        self._threads: List[threading.Thread] = []
+        self.gateway: Optional[GatewaySMS] = None
+        self.limite_taxa = LimiteTaxa(ENTREGA_TAXA_POR_S)
+
+    def iniciar(self):
+        if self._threads or self.trabalhadores <= 0:
+            return
+        fabrica = GATEWAYS.get(ENTREGA_GATEWAY)
+        if fabrica is None:
+            print(f"ENTREGA_GATEWAY desconhecido: {ENTREGA_GATEWAY} (disponíveis: {list(GATEWAYS)})")
+            return
+        self.gateway = fabrica()
+        self._parar.clear()
+        for i in range(self.trabalhadores):
+            t = threading.Thread(target=self._ciclo, name=f"entregas-{i}", daemon=True)
+            t.start()
+            self._threads.append(t)
+
+    def parar(self):
+        self._parar.set()
+        for t in self._threads:
+            t.join(timeout=5)
+        self._threads = []
+
+    def _ciclo(self):
+        espera_erro = 1.0
+        while not self._parar.is_set():
+            try:
+                conn = get_db_connection()
+            except psycopg2.Error:
+                self._parar.wait(espera_erro)
+                espera_erro = min(espera_erro * 2, 60.0)
+                continue
+            try:
+                while not self._parar.is_set():
+                    reclamadas = entregar_lote(conn, self.gateway, self.limite_taxa, self._parar)
+                    espera_erro = 1.0
+                    if reclamadas < ENTREGA_LOTE:
+                        self._parar.wait(ENTREGA_INTERVALO_S)
+            except Exception as e:
+                print(f"Erro na entrega de notificações: {e}")
+                self._parar.wait(espera_erro)
+                espera_erro = min(espera_erro * 2, 60.0)
+            finally:
+                conn.close()
+
+
+trabalhador_entregas = TrabalhadorEntregas(ENTREGA_WORKERS)
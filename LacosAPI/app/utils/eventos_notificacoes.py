@@ -0,0 +1,183 @@
+"""
+Eventos de notificações para o stream SSE (/api/notificacoes/stream).
+
+Um gatilho em notificacoes faz NOTIFY notificacoes_eventos no commit de cada INSERT, UPDATE
+de status ou DELETE, em qualquer processo. Cada processo da API tem uma única thread com
+LISTEN que, a cada aviso (e, por segurança, a cada SSE_POLL_S), lê as notificações novas e o
+total de pendentes uma vez e distribui o resultado por todas as ligações SSE abertas nesse
+processo. Sem o gatilho, o stream continua a funcionar com a latência de SSE_POLL_S.
+"""
+import asyncio
+import os
+import select
+import threading
+from collections import deque
+from typing import List, Optional, Set, Tuple
+
+import psycopg2
+import psycopg2.extras
+
+from app.database.database import get_db_connection
+from app.schemas.notificacao import Notificacao
+
+CANAL = "notificacoes_eventos"
+# Intervalo máximo entre leituras quando não chega nenhum NOTIFY
+SSE_POLL_S = float(os.getenv("SSE_POLL_S", "5"))
+# Intervalo dos comentários keep-alive enviados a cada ligação
+SSE_KEEPALIVE_S = float(os.getenv("SSE_KEEPALIVE_S", "15"))
+# Notificações reenviadas, no máximo, a quem volta a ligar com Last-Event-ID
+SSE_RETOMA_MAX = int(os.getenv("SSE_RETOMA_MAX", "1000"))
+# Eventos por ligação à espera de envio; um cliente mais lento do que isto é desligado
+SSE_FILA_MAX = 1000
+# Ids de transações concorrentes podem ser confirmados fora de ordem: relê-se esta margem
+# abaixo do último id visto e descartam-se os já enviados
+_MARGEM_IDS = 200
+# Espera depois de um NOTIFY para juntar numa leitura os avisos de escritas seguidas
+_AGRUPAR_S = 0.05
+# Colunas do modelo Notificacao: as de controlo da entrega (proxima_tentativa, gateway) ficam de
+# fora, também no caminho rápido do orjson, que serializa as linhas sem passar pelo modelo
+COLUNAS_NOTIFICACAO = ", ".join(Notificacao.model_fields)
+
+
+def ler_desde(cursor, ultimo_id: int, limite: int) -> List[dict]:
+    cursor.execute(
+        f"SELECT {COLUNAS_NOTIFICACAO} FROM notificacoes WHERE notificacao_id > %s ORDER BY notificacao_id LIMIT %s",
+        (ultimo_id, limite),
+    )
+    return cursor.fetchall()
+
+
+def ja_existentes(cursor) -> Tuple[int, Set[int]]:
+    """
+    Notificações que um stream a começar já não deve enviar: as de id até ao valor devolvido e
+    as do conjunto. Cobre a margem que o ouvinte relê, e publica, na primeira leitura.
+    """
+    # Uma só consulta: o máximo e os ids da margem vêm do mesmo instantâneo
+    cursor.execute("""
+        SELECT notificacao_id FROM notificacoes
+        WHERE notificacao_id > (SELECT COALESCE(MAX(notificacao_id), 0) FROM notificacoes) - %s
+    """, (_MARGEM_IDS,))
+    ids = {r["notificacao_id"] for r in cursor.fetchall()}
+    return max(max(ids, default=0) - _MARGEM_IDS, 0), ids
+
+
+def contar_pendentes(cursor) -> int:
+    cursor.execute("SELECT COUNT(*) AS pendentes FROM notificacoes WHERE status = 'Pendente'")
+    return cursor.fetchone()["pendentes"]
+
+
+class Subscricao:
+    """Fila asyncio de uma ligação SSE, alimentada a partir da thread de escuta."""
+
+    def __init__(self, loop: asyncio.AbstractEventLoop):
+        self.loop = loop
+        self.fila: asyncio.Queue = asyncio.Queue(maxsize=SSE_FILA_MAX)
+        # Cliente demasiado lento: o stream termina e o cliente retoma com Last-Event-ID
+        self.excedida = False
+
+    def _colocar(self, evento: Tuple[str, dict]):
+        try:
+            self.fila.put_nowait(evento)
+        except asyncio.QueueFull:
+            self.excedida = True
+
+    def publicar(self, evento: Tuple[str, dict]):
+        self.loop.call_soon_threadsafe(self._colocar, evento)
+
+
+class OuvinteNotificacoes:
+    """Thread única por processo com LISTEN; arranca com a primeira subscrição e pára com a última."""
+
+    def __init__(self):
+        self._subscricoes: Set[Subscricao] = set()
+        self._lock = threading.Lock()
+        self._parar = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._ultimo_id: Optional[int] = None
+        self._enviados: deque = deque(maxlen=4 * _MARGEM_IDS)
+        self._pendentes: Optional[int] = None
+
+    def subscrever(self, loop: asyncio.AbstractEventLoop) -> Subscricao:
+        subscricao = Subscricao(loop)
+        with self._lock:
+            self._subscricoes.add(subscricao)
+            if self._thread is None or not self._thread.is_alive():
+                self._parar.clear()
+                self._thread = threading.Thread(target=self._ciclo, name="notificacoes-listen", daemon=True)
+                self._thread.start()
+        return subscricao
+
+    def cancelar(self, subscricao: Subscricao):
+        with self._lock:
+            self._subscricoes.discard(subscricao)
+
+    def parar(self):
+        self._parar.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+    def _publicar(self, evento: Tuple[str, dict]):
+        with self._lock:
+            subscricoes = list(self._subscricoes)
+        for s in subscricoes:
+            s.publicar(evento)
+
+    def _ler(self, cursor):
+        if self._ultimo_id is None:
+            cursor.execute("SELECT COALESCE(MAX(notificacao_id), 0) AS ultimo FROM notificacoes")
+            self._ultimo_id = cursor.fetchone()["ultimo"]
+            # Primeira leitura: publica também a margem, porque pode ter sido confirmada depois do
+            # estado inicial de quem subscreveu; cada stream descarta o que ja_existentes já cobria
+        enviados = set(self._enviados)
+        desde = max(self._ultimo_id - _MARGEM_IDS, 0)
+        while True:
+            linhas = ler_desde(cursor, desde, SSE_RETOMA_MAX)
+            for linha in linhas:
+                if linha["notificacao_id"] in enviados:
+                    continue
+                self._enviados.append(linha["notificacao_id"])
+                self._publicar(("notificacao", linha))
+            if not linhas:
+                break
+            desde = linhas[-1]["notificacao_id"]
+            self._ultimo_id = max(self._ultimo_id, desde)
+            if len(linhas) < SSE_RETOMA_MAX:
+                break
+        pendentes = contar_pendentes(cursor)
+        if pendentes != self._pendentes:
+            self._pendentes = pendentes
+            self._publicar(("pendentes", {"pendentes": pendentes}))
+
+    def _ciclo(self):
+        espera = 1.0
+        while not self._parar.is_set():
+            conn = None
+            try:
+                conn = get_db_connection()
+                conn.set_session(autocommit=True)
+                cursor = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
+                cursor.execute(f"LISTEN {CANAL}")
+                espera = 1.0
+                while not self._parar.is_set():
+                    with self._lock:
+                        if not self._subscricoes:
+                            self._thread = None
+                            self._ultimo_id = None
+                            self._pendentes = None
+                            return
+                    self._ler(cursor)
+                    if select.select([conn], [], [], SSE_POLL_S) != ([], [], []):
+                        self._parar.wait(_AGRUPAR_S)
+                        conn.poll()
+                        conn.notifies.clear()
+            except psycopg2.Error:
+                # Base indisponível: volta a tentar com espera crescente
+                self._parar.wait(espera)
+                espera = min(espera * 2, 30.0)
+            finally:
+                if conn is not None:
+                    conn.close()
+
+
+ouvinte = OuvinteNotificacoes()
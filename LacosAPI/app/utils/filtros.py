@@ -0,0 +1,108 @@
+from fastapi import HTTPException
+from datetime import date, datetime, timedelta, timezone
+from typing import Dict, Optional
+import os
+
+# Acima deste número de linhas o total devolvido nas listagens passa a ser estimado pelo planeador
+COUNT_ESTIMATE_THRESHOLD = int(os.getenv("COUNT_ESTIMATE_THRESHOLD", "100000"))
+
+
+class FiltroSQL:
+    """
+    Acumula condições parametrizadas para um WHERE. As colunas vêm sempre do código
+    (nunca do pedido); apenas os valores são passados como parâmetros.
+    """
+
+    def __init__(self):
+        self.condicoes = []
+        self.valores = []
+
+    def igual(self, coluna: str, valor):
+        if valor is not None:
+            self.condicoes.append(f"{coluna} = %s")
+            self.valores.append(valor)
+        return self
+
+    def em(self, coluna: str, valores):
+        if valores is not None:
+            self.condicoes.append(f"{coluna} = ANY(%s)")
+            self.valores.append(list(valores))
+        return self
+
+    def minimo(self, coluna: str, valor):
+        if valor is not None:
+            self.condicoes.append(f"{coluna} >= %s")
+            self.valores.append(valor)
+        return self
+
+    def maximo(self, coluna: str, valor):
+        if valor is not None:
+            self.condicoes.append(f"{coluna} <= %s")
+            self.valores.append(valor)
+        return self
+
+    def intervalo_datas(self, coluna: str, inicio: Optional[date], fim: Optional[date]):
+        """Intervalo inclusivo em dias, escrito como comparação direta para poder usar o índice da coluna."""
+        if inicio is not None:
+            self.condicoes.append(f"{coluna} >= %s")
+            self.valores.append(datetime.combine(inicio, datetime.min.time(), tzinfo=timezone.utc))
+        if fim is not None:
+            self.condicoes.append(f"{coluna} < %s")
+            self.valores.append(datetime.combine(fim + timedelta(days=1), datetime.min.time(), tzinfo=timezone.utc))
+        return self
+
+    def where(self) -> str:
+        return (" WHERE " + " AND ".join(self.condicoes)) if self.condicoes else ""
+
+
+def ordenacao(ordenar_por: Optional[str], ordem: str, permitidas: Dict[str, str], padrao: str, desempate: str) -> str:
+    """
+    Traduz ordenar_por/ordem numa cláusula ORDER BY a partir de uma lista branca de colunas.
+    A chave primária entra sempre como desempate para a paginação ser estável.
+    """
+    chave = ordenar_por or padrao
+    coluna = permitidas.get(chave)
+    if coluna is None:
+        raise HTTPException(status_code=400, detail=f"ordenar_por deve ser um dos: {list(permitidas)}")
+    direcao = "DESC" if (ordem or "").lower() == "desc" else "ASC"
+    return f" ORDER BY {coluna} {direcao}, {desempate} {direcao}"
+
+
+def contar_total(cursor, tabela: str, filtro: FiltroSQL):
+    """
+    Total de linhas para o cabeçalho X-Total-Count. Devolve (total, estimado).
+    Em tabelas grandes usa as estatísticas do PostgreSQL (pg_class ou o plano) em vez de COUNT(*).
+    Numa tabela particionada o reltuples do pai fica a -1 (o autovacuum não analisa o pai),
+    pelo que se somam as partições.
+    """
+    if not filtro.condicoes:
+        cursor.execute("""
+            SELECT c.relkind, c.reltuples::bigint AS estimativa,
+                   (SELECT SUM(GREATEST(f.reltuples, 0))::bigint
+                    FROM pg_inherits i JOIN pg_class f ON f.oid = i.inhrelid
+                    WHERE i.inhparent = c.oid) AS particoes
+            FROM pg_class c
+            WHERE c.oid = %s::regclass
+        """, (tabela.split()[0],))
+        row = cursor.fetchone()
+        if not row:
+            estimativa = -1
+        elif row["relkind"] == "p":
+            estimativa = int(row["particoes"] or 0)
+        else:
+            estimativa = int(row["estimativa"])
+    else:
+        cursor.execute(f"EXPLAIN (FORMAT JSON) SELECT 1 FROM {tabela}{filtro.where()}", filtro.valores)
+        row = cursor.fetchone()
+        plano = row["QUERY PLAN"] if row else None
+        estimativa = int(plano[0]["Plan"]["Plan Rows"]) if plano else -1
+
+    if estimativa >= COUNT_ESTIMATE_THRESHOLD:
+        return estimativa, True
+
+    cursor.execute(f"SELECT COUNT(*) AS total FROM {tabela}{filtro.where()}", filtro.valores)
+    return int(cursor.fetchone()["total"]), False
+
+
+def cabecalhos_total(total: int, estimado: bool) -> Dict[str, str]:
+    return {"X-Total-Count": str(total), "X-Total-Count-Estimado": "true" if estimado else "false"}
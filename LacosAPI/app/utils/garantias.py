@@ -0,0 +1,108 @@
+"""
+Cobertura dos empréstimos ativos pelas garantias do cliente: bens penhorados (penhor) e
+testemunhas. O penhor é registado por cliente e não por empréstimo, por isso o valor
+penhorado é repartido pelos empréstimos ativos do cliente em proporção ao saldo de cada um;
+a cobertura (valor penhorado / saldo em aberto) é assim a mesma em todos eles.
+"""
+import threading
+from typing import List, Optional, Tuple
+
+from fastapi import HTTPException
+
+from app.utils.prestacoes import sql_total_devido
+
+FAIXAS_COBERTURA = ["sem_garantia", "so_testemunhas", "abaixo_50", "de_50_a_100", "total"]
+
+_versao = 0
+_LOCK = threading.Lock()
+
+
+def invalidar_cobertura():
+    """Chamado depois de cada escrita em penhor ou testemunhas neste processo."""
+    global _versao
+    with _LOCK:
+        _versao += 1
+
+
+def versao_cobertura() -> int:
+    """Entra nas chaves de cache das vistas que dependem da cobertura."""
+    return _versao
+
+
+def sql_cobertura() -> str:
+    """
+    Definições de CTE (para um WITH) que terminam em `cobertura`: uma linha por empréstimo
+    ativo com saldo, valor penhorado do cliente e alocado ao empréstimo, testemunhas,
+    cobertura (NULL sem saldo) e faixa_cobertura.
+    """
+    return f"""
+        cob_pagos AS (
+            SELECT emprestimo_id, SUM(valor_pago) AS total_pago
+            FROM pagamentos
+            GROUP BY emprestimo_id
+        ),
+        cob_penhor AS (
+            SELECT cliente_id, SUM(valor_estimado) AS valor_penhor, COUNT(*) AS itens_penhor
+            FROM penhor
+            GROUP BY cliente_id
+        ),
+        cob_testemunhas AS (
+            SELECT cliente_id, COUNT(*) AS testemunhas
+            FROM testemunhas
+            GROUP BY cliente_id
+        ),
+        cob_ativos AS (
+            SELECT e.emprestimo_id, e.cliente_id, e.valor, e.data_vencimento,
+                   GREATEST({sql_total_devido("e")} - COALESCE(p.total_pago, 0), 0) AS saldo
+            FROM emprestimos e
+            LEFT JOIN cob_pagos p ON p.emprestimo_id = e.emprestimo_id
+            WHERE e.status = 'Ativo'
+        ),
+        cob_clientes AS (
+            SELECT a.*,
+                   SUM(a.saldo) OVER (PARTITION BY a.cliente_id) AS saldo_cliente,
+                   COALESCE(pe.valor_penhor, 0) AS valor_penhor_cliente,
+                   COALESCE(pe.itens_penhor, 0) AS itens_penhor,
+                   COALESCE(t.testemunhas, 0) AS testemunhas
+            FROM cob_ativos a
+            LEFT JOIN cob_penhor pe ON pe.cliente_id = a.cliente_id
+            LEFT JOIN cob_testemunhas t ON t.cliente_id = a.cliente_id
+        ),
+        cobertura AS (
+            SELECT c.*,
+                   CASE WHEN c.saldo_cliente > 0 THEN c.valor_penhor_cliente * c.saldo / c.saldo_cliente ELSE 0 END
+                       AS valor_penhor_alocado,
+                   CASE WHEN c.saldo_cliente > 0 THEN c.valor_penhor_cliente / c.saldo_cliente END AS cobertura,
+                   CASE
+                       WHEN c.valor_penhor_cliente = 0 AND c.testemunhas = 0 THEN 'sem_garantia'
+                       WHEN c.valor_penhor_cliente = 0 THEN 'so_testemunhas'
+                       WHEN c.saldo_cliente > 0 AND c.valor_penhor_cliente < 0.5 * c.saldo_cliente THEN 'abaixo_50'
+                       WHEN c.saldo_cliente > 0 AND c.valor_penhor_cliente < c.saldo_cliente THEN 'de_50_a_100'
+                       ELSE 'total'
+                   END AS faixa_cobertura
+            FROM cob_clientes c
+        )
+    """
+
+
+def filtro_cobertura(coluna_emprestimo: str, cobertura_max: Optional[float],
+                     faixa_cobertura: Optional[str]) -> Tuple[str, str, List]:
+    """
+    Filtro das vistas de risco do dashboard por cobertura: devolve (CTEs a juntar ao WITH,
+    condição sobre coluna_emprestimo, valores). Sem filtro, devolve strings vazias.
+    """
+    if cobertura_max is not None and cobertura_max < 0:
+        raise HTTPException(status_code=400, detail="cobertura_max não pode ser negativa")
+    if faixa_cobertura is not None and faixa_cobertura not in FAIXAS_COBERTURA:
+        raise HTTPException(status_code=400, detail=f"faixa_cobertura deve ser uma das: {FAIXAS_COBERTURA}")
+    condicoes, valores = [], []
+    if cobertura_max is not None:
+        condicoes.append("COALESCE(cobertura, 0) < %s")
+        valores.append(cobertura_max)
+    if faixa_cobertura is not None:
+        condicoes.append("faixa_cobertura = %s")
+        valores.append(faixa_cobertura)
+    if not condicoes:
+        return "", "", []
+    condicao = f" AND {coluna_emprestimo} IN (SELECT emprestimo_id FROM cobertura WHERE {' AND '.join(condicoes)})"
+    return sql_cobertura() + ",", condicao, valores
@@ -0,0 +1,48 @@
+"""
+Consultas espaciais sobre localizacao sem PostGIS: o índice GiST do PostgreSQL sobre
+point(longitude, latitude) filtra por caixa envolvente (operador <@) e a distância exata
+(haversine, em km) é calculada só para as linhas que passam esse filtro.
+"""
+import math
+from typing import Tuple
+
+RAIO_TERRA_KM = 6371.0088
+KM_POR_GRAU_LAT = 110.574
+KM_POR_GRAU_LON = 111.320
+
+# Tem de ser a mesma expressão e o mesmo predicado do índice idx_localizacao_ponto
+SQL_PONTO = "point({a}longitude, {a}latitude)"
+SQL_COM_COORDENADAS = "{a}latitude IS NOT NULL AND {a}longitude IS NOT NULL"
+
+
+def _prefixo(alias: str) -> str:
+    return f"{alias}." if alias else ""
+
+
+def sql_na_caixa(alias: str = "") -> str:
+    """Condição indexável: ponto dentro da caixa; parâmetros lon_min, lat_min, lon_max, lat_max."""
+    a = _prefixo(alias)
+    return (f"{SQL_COM_COORDENADAS.format(a=a)} "
+            f"AND {SQL_PONTO.format(a=a)} <@ box(point(%s, %s), point(%s, %s))")
+
+
+def sql_distancia_km(alias: str = "") -> str:
+    """Distância haversine (km) ao ponto dado pelos parâmetros latitude, latitude, longitude."""
+    a = _prefixo(alias)
+    return (f"2 * {RAIO_TERRA_KM} * asin(sqrt("
+            f"power(sin(radians({a}latitude - %s) / 2), 2) + "
+            f"cos(radians({a}latitude)) * cos(radians(%s)) * power(sin(radians({a}longitude - %s) / 2), 2)))")
+
+
+def caixa_do_raio(latitude: float, longitude: float, raio_km: float) -> Tuple[float, float, float, float]:
+    """Caixa (lon_min, lat_min, lon_max, lat_max) que contém o círculo de raio_km à volta do ponto."""
+    d_lat = raio_km / KM_POR_GRAU_LAT
+    d_lon = raio_km / (KM_POR_GRAU_LON * max(math.cos(math.radians(latitude)), 1e-6))
+    return (max(longitude - d_lon, -180.0), max(latitude - d_lat, -90.0),
+            min(longitude + d_lon, 180.0), min(latitude + d_lat, 90.0))
+
+
+def graus_da_celula(celula_km: float, latitude: float) -> Tuple[float, float]:
+    """Lado de uma célula de celula_km em graus de latitude e de longitude, à latitude dada."""
+    return (celula_km / KM_POR_GRAU_LAT,
+            celula_km / (KM_POR_GRAU_LON * max(math.cos(math.radians(latitude)), 1e-6)))
@@ -0,0 +1,316 @@
+"""
+Importação em massa de clientes (grupos de poupança, associações de mercado): um CSV com uma
+linha por cliente, com a localização, a ocupação e um documento na mesma linha, ou um ZIP com
+esse CSV e os ficheiros dos documentos.
+
+O CSV é copiado tal como está (COPY) para uma tabela temporária e validado com um punhado de
+UPDATEs sobre o conjunto: campos obrigatórios, valores permitidos, formatos, duplicados dentro
+do ficheiro e contra a base. As linhas válidas são gravadas em lotes, cada lote (clientes,
+localizacao, ocupacoes e documentos) na sua transação; um lote que falhe não desfaz os outros.
+"""
+import csv
+import io
+import os
+import zipfile
+from typing import Dict, List, Tuple
+
+import psycopg2
+from fastapi import HTTPException
+
+from app.schemas.documento import TIPOS_DOCUMENTO_PERMITIDOS
+
+# Tamanho máximo do pacote (CSV ou ZIP já descomprimido) e número máximo de linhas
+IMPORTACAO_MAX_MB = int(os.getenv("IMPORTACAO_MAX_MB", "50"))
+IMPORTACAO_MAX_LINHAS = int(os.getenv("IMPORTACAO_MAX_LINHAS", "10000"))
+
+COLUNAS = [
+    "nome", "sexo", "telefone", "email", "nacionalidade", "data_nascimento",
+    "bairro", "numero_da_casa", "quarteirao", "cidade", "distrito", "provincia", "latitude", "longitude",
+    "ocupacao_codigo", "ocupacao_nome", "ocupacao_descricao", "categoria_risco", "renda_minima",
+    "setor_economico", "estabilidade_emprego",
+    "tipo_documento", "numero_documento", "arquivo_documento",
+]
+COLUNAS_OBRIGATORIAS = ["nome", "sexo", "telefone", "data_nascimento"]
+
+SEXOS = ["Masculino", "Feminino", "Outro"]
+NACIONALIDADES = ["Moçambicana", "Estrangeira"]
+CATEGORIAS_RISCO = ["Muito Baixo", "Baixo", "Medio", "Alto", "Muito Alto"]
+SETORES_ECONOMICOS = ["Primario", "Secundario", "Terciario", "Quaternario"]
+ESTABILIDADES_EMPREGO = ["Alta", "Media", "Baixa", "Sazonal"]
+
+_LOCALIZACAO = ["bairro", "numero_da_casa", "quarteirao", "cidade", "distrito", "provincia", "latitude", "longitude"]
+_OCUPACAO = ["ocupacao_codigo", "ocupacao_nome", "ocupacao_descricao", "categoria_risco", "renda_minima",
+             "setor_economico", "estabilidade_emprego"]
+_DOCUMENTO = ["tipo_documento", "numero_documento", "arquivo_documento"]
+
+
+def _data_invalida(coluna: str) -> str:
+    """Condição SQL verdadeira para um texto que não é uma data AAAA-MM-DD existente (sem erros de cast)."""
+    return f"""CASE WHEN {coluna} ~ '^\\d{{4}}-(0[1-9]|1[0-2])-(0[1-9]|[12]\\d|3[01])$'
+        THEN substr({coluna}, 9, 2)::int > extract(day from make_date(substr({coluna}, 1, 4)::int,
+             substr({coluna}, 6, 2)::int, 1) + interval '1 month - 1 day')
+        ELSE true END"""
+
+
+def _decimal_invalido(coluna: str, minimo: float, maximo: float) -> str:
+    return f"""CASE WHEN {coluna} ~ '^-?\\d{{1,12}}(\\.\\d+)?$'
+        THEN {coluna}::numeric NOT BETWEEN {minimo} AND {maximo}
+        ELSE true END"""
+
+
+def _algum(colunas: List[str]) -> str:
+    return "(" + " OR ".join(f"i.{c} IS NOT NULL" for c in colunas) + ")"
+
+
+# (condição sobre a linha i, mensagem); d tem a ordem de cada linha entre as que repetem um valor
+_REGRAS: List[Tuple[str, str]] = [
+    ("i.nome IS NULL", "nome é obrigatório"),
+    ("i.sexo IS NULL OR i.sexo <> ALL(%(sexos)s)", f"sexo deve ser um de: {', '.join(SEXOS)}"),
+    ("i.nacionalidade <> ALL(%(nacionalidades)s)", f"nacionalidade deve ser uma de: {', '.join(NACIONALIDADES)}"),
+    ("i.telefone IS NULL", "telefone é obrigatório"),
+    ("i.data_nascimento IS NULL OR " + _data_invalida("i.data_nascimento"), "data_nascimento deve ser AAAA-MM-DD"),
+    ("i.email IS NOT NULL AND i.email !~ '^[^@\\s]+@[^@\\s]+$'", "email inválido"),
+    ("d.ordem_telefone > 1", "telefone repetido no ficheiro"),
+    ("d.ordem_email > 1", "email repetido no ficheiro"),
+    ("d.ordem_documento > 1", "numero_documento repetido no ficheiro"),
+    ("EXISTS (SELECT 1 FROM clientes c WHERE c.telefone = i.telefone)", "telefone já registado"),
+    ("i.email IS NOT NULL AND EXISTS (SELECT 1 FROM clientes c WHERE lower(c.email) = lower(i.email))",
+     "email já registado"),
+    ("i.numero_documento IS NOT NULL AND EXISTS (SELECT 1 FROM documentos o WHERE o.numero_documento = i.numero_documento)",
+     "numero_documento já registado"),
+    (_algum(_LOCALIZACAO) + " AND (i.cidade IS NULL OR i.distrito IS NULL OR i.provincia IS NULL)",
+     "localização exige cidade, distrito e provincia"),
+    ("(i.latitude IS NULL) <> (i.longitude IS NULL)", "latitude e longitude vêm juntas"),
+    ("i.latitude IS NOT NULL AND " + _decimal_invalido("i.latitude", -90, 90), "latitude deve estar entre -90 e 90"),
+    ("i.longitude IS NOT NULL AND " + _decimal_invalido("i.longitude", -180, 180),
+     "longitude deve estar entre -180 e 180"),
+    (_algum(_OCUPACAO) + " AND (i.ocupacao_codigo IS NULL OR i.ocupacao_nome IS NULL OR i.categoria_risco IS NULL"
+     " OR i.setor_economico IS NULL OR i.estabilidade_emprego IS NULL)",
+     "ocupação exige ocupacao_codigo, ocupacao_nome, categoria_risco, setor_economico e estabilidade_emprego"),
+    ("length(i.ocupacao_codigo) > 10", "ocupacao_codigo tem no máximo 10 caracteres"),
+    ("length(i.ocupacao_nome) > 100", "ocupacao_nome tem no máximo 100 caracteres"),
+    ("i.categoria_risco <> ALL(%(categorias_risco)s)", f"categoria_risco deve ser uma de: {', '.join(CATEGORIAS_RISCO)}"),
+    ("i.setor_economico <> ALL(%(setores)s)", f"setor_economico deve ser um de: {', '.join(SETORES_ECONOMICOS)}"),
+    ("i.estabilidade_emprego <> ALL(%(estabilidades)s)",
+     f"estabilidade_emprego deve ser uma de: {', '.join(ESTABILIDADES_EMPREGO)}"),
+    ("i.renda_minima IS NOT NULL AND " + _decimal_invalido("i.renda_minima", 0, 99999999.99),
+     "renda_minima deve ser um valor entre 0 e 99999999.99"),
+    (_algum(_DOCUMENTO) + " AND (i.tipo_documento IS NULL OR i.numero_documento IS NULL)",
+     "documento exige tipo_documento e numero_documento"),
+    ("i.tipo_documento <> ALL(%(tipos_documento)s)",
+     f"tipo_documento deve ser um de: {', '.join(TIPOS_DOCUMENTO_PERMITIDOS)}"),
+    ("i.arquivo_documento IS NOT NULL AND NOT EXISTS (SELECT 1 FROM _importacao_arquivos a WHERE a.nome = i.arquivo_documento)",
+     "arquivo_documento não existe no pacote"),
+]
+
+
+def _ler_pacote(conteudo: bytes, nome_ficheiro: str) -> Tuple[str, Dict[str, bytes]]:
+    """Texto do CSV e, para um ZIP, os restantes ficheiros (nome no pacote -> conteúdo)."""
+    limite = IMPORTACAO_MAX_MB * 1024 * 1024
+    arquivos: Dict[str, bytes] = {}
+    if zipfile.is_zipfile(io.BytesIO(conteudo)):
+        with zipfile.ZipFile(io.BytesIO(conteudo)) as pacote:
+            entradas = [e for e in pacote.infolist() if not e.is_dir()]
+            if sum(e.file_size for e in entradas) > limite:
+                raise HTTPException(status_code=413, detail=f"Pacote acima de {IMPORTACAO_MAX_MB} MB descomprimido")
+            csvs = [e for e in entradas if e.filename.lower().endswith(".csv")]
+            if len(csvs) != 1:
+                raise HTTPException(status_code=400, detail="O ZIP deve conter exatamente um ficheiro .csv")
+            conteudo = pacote.read(csvs[0])
+            arquivos = {e.filename: pacote.read(e) for e in entradas if e is not csvs[0]}
+    elif not nome_ficheiro.lower().endswith(".csv"):
+        raise HTTPException(status_code=400, detail="Envie um ficheiro .csv ou .zip")
+    if len(conteudo) > limite:
+        raise HTTPException(status_code=413, detail=f"Ficheiro acima de {IMPORTACAO_MAX_MB} MB")
+    try:
+        return conteudo.decode("utf-8-sig"), arquivos
+    except UnicodeDecodeError:
+        raise HTTPException(status_code=400, detail="O CSV deve estar em UTF-8")
+
+
+def _cabecalho(texto: str) -> Tuple[List[str], str]:
+    """Colunas do cabeçalho (pela ordem do ficheiro) e separador (',' ou ';')."""
+    primeira = texto.split("\n", 1)[0]
+    separador = ";" if primeira.count(";") > primeira.count(",") else ","
+    colunas = [c.strip().lower() for c in next(csv.reader([primeira], delimiter=separador), [])]
+    desconhecidas = [c for c in colunas if c not in COLUNAS]
+    if desconhecidas:
+        raise HTTPException(status_code=400, detail=f"Colunas desconhecidas: {desconhecidas}; permitidas: {COLUNAS}")
+    if len(set(colunas)) != len(colunas):
+        raise HTTPException(status_code=400, detail="Colunas repetidas no cabeçalho")
+    em_falta = [c for c in COLUNAS_OBRIGATORIAS if c not in colunas]
+    if em_falta:
+        raise HTTPException(status_code=400, detail=f"Colunas obrigatórias em falta: {em_falta}")
+    return colunas, separador
+
+
+def _copiar(cursor, texto: str, colunas: List[str], separador: str, arquivos: Dict[str, bytes]):
+    definicoes = ", ".join(f"{c} text" for c in COLUNAS)
+    cursor.execute(f"""
+        CREATE TEMP TABLE _importacao (
+            linha bigint GENERATED ALWAYS AS IDENTITY (START WITH 2) PRIMARY KEY,
+            {definicoes},
+            erros text[] NOT NULL DEFAULT '{{}}',
+            lote integer,
+            cliente_id bigint
+        )
+    """)
+    cursor.execute("CREATE TEMP TABLE _importacao_arquivos (nome text PRIMARY KEY, conteudo bytea NOT NULL)")
+    try:
+        # A identidade segue a ordem do ficheiro: linha = número da linha no CSV (o cabeçalho é a 1)
+        cursor.copy_expert(
+            f"COPY _importacao ({', '.join(colunas)}) FROM STDIN WITH (FORMAT csv, HEADER true, DELIMITER '{separador}')",
+            io.StringIO(texto),
+        )
+    except psycopg2.DataError as e:
+        raise HTTPException(status_code=400, detail=f"CSV inválido: {e.diag.message_primary} ({e.diag.context})")
+    if arquivos:
+        buffer = io.StringIO()
+        buffer.writelines(
+            nome.replace("\\", "\\\\").replace("\t", "\\t").replace("\n", "\\n") + "\t\\\\x" + dados.hex() + "\n"
+            for nome, dados in arquivos.items()
+        )
+        buffer.seek(0)
+        cursor.copy_expert("COPY _importacao_arquivos (nome, conteudo) FROM STDIN", buffer)
+
+
+def _validar(cursor, tamanho_lote: int):
+    aparar = ", ".join(f"{c} = NULLIF(btrim({c}), '')" for c in COLUNAS)
+    cursor.execute(f"UPDATE _importacao SET {aparar}")
+    cursor.execute("UPDATE _importacao SET nacionalidade = %s WHERE nacionalidade IS NULL", (NACIONALIDADES[0],))
+
+    parametros = {
+        "sexos": SEXOS, "nacionalidades": NACIONALIDADES, "categorias_risco": CATEGORIAS_RISCO,
+        "setores": SETORES_ECONOMICOS, "estabilidades": ESTABILIDADES_EMPREGO,
+        "tipos_documento": TIPOS_DOCUMENTO_PERMITIDOS,
+    }
+    casos = []
+    for n, (condicao, mensagem) in enumerate(_REGRAS):
+        casos.append(f"CASE WHEN {condicao} THEN %(regra_{n})s END")
+        parametros[f"regra_{n}"] = mensagem
+    cursor.execute(f"""
+        UPDATE _importacao i
+        SET erros = i.erros || array_remove(ARRAY[{", ".join(casos)}]::text[], NULL)
+        FROM (
+            SELECT linha,
+                   CASE WHEN telefone IS NOT NULL THEN row_number() OVER (PARTITION BY telefone ORDER BY linha) END
+                       AS ordem_telefone,
+                   CASE WHEN email IS NOT NULL THEN row_number() OVER (PARTITION BY lower(email) ORDER BY linha) END
+                       AS ordem_email,
+                   CASE WHEN numero_documento IS NOT NULL
+                        THEN row_number() OVER (PARTITION BY numero_documento ORDER BY linha) END AS ordem_documento
+            FROM _importacao
+        ) d
+        WHERE d.linha = i.linha
+    """, parametros)
+
+    # Os lotes contam só as linhas válidas, para terem todos o mesmo tamanho
+    cursor.execute("""
+        UPDATE _importacao i
+        SET lote = v.ordem / %s
+        FROM (SELECT linha, row_number() OVER (ORDER BY linha) - 1 AS ordem FROM _importacao WHERE erros = '{}') v
+        WHERE v.linha = i.linha
+    """, (tamanho_lote,))
+
+
+def _gravar_lote(cursor, lote: int):
+    cursor.execute("""
+        WITH novos AS (
+            INSERT INTO clientes (nome, sexo, telefone, email, nacionalidade, data_nascimento)
+            SELECT nome, sexo, telefone, email, nacionalidade, data_nascimento::date
+            FROM _importacao
+            WHERE lote = %(lote)s
+            ORDER BY linha
+            RETURNING cliente_id, telefone
+        )
+        UPDATE _importacao i
+        SET cliente_id = n.cliente_id
+        FROM novos n
+        WHERE i.lote = %(lote)s AND i.telefone = n.telefone
+    """, {"lote": lote})
+    cursor.execute("""
+        INSERT INTO localizacao (cliente_id, bairro, numero_da_casa, quarteirao, cidade, distrito, provincia, latitude, longitude)
+        SELECT cliente_id, bairro, numero_da_casa, quarteirao, cidade, distrito, provincia,
+               latitude::double precision, longitude::double precision
+        FROM _importacao
+        WHERE lote = %s AND cidade IS NOT NULL
+    """, (lote,))
+    cursor.execute("""
+        INSERT INTO ocupacoes (cliente_id, codigo, nome, descricao, categoria_risco, renda_minima,
+                               setor_economico, estabilidade_emprego)
+        SELECT cliente_id, ocupacao_codigo, ocupacao_nome, ocupacao_descricao, categoria_risco,
+               renda_minima::numeric(10,2), setor_economico, estabilidade_emprego
+        FROM _importacao
+        WHERE lote = %s AND ocupacao_codigo IS NOT NULL
+    """, (lote,))
+    cursor.execute("""
+        INSERT INTO documentos (cliente_id, tipo_documento, numero_documento, arquivo)
+        SELECT i.cliente_id, i.tipo_documento, i.numero_documento, a.conteudo
+        FROM _importacao i
+        LEFT JOIN _importacao_arquivos a ON a.nome = i.arquivo_documento
+        WHERE i.lote = %s AND i.numero_documento IS NOT NULL
+    """, (lote,))
+
+
+def importar_clientes(conn, conteudo: bytes, nome_ficheiro: str, tamanho_lote: int = 200,
+                      simular: bool = False) -> dict:
+    """
+    Valida e (sem simular) grava o pacote. Devolve o relatório por linha do CSV: importado
+    (com cliente_id), valido (só a simular) ou rejeitado (com os erros da linha ou do lote).
+    """
+    texto, arquivos = _ler_pacote(conteudo, nome_ficheiro)
+    colunas, separador = _cabecalho(texto)
+    cursor = conn.cursor()
+    try:
+        _copiar(cursor, texto, colunas, separador, arquivos)
+        cursor.execute("SELECT COUNT(*) FROM _importacao")
+        total = cursor.fetchone()[0]
+        if total > IMPORTACAO_MAX_LINHAS:
+            raise HTTPException(status_code=413, detail=f"Máximo de {IMPORTACAO_MAX_LINHAS} linhas por importação")
+        _validar(cursor, tamanho_lote)
+        # As tabelas temporárias sobrevivem ao commit; a partir daqui cada lote é uma transação
+        conn.commit()
+
+        cursor.execute("SELECT DISTINCT lote FROM _importacao WHERE lote IS NOT NULL ORDER BY lote")
+        lotes = [r[0] for r in cursor.fetchall()]
+        falhas: Dict[int, str] = {}
+        if not simular:
+            for lote in lotes:
+                try:
+                    _gravar_lote(cursor, lote)
+                    conn.commit()
+                except psycopg2.Error as e:
+                    # Tipicamente um telefone ou documento gravado por outro pedido entretanto
+                    conn.rollback()
+                    falhas[lote] = f"lote não gravado: {e.diag.message_primary or e}"
+
+        cursor.execute("SELECT linha, erros, lote, cliente_id FROM _importacao ORDER BY linha")
+        linhas = []
+        for linha, erros, lote, cliente_id in cursor.fetchall():
+            if lote in falhas:
+                erros = [falhas[lote]]
+            if erros:
+                estado = "rejeitado"
+            else:
+                estado = "valido" if simular else "importado"
+            linhas.append({"linha": linha, "estado": estado, "cliente_id": cliente_id, "erros": erros})
+        return {
+            "total_linhas": total,
+            "importados": sum(1 for l in linhas if l["estado"] == "importado"),
+            "validos": sum(1 for l in linhas if l["estado"] in ("importado", "valido")),
+            "rejeitados": sum(1 for l in linhas if l["estado"] == "rejeitado"),
+            "lotes": len(lotes),
+            "lotes_falhados": len(falhas),
+            "simulacao": simular,
+            "linhas": linhas,
+        }
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        try:
+            cursor.execute("DROP TABLE IF EXISTS _importacao, _importacao_arquivos")
+            conn.commit()
+        except psycopg2.Error:
+            pass
+        cursor.close()
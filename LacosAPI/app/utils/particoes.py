@@ -0,0 +1,233 @@
+"""
+Particionamento mensal (PARTITION BY RANGE) de pagamentos, notificacoes e penalizacoes.
+
+Cada tabela tem uma partição por mês ({tabela}_AAAA_MM) e uma partição {tabela}_default que
+recebe as linhas de meses ainda sem partição. O trabalho diário "particoes" cria as partições
+do mês corrente e dos PARTICOES_MESES_FUTUROS seguintes e passa para partições próprias os
+meses que tenham caído na default. migrar_para_particoes converte uma tabela criada antes de
+database_setup.sql a declarar particionada, copiando as linhas existentes.
+
+Só há poda de partições quando a consulta filtra a coluna de partição por intervalo
+(coluna >= início AND coluna < fim); date_trunc('month', coluna) = ... lê todas.
+"""
+import os
+from datetime import date, timedelta
+from typing import Callable, Dict, List, Optional, Tuple
+
+# tabela -> (chave primária original, coluna de partição)
+TABELAS_PARTICIONADAS: Dict[str, Tuple[str, str]] = {
+    "pagamentos": ("pagamento_id", "data_pagamento"),
+    "notificacoes": ("notificacao_id", "data_envio"),
+    "penalizacoes": ("penalizacao_id", "data_aplicacao"),
+}
+# Meses à frente do corrente com partição já criada
+PARTICOES_MESES_FUTUROS = int(os.getenv("PARTICOES_MESES_FUTUROS", "3"))
+
+
+def inicio_mes(d: date) -> date:
+    return d.replace(day=1)
+
+
+def mes_seguinte(d: date) -> date:
+    return (d.replace(day=1) + timedelta(days=32)).replace(day=1)
+
+
+def nome_particao(tabela: str, mes: date) -> str:
+    """Partição mensal de uma tabela particionada por mês (também carteira_snapshots)."""
+    return f"{tabela}_{mes.year:04d}_{mes.month:02d}"
+
+
+def _existe(cursor, nome: str) -> bool:
+    cursor.execute("SELECT to_regclass(%s) IS NOT NULL", (f"public.{nome}",))
+    return cursor.fetchone()[0]
+
+
+def particionada(cursor, tabela: str) -> bool:
+    cursor.execute("SELECT relkind FROM pg_class WHERE oid = to_regclass(%s)", (f"public.{tabela}",))
+    linha = cursor.fetchone()
+    return linha is not None and linha[0] == "p"
+
+
+def garantir_particao(cursor, tabela: str, mes: date) -> bool:
+    """
+    Cria a partição do mês, se ainda não existir, e devolve True se a criou. Numa tabela com
+    partição default (as de TABELAS_PARTICIONADAS), as linhas desse mês que lá estejam passam
+    para a nova antes de ela ser anexada (com elas lá, o PostgreSQL recusa a partição).
+    """
+    nome = nome_particao(tabela, mes)
+    if _existe(cursor, nome):
+        return False
+    inicio, fim = inicio_mes(mes).isoformat(), mes_seguinte(mes).isoformat()
+    if not _existe(cursor, f"{tabela}_default"):
+        cursor.execute(f"""
+            CREATE TABLE IF NOT EXISTS public.{nome}
+            PARTITION OF public.{tabela}
+            FOR VALUES FROM (%s) TO (%s)
+        """, (inicio, fim))
+        return True
+    coluna = TABELAS_PARTICIONADAS[tabela][1]
+    # Sem o bloqueio, uma linha desse mês inserida na default entre a mudança e o ATTACH
+    # faria o ATTACH falhar; as leituras continuam até ao ATTACH
+    cursor.execute(f"LOCK TABLE public.{tabela}_default IN SHARE ROW EXCLUSIVE MODE")
+    cursor.execute(f"""
+        CREATE TABLE public.{nome}
+        (LIKE public.{tabela} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)
+    """)
+    cursor.execute(f"""
+        WITH movidas AS (
+            DELETE FROM public.{tabela}_default
+            WHERE {coluna} >= %s AND {coluna} < %s
+            RETURNING *
+        )
+        INSERT INTO public.{nome} SELECT * FROM movidas
+    """, (inicio, fim))
+    cursor.execute(f"ALTER TABLE public.{tabela} ATTACH PARTITION public.{nome} FOR VALUES FROM (%s) TO (%s)",
+                   (inicio, fim))
+    return True
+
+
+def _meses(desde: date, ate: date) -> List[date]:
+    meses, mes = [], inicio_mes(desde)
+    while mes <= ate:
+        meses.append(mes)
+        mes = mes_seguinte(mes)
+    return meses
+
+
+def manter_particoes(conn, desde: Optional[date] = None, hoje: Optional[date] = None,
+                     progresso: Optional[Callable[[int, Optional[int]], None]] = None) -> dict:
+    """
+    Garante as partições de desde (por omissão, o mês corrente) até PARTICOES_MESES_FUTUROS
+    meses depois de hoje e as dos meses com linhas na partição default. Um commit por tabela;
+    as tabelas ainda não migradas são ignoradas.
+    """
+    hoje = hoje or date.today()
+    ultimo = inicio_mes(hoje)
+    for _ in range(PARTICOES_MESES_FUTUROS):
+        ultimo = mes_seguinte(ultimo)
+    cursor = conn.cursor()
+    criadas: List[str] = []
+    ignoradas: List[str] = []
+    try:
+        for i, (tabela, (_, coluna)) in enumerate(TABELAS_PARTICIONADAS.items()):
+            if progresso:
+                progresso(i, len(TABELAS_PARTICIONADAS))
+            if not particionada(cursor, tabela):
+                ignoradas.append(tabela)
+                continue
+            meses = set(_meses(desde or hoje, ultimo))
+            if _existe(cursor, f"{tabela}_default"):
+                cursor.execute(f"""
+                    SELECT DISTINCT date_trunc('month', {coluna})::date
+                    FROM public.{tabela}_default
+                    WHERE {coluna} IS NOT NULL
+                """)
+                meses.update(r[0] for r in cursor.fetchall())
+            for mes in sorted(meses):
+                if garantir_particao(cursor, tabela, mes):
+                    criadas.append(nome_particao(tabela, mes))
+            conn.commit()
+        if progresso:
+            progresso(len(TABELAS_PARTICIONADAS), len(TABELAS_PARTICIONADAS))
+        return {
+            "mensagem": f"{len(criadas)} partições criadas",
+            "particoes": criadas,
+            "nao_particionadas": ignoradas,
+            "linhas_afetadas": len(criadas),
+        }
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+
+
+def migrar_para_particoes(conn, tabela: str) -> dict:
+    """
+    Converte uma tabela comum na versão particionada, numa única transação com a tabela
+    bloqueada (ACCESS EXCLUSIVE) do princípio ao fim: correr numa janela de manutenção.
+
+    A tabela é renomeada para {tabela}_antiga e recriada particionada com as mesmas colunas,
+    valores por omissão, CHECKs e identidade; as linhas são copiadas (as sem data ficam com a
+    data da migração) e a antiga é removida, depois de lidos os seus índices, chaves estrangeiras
+    e gatilhos, que são recriados na nova. A chave primária passa a (id, coluna de partição),
+    já que o PostgreSQL só garante unicidade que inclua a chave de partição; a unicidade do id
+    continua assegurada pela identidade.
+    """
+    id_coluna, coluna = TABELAS_PARTICIONADAS[tabela]
+    antiga = f"{tabela}_antiga"
+    cursor = conn.cursor()
+    try:
+        if particionada(cursor, tabela):
+            return {"mensagem": f"{tabela} já está particionada", "linhas_afetadas": 0}
+        cursor.execute(f"LOCK TABLE public.{tabela} IN ACCESS EXCLUSIVE MODE")
+
+        # Definições lidas antes de renomear, para já referirem o nome definitivo
+        cursor.execute("""
+            SELECT indexdef FROM pg_indexes
+            WHERE schemaname = 'public' AND tablename = %s
+              AND indexname NOT IN (SELECT conname FROM pg_constraint
+                                    WHERE conrelid = %s::regclass AND contype IN ('p', 'u'))
+        """, (tabela, f"public.{tabela}"))
+        indices = [r[0] for r in cursor.fetchall()]
+        cursor.execute("""
+            SELECT conname, pg_get_constraintdef(oid) FROM pg_constraint
+            WHERE conrelid = %s::regclass AND contype = 'f'
+        """, (f"public.{tabela}",))
+        chaves = cursor.fetchall()
+        cursor.execute("""
+            SELECT pg_get_triggerdef(oid) FROM pg_trigger
+            WHERE tgrelid = %s::regclass AND NOT tgisinternal
+        """, (f"public.{tabela}",))
+        gatilhos = [r[0] for r in cursor.fetchall()]
+        cursor.execute("""
+            SELECT attname FROM pg_attribute
+            WHERE attrelid = %s::regclass AND attnum > 0 AND NOT attisdropped
+            ORDER BY attnum
+        """, (f"public.{tabela}",))
+        colunas = [r[0] for r in cursor.fetchall()]
+
+        cursor.execute(f"ALTER TABLE public.{tabela} RENAME TO {antiga}")
+        cursor.execute(f"""
+            CREATE TABLE public.{tabela}
+            (LIKE public.{antiga} INCLUDING DEFAULTS INCLUDING CONSTRAINTS INCLUDING IDENTITY)
+            PARTITION BY RANGE ({coluna})
+        """)
+        cursor.execute(f"ALTER TABLE public.{tabela} ALTER COLUMN {coluna} SET NOT NULL")
+        cursor.execute(f"CREATE TABLE public.{tabela}_default PARTITION OF public.{tabela} DEFAULT")
+
+        cursor.execute(f"""
+            SELECT DISTINCT date_trunc('month', COALESCE({coluna}, now()))::date FROM public.{antiga}
+        """)
+        meses = {r[0] for r in cursor.fetchall()} | set(_meses(date.today(), date.today()))
+        for mes in sorted(meses):
+            garantir_particao(cursor, tabela, mes)
+
+        selecao = ", ".join(f"COALESCE({c}, now())" if c == coluna else c for c in colunas)
+        cursor.execute(f"""
+            INSERT INTO public.{tabela} ({", ".join(colunas)}) OVERRIDING SYSTEM VALUE
+            SELECT {selecao} FROM public.{antiga}
+        """)
+        copiadas = cursor.rowcount
+        cursor.execute(f"DROP TABLE public.{antiga}")
+
+        cursor.execute(f"ALTER TABLE public.{tabela} ADD CONSTRAINT {tabela}_pkey PRIMARY KEY ({id_coluna}, {coluna})")
+        for nome, definicao in chaves:
+            cursor.execute(f"ALTER TABLE public.{tabela} ADD CONSTRAINT {nome} {definicao}")
+        for definicao in indices + gatilhos:
+            cursor.execute(definicao)
+        cursor.execute(f"SELECT COALESCE(MAX({id_coluna}), 0) + 1 FROM public.{tabela}")
+        cursor.execute(f"ALTER TABLE public.{tabela} ALTER COLUMN {id_coluna} RESTART WITH %s",
+                       (cursor.fetchone()[0],))
+        cursor.execute(f"ANALYZE public.{tabela}")
+        conn.commit()
+        return {
+            "mensagem": f"{tabela} particionada por mês: {copiadas} linhas em {len(meses)} partições",
+            "particoes": [nome_particao(tabela, m) for m in sorted(meses)],
+            "linhas_afetadas": copiadas,
+        }
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
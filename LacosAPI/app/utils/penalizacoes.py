@@ -0,0 +1,99 @@
+"""
+Cálculo de penalizações de mora: a fórmula por empréstimo e um motor vetorizado (NumPy)
+que a aplica à carteira ativa inteira para qualquer data de referência, sem gravar nada.
+"""
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Dict, Optional
+
+import numpy as np
+
+from app.utils.prestacoes import sql_total_devido
+
+# 5% do valor do empréstimo por cada dia de atraso
+TAXA_MORA_DIARIA = Decimal("0.05")
+# A mesma taxa em pontos base inteiros, para o cálculo vetorizado sem vírgula flutuante
+_TAXA_MORA_BP = int(TAXA_MORA_DIARIA * 10000)
+
+
+def dias_atraso(data_vencimento, data_referencia: date) -> int:
+    vencimento = data_vencimento.date() if isinstance(data_vencimento, datetime) else data_vencimento
+    return max((data_referencia - vencimento).days, 0)
+
+
+def calcular_penalizacao(valor, dias: int) -> Decimal:
+    """Penalização de mora de um empréstimo: valor × 0.05 × dias de atraso."""
+    return Decimal(valor) * TAXA_MORA_DIARIA * dias
+
+
+def carregar_carteira(cursor, cliente_id: Optional[int] = None, emprestimo_id: Optional[int] = None) -> Dict[str, np.ndarray]:
+    """
+    Lê os empréstimos ativos para vetores NumPy (valores em cêntimos, datas em datetime64[D]).
+    Aceita cursores normais ou RealDictCursor.
+    """
+    condicoes = ["e.status = 'Ativo'"]
+    valores = []
+    if cliente_id is not None:
+        condicoes.append("e.cliente_id = %s")
+        valores.append(cliente_id)
+    if emprestimo_id is not None:
+        condicoes.append("e.emprestimo_id = %s")
+        valores.append(emprestimo_id)
+    cursor.execute(f"""
+        SELECT e.emprestimo_id,
+               e.cliente_id,
+               round(e.valor * 100)::bigint AS valor,
+               round({sql_total_devido("e")} * 100)::bigint AS total_devido,
+               (e.data_vencimento::date - DATE '1970-01-01') AS vencimento,
+               COALESCE(round(pen.total * 100), 0)::bigint AS penalizacoes,
+               (pen.emprestimo_id IS NOT NULL)::int AS penalizado,
+               COALESCE(round(pag.total * 100), 0)::bigint AS pago
+        FROM emprestimos e
+        LEFT JOIN (
+            SELECT emprestimo_id, SUM(valor) AS total
+            FROM penalizacoes
+            WHERE status = 'aplicada'
+            GROUP BY emprestimo_id
+        ) pen ON pen.emprestimo_id = e.emprestimo_id
+        LEFT JOIN (
+            SELECT emprestimo_id, SUM(valor_pago) AS total
+            FROM pagamentos
+            GROUP BY emprestimo_id
+        ) pag ON pag.emprestimo_id = e.emprestimo_id
+        WHERE {" AND ".join(condicoes)}
+        ORDER BY e.emprestimo_id
+    """, valores)
+    linhas = cursor.fetchall()
+    colunas = ["emprestimo_id", "cliente_id", "valor", "total_devido", "vencimento", "penalizacoes", "penalizado", "pago"]
+    if linhas and isinstance(linhas[0], dict):
+        linhas = [tuple(l[c] for c in colunas) for l in linhas]
+    matriz = np.array(linhas, dtype=np.int64).reshape(-1, len(colunas))
+    carteira = {c: matriz[:, i] for i, c in enumerate(colunas)}
+    carteira["vencimento"] = carteira["vencimento"].astype("datetime64[D]")
+    carteira["penalizado"] = carteira["penalizado"].astype(bool)
+    return carteira
+
+
+def simular(carteira: Dict[str, np.ndarray], data_referencia: date) -> Dict[str, np.ndarray]:
+    """
+    Penalizações que a aplicação automática criaria em data_referencia e o total em dívida
+    resultante, por empréstimo. Só os empréstimos vencidos e ainda sem penalização aplicada
+    recebem uma nova, tal como em executar_penalizacoes_automaticas.
+
+    O valor é calculado exatamente em inteiros (cêntimos × pontos base) e arredondado ao
+    cêntimo como o PostgreSQL o grava em numeric(10,2).
+    """
+    referencia = np.datetime64(data_referencia, "D")
+    dias = np.maximum((referencia - carteira["vencimento"]).astype(np.int64), 0)
+    elegivel = (dias > 0) & ~carteira["penalizado"]
+    # cêntimos × pontos base × dias = décimas-milésimas de cêntimo
+    bruto = carteira["valor"] * _TAXA_MORA_BP * dias
+    penalizacao = np.where(elegivel, (bruto + 5000) // 10000, 0)
+    total = carteira["total_devido"] + carteira["penalizacoes"] + penalizacao
+    return {
+        "dias_atraso": dias,
+        "elegivel": elegivel,
+        "penalizacao": penalizacao,
+        "total_com_penalizacoes": total,
+        "em_divida": np.maximum(total - carteira["pago"], 0),
+    }
@@ -0,0 +1,293 @@
+"""
+Motor de planos de prestações (cronogramas de amortização) para empréstimos.
+
+Os cálculos são vetorizados com NumPy por grupo de (frequência, método, nº de prestações),
+em cêntimos inteiros, para gerar cronogramas de carteiras inteiras de uma só vez.
+"""
+import io
+from decimal import Decimal
+from typing import Callable, Dict, Iterable, List, Optional
+
+import numpy as np
+
+# Margem aplicada aos empréstimos sem produto (comportamento histórico: 20% sobre o valor)
+MARGEM_PADRAO = Decimal("0.20")
+FATOR_TOTAL_PADRAO = 1 + MARGEM_PADRAO
+
+FREQUENCIAS = ("Semanal", "Quinzenal", "Mensal")
+METODOS = ("Fixo", "Saldo Decrescente")
+# Empréstimos sem produto: uma única prestação na data_vencimento do empréstimo
+FREQUENCIA_UNICA = "Unica"
+
+# Empréstimos lidos e gravados por lote ao gerar a carteira
+LOTE_CARTEIRA = 50000
+
+
+def total_devido(valor, total: Optional[Decimal] = None) -> Decimal:
+    """Total a pagar por um empréstimo: o do cronograma quando existe, senão valor × 1.20."""
+    if total is not None:
+        return Decimal(total)
+    return (Decimal(valor) * FATOR_TOTAL_PADRAO).quantize(Decimal("0.01"))
+
+
+def sql_total_devido(alias: str = "") -> str:
+    """Expressão SQL equivalente a total_devido() para usar nas consultas de agregação."""
+    prefixo = f"{alias}." if alias else ""
+    return f"COALESCE({prefixo}total_devido, {prefixo}valor * {FATOR_TOTAL_PADRAO})"
+
+
+def _somar_meses(datas: np.ndarray, meses: np.ndarray) -> np.ndarray:
+    """datas (datetime64[D], forma (L,1)) + meses (forma (n,)), com o dia limitado ao fim do mês."""
+    mes_base = datas.astype("datetime64[M]")
+    dia = (datas - mes_base.astype("datetime64[D]")).astype(np.int64)
+    mes_alvo = mes_base + meses
+    dias_no_mes = ((mes_alvo + 1).astype("datetime64[D]") - mes_alvo.astype("datetime64[D]")).astype(np.int64)
+    return mes_alvo.astype("datetime64[D]") + np.minimum(dia, dias_no_mes - 1)
+
+
+def _datas_vencimento(inicio: np.ndarray, frequencia: str, n: int) -> np.ndarray:
+    k = np.arange(1, n + 1)
+    inicio = inicio.reshape(-1, 1)
+    if frequencia == "Semanal":
+        return inicio + 7 * k
+    if frequencia == "Quinzenal":
+        return inicio + 14 * k
+    return _somar_meses(inicio, k)
+
+
+def _fixo(capital: np.ndarray, taxas: np.ndarray, n: int):
+    """Juro fixo: total de juros = capital × taxa, repartido por igual; restos de cêntimos na última."""
+    base = capital // n
+    cap = np.repeat(base.reshape(-1, 1), n, axis=1)
+    cap[:, -1] += capital - base * n
+    juros_total = np.rint(capital * taxas).astype(np.int64)
+    base_j = juros_total // n
+    jur = np.repeat(base_j.reshape(-1, 1), n, axis=1)
+    jur[:, -1] += juros_total - base_j * n
+    return cap, jur
+
+
+def _saldo_decrescente(capital: np.ndarray, taxas: np.ndarray, n: int):
+    """
+    Prestação constante (sistema francês): taxa é a taxa de juro por período.
+    Juro de cada prestação = saldo em dívida × taxa; o último capital fecha o valor exato.
+    """
+    p = capital.astype(np.float64).reshape(-1, 1)
+    r = taxas.astype(np.float64).reshape(-1, 1)
+    k = np.arange(n).reshape(1, -1)
+    sem_juro = r == 0
+    r_seguro = np.where(sem_juro, 1.0, r)
+    prestacao = np.where(sem_juro, p / n, p * r_seguro / (1 - (1 + r_seguro) ** -n))
+    crescimento = (1 + r_seguro) ** k
+    saldo = np.where(sem_juro, p - prestacao * k, p * crescimento - prestacao * (crescimento - 1) / r_seguro)
+    jur = np.rint(np.where(sem_juro, 0.0, saldo * r)).astype(np.int64)
+    cap = np.rint(prestacao).astype(np.int64) - jur
+    cap[:, -1] = capital - cap[:, :-1].sum(axis=1)
+    return cap, jur
+
+
+def gerar_cronogramas(
+    valores: np.ndarray,
+    datas_emprestimo: np.ndarray,
+    datas_vencimento: np.ndarray,
+    frequencias: np.ndarray,
+    metodos: np.ndarray,
+    taxas: np.ndarray,
+    prestacoes: np.ndarray,
+) -> Dict[str, np.ndarray]:
+    """
+    Gera os cronogramas de L empréstimos. Todos os argumentos são vetores de tamanho L
+    (datas em datetime64[D], valores em unidades monetárias). Devolve vetores planos com uma
+    linha por prestação: indice (posição do empréstimo na entrada), numero, data_vencimento,
+    capital e juro (em cêntimos, int64).
+    """
+    capital_total = np.rint(np.asarray(valores, dtype=np.float64) * 100).astype(np.int64)
+    taxas = np.asarray(taxas, dtype=np.float64)
+    prestacoes = np.asarray(prestacoes, dtype=np.int64)
+    frequencias = np.asarray(frequencias, dtype=object)
+    metodos = np.asarray(metodos, dtype=object)
+
+    partes = []
+    grupos = {}
+    for i, chave in enumerate(zip(frequencias.tolist(), metodos.tolist(), prestacoes.tolist())):
+        grupos.setdefault(chave, []).append(i)
+
+    for (frequencia, metodo, n), indices in grupos.items():
+        idx = np.asarray(indices, dtype=np.int64)
+        if frequencia == FREQUENCIA_UNICA:
+            n = 1
+            datas = datas_vencimento[idx].reshape(-1, 1)
+        else:
+            datas = _datas_vencimento(datas_emprestimo[idx], frequencia, n)
+        if metodo == "Saldo Decrescente":
+            cap, jur = _saldo_decrescente(capital_total[idx], taxas[idx], n)
+        else:
+            cap, jur = _fixo(capital_total[idx], taxas[idx], n)
+        partes.append({
+            "indice": np.repeat(idx, n),
+            "numero": np.tile(np.arange(1, n + 1, dtype=np.int64), len(idx)),
+            "data_vencimento": datas.reshape(-1),
+            "capital": cap.reshape(-1),
+            "juro": jur.reshape(-1),
+        })
+
+    if not partes:
+        vazio = {c: np.array([], dtype=np.int64) for c in ("indice", "numero", "capital", "juro")}
+        vazio["data_vencimento"] = np.array([], dtype="datetime64[D]")
+        return vazio
+    return {c: np.concatenate([p[c] for p in partes]) for c in partes[0]}
+
+
+def alocar(valores: np.ndarray, pago: float) -> np.ndarray:
+    """Reparte um total pago pelas prestações, da mais antiga para a mais recente."""
+    acumulado = np.cumsum(valores)
+    return np.clip(pago - (acumulado - valores), 0, valores)
+
+
+def _centimos(c: int) -> str:
+    return f"{c // 100}.{c % 100:02d}"
+
+
+def _gravar(cursor, emprestimo_ids: np.ndarray, cronograma: Dict[str, np.ndarray], com_produto: np.ndarray):
+    """Substitui as prestações destes empréstimos (COPY) e atualiza total_devido e data_vencimento."""
+    ids = emprestimo_ids[cronograma["indice"]]
+    datas = cronograma["data_vencimento"].astype(str)
+    buffer = io.StringIO()
+    buffer.writelines(
+        f"{e}\t{n}\t{d}\t{_centimos(c)}\t{_centimos(j)}\n"
+        for e, n, d, c, j in zip(ids.tolist(), cronograma["numero"].tolist(), datas.tolist(),
+                                 cronograma["capital"].tolist(), cronograma["juro"].tolist())
+    )
+    buffer.seek(0)
+    cursor.execute("DELETE FROM prestacoes WHERE emprestimo_id = ANY(%s)", (emprestimo_ids.tolist(),))
+    cursor.copy_expert("COPY prestacoes (emprestimo_id, numero, data_vencimento, capital, juro) FROM STDIN", buffer)
+
+    # Só os empréstimos com produto têm total e vencimento definidos pelo cronograma
+    if com_produto.any():
+        ultimo = np.zeros(len(emprestimo_ids), dtype="datetime64[D]")
+        totais = np.zeros(len(emprestimo_ids), dtype=np.int64)
+        np.add.at(totais, cronograma["indice"], cronograma["capital"] + cronograma["juro"])
+        np.maximum.at(ultimo, cronograma["indice"], cronograma["data_vencimento"])
+        cursor.execute("CREATE TEMP TABLE IF NOT EXISTS _totais_cronograma (emprestimo_id bigint, total_devido numeric(12,2), data_vencimento date) ON COMMIT DROP")
+        cursor.execute("TRUNCATE _totais_cronograma")
+        buffer = io.StringIO()
+        buffer.writelines(
+            f"{e}\t{_centimos(t)}\t{d}\n"
+            for e, t, d in zip(emprestimo_ids[com_produto].tolist(), totais[com_produto].tolist(),
+                               ultimo[com_produto].astype(str).tolist())
+        )
+        buffer.seek(0)
+        cursor.copy_expert("COPY _totais_cronograma FROM STDIN", buffer)
+        cursor.execute("""
+            UPDATE emprestimos e
+            SET total_devido = t.total_devido, data_vencimento = t.data_vencimento
+            FROM _totais_cronograma t
+            WHERE e.emprestimo_id = t.emprestimo_id
+        """)
+
+
+def alocar_pagamentos(cursor, emprestimo_ids: Iterable[int]):
+    """
+    Recalcula valor_pago de cada prestação a partir do total pago no empréstimo,
+    cobrindo primeiro as prestações mais antigas (o mesmo que alocar(), em SQL).
+    """
+    ids = list(emprestimo_ids)
+    if not ids:
+        return
+    cursor.execute("""
+        WITH pagos AS (
+            SELECT emprestimo_id, SUM(valor_pago) AS total
+            FROM pagamentos
+            WHERE emprestimo_id = ANY(%(ids)s)
+            GROUP BY emprestimo_id
+        ),
+        acumulado AS (
+            SELECT emprestimo_id, numero, capital + juro AS valor,
+                   SUM(capital + juro) OVER (PARTITION BY emprestimo_id ORDER BY numero) AS acumulado
+            FROM prestacoes
+            WHERE emprestimo_id = ANY(%(ids)s)
+        ),
+        alocado AS (
+            SELECT a.emprestimo_id, a.numero,
+                   LEAST(GREATEST(COALESCE(g.total, 0) - (a.acumulado - a.valor), 0), a.valor) AS valor_pago
+            FROM acumulado a
+            LEFT JOIN pagos g ON g.emprestimo_id = a.emprestimo_id
+        )
+        UPDATE prestacoes p
+        SET valor_pago = al.valor_pago
+        FROM alocado al
+        WHERE p.emprestimo_id = al.emprestimo_id AND p.numero = al.numero
+        AND p.valor_pago IS DISTINCT FROM al.valor_pago
+    """, {"ids": ids})
+
+
+_SELECAO_EMPRESTIMOS = """
+    SELECT e.emprestimo_id, e.valor,
+           e.data_emprestimo::date AS data_emprestimo, e.data_vencimento::date AS data_vencimento,
+           COALESCE(p.frequencia, %(unica)s) AS frequencia, COALESCE(p.metodo, 'Fixo') AS metodo,
+           COALESCE(p.taxa_juro, %(margem)s) AS taxa_juro, COALESCE(p.numero_prestacoes, 1) AS numero_prestacoes,
+           p.produto_id IS NOT NULL AS com_produto
+    FROM emprestimos e
+    LEFT JOIN produtos_credito p ON p.produto_id = e.produto_id
+"""
+
+
+def gerar_para_emprestimos(cursor, emprestimo_ids: List[int]) -> int:
+    """Gera (ou regenera) o cronograma dos empréstimos indicados e aloca os pagamentos existentes."""
+    cursor.execute(_SELECAO_EMPRESTIMOS + " WHERE e.emprestimo_id = ANY(%(ids)s)",
+                   {"unica": FREQUENCIA_UNICA, "margem": MARGEM_PADRAO, "ids": list(emprestimo_ids)})
+    return _processar_lote(cursor, cursor.fetchall())
+
+
+def _processar_lote(cursor, linhas) -> int:
+    if not linhas:
+        return 0
+    colunas = list(zip(*[tuple(l.values()) if isinstance(l, dict) else l for l in linhas]))
+    ids = np.asarray(colunas[0], dtype=np.int64)
+    cronograma = gerar_cronogramas(
+        valores=np.asarray(colunas[1], dtype=np.float64),
+        datas_emprestimo=np.asarray(colunas[2], dtype="datetime64[D]"),
+        datas_vencimento=np.asarray(colunas[3], dtype="datetime64[D]"),
+        frequencias=np.asarray(colunas[4], dtype=object),
+        metodos=np.asarray(colunas[5], dtype=object),
+        taxas=np.asarray(colunas[6], dtype=np.float64),
+        prestacoes=np.asarray(colunas[7], dtype=np.int64),
+    )
+    _gravar(cursor, ids, cronograma, np.asarray(colunas[8], dtype=bool))
+    alocar_pagamentos(cursor, ids.tolist())
+    return len(ids)
+
+
+def gerar_carteira(conn, regenerar: bool = False, progresso: Optional[Callable[[int, Optional[int]], None]] = None) -> dict:
+    """
+    Gera os cronogramas de toda a carteira (por omissão só dos empréstimos que ainda não têm),
+    em lotes de LOTE_CARTEIRA com um commit por lote.
+    """
+    cursor = conn.cursor()
+    try:
+        condicao = "" if regenerar else " WHERE NOT EXISTS (SELECT 1 FROM prestacoes x WHERE x.emprestimo_id = e.emprestimo_id)"
+        cursor.execute("SELECT COUNT(*) FROM emprestimos e" + condicao)
+        total = cursor.fetchone()[0]
+        processados = 0
+        ultimo_id = 0
+        while True:
+            if progresso:
+                progresso(processados, total)
+            filtro = (" AND " if condicao else " WHERE ") + "e.emprestimo_id > %(ultimo)s"
+            cursor.execute(
+                _SELECAO_EMPRESTIMOS + condicao + filtro
+                + " ORDER BY e.emprestimo_id LIMIT %(lote)s",
+                {"unica": FREQUENCIA_UNICA, "margem": MARGEM_PADRAO, "ultimo": ultimo_id, "lote": LOTE_CARTEIRA},
+            )
+            linhas = cursor.fetchall()
+            if not linhas:
+                break
+            processados += _processar_lote(cursor, linhas)
+            ultimo_id = linhas[-1][0]
+            conn.commit()
+        return {"mensagem": f"{processados} cronogramas gerados", "linhas_afetadas": processados}
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
@@ -0,0 +1,201 @@
+"""
+Previsão de cobranças diárias (fluxo de caixa) a partir dos saldos em aberto e da
+distribuição histórica do atraso dos pagamentos em relação à data_vencimento.
+"""
+import os
+import threading
+import time
+from datetime import date, timedelta
+from typing import Any, Dict, Optional, Tuple
+
+import numpy as np
+
+from app.database.database import get_db_connection, get_db_connection_leitura
+from app.utils.prestacoes import sql_total_devido
+
+# Intervalo de atraso (dias em relação ao vencimento) modelado; fora dele acumula-se nos extremos
+ATRASO_MIN = -180
+ATRASO_MAX = 365
+# Empréstimos vencidos há mais de ATRASO_MAX dias e no máximo há mais estes meses formam o histórico
+PREVISAO_HISTORICO_MESES = int(os.getenv("PREVISAO_HISTORICO_MESES", "24"))
+# Rede de segurança: mesmo sem escritas detetadas, a previsão é recalculada ao fim deste tempo
+PREVISAO_CACHE_TTL = int(os.getenv("PREVISAO_CACHE_TTL", "3600"))
+# O contador de escritas no primário é relido no máximo uma vez por este intervalo
+PREVISAO_MARCA_S = float(os.getenv("PREVISAO_MARCA_S", "5"))
+
+_CACHE: Dict[Tuple[date, int], Dict[str, Any]] = {}
+_versao_pagamentos = 0
+_LOCK = threading.Lock()
+# (valor, instante) da última leitura de _marca_pagamentos
+_marca: Tuple[Optional[int], float] = (None, 0.0)
+
+
+def invalidar_previsao():
+    """Chamado depois de cada escrita em pagamentos ou empréstimos neste processo."""
+    global _versao_pagamentos
+    with _LOCK:
+        _versao_pagamentos += 1
+        _CACHE.clear()
+
+
+def _marca_pagamentos() -> Optional[int]:
+    """
+    Contador de escritas em pagamentos no primário (pg_stat_user_tables), para que a cache
+    também caia quando os pagamentos são alterados por outro processo. None se indisponível.
+    Com pagamentos particionada as escritas contam nas partições, não no pai: somam-se as
+    folhas de pg_partition_tree (que numa tabela comum é a própria tabela). O valor é
+    reaproveitado durante PREVISAO_MARCA_S para não abrir uma ligação por pedido.
+    """
+    global _marca
+    valor, instante = _marca
+    if time.time() - instante < PREVISAO_MARCA_S:
+        return valor
+    try:
+        conn = get_db_connection()
+    except Exception:
+        return None
+    try:
+        cursor = conn.cursor()
+        cursor.execute("""
+            SELECT SUM(s.n_tup_ins + s.n_tup_upd + s.n_tup_del)
+            FROM pg_partition_tree('public.pagamentos') t
+            JOIN pg_stat_user_tables s ON s.relid = t.relid
+            WHERE t.isleaf
+        """)
+        linha = cursor.fetchone()
+        valor = int(linha[0]) if linha and linha[0] is not None else None
+    except Exception:
+        valor = None
+    finally:
+        conn.close()
+    _marca = (valor, time.time())
+    return valor
+
+
+def distribuicao_atrasos(cursor, hoje: date) -> Tuple[np.ndarray, int, float]:
+    """
+    Fração do total devido recebida em cada dia de atraso (índice 0 = ATRASO_MIN), medida nos
+    empréstimos cujo vencimento já passou há mais de ATRASO_MAX dias. Devolve (pmf, nº de
+    empréstimos, valor devido); a soma da pmf é a taxa de recuperação histórica.
+    """
+    fim = hoje - timedelta(days=ATRASO_MAX)
+    inicio = fim - timedelta(days=30 * PREVISAO_HISTORICO_MESES)
+    cursor.execute(f"""
+        SELECT COUNT(*), COALESCE(SUM({sql_total_devido("e")}), 0)
+        FROM emprestimos e
+        WHERE e.data_vencimento::date > %s AND e.data_vencimento::date <= %s
+    """, (inicio, fim))
+    n, devido = cursor.fetchone()
+    cursor.execute("""
+        SELECT LEAST(GREATEST(p.data_pagamento::date - e.data_vencimento::date, %s), %s) AS atraso,
+               SUM(p.valor_pago)
+        FROM pagamentos p
+        JOIN emprestimos e ON e.emprestimo_id = p.emprestimo_id
+        WHERE e.data_vencimento::date > %s AND e.data_vencimento::date <= %s
+        GROUP BY 1
+    """, (ATRASO_MIN, ATRASO_MAX, inicio, fim))
+    pmf = np.zeros(ATRASO_MAX - ATRASO_MIN + 1)
+    linhas = cursor.fetchall()
+    if linhas and devido:
+        atrasos = np.array([l[0] for l in linhas], dtype=np.int64)
+        pmf[atrasos - ATRASO_MIN] = np.array([float(l[1]) for l in linhas]) / float(devido)
+    return pmf, int(n), float(devido)
+
+
+def saldos_por_vencimento(cursor) -> Tuple[np.ndarray, np.ndarray]:
+    """Saldo em aberto dos empréstimos ativos somado por data de vencimento (dias desde 1970)."""
+    cursor.execute(f"""
+        SELECT e.data_vencimento::date - DATE '1970-01-01' AS vencimento,
+               SUM(GREATEST({sql_total_devido("e")} - COALESCE(p.total_pago, 0), 0)) AS saldo
+        FROM emprestimos e
+        LEFT JOIN (
+            SELECT emprestimo_id, SUM(valor_pago) AS total_pago
+            FROM pagamentos
+            GROUP BY emprestimo_id
+        ) p ON p.emprestimo_id = e.emprestimo_id
+        WHERE e.status = 'Ativo'
+        GROUP BY 1
+    """)
+    linhas = cursor.fetchall()
+    vencimentos = np.array([l[0] for l in linhas], dtype=np.int64)
+    saldos = np.array([float(l[1]) for l in linhas], dtype=np.float64)
+    return vencimentos, saldos
+
+
+def projetar(vencimentos: np.ndarray, saldos: np.ndarray, pmf: np.ndarray, hoje: date, dias: int) -> np.ndarray:
+    """
+    Cobrança esperada em cada um dos próximos `dias` dias (a partir de amanhã).
+
+    Para um saldo vencido em v e ainda por receber hoje (atraso e = hoje - v), a probabilidade
+    de chegar no dia hoje + j é pmf[e + j] / (1 - P(atraso <= e)): a distribuição histórica
+    condicionada a não ter sido pago até hoje. A parte não recuperada (1 - soma da pmf) fica
+    no denominador, pelo que saldos muito atrasados contribuem pouco.
+    """
+    hoje_dias = (hoje - date(1970, 1, 1)).days
+    decorridos = hoje_dias - vencimentos                        # (G,)
+    acumulada = np.concatenate([[0.0], np.cumsum(pmf)])        # acumulada[i] = soma de pmf[:i]
+    pagos_ate_hoje = acumulada[np.clip(decorridos - ATRASO_MIN + 1, 0, len(pmf))]
+    por_receber = 1.0 - pagos_ate_hoje
+    peso = np.divide(saldos, por_receber, out=np.zeros_like(saldos), where=por_receber > 1e-9)
+
+    atrasos = decorridos[:, None] + np.arange(1, dias + 1)[None, :]   # (G, dias)
+    indices = atrasos - ATRASO_MIN
+    validos = (indices >= 0) & (indices < len(pmf))
+    probabilidades = np.where(validos, pmf[np.clip(indices, 0, len(pmf) - 1)], 0.0)
+    return peso @ probabilidades
+
+
+def prever_fluxo(dias: int = 90, data_referencia: Optional[date] = None, refresh: bool = False) -> Dict[str, Any]:
+    """Previsão diária de cobranças, guardada em cache até à próxima escrita em pagamentos."""
+    hoje = data_referencia or date.today()
+    chave = (hoje, dias)
+    versao = _versao_pagamentos
+    marca = _marca_pagamentos()
+    entrada = _CACHE.get(chave)
+    if (not refresh and entrada is not None and entrada["versao"] == versao
+            and entrada["marca"] == marca and time.time() - entrada["ts"] <= PREVISAO_CACHE_TTL):
+        return entrada["dados"]
+
+    conn = get_db_connection_leitura()
+    cursor = conn.cursor()
+    try:
+        pmf, n_historico, devido_historico = distribuicao_atrasos(cursor, hoje)
+        vencimentos, saldos = saldos_por_vencimento(cursor)
+    finally:
+        cursor.close()
+        conn.close()
+
+    sem_historico = n_historico == 0 or pmf.sum() == 0
+    if sem_historico:
+        # Sem histórico observável: assume-se que tudo é pago no dia do vencimento
+        pmf = np.zeros(ATRASO_MAX - ATRASO_MIN + 1)
+        pmf[-ATRASO_MIN] = 1.0
+    previsto = projetar(vencimentos, saldos, pmf, hoje, dias)
+    acumulado = np.cumsum(previsto)
+
+    dados = {
+        "data_referencia": hoje.isoformat(),
+        "dias": dias,
+        "saldo_em_aberto": round(float(saldos.sum()), 2),
+        "total_previsto": round(float(previsto.sum()), 2),
+        "historico": {
+            "emprestimos": n_historico,
+            "valor_devido": round(devido_historico, 2),
+            "taxa_recuperacao": round(float(pmf.sum()), 4),
+            "sem_historico": sem_historico,
+        },
+        "serie": [
+            {
+                "data": (hoje + timedelta(days=j + 1)).isoformat(),
+                "previsto": round(float(previsto[j]), 2),
+                "acumulado": round(float(acumulado[j]), 2),
+            }
+            for j in range(dias)
+        ],
+    }
+    with _LOCK:
+        if versao == _versao_pagamentos:
+            for antiga in [c for c in _CACHE if c[0] != hoje]:
+                _CACHE.pop(antiga, None)
+            _CACHE[chave] = {"dados": dados, "versao": versao, "marca": marca, "ts": time.time()}
+    return dados
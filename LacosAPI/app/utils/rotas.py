@@ -0,0 +1,163 @@
+"""
+Ordenação de visitas de cobrança: percurso inicial (vizinho mais próximo ou curva de Hilbert)
+melhorado com 2-opt, vetorizados com NumPy. O percurso é aberto (começa no ponto de partida e
+não regressa) e as distâncias são euclidianas numa projeção equiretangular, suficientemente
+exata à escala de uma cidade.
+"""
+import time
+from typing import Optional, Sequence
+
+import numpy as np
+
+from app.utils.geo import KM_POR_GRAU_LAT, KM_POR_GRAU_LON
+
+# Acima disto o vizinho mais próximo (O(n²)) dá lugar à curva de Hilbert (O(n log n))
+LIMITE_VIZINHO_MAIS_PROXIMO = 1000
+# O 2-opt só testa inversões de segmentos até este comprimento: mais passagens no mesmo tempo
+JANELA_2OPT = 250
+
+
+def projetar_km(latitudes, longitudes, lat_referencia: Optional[float] = None) -> np.ndarray:
+    """Coordenadas (N, 2) em km, numa projeção centrada na latitude de referência (por omissão, a média)."""
+    latitudes = np.asarray(latitudes, dtype=np.float64)
+    longitudes = np.asarray(longitudes, dtype=np.float64)
+    if lat_referencia is None:
+        lat_referencia = float(latitudes.mean()) if len(latitudes) else 0.0
+    x = longitudes * KM_POR_GRAU_LON * np.cos(np.radians(lat_referencia))
+    y = latitudes * KM_POR_GRAU_LAT
+    return np.column_stack([x, y])
+
+
+def _vizinho_mais_proximo(pontos: np.ndarray, inicio: np.ndarray) -> np.ndarray:
+    n = len(pontos)
+    visitado = np.zeros(n, dtype=bool)
+    ordem = np.empty(n, dtype=np.int64)
+    atual = inicio
+    for k in range(n):
+        d = np.hypot(pontos[:, 0] - atual[0], pontos[:, 1] - atual[1])
+        d[visitado] = np.inf
+        i = int(np.argmin(d))
+        ordem[k] = i
+        visitado[i] = True
+        atual = pontos[i]
+    return ordem
+
+
+def _curva_hilbert(pontos: np.ndarray, ordem: int = 16) -> np.ndarray:
+    """Ordem dos pontos ao longo de uma curva de Hilbert: pontos próximos ficam próximos na ordem."""
+    minimo = pontos.min(axis=0)
+    extensao = float((pontos.max(axis=0) - minimo).max()) or 1.0
+    q = ((pontos - minimo) / extensao * (2 ** ordem - 1)).astype(np.int64)
+    x, y = q[:, 0].copy(), q[:, 1].copy()
+    d = np.zeros(len(pontos), dtype=np.int64)
+    s = 2 ** (ordem - 1)
+    while s > 0:
+        rx = (x & s) > 0
+        ry = (y & s) > 0
+        d += s * s * ((3 * rx.astype(np.int64)) ^ ry.astype(np.int64))
+        # Rodar o quadrante para a sub-curva seguinte
+        rodar = ~ry
+        espelhar = rodar & rx
+        x = np.where(espelhar, s - 1 - x, x)
+        y = np.where(espelhar, s - 1 - y, y)
+        x, y = np.where(rodar, y, x), np.where(rodar, x, y)
+        s //= 2
+    return np.argsort(d, kind="stable")
+
+
+def _dois_opt(caminho: np.ndarray, rotulos: np.ndarray, prazo: float):
+    """
+    2-opt de caminho aberto, no próprio array, com o primeiro ponto (a partida) fixo.
+    Para cada i calcula de uma só vez o ganho de inverter caminho[i..j] para todos os j até
+    i + JANELA_2OPT e aplica a melhor inversão; os rótulos acompanham as coordenadas. Pára
+    quando uma passagem completa não melhora nada ou quando se esgota o prazo.
+    """
+    n = len(caminho)
+    melhorou = n >= 3
+    while melhorou and time.perf_counter() < prazo:
+        melhorou = False
+        for i in range(1, n - 1):
+            fim = min(n, i + 1 + JANELA_2OPT)
+            a = caminho[i - 1]
+            b = caminho[i]
+            c = caminho[i + 1:fim]            # candidatos a último ponto do segmento invertido (j)
+            seguinte = caminho[i + 2:fim + 1]  # ponto a seguir a cada j (não existe para o último ponto)
+            d_ab = np.hypot(b[0] - a[0], b[1] - a[1])
+            d_ac = np.hypot(c[:, 0] - a[0], c[:, 1] - a[1])
+            m = len(seguinte)
+            d_cd = np.hypot(seguinte[:, 0] - c[:m, 0], seguinte[:, 1] - c[:m, 1])
+            d_bd = np.hypot(seguinte[:, 0] - b[0], seguinte[:, 1] - b[1])
+            if m < len(c):
+                d_cd = np.append(d_cd, 0.0)
+                d_bd = np.append(d_bd, 0.0)
+            ganho = d_ab + d_cd - d_ac - d_bd
+            k = int(np.argmax(ganho))
+            if ganho[k] > 1e-9:
+                j = i + 1 + k
+                caminho[i:j + 1] = caminho[i:j + 1][::-1].copy()
+                rotulos[i:j + 1] = rotulos[i:j + 1][::-1].copy()
+                melhorou = True
+            if (i & 63) == 0 and time.perf_counter() >= prazo:
+                return
+
+
+def ordenar_visitas(pontos: np.ndarray, partida: Optional[Sequence[float]] = None,
+                    tempo_max_s: float = 0.5) -> np.ndarray:
+    """
+    Ordem de visita de N pontos (em km, forma (N, 2)) a começar na partida (por omissão, o
+    centroide). O 2-opt corre até convergir ou até tempo_max_s.
+    """
+    n = len(pontos)
+    if n == 0:
+        return np.array([], dtype=np.int64)
+    prazo = time.perf_counter() + tempo_max_s
+    inicio = np.asarray(partida, dtype=np.float64) if partida is not None else pontos.mean(axis=0)
+    if n <= LIMITE_VIZINHO_MAIS_PROXIMO:
+        ordem = _vizinho_mais_proximo(pontos, inicio)
+    else:
+        ordem = _curva_hilbert(pontos)
+    caminho = np.vstack([inicio, pontos[ordem]])
+    rotulos = np.concatenate([[-1], ordem])
+    _dois_opt(caminho, rotulos, prazo)
+    return rotulos[1:]
+
+
+def ordenar_por_grupos(pontos: np.ndarray, grupos: np.ndarray, partida: Optional[Sequence[float]] = None,
+                       tempo_max_s: float = 0.5) -> np.ndarray:
+    """
+    Visita um grupo (ex.: bairro) de cada vez: ordena os centroides dos grupos e, dentro de
+    cada grupo, os pontos a partir de onde terminou o grupo anterior. O tempo disponível é
+    repartido pelos grupos em proporção ao número de pontos.
+    """
+    n = len(pontos)
+    if n == 0:
+        return np.array([], dtype=np.int64)
+    prazo = time.perf_counter() + tempo_max_s
+    chaves, grupo_de = np.unique(grupos, return_inverse=True)
+    contagens = np.bincount(grupo_de, minlength=len(chaves))
+    centroides = np.column_stack([
+        np.bincount(grupo_de, weights=pontos[:, 0]) / contagens,
+        np.bincount(grupo_de, weights=pontos[:, 1]) / contagens,
+    ])
+    atual = np.asarray(partida, dtype=np.float64) if partida is not None else pontos.mean(axis=0)
+    ordem_grupos = ordenar_visitas(centroides, atual, tempo_max_s=tempo_max_s * 0.1)
+
+    partes = []
+    for g in ordem_grupos:
+        membros = np.flatnonzero(grupo_de == g)
+        restante = max(prazo - time.perf_counter(), 0.0)
+        ordem = ordenar_visitas(pontos[membros], atual, tempo_max_s=restante * len(membros) / n)
+        partes.append(membros[ordem])
+        atual = pontos[membros[ordem[-1]]]
+    return np.concatenate(partes)
+
+
+def distancias_percurso(pontos: np.ndarray, ordem: np.ndarray, partida: Optional[Sequence[float]] = None) -> np.ndarray:
+    """Distância (km) de cada paragem à anterior; a primeira mede-se desde a partida (0 sem partida)."""
+    if len(ordem) == 0:
+        return np.array([])
+    trajeto = pontos[ordem]
+    if partida is not None:
+        trajeto = np.vstack([np.asarray(partida, dtype=np.float64), trajeto])
+        return np.hypot(*np.diff(trajeto, axis=0).T)
+    return np.concatenate([[0.0], np.hypot(*np.diff(trajeto, axis=0).T)])
@@ -0,0 +1,49 @@
+from fastapi.responses import ORJSONResponse, JSONResponse
+from fastapi.encoders import jsonable_encoder
+from decimal import Decimal
+from typing import Any, Dict, List, Optional, Type
+from pydantic import BaseModel
+import orjson
+import os
+
+# Modo de serialização rápida para listagens (ligado por omissão; FAST_JSON_RESPONSES=0 desliga)
+FAST_JSON_RESPONSES = os.getenv("FAST_JSON_RESPONSES", "1").lower() in ("1", "true", "sim", "yes")
+
+
+def _orjson_default(valor):
+    # Decimal como texto, tal como o Pydantic faz em modo JSON (preserva as casas decimais)
+    if isinstance(valor, Decimal):
+        return str(valor)
+    raise TypeError
+
+
+def codificar_json(conteudo: Any) -> bytes:
+    return orjson.dumps(
+        conteudo,
+        default=_orjson_default,
+        option=orjson.OPT_UTC_Z | orjson.OPT_NON_STR_KEYS,
+    )
+
+
+class RespostaJSONRapida(ORJSONResponse):
+    """
+    Codifica as linhas do RealDictCursor diretamente com orjson.
+    datetime/date saem em ISO 8601 (UTC como 'Z'), idêntico à saída dos modelos Pydantic.
+    """
+
+    def render(self, content: Any) -> bytes:
+        return codificar_json(content)
+
+
+def responder_lista(linhas: List[dict], modelo: Type[BaseModel], cabecalhos: Optional[Dict[str, str]] = None):
+    """
+    Devolve uma listagem sem a dupla validação (modelo por linha + response_model).
+    Só deve ser usado quando as colunas selecionadas coincidem com os campos do modelo;
+    o response_model do endpoint continua a documentar o formato no OpenAPI.
+    """
+    if FAST_JSON_RESPONSES:
+        return RespostaJSONRapida(linhas, headers=cabecalhos)
+    itens = [modelo(**linha) for linha in linhas]
+    if cabecalhos:
+        return JSONResponse(jsonable_encoder(itens), headers=cabecalhos)
+    return itens
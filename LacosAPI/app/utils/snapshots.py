@@ -0,0 +1,143 @@
+"""
+Fotografias diárias da carteira (aging): faixa de atraso e saldo em aberto de cada empréstimo
+no fim de cada dia, numa tabela particionada por mês (carteira_snapshots), mais um resumo por
+dia e faixa (carteira_snapshots_resumo) para as séries temporais.
+"""
+import os
+from datetime import date, timedelta
+from typing import Callable, Dict, List, Optional
+
+from app.utils.particoes import garantir_particao, inicio_mes, nome_particao
+from app.utils.prestacoes import sql_total_devido
+
+# Partições (meses) mais antigas do que isto são removidas pelo trabalho diário; 0 = guardar tudo
+SNAPSHOT_RETENCAO_MESES = int(os.getenv("SNAPSHOT_RETENCAO_MESES", "0"))
+
+# Faixas de /api/dashboard/aging, mais os empréstimos ainda não vencidos (o universo difere:
+# ver tirar_snapshot)
+FAIXAS = ["corrente", "b0_30", "b31_60", "b61_90", "b90_plus"]
+# Portfolio at risk: saldo com mais de N dias de atraso, em função das faixas
+PAR = {"par1": ["b0_30", "b31_60", "b61_90", "b90_plus"], "par30": ["b31_60", "b61_90", "b90_plus"],
+       "par60": ["b61_90", "b90_plus"], "par90": ["b90_plus"]}
+
+
+def remover_particoes_antigas(cursor, hoje: date) -> List[str]:
+    if SNAPSHOT_RETENCAO_MESES <= 0:
+        return []
+    limite = inicio_mes(hoje)
+    for _ in range(SNAPSHOT_RETENCAO_MESES):
+        limite = inicio_mes(limite - timedelta(days=1))
+    cursor.execute("""
+        SELECT c.relname
+        FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = 'public.carteira_snapshots'::regclass
+        ORDER BY c.relname
+    """)
+    removidas = [r[0] for r in cursor.fetchall() if r[0] < nome_particao("carteira_snapshots", limite)]
+    for nome in removidas:
+        cursor.execute(f"DROP TABLE IF EXISTS public.{nome}")
+    cursor.execute("DELETE FROM carteira_snapshots_resumo WHERE data_snapshot < %s", (limite,))
+    return removidas
+
+
+def tirar_snapshot(cursor, d: date) -> int:
+    """
+    Grava a carteira tal como estava no fim do dia d (idempotente: substitui a desse dia).
+    Entram os empréstimos desembolsados até d com saldo em aberto nessa data, contando só os
+    pagamentos feitos até d; por isso também serve para reconstruir dias passados.
+
+    Ao contrário de /api/dashboard/aging, que só conta os empréstimos com status 'Ativo', não
+    se filtra pelo status: é o atual, não o de d, e deixaria de fora dias passados de empréstimos
+    entretanto pagos ou declarados inadimplentes (estes, com saldo, ficam na faixa do atraso).
+    """
+    garantir_particao(cursor, "carteira_snapshots", d)
+    cursor.execute("DELETE FROM carteira_snapshots WHERE data_snapshot = %s", (d,))
+    cursor.execute(f"""
+        INSERT INTO carteira_snapshots (data_snapshot, emprestimo_id, cliente_id, dias_atraso, faixa, total_devido, saldo)
+        SELECT %(d)s, x.emprestimo_id, x.cliente_id, x.dias,
+               CASE
+                   WHEN x.dias = 0 THEN 'corrente'
+                   WHEN x.dias <= 30 THEN 'b0_30'
+                   WHEN x.dias <= 60 THEN 'b31_60'
+                   WHEN x.dias <= 90 THEN 'b61_90'
+                   ELSE 'b90_plus'
+               END,
+               x.devido, x.saldo
+        FROM (
+            SELECT e.emprestimo_id, e.cliente_id,
+                   {sql_total_devido("e")} AS devido,
+                   GREATEST({sql_total_devido("e")} - COALESCE(p.pago, 0), 0) AS saldo,
+                   GREATEST(%(d)s::date - e.data_vencimento::date, 0) AS dias
+            FROM emprestimos e
+            LEFT JOIN (
+                SELECT emprestimo_id, SUM(valor_pago) AS pago
+                FROM pagamentos
+                WHERE data_pagamento < %(d)s::date + 1
+                GROUP BY emprestimo_id
+            ) p ON p.emprestimo_id = e.emprestimo_id
+            WHERE e.data_emprestimo < %(d)s::date + 1
+        ) x
+        WHERE x.saldo > 0
+    """, {"d": d})
+    linhas = cursor.rowcount
+    cursor.execute("DELETE FROM carteira_snapshots_resumo WHERE data_snapshot = %s", (d,))
+    cursor.execute("""
+        INSERT INTO carteira_snapshots_resumo (data_snapshot, faixa, emprestimos, saldo)
+        SELECT data_snapshot, faixa, COUNT(*), SUM(saldo)
+        FROM carteira_snapshots
+        WHERE data_snapshot = %s
+        GROUP BY data_snapshot, faixa
+    """, (d,))
+    return linhas
+
+
+def gerar_snapshots(conn, data_inicio: Optional[date] = None, data_fim: Optional[date] = None,
+                    progresso: Optional[Callable[[int, Optional[int]], None]] = None) -> dict:
+    """
+    Fotografa cada dia de [data_inicio, data_fim] (por omissão, só ontem: o último dia completo),
+    com um commit por dia, e aplica a retenção de partições.
+    """
+    ontem = date.today() - timedelta(days=1)
+    data_fim = data_fim or ontem
+    data_inicio = data_inicio or data_fim
+    dias = (data_fim - data_inicio).days + 1
+    cursor = conn.cursor()
+    linhas = 0
+    try:
+        for i in range(dias):
+            if progresso:
+                progresso(i, dias)
+            linhas += tirar_snapshot(cursor, data_inicio + timedelta(days=i))
+            conn.commit()
+        removidas = remover_particoes_antigas(cursor, date.today())
+        conn.commit()
+        if progresso:
+            progresso(dias, dias)
+        return {
+            "mensagem": f"{dias} fotografias da carteira gravadas",
+            "linhas_afetadas": linhas,
+            "particoes_removidas": removidas,
+        }
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+
+
+def indicadores(por_faixa: Dict[str, Dict[str, float]]) -> dict:
+    """Faixas (valor e quantidade) e PAR a partir do saldo e nº de empréstimos por faixa."""
+    saldo_total = sum(v["saldo"] for v in por_faixa.values())
+    return {
+        "saldo_total": round(saldo_total, 2),
+        "emprestimos": int(sum(v["emprestimos"] for v in por_faixa.values())),
+        "buckets": {
+            "valor": {f: round(por_faixa.get(f, {}).get("saldo", 0.0), 2) for f in FAIXAS},
+            "qtd_emprestimos": {f: int(por_faixa.get(f, {}).get("emprestimos", 0)) for f in FAIXAS},
+        },
+        "par": {
+            nome: round(sum(por_faixa.get(f, {}).get("saldo", 0.0) for f in faixas) / saldo_total, 4) if saldo_total else 0.0
+            for nome, faixas in PAR.items()
+        },
+    }
@@ -0,0 +1,390 @@
+import os
+import socket
+import threading
+import traceback
+from datetime import date, datetime, timezone
+from decimal import Decimal
+from typing import Callable, Dict, List, Optional
+
+import psycopg2.extras
+from fastapi import HTTPException
+
+from app.database.database import get_db_connection
+
+# Número de threads que executam tarefas neste processo (0 = só aceita submissões)
+TASK_WORKERS = int(os.getenv("TASK_WORKERS", "2"))
+TASK_POLL_INTERVAL_S = float(os.getenv("TASK_POLL_INTERVAL_S", "2"))
+# De quanto em quanto tempo o progresso é gravado e o pedido de cancelamento é lido
+TASK_HEARTBEAT_INTERVAL_S = float(os.getenv("TASK_HEARTBEAT_INTERVAL_S", "2"))
+# Uma tarefa "Em curso" sem sinal de vida há mais do que isto pertence a um processo que morreu
+TASK_HEARTBEAT_TIMEOUT_S = float(os.getenv("TASK_HEARTBEAT_TIMEOUT_S", "60"))
+TASK_MAX_ATTEMPTS = int(os.getenv("TASK_MAX_ATTEMPTS", "3"))
+
+_INSTANCIA = f"{socket.gethostname()}:{os.getpid()}"
+
+
+class TarefaCancelada(Exception):
+    pass
+
+
+class ContextoTarefa:
+    """Estado de uma tarefa em execução, partilhado entre a thread que a corre e o heartbeat."""
+
+    def __init__(self, tarefa: dict):
+        self.tarefa_id = tarefa["tarefa_id"]
+        self.parametros = tarefa.get("parametros") or {}
+        self.processados = 0
+        self.total: Optional[int] = None
+        self.cancelada = False
+
+    def progresso(self, processados: int, total: Optional[int] = None):
+        """Chamado pelo trabalho a cada iteração; só mexe em memória. Interrompe se houve cancelamento."""
+        self.processados = processados
+        if total is not None:
+            self.total = total
+        if self.cancelada:
+            raise TarefaCancelada()
+
+    def percentagem(self) -> Decimal:
+        if not self.total:
+            return Decimal(0)
+        return min(Decimal(100), (Decimal(self.processados) * 100 / self.total).quantize(Decimal("0.01")))
+
+
+def _penalizacoes(contexto: ContextoTarefa) -> dict:
+    from app.routes.penalizacoes import executar_penalizacoes_automaticas
+    r = executar_penalizacoes_automaticas(progresso=contexto.progresso)
+    return {"mensagem": r["mensagem"], "linhas_afetadas": len(r["detalhes"])}
+
+
+def _lembretes(contexto: ContextoTarefa) -> dict:
+    from app.routes.notificacoes import executar_verificacao_pagamentos
+    r = executar_verificacao_pagamentos(progresso=contexto.progresso)
+    return {"mensagem": r["mensagem"], "linhas_afetadas": len(r["notificacoes"])}
+
+
+def _historico_credito(contexto: ContextoTarefa) -> dict:
+    from app.routes.historico_credito import executar_atualizacao_historico
+    r = executar_atualizacao_historico(progresso=contexto.progresso)
+    return {"mensagem": r["mensagem"], "linhas_afetadas": len(r["historicos"])}
+
+
+def _cronogramas(contexto: ContextoTarefa) -> dict:
+    from app.utils.prestacoes import gerar_carteira
+    conn = get_db_connection()
+    try:
+        return gerar_carteira(conn, regenerar=bool(contexto.parametros.get("regenerar", False)), progresso=contexto.progresso)
+    finally:
+        conn.close()
+
+
+def _coortes(contexto: ContextoTarefa) -> dict:
+    from app.utils.coortes import atualizar_cubo
+    conn = get_db_connection()
+    try:
+        return atualizar_cubo(conn, completo=bool(contexto.parametros.get("completo", False)), progresso=contexto.progresso)
+    finally:
+        conn.close()
+
+
+def _snapshots(contexto: ContextoTarefa) -> dict:
+    from app.utils.snapshots import gerar_snapshots
+    p = contexto.parametros
+    conn = get_db_connection()
+    try:
+        return gerar_snapshots(
+            conn,
+            data_inicio=date.fromisoformat(p["data_inicio"]) if p.get("data_inicio") else None,
+            data_fim=date.fromisoformat(p["data_fim"]) if p.get("data_fim") else None,
+            progresso=contexto.progresso,
+        )
+    finally:
+        conn.close()
+
+
+def _duplicados(contexto: ContextoTarefa) -> dict:
+    from app.utils.duplicados import DUPLICADOS_LIMIAR, analisar_carteira
+    conn = get_db_connection()
+    try:
+        return analisar_carteira(conn, limiar=float(contexto.parametros.get("limiar", DUPLICADOS_LIMIAR)),
+                                 progresso=contexto.progresso)
+    finally:
+        conn.close()
+
+
+def _arquivo_notificacoes(contexto: ContextoTarefa) -> dict:
+    from app.utils.arquivo_notificacoes import arquivar_notificacoes
+    dias = contexto.parametros.get("dias")
+    conn = get_db_connection()
+    try:
+        return arquivar_notificacoes(conn, dias=int(dias) if dias is not None else None, progresso=contexto.progresso)
+    finally:
+        conn.close()
+
+
+def _particoes(contexto: ContextoTarefa) -> dict:
+    from app.utils.particoes import TABELAS_PARTICIONADAS, manter_particoes, migrar_para_particoes
+    conn = get_db_connection()
+    try:
+        migradas = []
+        if contexto.parametros.get("migrar"):
+            migradas = [migrar_para_particoes(conn, tabela) for tabela in TABELAS_PARTICIONADAS]
+        resultado = manter_particoes(conn, progresso=contexto.progresso)
+        if migradas:
+            resultado["migracao"] = migradas
+        return resultado
+    finally:
+        conn.close()
+
+
+def _dashboard_cache(contexto: ContextoTarefa) -> dict:
+    """Recalcula os painéis do dashboard. A cache é em memória, pelo que só aquece este processo."""
+    from app.routes import dashboard
+    months = int(contexto.parametros.get("months", 6))
+    paineis = [
+        ("resumo", dashboard.obter_resumo_dashboard, {}),
+        ("trends", dashboard.obter_trends, {"months": months}),
+        ("aging", dashboard.obter_aging, {}),
+        ("top-clientes[saldo]", dashboard.obter_top_clientes, {"metric": "saldo", "limit": 10}),
+        ("top-clientes[atraso]", dashboard.obter_top_clientes, {"metric": "atraso", "limit": 10}),
+        ("top-clientes[pagos_mes]", dashboard.obter_top_clientes, {"metric": "pagos_mes", "limit": 10}),
+        ("distribuicoes", dashboard.obter_distribuicoes, {}),
+        ("notificacoes-metricas", dashboard.obter_notificacoes_metricas, {}),
+        ("eficiencia-cobranca", dashboard.obter_eficiencia_cobranca, {"months": months}),
+        ("clientes/insights", dashboard.obter_clientes_insights, {"limit": 20}),
+    ]
+    dashboard._CACHE.clear()
+    for i, (_, funcao, kwargs) in enumerate(paineis):
+        contexto.progresso(i, len(paineis))
+        funcao(funcionario_atual=None, use_cache=True, refresh=True, **kwargs)
+    contexto.progresso(len(paineis), len(paineis))
+    return {"mensagem": f"{len(paineis)} painéis do dashboard recalculados", "paineis": [p[0] for p in paineis]}
+
+
+EXECUTORES: Dict[str, Callable[[ContextoTarefa], dict]] = {
+    "penalizacoes": _penalizacoes,
+    "lembretes": _lembretes,
+    "historico-credito": _historico_credito,
+    "dashboard-cache": _dashboard_cache,
+    "cronogramas": _cronogramas,
+    "coortes": _coortes,
+    "snapshots": _snapshots,
+    "duplicados": _duplicados,
+    "arquivo-notificacoes": _arquivo_notificacoes,
+    "particoes": _particoes,
+}
+
+
+def submeter_tarefa(tipo: str, parametros: dict, criado_por: Optional[str]) -> dict:
+    conn = get_db_connection()
+    cursor = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
+    try:
+        cursor.execute("""
+            INSERT INTO tarefas (tipo, parametros, estado, criado_por)
+            VALUES (%s, %s, 'Pendente', %s)
+            RETURNING *
+        """, (tipo, psycopg2.extras.Json(parametros or {}), criado_por))
+        tarefa = cursor.fetchone()
+        conn.commit()
+    finally:
+        cursor.close()
+        conn.close()
+    gestor.acordar()
+    return tarefa
+
+
+def cancelar_tarefa(tarefa_id: int) -> Optional[dict]:
+    """
+    Pendente passa logo a Cancelada; Em curso fica marcada e pára no próximo heartbeat.
+    Devolve None se a tarefa não existir.
+    """
+    conn = get_db_connection()
+    cursor = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
+    try:
+        cursor.execute("""
+            UPDATE tarefas
+            SET cancelamento_pedido = TRUE,
+                estado = CASE WHEN estado = 'Pendente' THEN 'Cancelada' ELSE estado END,
+                terminada_em = CASE WHEN estado = 'Pendente' THEN now() ELSE terminada_em END
+            WHERE tarefa_id = %s AND estado IN ('Pendente', 'Em curso')
+            RETURNING *
+        """, (tarefa_id,))
+        tarefa = cursor.fetchone()
+        if tarefa is None:
+            cursor.execute("SELECT * FROM tarefas WHERE tarefa_id = %s", (tarefa_id,))
+            tarefa = cursor.fetchone()
+        conn.commit()
+        return tarefa
+    finally:
+        cursor.close()
+        conn.close()
+
+
+class GestorTarefas:
+    """
+    Conjunto de threads que retiram tarefas Pendentes da tabela (FOR UPDATE SKIP LOCKED) e
+    as executam. O estado vive na tabela tarefas, por isso um reinício não perde nada:
+    as tarefas que ficaram Em curso sem heartbeat voltam a Pendente (até TASK_MAX_ATTEMPTS).
+    """
+
+    def __init__(self, trabalhadores: int):
+        self.trabalhadores = trabalhadores
+        self._parar = threading.Event()
+        self._novas = threading.Event()
+        self._threads: List[threading.Thread] = []
+        self._ativas: Dict[int, ContextoTarefa] = {}
+        self._lock = threading.Lock()
+
+    def iniciar(self):
+        if self._threads or self.trabalhadores <= 0:
+            return
+        self._parar.clear()
+        for i in range(self.trabalhadores):
+            t = threading.Thread(target=self._ciclo, name=f"tarefas-{i}", daemon=True)
+            t.start()
+            self._threads.append(t)
+        t = threading.Thread(target=self._ciclo_heartbeat, name="tarefas-heartbeat", daemon=True)
+        t.start()
+        self._threads.append(t)
+
+    def parar(self):
+        self._parar.set()
+        self._novas.set()
+        for t in self._threads:
+            t.join(timeout=5)
+        self._threads = []
+
+    def acordar(self):
+        self._novas.set()
+
+    def _reclamar(self) -> Optional[dict]:
+        conn = get_db_connection()
+        cursor = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
+        try:
+            cursor.execute("""
+                UPDATE tarefas
+                SET estado = 'Em curso', iniciada_em = now(), heartbeat_em = now(),
+                    tentativas = tentativas + 1, instancia = %s
+                WHERE tarefa_id = (
+                    SELECT tarefa_id FROM tarefas
+                    WHERE estado = 'Pendente'
+                    ORDER BY tarefa_id
+                    FOR UPDATE SKIP LOCKED
+                    LIMIT 1
+                )
+                RETURNING *
+            """, (_INSTANCIA,))
+            tarefa = cursor.fetchone()
+            conn.commit()
+            return tarefa
+        finally:
+            cursor.close()
+            conn.close()
+
+    def _executar(self, tarefa: dict):
+        contexto = ContextoTarefa(tarefa)
+        with self._lock:
+            self._ativas[contexto.tarefa_id] = contexto
+        estado, resultado, erro = "Concluida", None, None
+        try:
+            if tarefa.get("cancelamento_pedido"):
+                raise TarefaCancelada()
+            resultado = EXECUTORES[tarefa["tipo"]](contexto)
+            if contexto.total is not None:
+                contexto.processados = contexto.total
+        except TarefaCancelada:
+            estado = "Cancelada"
+        except HTTPException as e:
+            estado, erro = "Erro", str(e.detail)
+        except Exception:
+            estado, erro = "Erro", traceback.format_exc(limit=5)
+        finally:
+            with self._lock:
+                self._ativas.pop(contexto.tarefa_id, None)
+
+        conn = get_db_connection()
+        cursor = conn.cursor()
+        try:
+            cursor.execute("""
+                UPDATE tarefas
+                SET estado = %s, resultado = %s, erro = %s, processados = %s, total = %s,
+                    progresso = %s, terminada_em = now(), heartbeat_em = now()
+                WHERE tarefa_id = %s
+            """, (
+                estado,
+                psycopg2.extras.Json(resultado) if resultado is not None else None,
+                erro,
+                contexto.processados,
+                contexto.total,
+                Decimal(100) if estado == "Concluida" else contexto.percentagem(),
+                contexto.tarefa_id,
+            ))
+            conn.commit()
+        finally:
+            cursor.close()
+            conn.close()
+
+    def _ciclo(self):
+        while not self._parar.is_set():
+            try:
+                tarefa = self._reclamar()
+            except Exception as e:
+                print(f"Erro ao obter tarefa: {e}")
+                tarefa = None
+            if tarefa is None:
+                self._novas.wait(TASK_POLL_INTERVAL_S)
+                self._novas.clear()
+                continue
+            self._executar(tarefa)
+
+    def _recuperar_orfas(self, cursor):
+        cursor.execute("""
+            UPDATE tarefas
+            SET estado = CASE
+                    WHEN cancelamento_pedido THEN 'Cancelada'
+                    WHEN tentativas >= %s THEN 'Erro'
+                    ELSE 'Pendente'
+                END,
+                erro = CASE WHEN tentativas >= %s AND NOT cancelamento_pedido
+                            THEN 'Interrompida demasiadas vezes (processo terminou durante a execução)'
+                            ELSE erro END,
+                terminada_em = CASE WHEN cancelamento_pedido OR tentativas >= %s THEN now() ELSE NULL END
+            WHERE estado = 'Em curso'
+            AND heartbeat_em < now() - make_interval(secs => %s)
+        """, (TASK_MAX_ATTEMPTS, TASK_MAX_ATTEMPTS, TASK_MAX_ATTEMPTS, TASK_HEARTBEAT_TIMEOUT_S))
+        if cursor.rowcount:
+            self.acordar()
+
+    def _ciclo_heartbeat(self):
+        """Grava o progresso das tarefas deste processo, lê pedidos de cancelamento e recupera órfãs."""
+        while not self._parar.wait(TASK_HEARTBEAT_INTERVAL_S):
+            with self._lock:
+                ativas = list(self._ativas.values())
+            try:
+                conn = get_db_connection()
+                cursor = conn.cursor()
+                try:
+                    if ativas:
+                        canceladas = psycopg2.extras.execute_values(cursor, """
+                            UPDATE tarefas t
+                            SET heartbeat_em = now(), processados = v.processados,
+                                total = v.total, progresso = v.progresso
+                            FROM (VALUES %s) AS v(tarefa_id, processados, total, progresso)
+                            WHERE t.tarefa_id = v.tarefa_id
+                            RETURNING t.tarefa_id, t.cancelamento_pedido
+                        """, [(c.tarefa_id, c.processados, c.total, c.percentagem()) for c in ativas],
+                            template="(%s::bigint, %s::integer, %s::integer, %s::numeric)", fetch=True)
+                        pedidos = {tarefa_id for tarefa_id, pedido in canceladas if pedido}
+                        for c in ativas:
+                            if c.tarefa_id in pedidos:
+                                c.cancelada = True
+                    self._recuperar_orfas(cursor)
+                    conn.commit()
+                finally:
+                    cursor.close()
+                    conn.close()
+            except Exception as e:
+                print(f"Erro no heartbeat das tarefas: {e}")
+
+
+gestor = GestorTarefas(TASK_WORKERS)
@@ -0,0 +1,279 @@
+"""
+Benchmarks dos endpoints mais usados e dos trabalhos automáticos, com a aplicação em processo.
+
+Corre a API através do TestClient (sem uvicorn nem rede) contra uma base já semeada com
+benchmarks/gerar_dados.py, mede latência p50/p95/p99 e débito, e grava tudo em JSON.
+Com --comparar, assinala regressões face a um ficheiro de baseline gravado anteriormente.
+
+Uso:
+    python -m benchmarks.executar --saida resultados.json
+    python -m benchmarks.executar --saida atual.json --comparar baseline.json --tolerancia 0.15
+    python -m benchmarks.executar --filtro dashboard --iteracoes 50
+
+Atenção: pagamentos/criar e os trabalhos automáticos escrevem na base. Volte a gerar os
+dados antes de gravar uma baseline para que as execuções sejam comparáveis.
+"""
+import argparse
+import json
+import math
+import os
+import platform
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+
+ROTAS_LISTAR = [
+    "clientes", "localizacoes", "documentos", "funcionarios", "emprestimos", "pagamentos",
+    "penalizacoes", "outros_ganhos", "penhor", "testemunhas", "notificacoes",
+    "historico-credito", "ocupacoes", "auth-clientes",
+]
+
+ROTAS_DASHBOARD = [
+    ("resumo", {}),
+    ("trends", {"months": 12}),
+    ("aging", {}),
+    ("top-clientes", {"metric": "saldo"}),
+    ("top-clientes", {"metric": "atraso"}),
+    ("top-clientes", {"metric": "pagos_mes"}),
+    ("distribuicoes", {}),
+    ("notificacoes-metricas", {}),
+    ("eficiencia-cobranca", {"months": 12}),
+    ("clientes/insights", {}),
+    ("previsao-fluxo", {"dias": 90}),
+    ("cobertura", {}),
+    ("aging", {"cobertura_max": 1}),
+]
+
+# Termos típicos do balcão: parte do nome, telefone e número de documento
+PESQUISAS_CLIENTES = ["mar", "maria coss", "8412", "84000123", "110"]
+
+TRABALHOS = [
+    ("penalizacoes", "/api/penalizacoes/aplicar-automatico"),
+    ("lembretes", "/api/notificacoes/verificar-pagamentos"),
+    ("historico-credito", "/api/historico-credito/atualizar-automatico"),
+]
+
+
+def percentil(amostras, p):
+    """Percentil pelo método nearest-rank (amostras já ordenadas)."""
+    if not amostras:
+        return None
+    k = max(0, min(len(amostras) - 1, math.ceil(p / 100 * len(amostras)) - 1))
+    return amostras[k]
+
+
+def medir(funcao, iteracoes, aquecimento=0):
+    for _ in range(aquecimento):
+        funcao()
+    duracoes = []
+    erros = 0
+    inicio_total = time.perf_counter()
+    for _ in range(iteracoes):
+        inicio = time.perf_counter()
+        ok = funcao()
+        duracoes.append((time.perf_counter() - inicio) * 1000)
+        if not ok:
+            erros += 1
+    total = time.perf_counter() - inicio_total
+    duracoes.sort()
+    return {
+        "iteracoes": iteracoes,
+        "erros": erros,
+        "p50_ms": round(percentil(duracoes, 50), 3),
+        "p95_ms": round(percentil(duracoes, 95), 3),
+        "p99_ms": round(percentil(duracoes, 99), 3),
+        "media_ms": round(sum(duracoes) / len(duracoes), 3),
+        "min_ms": round(duracoes[0], 3),
+        "max_ms": round(duracoes[-1], 3),
+        "debito_por_s": round(iteracoes / total, 2) if total > 0 else None,
+    }
+
+
+def _preparar_funcionario(utilizador, senha):
+    """Garante um funcionário Administrador com credenciais conhecidas para os benchmarks."""
+    from app.database.database import get_db_connection
+    from app.utils.auth import get_password_hash
+
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    try:
+        cursor.execute("""
+            INSERT INTO funcionarios (username, senha, nome_completo, email, nivel_acesso, ativo)
+            VALUES (%s, %s, %s, %s, 'Administrador', TRUE)
+            ON CONFLICT (username) DO UPDATE SET senha = EXCLUDED.senha
+        """, (utilizador, get_password_hash(senha), "Benchmark", f"{utilizador}@benchmark.local"))
+        conn.commit()
+    finally:
+        cursor.close()
+        conn.close()
+
+
+def _emprestimos_ativos(quantidade):
+    from app.database.database import get_db_connection
+
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    try:
+        cursor.execute(
+            "SELECT emprestimo_id, cliente_id FROM emprestimos WHERE status = 'Ativo' ORDER BY emprestimo_id LIMIT %s",
+            (quantidade,),
+        )
+        return cursor.fetchall()
+    finally:
+        cursor.close()
+        conn.close()
+
+
+def construir_casos(cliente, cabecalhos, utilizador, senha, args):
+    """Lista de (nome, grupo, função, iterações, aquecimento). Cada função devolve True em caso de sucesso."""
+    casos = []
+    n = args.iteracoes
+
+    def pedido(metodo, url, **kwargs):
+        def executar():
+            r = cliente.request(metodo, url, headers=cabecalhos, **kwargs)
+            return r.status_code < 400
+        return executar
+
+    def login():
+        r = cliente.post("/api/auth/token", data={"username": utilizador, "password": senha})
+        return r.status_code == 200
+
+    casos.append(("auth/token", "login", login, max(5, n // 10), 1))
+
+    emprestimos = _emprestimos_ativos(max(n, 1))
+    if emprestimos:
+        contador = {"i": 0}
+
+        def criar_pagamento():
+            emprestimo_id, cliente_id = emprestimos[contador["i"] % len(emprestimos)]
+            contador["i"] += 1
+            r = cliente.post("/api/pagamentos/criar", headers=cabecalhos, json={
+                "emprestimo_id": emprestimo_id,
+                "cliente_id": cliente_id,
+                "valor_pago": "10.00",
+                "data_pagamento": datetime.now(timezone.utc).isoformat(),
+                "metodo_pagamento": "M-Pesa",
+                "referencia_pagamento": f"BENCH-{contador['i']}",
+            })
+            return r.status_code == 200
+
+        casos.append(("pagamentos/criar", "escrita", criar_pagamento, n, 2))
+
+    for rota in ROTAS_LISTAR:
+        casos.append((f"{rota}/listar", "listar", pedido("GET", f"/api/{rota}/listar", params={"limite": args.limite}), n, 2))
+
+    for termo in PESQUISAS_CLIENTES:
+        casos.append((f"clientes/pesquisar[{termo}]", "pesquisa", pedido("GET", "/api/clientes/pesquisar", params={"q": termo}), n, 2))
+
+    for rota, params in ROTAS_DASHBOARD:
+        nome = f"dashboard/{rota}" + "".join(f"[{v}]" for v in params.values())
+        url = f"/api/dashboard/{rota}"
+        casos.append((f"{nome}:frio", "dashboard", pedido("GET", url, params={**params, "refresh": True}), n, 1))
+        casos.append((f"{nome}:quente", "dashboard", pedido("GET", url, params=params), n, 1))
+
+    for nome, url in TRABALHOS:
+        casos.append((f"trabalho/{nome}", "trabalhos", pedido("POST", url), args.iteracoes_trabalhos, 0))
+
+    return casos
+
+
+def comparar(atual, baseline, tolerancia):
+    """Devolve a lista de regressões de p95 acima da tolerância relativa (ex.: 0.10 = +10%)."""
+    regressoes = []
+    for nome, r in atual["resultados"].items():
+        base = baseline.get("resultados", {}).get(nome)
+        if not base or not base.get("p95_ms"):
+            continue
+        variacao = (r["p95_ms"] - base["p95_ms"]) / base["p95_ms"]
+        linha = {"caso": nome, "p95_base_ms": base["p95_ms"], "p95_atual_ms": r["p95_ms"], "variacao": round(variacao, 4)}
+        if variacao > tolerancia:
+            regressoes.append(linha)
+    return regressoes
+
+
+def _commit_atual():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], stderr=subprocess.DEVNULL).decode().strip()
+    except Exception:
+        return None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmarks em processo da API Lacos Microcrédito")
+    parser.add_argument("--dsn", help="Substitui DATABASE_URL (base semeada com benchmarks.gerar_dados)")
+    parser.add_argument("--saida", default="benchmark_resultados.json")
+    parser.add_argument("--comparar", help="Ficheiro JSON de baseline para detetar regressões")
+    parser.add_argument("--tolerancia", type=float, default=0.10, help="Aumento relativo de p95 tolerado")
+    parser.add_argument("--iteracoes", type=int, default=30)
+    parser.add_argument("--iteracoes-trabalhos", type=int, default=3)
+    parser.add_argument("--limite", type=int, default=100, help="Tamanho de página nos /listar")
+    parser.add_argument("--filtro", help="Só corre casos cujo nome ou grupo contenha este texto")
+    parser.add_argument("--utilizador", default="benchmark")
+    parser.add_argument("--senha", default="Benchmark@2024!")
+    args = parser.parse_args(argv)
+
+    if args.dsn:
+        os.environ["DATABASE_URL"] = args.dsn
+
+    # Importar só depois de definir DATABASE_URL
+    from fastapi.testclient import TestClient
+    from main import app
+    from app.routes import auth, dashboard
+    from app.utils import previsao
+
+    # O limite de 5 logins / 5 min impediria medir o login
+    auth.limiter.enabled = False
+
+    _preparar_funcionario(args.utilizador, args.senha)
+    cliente = TestClient(app)
+    r = cliente.post("/api/auth/token", data={"username": args.utilizador, "password": args.senha})
+    if r.status_code != 200:
+        print(f"[ERRO] Falha na autenticação: {r.status_code} - {r.text}")
+        return 2
+    cabecalhos = {"Authorization": f"Bearer {r.json()['access_token']}"}
+
+    resultados = {}
+    for nome, grupo, funcao, iteracoes, aquecimento in construir_casos(cliente, cabecalhos, args.utilizador, args.senha, args):
+        if args.filtro and args.filtro not in nome and args.filtro != grupo:
+            continue
+        if grupo == "dashboard":
+            # Cada caso parte de cache vazia; no caso "quente" o aquecimento preenche-a
+            dashboard._CACHE.clear()
+            previsao._CACHE.clear()
+        r = medir(funcao, iteracoes, aquecimento)
+        r["grupo"] = grupo
+        resultados[nome] = r
+        print(f"{nome:<48} p50={r['p50_ms']:>9.2f}ms p95={r['p95_ms']:>9.2f}ms p99={r['p99_ms']:>9.2f}ms "
+              f"{r['debito_por_s'] or 0:>8.1f}/s erros={r['erros']}")
+
+    saida = {
+        "meta": {
+            "data": datetime.now(timezone.utc).isoformat(),
+            "commit": _commit_atual(),
+            "python": platform.python_version(),
+            "iteracoes": args.iteracoes,
+            "limite": args.limite,
+        },
+        "resultados": resultados,
+    }
+    with open(args.saida, "w", encoding="utf-8") as f:
+        json.dump(saida, f, indent=2, ensure_ascii=False)
+    print(f"Resultados gravados em {args.saida}")
+
+    if args.comparar:
+        with open(args.comparar, encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressoes = comparar(saida, baseline, args.tolerancia)
+        if regressoes:
+            print(f"[REGRESSÃO] {len(regressoes)} casos com p95 acima de +{args.tolerancia:.0%}:")
+            for reg in regressoes:
+                print(f"  {reg['caso']}: {reg['p95_base_ms']}ms -> {reg['p95_atual_ms']}ms ({reg['variacao']:+.1%})")
+            return 1
+        print("[OK] Sem regressões face à baseline")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,392 @@
+"""
+Gerador determinístico de carteira sintética para testes de carga e benchmarks.
+
+Carrega clientes, ocupações, documentos (apenas metadados), empréstimos, pagamentos,
+penalizações e notificações numa base PostgreSQL local usando COPY. Com a mesma semente,
+a mesma data de referência e as mesmas contagens, os dados gerados são idênticos.
+
+Uso:
+    python -m benchmarks.gerar_dados --semente 42 --escala 0.01 --truncar
+    python -m benchmarks.gerar_dados --config distribuicoes.json --data-referencia 2026-03-31
+
+As distribuições (métodos de pagamento, atraso, categorias de risco, ...) podem ser
+substituídas por um ficheiro JSON com as mesmas chaves de DISTRIBUICOES_PADRAO.
+"""
+import argparse
+import json
+import random
+import sys
+import time
+from array import array
+from datetime import date, datetime, timedelta, timezone
+
+import psycopg2
+
+from app.database.database import DATABASE_URL
+from app.utils.particoes import manter_particoes
+from app.utils.prestacoes import FATOR_TOTAL_PADRAO
+
+DISTRIBUICOES_PADRAO = {
+    "metodo_pagamento": {
+        "M-Pesa": 0.45,
+        "Numerario": 0.20,
+        "E-Mola": 0.15,
+        "Transferência Bancária": 0.10,
+        "MKesh": 0.07,
+        "Outro": 0.03,
+    },
+    # Atraso do último pagamento face ao vencimento; "incumprimento" nunca liquida
+    "atraso": {
+        "em_dia": 0.70,
+        "1_30": 0.14,
+        "31_90": 0.08,
+        "90_mais": 0.04,
+        "incumprimento": 0.04,
+    },
+    "categoria_risco": {
+        "Muito Baixo": 0.10,
+        "Baixo": 0.30,
+        "Medio": 0.35,
+        "Alto": 0.18,
+        "Muito Alto": 0.07,
+    },
+    "sexo": {"Feminino": 0.58, "Masculino": 0.41, "Outro": 0.01},
+    "prazo_dias": {"30": 0.40, "60": 0.30, "90": 0.20, "180": 0.10},
+    "status_notificacao": {"Enviado": 0.55, "Lido": 0.25, "Pendente": 0.20},
+}
+
+FAIXAS_ATRASO = {
+    "em_dia": (0, 0),
+    "1_30": (1, 30),
+    "31_90": (31, 90),
+    "90_mais": (91, 365),
+    "incumprimento": (0, 0),
+}
+
+TIPOS_NOTIFICACAO = [
+    "Lembrete de Pagamento", "Atraso no Pagamento", "Confirmação de Pagamento",
+    "Confirmação de Empréstimo", "Penalização Aplicada", "Outro",
+]
+SETORES = ["Primario", "Secundario", "Terciario", "Quaternario"]
+ESTABILIDADES = ["Alta", "Media", "Baixa", "Sazonal"]
+OCUPACOES = [
+    ("AGR", "Agricultor"), ("COM", "Comerciante"), ("VEN", "Vendedor Ambulante"),
+    ("PES", "Pescador"), ("COS", "Costureira"), ("MOT", "Motorista"),
+    ("PRO", "Professor"), ("ENF", "Enfermeiro"), ("PED", "Pedreiro"), ("CAB", "Cabeleireira"),
+]
+NOMES = [
+    "Ana", "Maria", "Fátima", "Luísa", "Celeste", "Joana", "Rosa", "Helena", "Graça", "Teresa",
+    "João", "José", "Carlos", "António", "Manuel", "Armando", "Paulo", "Samuel", "Alberto", "Filipe",
+]
+APELIDOS = [
+    "Massinga", "Machava", "Cossa", "Nhantumbo", "Sitoe", "Mondlane", "Chissano", "Mabunda",
+    "Langa", "Tembe", "Macuácua", "Muianga", "Bila", "Nhaca", "Zandamela", "Cumbe",
+]
+
+
+class _FonteCopy:
+    """Adapta um gerador de linhas ao objeto tipo ficheiro esperado por copy_expert (memória constante)."""
+
+    def __init__(self, linhas):
+        self._linhas = linhas
+        self._resto = ""
+
+    def read(self, tamanho=-1):
+        partes = [self._resto]
+        total = len(self._resto)
+        for linha in self._linhas:
+            partes.append(linha)
+            total += len(linha)
+            if 0 < tamanho <= total:
+                break
+        dados = "".join(partes)
+        if tamanho > 0:
+            self._resto = dados[tamanho:]
+            return dados[:tamanho]
+        self._resto = ""
+        return dados
+
+
+def _escolha(rng, distribuicao):
+    """Devolve uma função que sorteia uma chave de acordo com os pesos da distribuição."""
+    chaves = list(distribuicao.keys())
+    acumulados = []
+    soma = 0.0
+    for k in chaves:
+        soma += float(distribuicao[k])
+        acumulados.append(soma)
+
+    def sortear():
+        return rng.choices(chaves, cum_weights=acumulados)[0]
+
+    return sortear
+
+
+def _campo(valor):
+    return "\\N" if valor is None else str(valor)
+
+
+def _linha(*valores):
+    return "\t".join(_campo(v) for v in valores) + "\n"
+
+
+def _ts(dia_ordinal, segundos=0):
+    d = date.fromordinal(dia_ordinal)
+    return datetime(d.year, d.month, d.day, tzinfo=timezone.utc) + timedelta(seconds=segundos)
+
+
+def _copiar(cursor, tabela, colunas, linhas):
+    inicio = time.perf_counter()
+    cursor.copy_expert(
+        f"COPY {tabela} ({', '.join(colunas)}) FROM STDIN WITH (FORMAT text)",
+        _FonteCopy(linhas),
+    )
+    print(f"  {tabela}: {cursor.rowcount} linhas em {time.perf_counter() - inicio:.1f}s")
+
+
+def _ids_inseridos(cursor, tabela, coluna_id, quantidade):
+    """IDs gerados pelo COPY, pela ordem de inserção (assume que não há escritas concorrentes)."""
+    cursor.execute(f"SELECT {coluna_id} FROM {tabela} ORDER BY {coluna_id} DESC LIMIT %s", (quantidade,))
+    ids = array("q", (r[0] for r in cursor.fetchall()))
+    ids.reverse()
+    return ids
+
+
+def gerar(conn, semente, contagens, distribuicoes, data_referencia, anos_historico=3):
+    cursor = conn.cursor()
+    ref = data_referencia.toordinal()
+    inicio_historico = ref - 365 * anos_historico
+
+    # Um gerador independente por tabela: mudar a contagem de uma não altera as restantes
+    def rng_para(nome):
+        return random.Random(f"{semente}:{nome}")
+
+    cursor.execute("SELECT COALESCE(MAX(cliente_id), 0) FROM clientes")
+    deslocamento = int(cursor.fetchone()[0])
+
+    # CLIENTES
+    rng = rng_para("clientes")
+    sortear_sexo = _escolha(rng, distribuicoes["sexo"])
+    n_clientes = contagens["clientes"]
+    cadastro = array("l")
+
+    def linhas_clientes():
+        for i in range(n_clientes):
+            seq = deslocamento + i + 1
+            sexo = sortear_sexo()
+            nome = f"{rng.choice(NOMES)} {rng.choice(APELIDOS)} {rng.choice(APELIDOS)}"
+            telefone = f"8{rng.choice('234567')}{seq:08d}"
+            email = f"cliente{seq}@exemplo.co.mz" if rng.random() < 0.8 else None
+            nacionalidade = "Moçambicana" if rng.random() < 0.95 else "Estrangeira"
+            dia_cadastro = rng.randint(inicio_historico, ref)
+            cadastro.append(dia_cadastro)
+            nascimento = date.fromordinal(ref - rng.randint(18 * 365, 70 * 365))
+            yield _linha(nome, sexo, telefone, email, nacionalidade,
+                         _ts(dia_cadastro, rng.randint(0, 86399)).isoformat(), nascimento.isoformat())
+
+    _copiar(cursor, "clientes",
+            ["nome", "sexo", "telefone", "email", "nacionalidade", "data_cadastro", "data_nascimento"],
+            linhas_clientes())
+    clientes = _ids_inseridos(cursor, "clientes", "cliente_id", n_clientes)
+
+    # OCUPACOES (uma ativa por cliente)
+    rng = rng_para("ocupacoes")
+    sortear_risco = _escolha(rng, distribuicoes["categoria_risco"])
+
+    def linhas_ocupacoes():
+        for cliente_id in clientes:
+            codigo, nome = rng.choice(OCUPACOES)
+            renda = round(rng.lognormvariate(9.0, 0.6), 2)
+            yield _linha(cliente_id, codigo, nome, sortear_risco(), f"{renda:.2f}",
+                         rng.choice(SETORES), rng.choice(ESTABILIDADES), "true")
+
+    _copiar(cursor, "ocupacoes",
+            ["cliente_id", "codigo", "nome", "categoria_risco", "renda_minima",
+             "setor_economico", "estabilidade_emprego", "ativo"],
+            linhas_ocupacoes())
+
+    # DOCUMENTOS (apenas metadados, sem arquivo)
+    rng = rng_para("documentos")
+
+    def linhas_documentos():
+        for i in range(contagens["documentos"]):
+            cliente_id = clientes[i % n_clientes] if i < n_clientes else clientes[rng.randrange(n_clientes)]
+            tipo = "BI" if i < n_clientes else rng.choice(["NUIT", "Passaporte", "Comprovativo de Residencia"])
+            yield _linha(cliente_id, tipo, f"{tipo[:2].upper()}{deslocamento + i + 1:012d}")
+
+    _copiar(cursor, "documentos", ["cliente_id", "tipo_documento", "numero_documento"], linhas_documentos())
+
+    # EMPRESTIMOS
+    rng = rng_para("emprestimos")
+    sortear_atraso = _escolha(rng, distribuicoes["atraso"])
+    sortear_prazo = _escolha(rng, distribuicoes["prazo_dias"])
+    n_emprestimos = contagens["emprestimos"]
+    emp_cliente = array("q")
+    emp_valor = array("q")        # em centavos
+    emp_inicio = array("l")
+    emp_vencimento = array("l")
+    emp_atraso = array("l")       # dias de atraso do último pagamento (-1 = incumprimento)
+    emp_fracao = array("d")       # fração de valor * 1.20 paga até à data de referência
+
+    def linhas_emprestimos():
+        for _ in range(n_emprestimos):
+            idx = rng.randrange(n_clientes)
+            cliente_id = clientes[idx]
+            inicio = rng.randint(cadastro[idx], ref)
+            vencimento = inicio + int(sortear_prazo())
+            valor = int(min(max(rng.lognormvariate(9.2, 0.7), 1000.0), 100000.0) * 100)
+            faixa = sortear_atraso()
+            if faixa == "incumprimento":
+                atraso = -1
+                fracao = rng.uniform(0.0, 0.5)
+                status = "Inadimplente" if vencimento < ref - 90 else "Ativo"
+            else:
+                minimo, maximo = FAIXAS_ATRASO[faixa]
+                atraso = rng.randint(minimo, maximo)
+                fim = vencimento + atraso
+                if fim <= ref:
+                    fracao, status = 1.0, "Pago"
+                else:
+                    fracao = min(0.95, max(0.0, (ref - inicio) / max(fim - inicio, 1)))
+                    status = "Ativo"
+            emp_cliente.append(cliente_id)
+            emp_valor.append(valor)
+            emp_inicio.append(inicio)
+            emp_vencimento.append(vencimento)
+            emp_atraso.append(atraso)
+            emp_fracao.append(fracao)
+            yield _linha(cliente_id, f"{valor / 100:.2f}", _ts(inicio, 36000).isoformat(),
+                         _ts(vencimento, 36000).isoformat(), status)
+
+    _copiar(cursor, "emprestimos",
+            ["cliente_id", "valor", "data_emprestimo", "data_vencimento", "status"],
+            linhas_emprestimos())
+    emprestimos = _ids_inseridos(cursor, "emprestimos", "emprestimo_id", n_emprestimos)
+
+    # PAGAMENTOS: a contagem total é repartida pelos empréstimos, datas até ao fim do atraso
+    rng = rng_para("pagamentos")
+    sortear_metodo = _escolha(rng, distribuicoes["metodo_pagamento"])
+    base, extra = divmod(contagens["pagamentos"], max(n_emprestimos, 1))
+
+    def linhas_pagamentos():
+        seq = 0
+        for i in range(n_emprestimos):
+            n = base + (1 if i < extra else 0)
+            total = int(emp_valor[i] * float(FATOR_TOTAL_PADRAO) * emp_fracao[i])
+            if n == 0 or total < n:
+                continue
+            atraso = emp_atraso[i]
+            fim = emp_vencimento[i] + (atraso if atraso >= 0 else rng.randint(0, 120))
+            fim = min(fim, ref)
+            inicio = min(emp_inicio[i] + 1, fim)
+            parcela = total // n
+            for k in range(n):
+                seq += 1
+                valor = parcela if k < n - 1 else total - parcela * (n - 1)
+                dia = inicio + (fim - inicio) * (k + 1) // n
+                yield _linha(emprestimos[i], emp_cliente[i], f"{valor / 100:.2f}",
+                             _ts(dia, rng.randint(28800, 64800)).isoformat(),
+                             sortear_metodo(), f"SIM-{semente}-{seq}")
+
+    _copiar(cursor, "pagamentos",
+            ["emprestimo_id", "cliente_id", "valor_pago", "data_pagamento", "metodo_pagamento", "referencia_pagamento"],
+            linhas_pagamentos())
+
+    # PENALIZACOES: uma por empréstimo vencido com atraso, até à contagem pedida
+    rng = rng_para("penalizacoes")
+
+    def linhas_penalizacoes():
+        restantes = contagens["penalizacoes"]
+        for i in range(n_emprestimos):
+            if restantes <= 0:
+                break
+            if emp_vencimento[i] >= ref or emp_atraso[i] == 0:
+                continue
+            atraso = emp_atraso[i] if emp_atraso[i] > 0 else ref - emp_vencimento[i]
+            dias = max(1, min(atraso, ref - emp_vencimento[i]))
+            valor = emp_valor[i] * 5 * dias // 100
+            restantes -= 1
+            yield _linha(emprestimos[i], emp_cliente[i], "Mora", dias, f"{valor / 100:.2f}", "aplicada",
+                         _ts(emp_vencimento[i] + dias, rng.randint(0, 86399)).isoformat())
+
+    _copiar(cursor, "penalizacoes",
+            ["emprestimo_id", "cliente_id", "tipo", "dias_atraso", "valor", "status", "data_aplicacao"],
+            linhas_penalizacoes())
+
+    # NOTIFICACOES (30% administrativas, sem cliente)
+    rng = rng_para("notificacoes")
+    sortear_status = _escolha(rng, distribuicoes["status_notificacao"])
+
+    def linhas_notificacoes():
+        for _ in range(contagens["notificacoes"]):
+            cliente_id = clientes[rng.randrange(n_clientes)] if rng.random() < 0.7 else None
+            tipo = rng.choice(TIPOS_NOTIFICACAO)
+            dia = rng.randint(inicio_historico, ref)
+            yield _linha(cliente_id, tipo, f"Notificação sintética: {tipo}",
+                         _ts(dia, rng.randint(0, 86399)).isoformat(), sortear_status())
+
+    _copiar(cursor, "notificacoes", ["cliente_id", "tipo", "mensagem", "data_envio", "status"], linhas_notificacoes())
+
+    conn.commit()
+    cursor.close()
+
+
+TABELAS = ["notificacoes", "penalizacoes", "pagamentos", "emprestimos", "documentos", "ocupacoes", "clientes"]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Carrega uma carteira sintética reprodutível no PostgreSQL")
+    parser.add_argument("--dsn", default=DATABASE_URL)
+    parser.add_argument("--semente", type=int, default=42)
+    parser.add_argument("--data-referencia", type=date.fromisoformat, default=date.today(),
+                        help="Data 'hoje' da carteira (AAAA-MM-DD); fixe-a para resultados reprodutíveis")
+    parser.add_argument("--anos-historico", type=int, default=3)
+    parser.add_argument("--escala", type=float, default=1.0, help="Multiplica todas as contagens (ex.: 0.01)")
+    parser.add_argument("--clientes", type=int, default=500_000)
+    parser.add_argument("--emprestimos", type=int, default=2_000_000)
+    parser.add_argument("--pagamentos", type=int, default=10_000_000)
+    parser.add_argument("--penalizacoes", type=int, default=300_000)
+    parser.add_argument("--notificacoes", type=int, default=3_000_000)
+    parser.add_argument("--documentos", type=int, default=750_000)
+    parser.add_argument("--config", help="Ficheiro JSON que substitui as distribuições padrão")
+    parser.add_argument("--truncar", action="store_true", help="Esvazia as tabelas geradas (e as dependentes, por CASCADE) antes de carregar")
+    args = parser.parse_args(argv)
+
+    contagens = {
+        nome: max(1, int(getattr(args, nome) * args.escala))
+        for nome in ["clientes", "emprestimos", "pagamentos", "penalizacoes", "notificacoes", "documentos"]
+    }
+    distribuicoes = {k: dict(v) for k, v in DISTRIBUICOES_PADRAO.items()}
+    if args.config:
+        with open(args.config, encoding="utf-8") as f:
+            for chave, valor in json.load(f).items():
+                if chave not in distribuicoes:
+                    print(f"Distribuição desconhecida: {chave}")
+                    return 1
+                distribuicoes[chave] = valor
+
+    conn = psycopg2.connect(args.dsn)
+    conn.set_client_encoding('UTF8')
+    try:
+        cursor = conn.cursor()
+        if args.truncar:
+            cursor.execute(f"TRUNCATE {', '.join(TABELAS)} RESTART IDENTITY CASCADE")
+            conn.commit()
+        print(f"A gerar carteira (semente={args.semente}, referência={args.data_referencia}): {contagens}")
+        inicio = time.perf_counter()
+        # Partições mensais de todo o histórico antes do COPY, para nada ficar na partição default
+        manter_particoes(conn, desde=args.data_referencia - timedelta(days=365 * args.anos_historico),
+                         hoje=args.data_referencia)
+        gerar(conn, args.semente, contagens, distribuicoes, args.data_referencia, args.anos_historico)
+        for tabela in TABELAS:
+            cursor.execute(f"ANALYZE {tabela}")
+        conn.commit()
+        cursor.close()
+        print(f"Concluído em {time.perf_counter() - inicio:.1f}s")
+    finally:
+        conn.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
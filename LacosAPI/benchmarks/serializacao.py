@@ -0,0 +1,71 @@
+"""
+Compara a serialização de uma página de /listar com e sem o modo rápido (orjson).
+
+Não precisa de base de dados: gera linhas com o mesmo formato que o RealDictCursor devolve
+para a tabela pagamentos e serve-as por dois endpoints com o mesmo response_model.
+
+Uso:
+    python -m benchmarks.serializacao --linhas 1000 --iteracoes 200
+"""
+import argparse
+import sys
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal
+from typing import List
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app.schemas.pagamento import Pagamento
+from app.utils.serializacao import RespostaJSONRapida
+from benchmarks.executar import medir
+
+
+def gerar_linhas(quantidade):
+    inicio = datetime(2026, 1, 1, 8, 0, tzinfo=timezone.utc)
+    return [
+        {
+            "pagamento_id": i,
+            "emprestimo_id": 1000 + i // 5,
+            "cliente_id": 500 + i // 10,
+            "valor_pago": Decimal(f"{(i % 97) * 13 + 100}.50"),
+            "data_pagamento": inicio + timedelta(hours=i),
+            "metodo_pagamento": "M-Pesa",
+            "referencia_pagamento": f"REF-{i:06d}",
+        }
+        for i in range(quantidade)
+    ]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serialização de listagens: Pydantic vs orjson")
+    parser.add_argument("--linhas", type=int, default=1000)
+    parser.add_argument("--iteracoes", type=int, default=200)
+    args = parser.parse_args(argv)
+
+    linhas = gerar_linhas(args.linhas)
+    app = FastAPI()
+
+    @app.get("/pydantic", response_model=List[Pagamento])
+    def via_pydantic():
+        return [Pagamento(**linha) for linha in linhas]
+
+    @app.get("/rapido", response_model=List[Pagamento])
+    def via_orjson():
+        return RespostaJSONRapida(linhas)
+
+    cliente = TestClient(app)
+    a = cliente.get("/pydantic").json()
+    b = cliente.get("/rapido").json()
+    if sorted(a, key=lambda x: x["pagamento_id"]) != sorted(b, key=lambda x: x["pagamento_id"]):
+        print("[ERRO] As duas serializações não produzem o mesmo JSON")
+        return 1
+
+    for nome in ("pydantic", "rapido"):
+        r = medir(lambda: cliente.get(f"/{nome}").status_code == 200, args.iteracoes, aquecimento=5)
+        print(f"{nome:<10} {args.linhas} linhas: p50={r['p50_ms']:.2f}ms p95={r['p95_ms']:.2f}ms {r['debito_por_s']:.1f}/s")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -108,20 +108,22 @@ CREATE TABLE public.localizacao (
         REFERENCES public.clientes(cliente_id) ON DELETE CASCADE
 );
 
--- NOTIFICACOES
+-- NOTIFICACOES (particionada por mês em data_envio, ver PARTIÇÕES MENSAIS)
 CREATE TABLE public.notificacoes (
-    notificacao_id bigint GENERATED ALWAYS AS IDENTITY PRIMARY KEY,
+    notificacao_id bigint GENERATED ALWAYS AS IDENTITY,
     cliente_id bigint,
     tipo text NOT NULL,
     mensagem text NOT NULL,
-    data_envio timestamp with time zone DEFAULT CURRENT_TIMESTAMP,
+    data_envio timestamp with time zone NOT NULL DEFAULT CURRENT_TIMESTAMP,
     status text DEFAULT 'Pendente',
+    CONSTRAINT notificacoes_pkey PRIMARY KEY (notificacao_id, data_envio),
     CONSTRAINT notificacoes_status_check CHECK (status IN ('Enviado','Lido','Pendente')),
     CONSTRAINT notificacoes_tipo_check CHECK (tipo IN ('Lembrete de Pagamento','Atraso no Pagamento',
         'Confirmação de Pagamento','Confirmação de Empréstimo','Penalização Aplicada','Outro')),
     CONSTRAINT notificacoes_cliente_id_fkey FOREIGN KEY (cliente_id)
         REFERENCES public.clientes(cliente_id) ON DELETE CASCADE
-);
+) PARTITION BY RANGE (data_envio);
+CREATE TABLE public.notificacoes_default PARTITION OF public.notificacoes DEFAULT;
 
 -- OCUPACOES
 CREATE TABLE public.ocupacoes (
@@ -152,9 +154,9 @@ CREATE TABLE public.outros_ganhos (
         REFERENCES public.clientes(cliente_id) ON DELETE CASCADE
 );
 
--- PAGAMENTOS
+-- PAGAMENTOS (particionada por mês em data_pagamento)
 CREATE TABLE public.pagamentos (
-    pagamento_id bigint GENERATED ALWAYS AS IDENTITY PRIMARY KEY,
+    pagamento_id bigint GENERATED ALWAYS AS IDENTITY,
     emprestimo_id bigint,
     cliente_id bigint,
     valor_pago numeric(10,2) NOT NULL,
@@ -163,29 +165,33 @@ CREATE TABLE public.pagamentos (
     referencia_pagamento text,
     CONSTRAINT pagamentos_metodo_pagamento_check CHECK (metodo_pagamento IN ('Numerario','Transferência Bancária',
         'M-Pesa','E-Mola','MKesh','Penhor','Outro')),
+    CONSTRAINT pagamentos_pkey PRIMARY KEY (pagamento_id, data_pagamento),
     CONSTRAINT pagamentos_cliente_id_fkey FOREIGN KEY (cliente_id)
         REFERENCES public.clientes(cliente_id) ON DELETE CASCADE,
     CONSTRAINT pagamentos_emprestimo_id_fkey FOREIGN KEY (emprestimo_id)
         REFERENCES public.emprestimos(emprestimo_id) ON DELETE CASCADE
-);
+) PARTITION BY RANGE (data_pagamento);
+CREATE TABLE public.pagamentos_default PARTITION OF public.pagamentos DEFAULT;
 
--- PENALIZACOES
+-- PENALIZACOES (particionada por mês em data_aplicacao)
 CREATE TABLE public.penalizacoes (
-    penalizacao_id bigint GENERATED ALWAYS AS IDENTITY PRIMARY KEY,
+    penalizacao_id bigint GENERATED ALWAYS AS IDENTITY,
     emprestimo_id bigint NOT NULL,
     cliente_id bigint NOT NULL,
     tipo text NOT NULL,
     dias_atraso integer DEFAULT 0,
     valor numeric(10,2) NOT NULL,
     status text NOT NULL,
-    data_aplicacao timestamp with time zone DEFAULT CURRENT_TIMESTAMP,
+    data_aplicacao timestamp with time zone NOT NULL DEFAULT CURRENT_TIMESTAMP,
     observacoes text,
+    CONSTRAINT penalizacoes_pkey PRIMARY KEY (penalizacao_id, data_aplicacao),
     CONSTRAINT penalizacoes_status_check CHECK (status IN ('pendente','simulado','aplicada','cancelada')),
     CONSTRAINT fk_cliente FOREIGN KEY (cliente_id)
         REFERENCES public.clientes(cliente_id) ON DELETE CASCADE,
     CONSTRAINT fk_emprestimo FOREIGN KEY (emprestimo_id)
         REFERENCES public.emprestimos(emprestimo_id) ON DELETE CASCADE
-);
+) PARTITION BY RANGE (data_aplicacao);
+CREATE TABLE public.penalizacoes_default PARTITION OF public.penalizacoes DEFAULT;
 
 -- PENHOR
 CREATE TABLE public.penhor (
@@ -209,3 +215,284 @@ CREATE TABLE public.testemunhas (
     CONSTRAINT testemunhas_cliente_id_fkey FOREIGN KEY (cliente_id)
         REFERENCES public.clientes(cliente_id) ON DELETE CASCADE
 );
+
+-- PRODUTOS DE CRÉDITO (condições usadas para gerar o plano de prestações)
+CREATE TABLE IF NOT EXISTS public.produtos_credito (
+    produto_id bigint GENERATED ALWAYS AS IDENTITY PRIMARY KEY,
+    nome text NOT NULL UNIQUE,
+    frequencia text NOT NULL,
+    metodo text NOT NULL,
+    taxa_juro numeric(8,6) NOT NULL,
+    numero_prestacoes smallint NOT NULL,
+    ativo boolean NOT NULL DEFAULT true,
+    CONSTRAINT produtos_credito_frequencia_check CHECK (frequencia IN ('Semanal','Quinzenal','Mensal')),
+    CONSTRAINT produtos_credito_metodo_check CHECK (metodo IN ('Fixo','Saldo Decrescente')),
+    CONSTRAINT produtos_credito_taxa_check CHECK (taxa_juro >= 0),
+    CONSTRAINT produtos_credito_prestacoes_check CHECK (numero_prestacoes BETWEEN 1 AND 520)
+);
+
+-- Empréstimos com produto: total_devido vem do plano de prestações (sem produto: valor * 1.20)
+ALTER TABLE public.emprestimos ADD COLUMN IF NOT EXISTS produto_id bigint REFERENCES public.produtos_credito(produto_id);
+ALTER TABLE public.emprestimos ADD COLUMN IF NOT EXISTS total_devido numeric(12,2);
+
+-- Coordenadas (WGS84) da residência, opcionais, usadas no planeamento das rotas de cobrança
+ALTER TABLE public.localizacao ADD COLUMN IF NOT EXISTS latitude double precision;
+ALTER TABLE public.localizacao ADD COLUMN IF NOT EXISTS longitude double precision;
+
+-- PRESTACOES (plano de amortização; chave composta e sem colunas derivadas para ocupar pouco)
+CREATE TABLE IF NOT EXISTS public.prestacoes (
+    emprestimo_id bigint NOT NULL REFERENCES public.emprestimos(emprestimo_id) ON DELETE CASCADE,
+    numero smallint NOT NULL,
+    data_vencimento date NOT NULL,
+    capital numeric(12,2) NOT NULL,
+    juro numeric(12,2) NOT NULL,
+    valor_pago numeric(12,2) NOT NULL DEFAULT 0,
+    PRIMARY KEY (emprestimo_id, numero)
+);
+CREATE INDEX IF NOT EXISTS idx_prestacoes_vencimento ON public.prestacoes (data_vencimento);
+
+-- EXECUCOES AGENDADAS (histórico do agendador de trabalhos automáticos)
+CREATE TABLE IF NOT EXISTS public.execucoes_agendadas (
+    execucao_id bigint GENERATED ALWAYS AS IDENTITY PRIMARY KEY,
+    trabalho text NOT NULL,
+    agendado_para timestamp with time zone NOT NULL,
+    inicio timestamp with time zone NOT NULL,
+    fim timestamp with time zone,
+    estado text NOT NULL,
+    linhas_afetadas integer,
+    erro text,
+    instancia text,
+    CONSTRAINT execucoes_agendadas_ocorrencia_key UNIQUE (trabalho, agendado_para),
+    CONSTRAINT execucoes_agendadas_estado_check CHECK (estado IN ('Em curso','Sucesso','Erro'))
+);
+CREATE INDEX IF NOT EXISTS idx_execucoes_agendadas_inicio ON public.execucoes_agendadas (inicio DESC);
+
+-- TAREFAS (operações longas executadas em segundo plano, ver /api/tarefas)
+CREATE TABLE IF NOT EXISTS public.tarefas (
+    tarefa_id bigint GENERATED ALWAYS AS IDENTITY PRIMARY KEY,
+    tipo text NOT NULL,
+    parametros jsonb NOT NULL DEFAULT '{}'::jsonb,
+    estado text NOT NULL DEFAULT 'Pendente',
+    progresso numeric(5,2) NOT NULL DEFAULT 0,
+    processados integer NOT NULL DEFAULT 0,
+    total integer,
+    resultado jsonb,
+    erro text,
+    cancelamento_pedido boolean NOT NULL DEFAULT false,
+    tentativas integer NOT NULL DEFAULT 0,
+    instancia text,
+    criado_por text,
+    criada_em timestamp with time zone NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    iniciada_em timestamp with time zone,
+    heartbeat_em timestamp with time zone,
+    terminada_em timestamp with time zone,
+    CONSTRAINT tarefas_estado_check CHECK (estado IN ('Pendente','Em curso','Concluida','Erro','Cancelada'))
+);
+-- Fila: só as pendentes e em curso interessam aos trabalhadores
+CREATE INDEX IF NOT EXISTS idx_tarefas_ativas ON public.tarefas (estado, tarefa_id) WHERE estado IN ('Pendente','Em curso');
+
+-- COORTES (cubo vintage: fluxos por mês de desembolso × meses em carteira × dimensões, ver app/utils/coortes.py)
+CREATE TABLE IF NOT EXISTS public.coortes (
+    mes_desembolso date NOT NULL,
+    meses_em_carteira smallint NOT NULL,
+    categoria_risco text NOT NULL,
+    sexo text NOT NULL,
+    emprestimos integer NOT NULL DEFAULT 0,
+    valor_desembolsado numeric(14,2) NOT NULL DEFAULT 0,
+    total_devido numeric(14,2) NOT NULL DEFAULT 0,
+    valor_pago numeric(14,2) NOT NULL DEFAULT 0,
+    incumprimentos integer NOT NULL DEFAULT 0,
+    valor_incumprido numeric(14,2) NOT NULL DEFAULT 0,
+    PRIMARY KEY (mes_desembolso, meses_em_carteira, categoria_risco, sexo)
+);
+
+-- Marcas da última atualização incremental do cubo (uma única linha)
+CREATE TABLE IF NOT EXISTS public.coortes_estado (
+    id boolean PRIMARY KEY DEFAULT TRUE CHECK (id),
+    ultimo_emprestimo_id bigint NOT NULL DEFAULT 0,
+    ultimo_pagamento_id bigint NOT NULL DEFAULT 0,
+    data_incumprimento date,
+    atualizado_em timestamp with time zone
+);
+-- Ids já somados nos últimos 1000 abaixo de cada marca (confirmações fora de ordem, ver app/utils/coortes.py)
+ALTER TABLE public.coortes_estado ADD COLUMN IF NOT EXISTS margem_emprestimos bigint[] NOT NULL DEFAULT '{}';
+ALTER TABLE public.coortes_estado ADD COLUMN IF NOT EXISTS margem_pagamentos bigint[] NOT NULL DEFAULT '{}';
+
+-- FOTOGRAFIAS DA CARTEIRA (aging por empréstimo no fim de cada dia; partições mensais
+-- carteira_snapshots_AAAA_MM criadas pelo trabalho diário, ver app/utils/snapshots.py)
+CREATE TABLE IF NOT EXISTS public.carteira_snapshots (
+    data_snapshot date NOT NULL,
+    emprestimo_id bigint NOT NULL,
+    cliente_id bigint,
+    dias_atraso integer NOT NULL,
+    faixa text NOT NULL,
+    total_devido numeric(12,2) NOT NULL,
+    saldo numeric(12,2) NOT NULL,
+    PRIMARY KEY (data_snapshot, emprestimo_id)
+) PARTITION BY RANGE (data_snapshot);
+CREATE INDEX IF NOT EXISTS idx_carteira_snapshots_cliente ON public.carteira_snapshots (cliente_id, data_snapshot);
+
+-- Totais por dia e faixa, para as séries temporais
+CREATE TABLE IF NOT EXISTS public.carteira_snapshots_resumo (
+    data_snapshot date NOT NULL,
+    faixa text NOT NULL,
+    emprestimos integer NOT NULL,
+    saldo numeric(14,2) NOT NULL,
+    PRIMARY KEY (data_snapshot, faixa)
+);
+
+-- CLIENTES_DUPLICADOS (resultado da última análise de duplicados; substituído a cada passagem)
+CREATE TABLE IF NOT EXISTS public.clientes_duplicados (
+    cliente_id bigint NOT NULL REFERENCES public.clientes(cliente_id) ON DELETE CASCADE,
+    duplicado_de bigint NOT NULL REFERENCES public.clientes(cliente_id) ON DELETE CASCADE,
+    grupo bigint NOT NULL,
+    pontuacao real NOT NULL,
+    motivos text[] NOT NULL,
+    detetado_em timestamp with time zone NOT NULL DEFAULT now(),
+    PRIMARY KEY (cliente_id, duplicado_de)
+);
+CREATE INDEX IF NOT EXISTS idx_clientes_duplicados_grupo ON public.clientes_duplicados (grupo);
+
+-- RENDIMENTOS_CLIENTES (rendimento mensal guardado para a verificação de capacidade de pagamento,
+-- com a versão dos dados de origem em que foi calculado; só é usado enquanto essa versão for a de
+-- rendimentos_versoes, incrementada pelos gatilhos de ocupacoes e outros_ganhos)
+CREATE TABLE IF NOT EXISTS public.rendimentos_clientes (
+    cliente_id bigint PRIMARY KEY REFERENCES public.clientes(cliente_id) ON DELETE CASCADE,
+    renda_ocupacoes numeric(12,2) NOT NULL,
+    outros_ganhos numeric(12,2) NOT NULL,
+    atualizado_em timestamp with time zone NOT NULL DEFAULT now()
+);
+ALTER TABLE public.rendimentos_clientes ADD COLUMN IF NOT EXISTS versao bigint NOT NULL DEFAULT 0;
+CREATE TABLE IF NOT EXISTS public.rendimentos_versoes (
+    cliente_id bigint PRIMARY KEY REFERENCES public.clientes(cliente_id) ON DELETE CASCADE,
+    versao bigint NOT NULL DEFAULT 1
+);
+CREATE OR REPLACE FUNCTION public.versionar_rendimento() RETURNS trigger
+LANGUAGE plpgsql AS $$
+BEGIN
+    IF TG_OP <> 'INSERT' AND OLD.cliente_id IS NOT NULL THEN
+        INSERT INTO public.rendimentos_versoes (cliente_id) VALUES (OLD.cliente_id)
+        ON CONFLICT (cliente_id) DO UPDATE SET versao = rendimentos_versoes.versao + 1;
+    END IF;
+    IF TG_OP <> 'DELETE' AND NEW.cliente_id IS NOT NULL
+       AND (TG_OP = 'INSERT' OR NEW.cliente_id IS DISTINCT FROM OLD.cliente_id) THEN
+        INSERT INTO public.rendimentos_versoes (cliente_id) VALUES (NEW.cliente_id)
+        ON CONFLICT (cliente_id) DO UPDATE SET versao = rendimentos_versoes.versao + 1;
+    END IF;
+    RETURN NULL;
+END;
+$$;
+DROP TRIGGER IF EXISTS trg_ocupacoes_rendimento ON public.ocupacoes;
+CREATE TRIGGER trg_ocupacoes_rendimento
+    AFTER INSERT OR UPDATE OR DELETE ON public.ocupacoes
+    FOR EACH ROW EXECUTE FUNCTION public.versionar_rendimento();
+DROP TRIGGER IF EXISTS trg_outros_ganhos_rendimento ON public.outros_ganhos;
+CREATE TRIGGER trg_outros_ganhos_rendimento
+    AFTER INSERT OR UPDATE OR DELETE ON public.outros_ganhos
+    FOR EACH ROW EXECUTE FUNCTION public.versionar_rendimento();
+
+-- Entrega por SMS (app/utils/entregas.py): tentativas, reserva/espera até à próxima tentativa e
+-- o estado Falhada para as que esgotaram as tentativas
+ALTER TABLE public.notificacoes ADD COLUMN IF NOT EXISTS tentativas integer NOT NULL DEFAULT 0;
+ALTER TABLE public.notificacoes ADD COLUMN IF NOT EXISTS proxima_tentativa timestamp with time zone;
+ALTER TABLE public.notificacoes ADD COLUMN IF NOT EXISTS enviada_em timestamp with time zone;
+ALTER TABLE public.notificacoes ADD COLUMN IF NOT EXISTS ultimo_erro text;
+ALTER TABLE public.notificacoes ADD COLUMN IF NOT EXISTS gateway text;
+ALTER TABLE public.notificacoes DROP CONSTRAINT IF EXISTS notificacoes_status_check;
+ALTER TABLE public.notificacoes ADD CONSTRAINT notificacoes_status_check
+    CHECK (status IN ('Enviado','Lido','Pendente','Falhada'));
+
+-- NOTIFICACOES_ARQUIVO (notificações lidas e antigas, retiradas de notificacoes pelo trabalho arquivo-notificacoes)
+CREATE TABLE IF NOT EXISTS public.notificacoes_arquivo (
+    notificacao_id bigint PRIMARY KEY,
+    cliente_id bigint REFERENCES public.clientes(cliente_id) ON DELETE CASCADE,
+    tipo text NOT NULL,
+    mensagem text NOT NULL,
+    data_envio timestamp with time zone,
+    status text NOT NULL,
+    arquivada_em timestamp with time zone NOT NULL DEFAULT now()
+);
+CREATE INDEX IF NOT EXISTS idx_notificacoes_arquivo_cliente_data ON public.notificacoes_arquivo (cliente_id, data_envio);
+CREATE INDEX IF NOT EXISTS idx_notificacoes_arquivo_data ON public.notificacoes_arquivo (data_envio);
+ALTER TABLE public.notificacoes_arquivo ADD COLUMN IF NOT EXISTS tentativas integer NOT NULL DEFAULT 0;
+ALTER TABLE public.notificacoes_arquivo ADD COLUMN IF NOT EXISTS enviada_em timestamp with time zone;
+ALTER TABLE public.notificacoes_arquivo ADD COLUMN IF NOT EXISTS gateway text;
+ALTER TABLE public.notificacoes_arquivo ADD COLUMN IF NOT EXISTS ultimo_erro text;
+
+-- Avisos para o stream SSE (/api/notificacoes/stream): um NOTIFY por instrução, entregue no commit
+CREATE OR REPLACE FUNCTION public.avisar_notificacoes() RETURNS trigger
+LANGUAGE plpgsql AS $$
+BEGIN
+    PERFORM pg_notify('notificacoes_eventos', TG_OP);
+    RETURN NULL;
+END;
+$$;
+DROP TRIGGER IF EXISTS trg_notificacoes_eventos ON public.notificacoes;
+CREATE TRIGGER trg_notificacoes_eventos
+    AFTER INSERT OR UPDATE OF status OR DELETE ON public.notificacoes
+    FOR EACH STATEMENT EXECUTE FUNCTION public.avisar_notificacoes();
+
+-- PARTIÇÕES MENSAIS de pagamentos, notificacoes e penalizacoes ({tabela}_AAAA_MM), criadas pelo
+-- trabalho diário "particoes" (app/utils/particoes.py) para o mês corrente e os
+-- PARTICOES_MESES_FUTUROS seguintes; até lá as linhas ficam na partição {tabela}_default.
+-- Bases criadas antes desta versão: submeter a tarefa "particoes" com {"migrar": true}.
+
+-- =========================
+-- ÍNDICES
+-- =========================
+-- Seguros para reexecutar numa base existente (IF NOT EXISTS).
+
+-- Pesquisa de clientes (/api/clientes/pesquisar): prefixo em btree e trigramas (pg_trgm)
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+CREATE INDEX IF NOT EXISTS idx_clientes_nome_prefixo ON public.clientes (lower(nome) text_pattern_ops);
+CREATE INDEX IF NOT EXISTS idx_clientes_nome_trgm ON public.clientes USING gist (lower(nome) gist_trgm_ops);
+CREATE INDEX IF NOT EXISTS idx_clientes_telefone_prefixo ON public.clientes (telefone text_pattern_ops);
+CREATE INDEX IF NOT EXISTS idx_clientes_telefone_trgm ON public.clientes USING gin (telefone gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS idx_clientes_email_trgm ON public.clientes USING gin (lower(email) gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS idx_documentos_numero_prefixo ON public.documentos (upper(numero_documento) text_pattern_ops);
+CREATE INDEX IF NOT EXISTS idx_documentos_numero_trgm ON public.documentos USING gin (upper(numero_documento) gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS idx_documentos_cliente ON public.documentos (cliente_id);
+
+-- Verificação de duplicados em clientes/criar (app/utils/duplicados.py): as mesmas normalizações em SQL
+CREATE INDEX IF NOT EXISTS idx_clientes_telefone_normalizado ON public.clientes (right(regexp_replace(telefone, '[^0-9]', '', 'g'), 9));
+CREATE INDEX IF NOT EXISTS idx_clientes_email_lower ON public.clientes (lower(email));
+CREATE INDEX IF NOT EXISTS idx_clientes_nascimento ON public.clientes (data_nascimento);
+CREATE INDEX IF NOT EXISTS idx_documentos_numero_normalizado ON public.documentos (upper(regexp_replace(numero_documento, '[^0-9A-Za-z]', '', 'g')));
+
+-- Filtros e ordenação das listagens (/listar) e junções por cliente/empréstimo
+CREATE INDEX IF NOT EXISTS idx_emprestimos_cliente ON public.emprestimos (cliente_id);
+CREATE INDEX IF NOT EXISTS idx_emprestimos_status_vencimento ON public.emprestimos (status, data_vencimento);
+CREATE INDEX IF NOT EXISTS idx_emprestimos_data_emprestimo ON public.emprestimos (data_emprestimo);
+
+CREATE INDEX IF NOT EXISTS idx_pagamentos_emprestimo ON public.pagamentos (emprestimo_id);
+CREATE INDEX IF NOT EXISTS idx_pagamentos_cliente_data ON public.pagamentos (cliente_id, data_pagamento);
+CREATE INDEX IF NOT EXISTS idx_pagamentos_data ON public.pagamentos (data_pagamento);
+CREATE INDEX IF NOT EXISTS idx_pagamentos_metodo_data ON public.pagamentos (metodo_pagamento, data_pagamento);
+
+CREATE INDEX IF NOT EXISTS idx_penhor_cliente ON public.penhor (cliente_id);
+CREATE INDEX IF NOT EXISTS idx_testemunhas_cliente ON public.testemunhas (cliente_id);
+
+CREATE INDEX IF NOT EXISTS idx_penalizacoes_emprestimo ON public.penalizacoes (emprestimo_id);
+CREATE INDEX IF NOT EXISTS idx_penalizacoes_cliente ON public.penalizacoes (cliente_id);
+CREATE INDEX IF NOT EXISTS idx_penalizacoes_status_data ON public.penalizacoes (status, data_aplicacao);
+CREATE INDEX IF NOT EXISTS idx_penalizacoes_data ON public.penalizacoes (data_aplicacao);
+
+CREATE INDEX IF NOT EXISTS idx_notificacoes_cliente_data ON public.notificacoes (cliente_id, data_envio);
+CREATE INDEX IF NOT EXISTS idx_notificacoes_status_data ON public.notificacoes (status, data_envio);
+CREATE INDEX IF NOT EXISTS idx_notificacoes_tipo_data ON public.notificacoes (tipo, data_envio);
+CREATE INDEX IF NOT EXISTS idx_notificacoes_data ON public.notificacoes (data_envio);
+
+-- Localização mais recente de cada cliente (rotas de cobrança)
+CREATE INDEX IF NOT EXISTS idx_localizacao_cliente ON public.localizacao (cliente_id, localizacao_id DESC);
+
+-- Consultas por raio, caixa e mapa de calor (/api/localizacoes): GiST nativo sobre point, sem PostGIS
+CREATE INDEX IF NOT EXISTS idx_localizacao_ponto ON public.localizacao USING gist (point(longitude, latitude))
+    WHERE latitude IS NOT NULL AND longitude IS NOT NULL;
+
+-- Rendimento do cliente na verificação de capacidade de pagamento (/api/emprestimos/criar)
+CREATE INDEX IF NOT EXISTS idx_ocupacoes_cliente ON public.ocupacoes (cliente_id);
+CREATE INDEX IF NOT EXISTS idx_outros_ganhos_cliente ON public.outros_ganhos (cliente_id);
+
+-- Fila de entrega: notificações de clientes por entregar, pela ordem em que são reclamadas
+CREATE INDEX IF NOT EXISTS idx_notificacoes_entrega ON public.notificacoes (notificacao_id)
+    WHERE status = 'Pendente' AND cliente_id IS NOT NULL;
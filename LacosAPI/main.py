@@ -1,4 +1,4 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
 import uvicorn
 import os
@@ -22,6 +22,17 @@ from app.routes.historico_credito import router as historico_credito_router
 from app.routes.ocupacoes import router as ocupacoes_router
 from app.routes.auth_clientes import router as auth_clientes_router
 from app.routes.dashboard import router as dashboard_router
+from app.routes.diagnostico import router as diagnostico_router
+from app.routes.exportacoes import router as exportacoes_router
+from app.routes.agendador import router as agendador_router
+from app.routes.tarefas import router as tarefas_router
+from app.routes.produtos_credito import router as produtos_credito_router
+from app.routes.coortes import router as coortes_router
+from app.utils.agendador import SCHEDULER_ENABLED, agendador
+from app.utils.tarefas import gestor as gestor_tarefas
+from app.utils.eventos_notificacoes import ouvinte as ouvinte_notificacoes
+from app.utils.entregas import trabalhador_entregas
+from app.database.replicas import identificar_cliente, definir_cliente_pedido, registar_escrita
 
 app = FastAPI(title="Lacos Microcrédito API", description="API para gestão de clientes, localizações, documentos e operações financeiras")
 
@@ -37,8 +48,33 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["GET", "POST", "PUT", "DELETE"],
     allow_headers=["Authorization", "Content-Type"],
+    expose_headers=["X-Total-Count", "X-Total-Count-Estimado"],
 )
 
+@app.middleware("http")
+async def encaminhar_leituras(request: Request, call_next):
+    # Identifica o cliente para que, depois de uma escrita, as suas leituras fiquem no primário
+    chave = identificar_cliente(request.headers.get("authorization"), request.client.host if request.client else None)
+    definir_cliente_pedido(chave)
+    response = await call_next(request)
+    if request.method not in ("GET", "HEAD", "OPTIONS") and response.status_code < 400:
+        registar_escrita(chave)
+    return response
+
+@app.on_event("startup")
+def iniciar_trabalhos_em_segundo_plano():
+    if SCHEDULER_ENABLED:
+        agendador.iniciar()
+    gestor_tarefas.iniciar()
+    trabalhador_entregas.iniciar()
+
+@app.on_event("shutdown")
+def parar_trabalhos_em_segundo_plano():
+    agendador.parar()
+    gestor_tarefas.parar()
+    ouvinte_notificacoes.parar()
+    trabalhador_entregas.parar()
+
 @app.get("/")
 def verificar_conexao():
     return {"mensagem": "Lacos Microcrédito API"}
@@ -59,6 +95,12 @@ app.include_router(historico_credito_router, prefix="/api/historico-credito", ta
 app.include_router(ocupacoes_router, prefix="/api/ocupacoes", tags=["ocupacoes"])
 app.include_router(auth_clientes_router, prefix="/api/auth-clientes", tags=["auth-clientes"])
 app.include_router(dashboard_router, prefix="/api/dashboard", tags=["dashboard"])
+app.include_router(diagnostico_router, prefix="/api/diagnostico", tags=["diagnostico"])
+app.include_router(exportacoes_router, prefix="/api/exportacoes", tags=["exportacoes"])
+app.include_router(agendador_router, prefix="/api/agendador", tags=["agendador"])
+app.include_router(tarefas_router, prefix="/api/tarefas", tags=["tarefas"])
+app.include_router(produtos_credito_router, prefix="/api/produtos-credito", tags=["produtos-credito"])
+app.include_router(coortes_router, prefix="/api/coortes", tags=["coortes"])
 
 if __name__ == "__main__":
     uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
@@ -133,6 +133,42 @@ def testar_clientes(access_token):
         except Exception as e:
             print(f"[ERRO] {e}")
 
+    # 4. Registar o mesmo cliente outra vez, com outro telefone, deve ser recusado
+    if client_id:
+        print("\n4. Verificando deteção de duplicados...")
+        try:
+            duplicado = dict(client_data, nome="Joao Silva Teste", telefone=f"861234567{int(time.time())}", email=None)
+            response = requests.post(f"{BASE_URL}/api/clientes/criar", params={"verificar_duplicados": "true"},
+                                     json=duplicado, headers=headers)
+            print(f"Status: {response.status_code}")
+            if response.status_code == 409:
+                candidatos = response.json()["detail"]["candidatos"]
+                print(f"[OK] Duplicado recusado; {len(candidatos)} candidatos")
+            else:
+                print(f"[ERRO] Esperado 409: {response.text}")
+        except Exception as e:
+            print(f"[ERRO] {e}")
+
+    # 5. Importação em massa (só validação): a segunda linha repete o telefone da primeira
+    print("\n5. Simulando importação em massa...")
+    try:
+        telefone = f"871234567{int(time.time())}"
+        csv_texto = (
+            "nome,sexo,telefone,data_nascimento,cidade,distrito,provincia\n"
+            f"Ana Importada,Feminino,{telefone},1985-03-04,Maputo,KaMpfumo,Maputo\n"
+            f"Rui Importado,Masculino,{telefone},1985-02-30,Maputo,KaMpfumo,Maputo\n"
+        )
+        response = requests.post(f"{BASE_URL}/api/clientes/importar", params={"simular": "true"},
+                                 files={"arquivo": ("clientes.csv", csv_texto.encode("utf-8"), "text/csv")},
+                                 headers=headers)
+        print(f"Status: {response.status_code}")
+        if response.status_code == 200 and [l["estado"] for l in response.json()["linhas"]] == ["valido", "rejeitado"]:
+            print(f"[OK] Relatório por linha: {response.json()['linhas'][1]['erros']}")
+        else:
+            print(f"[ERRO] {response.text}")
+    except Exception as e:
+        print(f"[ERRO] {e}")
+
     return client_id
 
 def testar_localizacoes(access_token, client_id):
@@ -157,7 +193,9 @@ def testar_localizacoes(access_token, client_id):
             "quarteirao": "B",
             "cidade": "Maputo",
             "distrito": "Kampfumo",
-            "provincia": "Maputo"
+            "provincia": "Maputo",
+            "latitude": -25.9692,
+            "longitude": 32.5732
         }
         response = requests.post(f"{BASE_URL}/api/localizacoes/criar", json=location_data, headers=headers)
         print(f"Status: {response.status_code}")
@@ -181,6 +219,21 @@ def testar_localizacoes(access_token, client_id):
     except Exception as e:
         print(f"[ERRO] {e}")
 
+    # 3. Procurar clientes num raio de 1 km
+    print("\n3. Procurando clientes próximos...")
+    try:
+        params = {"latitude": -25.9700, "longitude": 32.5740, "raio_km": 1}
+        response = requests.get(f"{BASE_URL}/api/localizacoes/proximas", params=params, headers=headers)
+        print(f"Status: {response.status_code}")
+        if response.status_code == 200:
+            proximos = response.json()["clientes"]
+            encontrado = any(c["cliente_id"] == client_id for c in proximos)
+            print(f"[{'OK' if encontrado else 'ERRO'}] {len(proximos)} clientes no raio; cliente de teste {'incluído' if encontrado else 'em falta'}")
+        else:
+            print(f"[ERRO] {response.text}")
+    except Exception as e:
+        print(f"[ERRO] {e}")
+
     return location_id
 
 def testar_emprestimos(access_token, client_id):